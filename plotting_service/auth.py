@@ -2,27 +2,53 @@
 Auth functionality
 """
 
-import importlib
+import asyncio
+import hashlib
 import logging
 import os
+import time
 from dataclasses import dataclass
 from http import HTTPStatus
-from typing import Any, Literal
+from typing import Literal
 
+import httpx
 import jwt
 from jwt import PyJWTError
 
-from plotting_service.exceptions import AuthError
+from plotting_service.cache import TTLCache
+from plotting_service.exceptions import AuthError, AuthServiceUnavailableError
 
 JWT_SECRET = os.environ.get("JWT_SECRET", "shh")
 FIA_AUTH_URL = os.environ.get("FIA_AUTH_URL")
 FIA_AUTH_API_KEY = os.environ.get("FIA_AUTH_API_KEY")
+FIA_AUTH_TIMEOUT = float(os.environ.get("FIA_AUTH_TIMEOUT", "5"))
+FIA_AUTH_MAX_CONNECTIONS = int(os.environ.get("FIA_AUTH_MAX_CONNECTIONS", "20"))
+FIA_AUTH_FAILURE_THRESHOLD = int(os.environ.get("FIA_AUTH_FAILURE_THRESHOLD", "5"))
+FIA_AUTH_RESET_TIMEOUT = float(os.environ.get("FIA_AUTH_RESET_TIMEOUT", "30"))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get("TOKEN_CACHE_MAX_SIZE", "4096"))
+EXPERIMENT_CACHE_TTL = float(os.environ.get("EXPERIMENT_CACHE_TTL", "60"))
+EXPERIMENT_CACHE_STALE_TTL = float(os.environ.get("EXPERIMENT_CACHE_STALE_TTL", "300"))
+EXPERIMENT_CACHE_MAX_SIZE = int(os.environ.get("EXPERIMENT_CACHE_MAX_SIZE", "1024"))
+DECISION_CACHE_TTL = float(os.environ.get("DECISION_CACHE_TTL", "300"))
+DECISION_CACHE_NEGATIVE_TTL = float(os.environ.get("DECISION_CACHE_NEGATIVE_TTL", "30"))
+DECISION_CACHE_MAX_SIZE = int(os.environ.get("DECISION_CACHE_MAX_SIZE", "65536"))
 
 logger = logging.getLogger(__name__)
-requests: Any = importlib.import_module("requests")
 
+# Verified users per token hash, entries expire with the token or after TOKEN_CACHE_TTL when it has no expiry
+token_cache: TTLCache[str, "User"] = TTLCache(max_size=TOKEN_CACHE_MAX_SIZE, ttl=TOKEN_CACHE_TTL)
+# Experiment numbers per user number, stale entries are served while being refreshed in the background
+experiment_cache: TTLCache[int, frozenset[int]] = TTLCache(
+    max_size=EXPERIMENT_CACHE_MAX_SIZE, ttl=EXPERIMENT_CACHE_TTL, stale_ttl=EXPERIMENT_CACHE_STALE_TTL
+)
+# Access decisions per (user number, experiment number), denials expire sooner so new experiments show up quickly and
+# allows expire with the experiment list so removed users lose access once it is refreshed
+decision_cache: TTLCache[tuple[int, int], bool] = TTLCache(max_size=DECISION_CACHE_MAX_SIZE, ttl=DECISION_CACHE_TTL)
+_refresh_tasks: set[asyncio.Task[None]] = set()
 
-@dataclass
+
+@dataclass(frozen=True)
 class User:
     """
     Simple dataclass for the token attached user
@@ -34,10 +60,15 @@ class User:
 
 def get_user_from_token(token: str) -> User:
     """
-    Given a jwt token, return the user, will raise if token is not valid
+    Given a jwt token, return the user, will raise if token is not valid. Verified tokens are cached by their hash
+    until they expire so repeated requests with the same token skip decoding.
     :param token: the jwt token to check
     :return: The user
     """
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    cached_user = token_cache.get(token_hash)
+    if cached_user is not None:
+        return cached_user
     try:
         logger.info("Getting user from token")
         payload = jwt.decode(
@@ -48,24 +79,269 @@ def get_user_from_token(token: str) -> User:
         )
         user = User(user_number=payload["usernumber"], role=payload["role"])
         logger.info("Successfuly retrieved user")
-        return user
     except PyJWTError as exc:
         logger.exception("Failed to get user from token")
         raise AuthError() from exc
 
+    expiry = payload.get("exp")
+    token_cache.set(token_hash, user, ttl=None if expiry is None else float(expiry) - time.time())
+    return user
+
+
+class AuthClient:
+    """
+    Async client for the FIA auth api. A single keep-alive connection pool is shared by every request, concurrent
+    lookups for the same user are coalesced into one call, and a circuit breaker fails fast while the auth api is
+    unhealthy so that slow responses cannot pile up waiting requests.
+    """
+
+    def __init__(
+        self,
+        base_url: str | None,
+        api_key: str | None,
+        timeout: float = FIA_AUTH_TIMEOUT,
+        max_connections: int = FIA_AUTH_MAX_CONNECTIONS,
+        failure_threshold: int = FIA_AUTH_FAILURE_THRESHOLD,
+        reset_timeout: float = FIA_AUTH_RESET_TIMEOUT,
+    ) -> None:
+        """
+        :param base_url: The url of the auth api
+        :param api_key: The api key sent to the auth api
+        :param timeout: Seconds allowed for each request, including waiting for a pooled connection
+        :param max_connections: Size of the keep-alive connection pool
+        :param failure_threshold: Consecutive failures before the circuit opens
+        :param reset_timeout: Seconds the circuit stays open before a trial request is let through
+        """
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._client: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._in_flight: dict[int, asyncio.Task[list[int]]] = {}
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_progress = False
+
+    @property
+    def circuit_open(self) -> bool:
+        """Whether requests are currently being rejected without contacting the auth api"""
+        return self._opened_at is not None
+
+    def is_in_flight(self, user_number: int) -> bool:
+        """
+        Check if a lookup for the user is currently running
+        :param user_number: The user number to check
+        :return: Whether a lookup is running
+        """
+        return user_number in self._in_flight
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        Return the pooled http client, recreating it if it was made on another event loop
+        :return: The http client
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections, max_keepalive_connections=self.max_connections
+                ),
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+            self._loop = loop
+            self._in_flight = {}
+        return self._client
+
+    async def aclose(self) -> None:
+        """
+        Close the connection pool
+        :return: None
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    def _before_request(self) -> None:
+        """
+        Reject the request if the circuit is open, letting a single trial through once the reset timeout has passed
+        :return: None
+        """
+        if self._opened_at is None:
+            return
+        remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+        if remaining > 0 or self._trial_in_progress:
+            raise AuthServiceUnavailableError("Auth api circuit is open", retry_after=max(remaining, 0))
+        self._trial_in_progress = True
+
+    def _record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    def _record_failure(self) -> None:
+        self._failures += 1
+        if self._trial_in_progress or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logger.warning("Opening auth api circuit after %s failures", self._failures)
+            self._opened_at = time.monotonic()
+        self._trial_in_progress = False
+
+    async def _request_experiments(self, user_number: int) -> list[int]:
+        """
+        Request the experiment numbers of a user from the auth api, tracking the outcome in the circuit breaker
+        :param user_number: The user number to get for
+        :return: The users experiment numbers
+        """
+        self._before_request()
+        try:
+            response = await self._get_client().get(f"{self.base_url}/experiment", params={"user_number": user_number})
+        except httpx.HTTPError as exc:
+            self._record_failure()
+            raise AuthServiceUnavailableError("Could not contact the auth api") from exc
+        if response.status_code == HTTPStatus.OK:
+            self._record_success()
+            experiment_numbers: list[int] = response.json()
+            return experiment_numbers
+        if response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+            self._record_failure()
+        else:
+            self._record_success()
+        raise AuthServiceUnavailableError("Could not contact the auth api")
+
+    async def get_experiments(self, user_number: int) -> list[int]:
+        """
+        Return the experiment numbers of a user, sharing the result with any concurrent lookup for the same user. The
+        lookup runs as a task of its own, so a caller that is cancelled does not cancel it for the others.
+        :param user_number: The user number to get for
+        :return: The users experiment numbers
+        """
+        self._get_client()
+        task = self._in_flight.get(user_number)
+        if task is None:
+            task = asyncio.create_task(self._request_experiments(user_number))
+            self._in_flight[user_number] = task
+            task.add_done_callback(lambda done: self._forget(user_number, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, user_number: int, task: asyncio.Task[list[int]]) -> None:
+        if self._in_flight.get(user_number) is task:
+            del self._in_flight[user_number]
+        if not task.cancelled():
+            # Mark the exception as retrieved so it is not reported when every caller was cancelled
+            task.exception()
+
+
+auth_client = AuthClient(base_url=FIA_AUTH_URL, api_key=FIA_AUTH_API_KEY)
+
+
+def _store_experiments(user_number: int, experiment_numbers: list[int]) -> frozenset[int]:
+    """
+    Cache the experiments of a user, dropping their cached decisions if the experiments have changed
+    :param user_number: The user number
+    :param experiment_numbers: The users experiment numbers
+    :return: The cached experiment numbers
+    """
+    experiments = frozenset(experiment_numbers)
+    previous = experiment_cache.lookup(user_number, record=False)
+    if previous is not None and previous[0] != experiments:
+        decision_cache.invalidate_where(lambda key: key[0] == user_number)
+    experiment_cache.set(user_number, experiments)
+    return experiments
+
+
+def invalidate_user(user_number: int) -> None:
+    """
+    Drop the cached experiments and decisions of a user
+    :param user_number: The user number
+    :return: None
+    """
+    experiment_cache.invalidate(user_number)
+    decision_cache.invalidate_where(lambda key: key[0] == user_number)
+
+
+async def _refresh_experiments_for_user(user: User) -> None:
+    """
+    Refresh the cached experiments for a user, keeping the stale entry if the auth api cannot be reached
+    :param user: The user to refresh
+    :return: None
+    """
+    try:
+        _store_experiments(user.user_number, await auth_client.get_experiments(user.user_number))
+    except Exception:
+        logger.exception("Failed to refresh experiments for user %s", user.user_number)
+
 
-def get_experiments_for_user(user: User) -> list[int]:
+def _schedule_refresh(user: User) -> None:
     """
-    Given a user, return the experiment (RB) numbers associated with that user
+    Start a background refresh of the users experiments unless a lookup is already running
+    :param user: The user to refresh
+    :return: None
+    """
+    if auth_client.is_in_flight(user.user_number):
+        return
+    task = asyncio.create_task(_refresh_experiments_for_user(user))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+async def get_experiments_for_user(user: User) -> frozenset[int]:
+    """
+    Given a user, return the experiment (RB) numbers associated with that user. Results are cached per user, stale
+    results are returned immediately while a refresh happens in the background.
     :param user: The user to get for
     :return: The users experiment numbers
     """
-    response = requests.get(
-        f"{FIA_AUTH_URL}/experiment?user_number={user.user_number}",
-        headers={"Authorization": f"Bearer {FIA_AUTH_API_KEY}"},
-        timeout=30,
-    )
-    if response.status_code == HTTPStatus.OK:
-        experiment_numbers: list[int] = response.json()
+    cached = experiment_cache.lookup(user.user_number)
+    if cached is not None:
+        experiment_numbers, stale = cached
+        if stale:
+            _schedule_refresh(user)
         return experiment_numbers
-    raise RuntimeError("Could not contact the auth api")
+
+    return _store_experiments(user.user_number, await auth_client.get_experiments(user.user_number))
+
+
+async def user_can_access_experiment(user: User, experiment_number: int) -> bool:
+    """
+    Check if a user may access an experiment, caching the decision
+    :param user: The user to check
+    :param experiment_number: The experiment (RB) number to check
+    :return: Whether the user may access the experiment
+    """
+    key = (user.user_number, experiment_number)
+    decision = decision_cache.get(key)
+    if decision is not None:
+        return decision
+    decision = experiment_number in await get_experiments_for_user(user)
+    decision_cache.set(key, decision, ttl=_decision_ttl(decision))
+    return decision
+
+
+def _decision_ttl(decision: bool) -> float:
+    """
+    Return the seconds an access decision is cached for
+    :param decision: Whether access was allowed
+    :return: The time to live of the decision
+    """
+    if not decision:
+        return DECISION_CACHE_NEGATIVE_TTL
+    # A cached allow skips the experiment list, which would otherwise never be refreshed while the allow lasts
+    return min(DECISION_CACHE_TTL, EXPERIMENT_CACHE_TTL)
+
+
+async def warm_user(user: User) -> frozenset[int]:
+    """
+    Fetch the experiments of a user from the auth api and cache an allow decision for each of them
+    :param user: The user to warm the caches for
+    :return: The users experiment numbers
+    """
+    experiments = _store_experiments(user.user_number, await auth_client.get_experiments(user.user_number))
+    decision_cache.invalidate_where(lambda key: key[0] == user.user_number)
+    for experiment_number in experiments:
+        decision_cache.set((user.user_number, experiment_number), True, ttl=_decision_ttl(True))
+    return experiments
@@ -0,0 +1,289 @@
+"""
+Request authorization layer
+"""
+
+import enum
+import logging
+import math
+import os
+import re
+import typing
+from collections.abc import Iterable
+from dataclasses import dataclass
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from plotting_service.auth import User, get_user_from_token, user_can_access_experiment
+from plotting_service.exceptions import AuthError, AuthServiceUnavailableError
+from plotting_service.utils import get_current_rb_async
+
+if typing.TYPE_CHECKING:
+    from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class Policy(enum.Enum):
+    """How a route is authorized"""
+
+    PUBLIC = "public"
+    AUTHENTICATED = "authenticated"
+    EXPERIMENT = "experiment"
+    USER_NUMBER = "user_number"
+    LIVE_INSTRUMENT = "live_instrument"
+
+
+@dataclass(frozen=True)
+class Route:
+    """A compiled route table entry, named groups in the pattern are used by the policy"""
+
+    pattern: re.Pattern[str]
+    policy: Policy
+    query_token: bool = False
+
+
+# Checked in order against the request path, requests matching no entry use the experiment policy with the
+# experiment number taken from the file query parameter
+ROUTE_TABLE: tuple[Route, ...] = (
+    Route(re.compile(r"/(healthz|docs|docs/oauth2-redirect|redoc|openapi\.json)"), Policy.PUBLIC),
+    Route(re.compile(r"/(admin|auth)/.*"), Policy.AUTHENTICATED),
+    Route(re.compile(r"/live/live-data/(?P<instrument>[^/]+)(/files)?"), Policy.LIVE_INSTRUMENT, query_token=True),
+    Route(re.compile(r"/live(/.*)?"), Policy.LIVE_INSTRUMENT, query_token=True),
+    Route(re.compile(r"/find_file/batch"), Policy.AUTHENTICATED),
+    Route(re.compile(r"/find_file/generic/user_number/(?P<user_number>\d+)"), Policy.USER_NUMBER),
+    # Followed from the browser with EventSource, which cannot set headers
+    Route(
+        re.compile(r"/text/.*/experiment_number/(?P<experiment_number>\d+)/follow"), Policy.EXPERIMENT, query_token=True
+    ),
+    Route(re.compile(r"/(text|find_file)/.*/experiment_number/(?P<experiment_number>\d+)(/.*)?"), Policy.EXPERIMENT),
+    Route(re.compile(r"/"), Policy.AUTHENTICATED),
+)
+DEFAULT_ROUTE = Route(re.compile(r".*"), Policy.EXPERIMENT)
+QUERY_EXPERIMENT_NUMBER = re.compile(r"%2FRB(\d+)%2F")
+
+
+@dataclass(frozen=True)
+class AuthorizationDecision:
+    """The outcome of authorizing a request, attached to request.state.authorization"""
+
+    policy: Policy
+    user: User | None = None
+    api_key: bool = False
+    experiment_number: int | None = None
+    user_number: int | None = None
+    instrument: str | None = None
+
+    @property
+    def privileged(self) -> bool:
+        """Whether the requester bypasses resource checks, either by api key or being staff"""
+        return self.api_key or (self.user is not None and self.user.role == "staff")
+
+
+def resolve_route(path: str) -> tuple[Route, re.Match[str] | None]:
+    """
+    Find the route table entry for a request path
+    :param path: The request path
+    :return: The route and the match of its pattern
+    """
+    for route in ROUTE_TABLE:
+        match = route.pattern.fullmatch(path)
+        if match is not None:
+            return route, match
+    return DEFAULT_ROUTE, None
+
+
+def _get_token(headers: Headers, query: dict[str, list[str]], route: Route) -> str:
+    """
+    Get the bearer token of the request, streaming routes may also pass it as a query parameter for EventSource
+    clients
+    :param headers: The request headers
+    :param query: The parsed query string
+    :param route: The matched route
+    :return: The token
+    """
+    if route.query_token and "token" in query:
+        return query["token"][0]
+    auth_header = headers.get("Authorization")
+    if auth_header is None:
+        raise HTTPException(HTTPStatus.UNAUTHORIZED, "Unauthenticated")
+    parts = auth_header.split(" ")
+    if len(parts) < 2:  # noqa: PLR2004
+        raise HTTPException(HTTPStatus.UNAUTHORIZED, "Unauthenticated")
+    return parts[1]
+
+
+def _get_experiment_number(match: re.Match[str] | None, query_string: str) -> int:
+    """
+    Get the experiment number from the route match, or from the file in the query string
+    :param match: The match of the route pattern
+    :param query_string: The raw query string
+    :return: The experiment number
+    """
+    if match is not None and match.groupdict().get("experiment_number") is not None:
+        return int(match["experiment_number"])
+    query_match = QUERY_EXPERIMENT_NUMBER.search(query_string)
+    if query_match is not None:
+        return int(query_match.group(1))
+    logger.warning("The request does not include an experiment number. Permissions cannot be checked")
+    raise HTTPException(HTTPStatus.BAD_REQUEST, "Request missing experiment number")
+
+
+def _get_live_instrument(match: re.Match[str] | None, query: dict[str, list[str]]) -> str:
+    """
+    Get the instrument of a live request, from the path or the first part of the file query parameter
+    :param match: The match of the route pattern
+    :param query: The parsed query string
+    :return: The instrument name
+    """
+    if match is not None and match.groupdict().get("instrument") is not None:
+        return match["instrument"]
+    file_param = query.get("file", [""])[0]
+    if not file_param:
+        raise HTTPException(HTTPStatus.BAD_REQUEST, "Missing 'file' parameter for live check")
+    # Assuming structure: INSTRUMENT/RBnumber/...
+    parts = Path(file_param).parts
+    if not parts or parts[0] == "/" or parts[0] == ".":
+        raise HTTPException(HTTPStatus.BAD_REQUEST, "Invalid file path format")
+    return parts[0]
+
+
+async def _check_live_instrument(user: User, instrument: str) -> None:
+    """
+    Check the user has permission to view the *current* experiment on the instrument
+    :param user: The user to check
+    :param instrument: The instrument to check
+    :return: None
+    """
+    try:
+        current_rb = await get_current_rb_async(instrument)
+    except Exception as e:
+        logger.error(f"Failed to get current RB for instrument {instrument}: {e}")
+        # If we can't check 'live' status, fail safe
+        raise HTTPException(HTTPStatus.INTERNAL_SERVER_ERROR, "Unable to verify live experiment status") from None
+
+    try:
+        # It usually comes as just the number from the PV, but handle "RB" prefix just in case
+        current_rb_int = int(current_rb[2:]) if current_rb.upper().startswith("RB") else int(current_rb)
+    except ValueError:
+        logger.error(f"Invalid RB number format from PV: {current_rb}")
+        raise HTTPException(HTTPStatus.INTERNAL_SERVER_ERROR, "Invalid live experiment data") from None
+
+    if not await user_can_access_experiment(user, current_rb_int):
+        logger.warning(f"User {user.user_number} denied access to live experiment {current_rb_int}")
+        raise HTTPException(
+            HTTPStatus.FORBIDDEN, detail="Forbidden: You do not have access to the current live experiment"
+        )
+
+
+def auth_unavailable(exc: AuthServiceUnavailableError) -> HTTPException:
+    """
+    Return the error for a request whose permissions cannot be checked because the auth api is unavailable
+    :param exc: The error from the auth client
+    :return: A 503, with the seconds until the auth api is tried again when they are known
+    """
+    headers = None if exc.retry_after is None else {"Retry-After": str(math.ceil(exc.retry_after))}
+    return HTTPException(HTTPStatus.SERVICE_UNAVAILABLE, detail=str(exc), headers=headers)
+
+
+async def authorize(scope: "Scope") -> AuthorizationDecision:
+    """
+    Authorize a http request, choosing the policy from the route table
+    :param scope: The ASGI scope of the request
+    :return: The decision, raises HTTPException if the request is not allowed
+    """
+    try:
+        return await _authorize(scope)
+    except AuthServiceUnavailableError as exc:
+        raise auth_unavailable(exc) from exc
+
+
+async def _authorize(scope: "Scope") -> AuthorizationDecision:
+    route, match = resolve_route(scope["path"])
+    if route.policy is Policy.PUBLIC or scope["method"] == "OPTIONS":
+        return AuthorizationDecision(policy=Policy.PUBLIC)
+
+    query_string = scope.get("query_string", b"").decode("latin-1")
+    query = parse_qs(query_string)
+    token = _get_token(Headers(scope=scope), query, route)
+
+    api_key = os.environ.get("API_KEY", "")
+    if token == api_key and api_key != "":
+        return AuthorizationDecision(policy=route.policy, api_key=True)
+
+    try:
+        user = get_user_from_token(token)
+    except AuthError:
+        raise HTTPException(HTTPStatus.FORBIDDEN, detail="Forbidden") from None
+
+    if user.role == "staff" or route.policy is Policy.AUTHENTICATED:
+        return AuthorizationDecision(policy=route.policy, user=user)
+
+    if route.policy is Policy.USER_NUMBER:
+        assert match is not None
+        user_number = int(match["user_number"])
+        if user_number == user.user_number:
+            return AuthorizationDecision(policy=route.policy, user=user, user_number=user_number)
+        raise HTTPException(HTTPStatus.FORBIDDEN, detail="Forbidden")
+
+    if route.policy is Policy.LIVE_INSTRUMENT:
+        instrument = _get_live_instrument(match, query)
+        await _check_live_instrument(user, instrument)
+        return AuthorizationDecision(policy=route.policy, user=user, instrument=instrument)
+
+    experiment_number = _get_experiment_number(match, query_string)
+    if await user_can_access_experiment(user, experiment_number):
+        return AuthorizationDecision(policy=route.policy, user=user, experiment_number=experiment_number)
+    raise HTTPException(HTTPStatus.FORBIDDEN, detail="Forbidden")
+
+
+async def authorize_experiments(decision: AuthorizationDecision | None, experiment_numbers: Iterable[int]) -> None:
+    """
+    Check the requester may access every experiment, for endpoints that take experiment numbers in the request body
+    rather than the path
+    :param decision: The authorization decision of the request, None when authorization is disabled in dev mode
+    :param experiment_numbers: The experiment numbers to check
+    :return: None, raises HTTPException if any experiment is not allowed
+    """
+    if decision is None or decision.privileged:
+        return
+    if decision.user is None:
+        raise HTTPException(HTTPStatus.FORBIDDEN, detail="Forbidden")
+    for experiment_number in dict.fromkeys(experiment_numbers):
+        if not await user_can_access_experiment(decision.user, experiment_number):
+            raise HTTPException(HTTPStatus.FORBIDDEN, detail=f"Forbidden: no access to experiment {experiment_number}")
+
+
+class AuthorizationMiddleware:
+    """
+    Pure ASGI middleware that authorizes every http request once, attaching the decision and user to request.state
+    """
+
+    def __init__(self, app: "ASGIApp", dev_mode: bool = False) -> None:
+        """
+        :param app: The wrapped ASGI app
+        :param dev_mode: Skip authorization entirely when running in development mode
+        """
+        self.app = app
+        self.dev_mode = dev_mode
+
+    async def __call__(self, scope: "Scope", receive: "Receive", send: "Send") -> None:
+        if scope["type"] != "http" or self.dev_mode:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            decision = await authorize(scope)
+        except HTTPException as exc:
+            response = JSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+            await response(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+        state["authorization"] = decision
+        state["user"] = decision.user
+        await self.app(scope, receive, send)
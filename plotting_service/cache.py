@@ -0,0 +1,173 @@
+"""
+In-process caching primitives shared by the service
+"""
+
+import threading
+import time
+import typing
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+
+K = typing.TypeVar("K", bound=Hashable)
+V = typing.TypeVar("V")
+
+
+@dataclass
+class _Entry(typing.Generic[V]):
+    value: V
+    fresh_until: float
+    stale_until: float
+
+
+class TTLCache(typing.Generic[K, V]):
+    """
+    Thread safe, size bounded LRU cache where every entry expires after a time to live. Entries that have expired but
+    are still inside the stale window can be looked up as stale, allowing callers to serve them while refreshing.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        stale_ttl: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        :param max_size: The maximum number of entries held before the least recently used is evicted
+        :param ttl: Default number of seconds an entry is fresh for
+        :param stale_ttl: Number of seconds after going stale that an entry can still be served as stale
+        :param clock: Monotonic clock used for expiry, replaceable for testing
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._entries: OrderedDict[K, _Entry[V]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key, record=False) is not None
+
+    def lookup(self, key: K, record: bool = True) -> tuple[V, bool] | None:
+        """
+        Look up a key, returning the value and whether it is stale, or None if missing or expired
+        :param key: The key to look up
+        :param record: Whether this lookup counts towards the hit and miss counters
+        :return: Tuple of (value, is_stale) or None
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now >= entry.stale_until:
+                if entry is not None:
+                    del self._entries[key]
+                if record:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            stale = now >= entry.fresh_until
+            if record:
+                if stale:
+                    self.stale_hits += 1
+                else:
+                    self.hits += 1
+            return entry.value, stale
+
+    def get(self, key: K, record: bool = True) -> V | None:
+        """
+        Return the fresh value for a key, or None if it is missing or stale
+        :param key: The key to look up
+        :param record: Whether this lookup counts towards the hit and miss counters
+        :return: The value or None
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now >= entry.fresh_until:
+                if record:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if record:
+                self.hits += 1
+            return entry.value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        """
+        Store a value, evicting the least recently used entries if the cache is full
+        :param key: The key to store against
+        :param value: The value to store
+        :param ttl: Seconds the entry is fresh for, defaults to the cache ttl
+        :return: None
+        """
+        now = self._clock()
+        fresh_until = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = _Entry(value, fresh_until, fresh_until + self.stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def items(self) -> list[tuple[K, V]]:
+        """
+        Return the fresh entries without counting as lookups
+        :return: List of (key, value) from least to most recently used
+        """
+        now = self._clock()
+        with self._lock:
+            return [(key, entry.value) for key, entry in self._entries.items() if now < entry.fresh_until]
+
+    def invalidate(self, key: K) -> bool:
+        """
+        Remove a single key from the cache
+        :param key: The key to remove
+        :return: Whether the key was present
+        """
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def invalidate_where(self, predicate: Callable[[K], bool]) -> int:
+        """
+        Remove every key matching a predicate
+        :param predicate: Called with each key, keys it returns True for are removed
+        :return: The number of keys removed
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        """
+        Remove every entry from the cache, counters are kept
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Return the counters and occupancy of the cache
+        :return: Dictionary of cache statistics
+        """
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            }
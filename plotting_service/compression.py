@@ -0,0 +1,391 @@
+"""
+Content aware response compression, negotiating zstd, brotli or gzip from Accept-Encoding
+"""
+
+import logging
+import os
+import threading
+import time
+import typing
+import zlib
+from collections import defaultdict
+from collections.abc import Callable
+
+import numpy as np
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+if typing.TYPE_CHECKING:
+    from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get("COMPRESSION_MINIMUM_SIZE", "1000"))
+COMPRESSION_ENCODINGS = os.environ.get("COMPRESSION_ENCODINGS", "zstd,br,gzip")
+COMPRESSION_LEVELS = {
+    "zstd": int(os.environ.get("COMPRESSION_ZSTD_LEVEL", "3")),
+    "br": int(os.environ.get("COMPRESSION_BROTLI_LEVEL", "4")),
+    "gzip": int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6")),
+}
+# Bodies whose first SAMPLE_SIZE bytes compress worse than this ratio are sent uncompressed
+COMPRESSION_SAMPLE_RATIO = float(os.environ.get("COMPRESSION_SAMPLE_RATIO", "0.9"))
+SAMPLE_SIZE = 64 * 1024
+
+# Formats that are already compressed, or that must reach the client as soon as they are written
+SKIPPED_CONTENT_TYPES = (
+    "image/png",
+    "image/jpeg",
+    "image/webp",
+    "image/gif",
+    "application/zip",
+    "application/gzip",
+    "application/zstd",
+    "text/event-stream",
+)
+
+
+class _Encoder(typing.Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+    def finish(self) -> bytes: ...
+
+
+class _GzipEncoder:
+    def __init__(self, level: int) -> None:
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int) -> None:
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return typing.cast("bytes", self._compressor.compress(data))
+
+    def flush(self) -> bytes:
+        return typing.cast("bytes", self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+
+    def finish(self) -> bytes:
+        return typing.cast("bytes", self._compressor.flush())
+
+
+class _BrotliEncoder:
+    def __init__(self, level: int) -> None:
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return typing.cast("bytes", self._compressor.process(data))
+
+    def flush(self) -> bytes:
+        return typing.cast("bytes", self._compressor.flush())
+
+    def finish(self) -> bytes:
+        return typing.cast("bytes", self._compressor.finish())
+
+
+ENCODERS: dict[str, Callable[[int], _Encoder]] = {"gzip": _GzipEncoder}
+if zstandard is not None:
+    ENCODERS["zstd"] = _ZstdEncoder
+if brotli is not None:
+    ENCODERS["br"] = _BrotliEncoder
+
+
+def choose_encoding(accept_encoding: str, preference: list[str]) -> str | None:
+    """
+    Choose the encoding the client weights highest, breaking ties by the server preference
+    :param accept_encoding: The Accept-Encoding header
+    :param preference: Available encodings, most preferred first
+    :return: The encoding, or None to send the response as it is
+    """
+    weights: dict[str, float] = {}
+    for member in accept_encoding.split(","):
+        name, _, params = member.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                continue
+        weights[name.strip().lower()] = weight
+    wildcard = weights.get("*", 0.0)
+    best = None
+    best_weight = 0.0
+    for encoding in preference:
+        weight = weights.get(encoding, wildcard)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def byte_shuffle(data: bytes, item_size: int) -> bytes:
+    """
+    Group the first bytes of every item together, then the second bytes and so on, which makes numeric arrays far more
+    compressible as the high bytes of neighbouring values are usually equal
+    :param data: The array bytes
+    :param item_size: Bytes per item
+    :return: The shuffled bytes, any trailing partial item is left at the end
+    """
+    items = len(data) // item_size
+    shuffled = np.frombuffer(data, dtype=np.uint8, count=items * item_size).reshape(items, item_size).T.tobytes()
+    return shuffled + data[items * item_size :]
+
+
+def compression(enabled: bool) -> Callable[[Request], None]:
+    """
+    Create a route dependency that turns compression on or off regardless of the content type and sampled ratio
+    :param enabled: Whether responses of the route are compressed
+    :return: The dependency
+    """
+
+    def dependency(request: Request) -> None:
+        request.state.compression = enabled
+
+    return dependency
+
+
+class CompressionMetrics:
+    """Counts the bytes in and out of and time spent by each encoding, and the reasons responses were not compressed"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._encodings: dict[str, dict[str, float]] = defaultdict(
+            lambda: {"responses": 0, "bytes_in": 0, "bytes_out": 0, "seconds": 0.0}
+        )
+        self._skipped: dict[str, int] = defaultdict(int)
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int, seconds: float) -> None:
+        """
+        Record a compressed response, or part of a streamed one
+        :param encoding: The encoding used
+        :param bytes_in: Bytes before compression
+        :param bytes_out: Bytes after compression
+        :param seconds: Time spent compressing
+        :return: None
+        """
+        with self._lock:
+            counters = self._encodings[encoding]
+            counters["bytes_in"] += bytes_in
+            counters["bytes_out"] += bytes_out
+            counters["seconds"] += seconds
+
+    def record_response(self, encoding: str) -> None:
+        """
+        Count a response compressed with an encoding
+        :param encoding: The encoding used
+        :return: None
+        """
+        with self._lock:
+            self._encodings[encoding]["responses"] += 1
+
+    def skip(self, reason: str) -> None:
+        """
+        Count a response sent uncompressed
+        :param reason: Why it was not compressed
+        :return: None
+        """
+        with self._lock:
+            self._skipped[reason] += 1
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Return the counters and the compression ratio of each encoding
+        :return: Dictionary of compression statistics
+        """
+        with self._lock:
+            return {
+                "available": list(ENCODERS),
+                "encodings": {
+                    encoding: {
+                        **counters,
+                        "ratio": counters["bytes_out"] / counters["bytes_in"] if counters["bytes_in"] else 0.0,
+                    }
+                    for encoding, counters in self._encodings.items()
+                },
+                "skipped": dict(self._skipped),
+            }
+
+    def clear(self) -> None:
+        """
+        Reset every counter
+        :return: None
+        """
+        with self._lock:
+            self._encodings.clear()
+            self._skipped.clear()
+
+
+compression_metrics = CompressionMetrics()
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware compressing responses with the best encoding the client accepts. Formats that are already
+    compressed, partial content and bodies whose first bytes barely compress are sent as they are, unless the route
+    opts in with the compression dependency. Responses declaring their item size in an X-Item-Size header are byte
+    shuffled first when the client sends X-Accept-Byte-Shuffle, which the response reports in X-Byte-Shuffle.
+    """
+
+    def __init__(
+        self,
+        app: "ASGIApp",
+        minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+        encodings: str = COMPRESSION_ENCODINGS,
+        levels: dict[str, int] | None = None,
+    ) -> None:
+        """
+        :param app: The wrapped ASGI app
+        :param minimum_size: Bodies smaller than this are not compressed
+        :param encodings: Comma separated encodings to offer, most preferred first, unavailable ones are ignored
+        :param levels: Compression level of each encoding
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.preference = [encoding.strip() for encoding in encodings.split(",") if encoding.strip() in ENCODERS]
+        self.levels = {**COMPRESSION_LEVELS, **(levels or {})}
+
+    async def __call__(self, scope: "Scope", receive: "Receive", send: "Send") -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""), self.preference)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _Responder(self, scope, send, encoding, "x-accept-byte-shuffle" in request_headers)
+        await self.app(scope, receive, responder.send)
+
+
+class _Responder:
+    """Compresses one response, deciding from its headers and first body message"""
+
+    def __init__(
+        self, middleware: CompressionMiddleware, scope: "Scope", send: "Send", encoding: str, shuffle: bool
+    ) -> None:
+        self.middleware = middleware
+        self.scope = scope
+        self.downstream = send
+        self.encoding = encoding
+        self.shuffle = shuffle
+        self.start: Message | None = None
+        self.encoder: _Encoder | None = None
+        self.passthrough = False
+
+    def _skip_reason(self, headers: MutableHeaders) -> str | None:
+        assert self.start is not None
+        if self.start["status"] in (204, 206, 304) or "content-encoding" in headers:
+            return "not_applicable"
+        policy = self.scope.get("state", {}).get("compression")
+        if policy is False:
+            return "route"
+        if policy is None and headers.get("content-type", "").split(";")[0].strip() in SKIPPED_CONTENT_TYPES:
+            return "content_type"
+        return None
+
+    def _new_encoder(self) -> _Encoder:
+        return ENCODERS[self.encoding](self.middleware.levels[self.encoding])
+
+    async def send(self, message: "Message") -> None:
+        if self.passthrough:
+            await self.downstream(message)
+            return
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.downstream(message)
+            return
+        if self.encoder is not None:
+            await self._send_streamed(message)
+            return
+
+        assert self.start is not None
+        headers = MutableHeaders(raw=self.start["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        reason = self._skip_reason(headers)
+        if reason is None and not more_body and len(body) < self.middleware.minimum_size:
+            reason = "small"
+        if reason is not None:
+            compression_metrics.skip(reason)
+            self.passthrough = True
+            await self.downstream(self.start)
+            await self.downstream(message)
+            return
+
+        headers.add_vary_header("Accept-Encoding")
+        if more_body:
+            headers["Content-Encoding"] = self.encoding
+            del headers["Content-Length"]
+            self.encoder = self._new_encoder()
+            await self.downstream(self.start)
+            await self._send_streamed(message)
+            return
+        await self._send_whole(headers, body)
+
+    async def _send_whole(self, headers: MutableHeaders, body: bytes) -> None:
+        assert self.start is not None
+        started = time.perf_counter()
+        item_size = int(headers.get("x-item-size", "1"))
+        payload = byte_shuffle(body, item_size) if self.shuffle and item_size > 1 else body
+        forced = self.scope.get("state", {}).get("compression") is True
+        compressed = None
+        if forced or len(payload) <= SAMPLE_SIZE or self._sample_compresses(payload):
+            encoder = self._new_encoder()
+            compressed = encoder.compress(payload) + encoder.finish()
+        seconds = time.perf_counter() - started
+
+        self.passthrough = True
+        if compressed is None or len(compressed) >= len(body):
+            compression_metrics.skip("incompressible")
+            await self.downstream(self.start)
+            await self.downstream({"type": "http.response.body", "body": body})
+            return
+        compression_metrics.record(self.encoding, len(body), len(compressed), seconds)
+        compression_metrics.record_response(self.encoding)
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        if payload is not body:
+            headers["X-Byte-Shuffle"] = str(item_size)
+            exposed = headers.get("access-control-expose-headers")
+            headers["Access-Control-Expose-Headers"] = f"{exposed}, X-Byte-Shuffle" if exposed else "X-Byte-Shuffle"
+        await self.downstream(self.start)
+        await self.downstream({"type": "http.response.body", "body": compressed})
+
+    def _sample_compresses(self, payload: bytes) -> bool:
+        encoder = self._new_encoder()
+        sample = encoder.compress(payload[:SAMPLE_SIZE]) + encoder.finish()
+        return len(sample) < SAMPLE_SIZE * COMPRESSION_SAMPLE_RATIO
+
+    async def _send_streamed(self, message: "Message") -> None:
+        assert self.encoder is not None
+        started = time.perf_counter()
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        compressed = self.encoder.compress(body) + (self.encoder.flush() if more_body else self.encoder.finish())
+        compression_metrics.record(self.encoding, len(body), len(compressed), time.perf_counter() - started)
+        if not more_body:
+            compression_metrics.record_response(self.encoding)
+        await self.downstream({"type": "http.response.body", "body": compressed, "more_body": more_body})
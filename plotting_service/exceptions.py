@@ -5,3 +5,19 @@ Custom exceptions
 
 class AuthError(Exception):
     """Problem with auth"""
+
+
+class AuthServiceUnavailableError(RuntimeError):
+    """The auth api could not be reached or is being short circuited"""
+
+    def __init__(self, message: str = "Could not contact the auth api", retry_after: float | None = None) -> None:
+        """
+        :param message: What went wrong
+        :param retry_after: Seconds until the auth api will be tried again, None if unknown
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BlockingIOTimeoutError(TimeoutError):
+    """Blocking filesystem or decode work did not finish in time"""
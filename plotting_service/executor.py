@@ -0,0 +1,190 @@
+"""
+Bounded thread pool for blocking filesystem and decode work
+"""
+
+import asyncio
+import enum
+import functools
+import logging
+import os
+import threading
+import typing
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from plotting_service.exceptions import BlockingIOTimeoutError
+
+logger = logging.getLogger(__name__)
+
+T = typing.TypeVar("T")
+
+FS_EXECUTOR_WORKERS = int(os.environ.get("FS_EXECUTOR_WORKERS", "32"))
+FS_METADATA_LIMIT = int(os.environ.get("FS_METADATA_LIMIT", "16"))
+FS_BULK_READ_LIMIT = int(os.environ.get("FS_BULK_READ_LIMIT", "8"))
+FS_IMAGE_DECODE_LIMIT = int(os.environ.get("FS_IMAGE_DECODE_LIMIT", str(os.cpu_count() or 4)))
+FS_TIMEOUT = float(os.environ.get("FS_TIMEOUT", "30"))
+
+
+class IOCategory(enum.Enum):
+    """Kinds of blocking work, each with its own concurrency limit"""
+
+    METADATA = "metadata"
+    BULK_READ = "bulk_read"
+    IMAGE_DECODE = "image_decode"
+
+
+class _CategoryStats:
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.queued = 0
+        self.max_queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "limit": self.limit,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+        }
+
+
+class BlockingExecutor:
+    """
+    Runs blocking callables on a dedicated thread pool so they do not stall the event loop. Each category of work has
+    its own concurrency limit, so a burst of slow metadata calls cannot starve image decoding and vice versa. A slot is
+    only released once its thread has finished, so timed out work still counts towards the limit.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = FS_EXECUTOR_WORKERS,
+        limits: dict[IOCategory, int] | None = None,
+        timeout: float = FS_TIMEOUT,
+    ) -> None:
+        """
+        :param max_workers: Number of threads in the pool
+        :param limits: Maximum concurrent calls per category
+        :param timeout: Default seconds a call may take, including waiting for a slot
+        """
+        limits = limits or {
+            IOCategory.METADATA: FS_METADATA_LIMIT,
+            IOCategory.BULK_READ: FS_BULK_READ_LIMIT,
+            IOCategory.IMAGE_DECODE: FS_IMAGE_DECODE_LIMIT,
+        }
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool: ThreadPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+        self._stats = {category: _CategoryStats(limits[category]) for category in IOCategory}
+        self._semaphores: dict[IOCategory, asyncio.Semaphore] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="blocking-io")
+            return self._pool
+
+    def _get_semaphore(self, category: IOCategory) -> asyncio.Semaphore:
+        """
+        Return the semaphore limiting a category, recreating them if used from another event loop
+        :param category: The category of work
+        :return: The semaphore
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphores = {category: asyncio.Semaphore(stats.limit) for category, stats in self._stats.items()}
+        return self._semaphores[category]
+
+    async def _run(self, category: IOCategory, call: Callable[[], T]) -> T:
+        stats = self._stats[category]
+        semaphore = self._get_semaphore(category)
+        stats.queued += 1
+        stats.max_queued = max(stats.max_queued, stats.queued)
+        try:
+            await semaphore.acquire()
+        finally:
+            stats.queued -= 1
+
+        def release(future: "asyncio.Future[T]") -> None:
+            stats.running -= 1
+            semaphore.release()
+            if not future.cancelled() and future.exception() is None:
+                stats.completed += 1
+            else:
+                stats.failed += 1
+
+        stats.running += 1
+        future = asyncio.get_running_loop().run_in_executor(self._get_pool(), call)
+        future.add_done_callback(release)
+        return await asyncio.shield(future)
+
+    async def run(
+        self,
+        category: IOCategory,
+        func: Callable[..., T],
+        *args: typing.Any,
+        timeout: float | None = None,
+        **kwargs: typing.Any,
+    ) -> T:
+        """
+        Run a blocking callable in the pool
+        :param category: The category of work, used for concurrency limits and metrics
+        :param func: The blocking callable
+        :param args: Positional arguments for the callable
+        :param timeout: Seconds to allow, defaults to the executor timeout
+        :param kwargs: Keyword arguments for the callable
+        :return: The result of the callable
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(self._run(category, functools.partial(func, *args, **kwargs)), timeout)
+        except TimeoutError:
+            self._stats[category].timeouts += 1
+            name = getattr(func, "__name__", repr(func))
+            logger.warning("Blocking %s call %s timed out after %ss", category.value, name, timeout)
+            raise BlockingIOTimeoutError(f"{category.value} call timed out after {timeout} seconds") from None
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Return the queue depth and counters of each category
+        :return: Dictionary of executor statistics
+        """
+        return {
+            "max_workers": self.max_workers,
+            "timeout": self.timeout,
+            "categories": {category.value: stats.as_dict() for category, stats in self._stats.items()},
+        }
+
+    def shutdown(self) -> None:
+        """
+        Stop the thread pool without waiting for running calls
+        :return: None
+        """
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+blocking_executor = BlockingExecutor()
+
+
+async def run_blocking(category: IOCategory, func: Callable[..., T], *args: typing.Any, **kwargs: typing.Any) -> T:
+    """
+    Run a blocking callable on the shared executor
+    :param category: The category of work
+    :param func: The blocking callable
+    :param args: Positional arguments for the callable
+    :param kwargs: Keyword arguments for the callable
+    :return: The result of the callable
+    """
+    return await blocking_executor.run(category, func, *args, **kwargs)
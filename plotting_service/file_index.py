@@ -0,0 +1,466 @@
+"""
+Filename indexes of the reduced data directories, replacing a recursive scan per lookup
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+import typing
+from collections.abc import Callable, Hashable, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+from plotting_service.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+FILE_INDEX_REFRESH_INTERVAL = float(os.environ.get("FILE_INDEX_REFRESH_INTERVAL", "30"))
+FILE_INDEX_MISS_REFRESH_INTERVAL = float(os.environ.get("FILE_INDEX_MISS_REFRESH_INTERVAL", "1"))
+FILE_INDEX_MAX_FILES = int(os.environ.get("FILE_INDEX_MAX_FILES", "500000"))
+FILE_INDEX_MAX_ROOTS = int(os.environ.get("FILE_INDEX_MAX_ROOTS", "256"))
+# A few hundred bytes per indexed file, so a few hundred megabytes across every index
+FILE_INDEX_MAX_TOTAL_FILES = int(os.environ.get("FILE_INDEX_MAX_TOTAL_FILES", "1000000"))
+FILE_INDEX_IDLE_TTL = float(os.environ.get("FILE_INDEX_IDLE_TTL", "3600"))
+NEGATIVE_LOOKUP_TTL = float(os.environ.get("NEGATIVE_LOOKUP_TTL", "10"))
+NEGATIVE_LOOKUP_MAX_SIZE = int(os.environ.get("NEGATIVE_LOOKUP_MAX_SIZE", "16384"))
+
+# Directory mtimes are only trusted once they are older than this, a directory listed within the same timestamp tick
+# as a write to it could otherwise hide that write until it is modified again
+_MTIME_GRACE_NS = 2_000_000_000
+_GLOB_CHARACTERS = frozenset("*?[")
+# Shared by every index, so an index created again after being dropped never reuses the version of the old one
+_versions = itertools.count()
+
+
+@dataclass
+class _Directory:
+    mtime_ns: int | None
+    files: tuple[str, ...]
+    subdirs: tuple[str, ...]
+
+
+class IndexTooLargeError(Exception):
+    """Raised when a directory tree holds more files than an index may hold"""
+
+
+class FileIndex:
+    """
+    Map of filename to the directories containing it for every file below a root directory. The index is refreshed
+    incrementally: every directory is stat'ed but only those whose mtime changed are listed again. The version changes
+    whenever a refresh finds a file or directory added or removed.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        refresh_interval: float = FILE_INDEX_REFRESH_INTERVAL,
+        miss_refresh_interval: float = FILE_INDEX_MISS_REFRESH_INTERVAL,
+        max_files: int = FILE_INDEX_MAX_FILES,
+    ) -> None:
+        """
+        :param root: The directory to index
+        :param refresh_interval: Seconds a refreshed index is trusted for before the next lookup refreshes it
+        :param miss_refresh_interval: Minimum seconds between refreshes triggered by a lookup missing
+        :param max_files: The most files the index may hold, larger trees are always scanned
+        """
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self.miss_refresh_interval = miss_refresh_interval
+        self.max_files = max_files
+        self.ready = False
+        self.too_large = False
+        self.refreshes = 0
+        self.file_count = 0
+        self.version = next(_versions)
+        self._directories: dict[str, _Directory] = {}
+        self._names: dict[str, set[str]] = {}
+        self._refreshed_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._data_lock = threading.Lock()
+
+    @property
+    def refreshing(self) -> bool:
+        """Whether a refresh is running"""
+        return self._refresh_lock.locked()
+
+    def refresh(self) -> None:
+        """
+        Bring the index up to date with the directory tree, listing only directories that changed
+        :return: None
+        """
+        with self._refresh_lock:
+            started = time.monotonic()
+            try:
+                directories, changed = self._walk()
+            except IndexTooLargeError:
+                logger.warning("Not indexing %s, it holds more than %s files", self.root, self.max_files)
+                with self._data_lock:
+                    self.too_large = True
+                    self.ready = False
+                    self._directories = {}
+                    self._names = {}
+                    self.file_count = 0
+                return
+            removed = [
+                (relative_dir, self._directories[relative_dir], None)
+                for relative_dir in self._directories.keys() - directories.keys()
+            ]
+            with self._data_lock:
+                for relative_dir, old, new in [*removed, *changed]:
+                    if old is not None:
+                        self._remove_files(relative_dir, old.files)
+                    if new is not None:
+                        self._add_files(relative_dir, new.files)
+                    if _listing(old) != _listing(new):
+                        self.version = next(_versions)
+                self._directories = directories
+                self.ready = True
+            self._refreshed_at = time.monotonic()
+            self.refreshes += 1
+            logger.debug("Refreshed index of %s in %.3fs", self.root, self._refreshed_at - started)
+
+    def _walk(self) -> tuple[dict[str, _Directory], list[tuple[str, _Directory | None, _Directory | None]]]:
+        """
+        Stat every directory below the root, listing those that are new or changed
+        :return: Tuple of every directory and the (relative_dir, old, new) listings of those that changed
+        """
+        now_ns = time.time_ns()
+        directories: dict[str, _Directory] = {}
+        changed: list[tuple[str, _Directory | None, _Directory | None]] = []
+        file_count = self.file_count
+        pending = [""]
+        while pending:
+            relative_dir = pending.pop()
+            path = os.path.join(self.root, relative_dir)  # noqa: PTH118
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns  # noqa: PTH116
+            except OSError:
+                continue
+            directory = self._directories.get(relative_dir)
+            if directory is None or directory.mtime_ns != mtime_ns:
+                trusted_mtime_ns = mtime_ns if now_ns - mtime_ns > _MTIME_GRACE_NS else None
+                listed = self._list(path, relative_dir, trusted_mtime_ns)
+                file_count += len(listed.files) - (len(directory.files) if directory is not None else 0)
+                if file_count > self.max_files:
+                    raise IndexTooLargeError(self.root)
+                changed.append((relative_dir, directory, listed))
+                directory = listed
+            directories[relative_dir] = directory
+            pending.extend(directory.subdirs)
+        return directories, changed
+
+    @staticmethod
+    def _list(path: str, relative_dir: str, mtime_ns: int | None) -> _Directory:
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(os.path.join(relative_dir, entry.name))  # noqa: PTH118
+                    else:
+                        files.append(entry.name)
+        except OSError:
+            return _Directory(mtime_ns=None, files=(), subdirs=())
+        return _Directory(mtime_ns=mtime_ns, files=tuple(files), subdirs=tuple(subdirs))
+
+    def _add_files(self, relative_dir: str, files: tuple[str, ...]) -> None:
+        for name in files:
+            self._names.setdefault(name, set()).add(relative_dir)
+        self.file_count += len(files)
+
+    def _remove_files(self, relative_dir: str, files: tuple[str, ...]) -> None:
+        for name in files:
+            dirs = self._names.get(name)
+            if dirs is not None:
+                dirs.discard(relative_dir)
+                if not dirs:
+                    del self._names[name]
+        self.file_count -= len(files)
+
+    def _find_indexed(self, filename: str) -> Path | None:
+        with self._data_lock:
+            dirs = self._names.get(filename)
+            if not dirs:
+                return None
+            # Prefer the shallowest match so results do not depend on directory listing order
+            relative_dir = min(dirs, key=lambda directory: (directory.count(os.sep), directory))
+        return self.root / relative_dir / filename
+
+    def changed_since(self, version: int) -> bool:
+        """
+        Check whether any file or directory was added or removed since a version, refreshing the index at most once
+        per miss refresh interval
+        :param version: A version of this index
+        :return: Whether the tree changed
+        """
+        if time.monotonic() - self._refreshed_at > self.miss_refresh_interval:
+            self.refresh()
+        return not self.ready or self.version != version
+
+    def find(self, filename: str) -> Path | None:
+        """
+        Find a file anywhere below the root, refreshing the index if it is out of date or the file is not in it
+        :param filename: The name of the file
+        :return: Path to the file or None
+        """
+        if not self.ready or time.monotonic() - self._refreshed_at > self.refresh_interval:
+            self.refresh()
+        found = self._find_indexed(filename)
+        if found is not None and found.exists():
+            return found
+        if time.monotonic() - self._refreshed_at > self.miss_refresh_interval:
+            self.refresh()
+            found = self._find_indexed(filename)
+            if found is not None and found.exists():
+                return found
+        return None
+
+
+def _listing(directory: _Directory | None) -> tuple[frozenset[str], frozenset[str]] | None:
+    """The files and subdirectories of a listed directory, unchanged when it is listed again for an untrusted mtime"""
+    return None if directory is None else (frozenset(directory.files), frozenset(directory.subdirs))
+
+
+def _is_pattern(filename: str) -> bool:
+    """
+    Whether a filename has to be matched by globbing rather than looked up by name
+    :param filename: The file name or glob pattern
+    :return: True if it contains glob characters or a path separator
+    """
+    return bool(_GLOB_CHARACTERS.intersection(filename)) or os.sep in filename
+
+
+def _scan(dir_path: Path, filename: str) -> Path | None:
+    """
+    Search a directory tree for a file, stopping at the first match
+    :param dir_path: The directory to search
+    :param filename: The file name or glob pattern to find
+    :return: Path to the file or None
+    """
+    return next((path for path in dir_path.rglob(filename) if path.exists()), None)
+
+
+def _scan_many(dir_path: Path, filenames: Iterable[str]) -> dict[str, Path | None]:
+    """
+    Walk a directory tree once, stopping as soon as every file has been found
+    :param dir_path: The directory to search
+    :param filenames: The names of the files
+    :return: Mapping of each filename to the first path found or None
+    """
+    found: dict[str, Path | None] = dict.fromkeys(filenames)
+    remaining = set(found)
+    for directory, _, files in os.walk(dir_path):
+        for filename in remaining.intersection(files):
+            found[filename] = Path(directory) / filename
+        remaining.difference_update(files)
+        if not remaining:
+            break
+    return found
+
+
+class FileIndexRegistry:
+    """
+    The shared indexes of every searched directory. Indexes are built in the background the first time a directory is
+    searched, lookups scan the directory until then. Indexes not used for a while are dropped to bound memory, as are
+    the least recently used once every index together holds more files than the budget.
+    """
+
+    def __init__(
+        self,
+        max_roots: int = FILE_INDEX_MAX_ROOTS,
+        idle_ttl: float = FILE_INDEX_IDLE_TTL,
+        max_total_files: int = FILE_INDEX_MAX_TOTAL_FILES,
+        miss_refresh_interval: float = FILE_INDEX_MISS_REFRESH_INTERVAL,
+    ) -> None:
+        """
+        :param max_roots: The most directories indexed at once
+        :param idle_ttl: Seconds an unused index is kept for
+        :param max_total_files: The most files held across every index, the index in use is kept even if it is larger
+        :param miss_refresh_interval: Minimum seconds between refreshes of an index triggered by a lookup missing
+        """
+        self._indexes: TTLCache[Path, FileIndex] = TTLCache(max_size=max_roots, ttl=idle_ttl)
+        self._lock = threading.Lock()
+        self.max_total_files = max_total_files
+        self.miss_refresh_interval = miss_refresh_interval
+        self.scans = 0
+        self.evictions = 0
+
+    def get(self, root: Path) -> FileIndex:
+        """
+        Return the index of a directory, creating an empty one if there is none
+        :param root: The directory
+        :return: The index of the directory
+        """
+        with self._lock:
+            index = self._indexes.get(root, record=False)
+            if index is None:
+                index = FileIndex(root, miss_refresh_interval=self.miss_refresh_interval)
+            # Storing again on every use keeps indexes in use from expiring
+            self._indexes.set(root, index)
+            self._evict_beyond_budget(root)
+            return index
+
+    def peek(self, root: Path) -> FileIndex | None:
+        """
+        Return the index of a directory without creating one or counting as a use
+        :param root: The directory
+        :return: The index of the directory or None
+        """
+        return self._indexes.get(root, record=False)
+
+    def _evict_beyond_budget(self, keep: Path) -> None:
+        """Drop the least recently used indexes while every index together holds too many files, lock must be held"""
+        indexes = self._indexes.items()
+        # Indexes grow as they are built in the background, so the total is checked on every use
+        total = sum(index.file_count for _, index in indexes)
+        for root, index in indexes:
+            if total <= self.max_total_files:
+                break
+            if root != keep:
+                self._indexes.invalidate(root)
+                total -= index.file_count
+                self.evictions += 1
+
+    def find(self, dir_path: Path, filename: str) -> Path | None:
+        """
+        Find a file anywhere below a directory
+        :param dir_path: The directory to search
+        :param filename: The name of the file
+        :return: Path to the file or None
+        """
+        if _is_pattern(filename):
+            self.scans += 1
+            return _scan(dir_path, filename)
+        index = self.get(dir_path)
+        if index.ready:
+            return index.find(filename)
+        if not index.too_large:
+            self._build_in_background(index)
+        self.scans += 1
+        return _scan(dir_path, filename)
+
+    def find_many(self, dir_path: Path, filenames: Iterable[str]) -> dict[str, Path | None]:
+        """
+        Find several files below a directory with at most one traversal of it, building its index if needed
+        :param dir_path: The directory to search
+        :param filenames: The names of the files
+        :return: Mapping of each filename to its path or None
+        """
+        index = self.get(dir_path)
+        if not index.ready and not index.too_large:
+            index.refresh()
+        names = [filename for filename in filenames if not _is_pattern(filename)]
+        patterns = [filename for filename in filenames if _is_pattern(filename)]
+        if index.ready:
+            found = {filename: index.find(filename) for filename in names}
+        else:
+            self.scans += 1
+            found = _scan_many(dir_path, names)
+        self.scans += len(patterns)
+        return found | {pattern: _scan(dir_path, pattern) for pattern in patterns}
+
+    @staticmethod
+    def _build_in_background(index: FileIndex) -> None:
+        if index.refreshing:
+            return
+        threading.Thread(target=index.refresh, name=f"file-index-{index.root.name}", daemon=True).start()
+
+    def clear(self) -> None:
+        """
+        Drop every index
+        :return: None
+        """
+        self._indexes.clear()
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return the number of indexes and the files they hold, and of lookups that had to scan
+        :return: Dictionary of registry statistics
+        """
+        return {
+            "indexes": len(self._indexes),
+            "indexed_files": sum(index.file_count for _, index in self._indexes.items()),
+            "index_evictions": self.evictions,
+            "scans": self.scans,
+        }
+
+
+class NegativeLookupCache:
+    """
+    Remembers lookups that found nothing, so polling for a file that has not been written yet costs a check of the
+    index of the directory searched rather than a search. An entry is dropped once it expires or the index finds a
+    file or directory added or removed anywhere below the directory. Misses in directories without a built index are
+    not remembered.
+    """
+
+    def __init__(
+        self,
+        registry: FileIndexRegistry,
+        max_size: int = NEGATIVE_LOOKUP_MAX_SIZE,
+        ttl: float = NEGATIVE_LOOKUP_TTL,
+    ) -> None:
+        """
+        :param registry: The indexes that tell whether a directory changed
+        :param max_size: The most misses remembered
+        :param ttl: Seconds a miss is remembered for
+        """
+        self._registry = registry
+        self._misses: TTLCache[Hashable, int] = TTLCache(max_size=max_size, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def find(self, key: Hashable, directory: Path, search: Callable[[], Path | None]) -> Path | None:
+        """
+        Run a search unless the same search recently found nothing and nothing below the directory changed since
+        :param key: Identifies the search
+        :param directory: The directory the search looks in
+        :param search: The search to run
+        :return: Path to the file or None
+        """
+        index = self._registry.peek(directory)
+        remembered = self._misses.get(key, record=False)
+        if remembered is not None and index is not None and not index.changed_since(remembered):
+            self.negative_hits += 1
+            return None
+        # Taken before the search, so a file written while searching changes the version
+        version = index.version if index is not None and index.ready else None
+        found = search()
+        if found is not None:
+            self.hits += 1
+            self._misses.invalidate(key)
+            return found
+        self.misses += 1
+        if version is not None:
+            self._misses.set(key, version)
+        else:
+            self._misses.invalidate(key)
+        return None
+
+    def clear(self) -> None:
+        """
+        Forget every remembered miss
+        :return: None
+        """
+        self._misses.clear()
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Return the lookup counters and the number of remembered misses
+        :return: Dictionary of lookup statistics
+        """
+        lookups = self.hits + self.misses + self.negative_hits
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "negative_entries": len(self._misses),
+            "negative_hit_ratio": self.negative_hits / lookups if lookups else 0.0,
+        }
+
+
+file_index_registry = FileIndexRegistry()
+negative_lookup_cache = NegativeLookupCache(file_index_registry)
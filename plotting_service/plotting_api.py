@@ -3,26 +3,32 @@
 import logging
 import os
 import sys
-import typing
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from http import HTTPStatus
 from pathlib import Path
 
-from fastapi import FastAPI, HTTPException
-from h5grove.fastapi_utils import router, settings  # type: ignore
+from fastapi import FastAPI
+from h5grove.fastapi_utils import settings  # type: ignore
 from starlette.middleware.cors import CORSMiddleware
-from starlette.middleware.gzip import GZipMiddleware
 from starlette.requests import Request
-
-from plotting_service.auth import get_experiments_for_user, get_user_from_token
-from plotting_service.exceptions import AuthError
+from starlette.responses import JSONResponse
+
+from plotting_service.auth import auth_client
+from plotting_service.authorization import AuthorizationMiddleware, auth_unavailable
+from plotting_service.compression import CompressionMiddleware
+from plotting_service.exceptions import AuthServiceUnavailableError, BlockingIOTimeoutError
+from plotting_service.executor import blocking_executor
+from plotting_service.routers.admin import AdminRouter
+from plotting_service.routers.auth import AuthRouter
+from plotting_service.routers.hdf5 import HDF5Router
 from plotting_service.routers.health import HealthRouter
-from plotting_service.routers.imat import ImatRouter
+from plotting_service.routers.imat import ImatRouter, latest_image_index
 from plotting_service.routers.live_data import LiveDataRouter
 from plotting_service.routers.plotting import PlottingRouter
-from plotting_service.utils import (
-    find_experiment_number,
-    get_current_rb_async,
-)
+from plotting_service.services.hdf5_service import h5_file_cache
+from plotting_service.services.pv_service import pv_manager
+from plotting_service.services.stack_service import frame_decoder
 
 stdout_handler = logging.StreamHandler(stream=sys.stdout)
 logging.basicConfig(
@@ -49,10 +55,41 @@ if DEV_MODE:
     logger.info("Development only mode")
 else:
     logger.info("Production ready mode")
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    """Start the IMAT image index, and release shared clients when the app shuts down."""
+    latest_image_index().start()
+    yield
+    latest_image_index().stop()
+    await auth_client.aclose()
+    await pv_manager.stop()
+    blocking_executor.shutdown()
+    frame_decoder.shutdown()
+    h5_file_cache.clear()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(BlockingIOTimeoutError)
+async def blocking_io_timeout_handler(_: Request, exc: BlockingIOTimeoutError) -> JSONResponse:
+    """Report slow filesystem or decode work as a gateway timeout rather than an internal error."""
+    return JSONResponse({"detail": str(exc)}, status_code=HTTPStatus.GATEWAY_TIMEOUT)
+
+
+@app.exception_handler(AuthServiceUnavailableError)
+async def auth_service_unavailable_handler(_: Request, exc: AuthServiceUnavailableError) -> JSONResponse:
+    """Report permissions that cannot be checked while the auth api is down as unavailable rather than an error."""
+    error = auth_unavailable(exc)
+    return JSONResponse({"detail": error.detail}, status_code=error.status_code, headers=error.headers)
+
 
 ALLOWED_ORIGINS = ["*"]
 
+# Added first so that it sits inside CORS and error responses still carry CORS headers
+app.add_middleware(AuthorizationMiddleware, dev_mode=DEV_MODE)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
@@ -60,147 +97,17 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+app.add_middleware(CompressionMiddleware)
 
 CEPH_DIR = os.environ.get("CEPH_DIR", "/ceph")
 logger.info("Setting ceph directory to %s", CEPH_DIR)
 settings.base_dir = Path(CEPH_DIR).resolve()
 
 
-@app.middleware("http")
-async def check_permissions(request: Request, call_next: typing.Callable[..., typing.Any]) -> typing.Any:  # noqa: C901, PLR0911
-    """Middleware that checks the requestee token has permissions for that
-    experiment
-    :param request: The request to check
-    :param call_next: The next call (the route function called)
-    :return: A response.
-    """
-    if DEV_MODE:
-        return await call_next(request)
-    if request.method == "OPTIONS":
-        return await call_next(request)
-    if request.url.path.startswith(("/live", "/healthz", "/docs")):
-        return await call_next(request)
-
-    logger.info(f"Checking permissions for {request.url.path}")
-
-    auth_header = request.headers.get("Authorization")
-    if auth_header is None:
-        raise HTTPException(HTTPStatus.UNAUTHORIZED, "Unauthenticated")
-
-    token = auth_header.split(" ")[1]
-
-    api_key = os.environ.get("API_KEY", "")
-    if token == api_key and api_key != "":
-        return await call_next(request)
-
-    try:
-        user = get_user_from_token(token)
-    except AuthError:
-        raise HTTPException(HTTPStatus.FORBIDDEN, detail="Forbidden") from None
-    logger.info("Checking role of user")
-    if user.role == "staff":
-        # Bypass permission check
-        return await call_next(request)
-
-    # Handle case without experiment number
-    if request.url.path.startswith("/find_file/generic/user_number/"):
-        # Does not have an experiment number! Extract user number and check based on that.
-        user_number = request.path_params["user_number"]
-        if user_number == user.user_number:
-            return await call_next(request)
-        raise HTTPException(HTTPStatus.FORBIDDEN, detail="Forbidden")
-
-    # Otherwise handle with experiment number
-    experiment_number = find_experiment_number(request)
-
-    logger.info("Checking experiments for user")
-    allowed_experiments = get_experiments_for_user(user)
-    if experiment_number in allowed_experiments:
-        return await call_next(request)
-
-    raise HTTPException(HTTPStatus.FORBIDDEN, detail="Forbidden")
-
-
-@app.middleware("http")
-async def check_live_permissions(request: Request, call_next: typing.Callable[..., typing.Any]) -> typing.Any:  # noqa: C901, PLR0911, PLR0912
-    """
-    Middleware for the live app that checks if the user has permission
-    to view the *current* experiment on the requested instrument.
-    """
-    if DEV_MODE:
-        return await call_next(request)
-    if request.method == "OPTIONS":
-        return await call_next(request)
-    if request.url.path in ("/healthz", "/docs", "/openapi.json"):
-        return await call_next(request)
-
-    logger.info(f"Checking live permissions for {request.url.path}")
-
-    token_query = request.query_params.get("token")
-    if token_query is None:
-        token_query = request.headers.get("Authorization")
-        if token_query is not None:
-            token_query = token_query.split(" ")[1]
-    if token_query is None:
-        raise HTTPException(HTTPStatus.UNAUTHORIZED, "Unauthenticated")
-
-    token = token_query
-
-    # API Key check (if applicable globally, otherwise remove/adapt)
-    api_key = os.environ.get("API_KEY", "")
-    if token == api_key and api_key != "":
-        return await call_next(request)
-
-    try:
-        user = get_user_from_token(token)
-    except AuthError:
-        raise HTTPException(HTTPStatus.FORBIDDEN, detail="Forbidden") from None
-
-    if user.role == "staff":
-        return await call_next(request)
-
-    file_param = request.query_params.get("file")
-    if not file_param:
-        logger.warning(f"Request to live app without 'file' param: {request.url}")
-
-        if request.url.path == "/":  # Root of sub-app
-            return await call_next(request)
-        raise HTTPException(HTTPStatus.BAD_REQUEST, "Missing 'file' parameter for live check")
-
-    # Assuming structure: INSTRUMENT/RBnumber/...
-    parts = Path(file_param).parts
-    if not parts or parts[0] == "/" or parts[0] == ".":
-        raise HTTPException(HTTPStatus.BAD_REQUEST, "Invalid file path format")
-
-    instrument = parts[0]
-
-    try:
-        current_rb = await get_current_rb_async(instrument)
-    except Exception as e:
-        logger.error(f"Failed to get current RB for instrument {instrument}: {e}")
-        # If we can't check 'live' status, fail safe
-        raise HTTPException(HTTPStatus.INTERNAL_SERVER_ERROR, "Unable to verify live experiment status") from None
-
-    try:
-        # It usually comes as just the number from the PV, but handle "RB" prefix just in case
-        current_rb_int = int(current_rb[2:]) if current_rb.upper().startswith("RB") else int(current_rb)
-    except ValueError:
-        logger.error(f"Invalid RB number format from PV: {current_rb}")
-        raise HTTPException(HTTPStatus.INTERNAL_SERVER_ERROR, "Invalid live experiment data") from None
-
-    logger.info(f"Checking if user {user.user_number} has access to current RB {current_rb_int} on {instrument}")
-    allowed_experiments = get_experiments_for_user(user)
-
-    if current_rb_int in allowed_experiments:
-        return await call_next(request)
-
-    logger.warning(f"User {user.user_number} denied access to live experiment {current_rb_int}")
-    raise HTTPException(HTTPStatus.FORBIDDEN, detail="Forbidden: You do not have access to the current live experiment")
-
-
-app.include_router(router)
+app.include_router(HDF5Router)
 app.include_router(HealthRouter)
 app.include_router(PlottingRouter)
 app.include_router(ImatRouter)
 app.include_router(LiveDataRouter)
+app.include_router(AdminRouter)
+app.include_router(AuthRouter)
@@ -0,0 +1,180 @@
+import os
+import secrets
+import typing
+from http import HTTPStatus
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from plotting_service.auth import decision_cache, experiment_cache, invalidate_user
+from plotting_service.compression import compression_metrics
+from plotting_service.executor import IOCategory, blocking_executor, run_blocking
+from plotting_service.file_index import file_index_registry, negative_lookup_cache
+from plotting_service.routers.imat import latest_image_index
+from plotting_service.services.hdf5_service import h5_file_cache
+from plotting_service.services.image_cache_service import derived_image_cache
+from plotting_service.services.pyramid_service import pyramid_cache
+from plotting_service.services.stack_service import frame_decoder
+from plotting_service.services.stats_service import stats_cache
+
+
+async def require_api_key(authorization: typing.Annotated[str | None, Header()] = None) -> None:
+    """
+    Dependency that only allows requests bearing the API_KEY through
+    :param authorization: The Authorization header of the request
+    :return: None
+    """
+    api_key = os.environ.get("API_KEY", "")
+    if authorization is None:
+        raise HTTPException(HTTPStatus.UNAUTHORIZED, "Unauthenticated")
+    token = authorization.split(" ")[-1]
+    if api_key == "" or not secrets.compare_digest(token, api_key):
+        raise HTTPException(HTTPStatus.FORBIDDEN, detail="Forbidden")
+
+
+AdminRouter = APIRouter(prefix="/admin", dependencies=[Depends(require_api_key)])
+
+
+@AdminRouter.get("/cache/experiments")
+async def get_experiment_cache_stats() -> dict[str, typing.Any]:
+    """Return the hit/miss counters and occupancy of the experiment cache.
+
+    :return: The experiment cache statistics
+    """
+    return experiment_cache.stats()
+
+
+@AdminRouter.get("/cache/decisions")
+async def get_decision_cache_stats() -> dict[str, typing.Any]:
+    """Return the hit/miss counters and occupancy of the access decision cache.
+
+    :return: The decision cache statistics
+    """
+    return decision_cache.stats()
+
+
+@AdminRouter.delete("/cache/experiments", status_code=HTTPStatus.NO_CONTENT)
+async def invalidate_experiment_cache() -> None:
+    """Drop every cached experiment list and access decision."""
+    experiment_cache.clear()
+    decision_cache.clear()
+
+
+@AdminRouter.delete("/cache/experiments/{user_number}", status_code=HTTPStatus.NO_CONTENT)
+async def invalidate_experiment_cache_for_user(user_number: int) -> None:
+    """Drop the cached experiment list and access decisions of a single user.
+
+    :param user_number: The user number to invalidate
+    """
+    invalidate_user(user_number)
+
+
+@AdminRouter.get("/cache/find-file")
+async def get_find_file_cache_stats() -> dict[str, typing.Any]:
+    """Return the hit, miss and negative hit counters of file lookups and the state of the filename indexes.
+
+    :return: The file lookup statistics
+    """
+    return {**negative_lookup_cache.stats(), **file_index_registry.stats()}
+
+
+@AdminRouter.delete("/cache/find-file", status_code=HTTPStatus.NO_CONTENT)
+async def invalidate_find_file_cache() -> None:
+    """Drop every remembered missing file and filename index."""
+    negative_lookup_cache.clear()
+    file_index_registry.clear()
+
+
+@AdminRouter.get("/cache/h5-handles")
+async def get_h5_handle_cache_stats() -> dict[str, typing.Any]:
+    """Return the hit/miss counters and number of open handles of the HDF5 handle cache.
+
+    :return: The handle cache statistics
+    """
+    return h5_file_cache.stats()
+
+
+@AdminRouter.delete("/cache/h5-handles", status_code=HTTPStatus.NO_CONTENT)
+async def close_h5_handles() -> None:
+    """Close every cached HDF5 handle, handles in use are closed once their request completes."""
+    h5_file_cache.clear()
+
+
+@AdminRouter.get("/cache/pyramids")
+async def get_pyramid_cache_stats() -> dict[str, typing.Any]:
+    """Return the hit and build counters and disk usage of the pyramid cache.
+
+    :return: The pyramid cache statistics
+    """
+    return pyramid_cache.stats()
+
+
+@AdminRouter.delete("/cache/pyramids", status_code=HTTPStatus.NO_CONTENT)
+async def clear_pyramid_cache() -> None:
+    """Delete every cached pyramid, they are rebuilt on their next access."""
+    await run_blocking(IOCategory.METADATA, pyramid_cache.clear)
+
+
+@AdminRouter.get("/cache/stats")
+async def get_stats_cache_stats() -> dict[str, typing.Any]:
+    """Return the hit and miss counters of the dataset statistics cache.
+
+    :return: The statistics cache counters
+    """
+    return stats_cache.stats()
+
+
+@AdminRouter.delete("/cache/stats", status_code=HTTPStatus.NO_CONTENT)
+async def clear_stats_cache() -> None:
+    """Delete every cached dataset statistic, they are recomputed on their next request."""
+    await run_blocking(IOCategory.METADATA, stats_cache.clear)
+
+
+@AdminRouter.get("/cache/images")
+async def get_image_cache_stats() -> dict[str, typing.Any]:
+    """Return the hit and miss counters and occupancy of the memory and disk tiers of the derived image cache.
+
+    :return: The derived image cache statistics
+    """
+    return derived_image_cache.stats()
+
+
+@AdminRouter.delete("/cache/images", status_code=HTTPStatus.NO_CONTENT)
+async def clear_image_cache() -> None:
+    """Drop every derived image, they are generated again on their next request."""
+    await run_blocking(IOCategory.METADATA, derived_image_cache.clear)
+
+
+@AdminRouter.get("/imat-index")
+async def get_imat_index_stats() -> dict[str, typing.Any]:
+    """Return the size and refresh counters of the IMAT latest image index.
+
+    :return: The image index statistics
+    """
+    return latest_image_index().stats()
+
+
+@AdminRouter.get("/imat-stack")
+async def get_imat_stack_stats() -> dict[str, typing.Any]:
+    """Return the pool size and frame counters of the IMAT stack decoder.
+
+    :return: The stack decoder statistics
+    """
+    return frame_decoder.stats()
+
+
+@AdminRouter.get("/compression")
+async def get_compression_stats() -> dict[str, typing.Any]:
+    """Return the bytes in and out, ratio and time spent of each response encoding, and why responses were skipped.
+
+    :return: The compression statistics
+    """
+    return compression_metrics.stats()
+
+
+@AdminRouter.get("/executor")
+async def get_executor_stats() -> dict[str, typing.Any]:
+    """Return the queue depth, concurrency and timeout counters of the blocking IO executor.
+
+    :return: The executor statistics
+    """
+    return blocking_executor.stats()
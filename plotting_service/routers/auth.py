@@ -0,0 +1,22 @@
+from http import HTTPStatus
+
+from fastapi import APIRouter, HTTPException
+from starlette.requests import Request
+
+from plotting_service.auth import warm_user
+
+AuthRouter = APIRouter(prefix="/auth")
+
+
+@AuthRouter.post("/warm")
+async def warm_permissions(request: Request) -> dict[str, int]:
+    """Prefetch the experiments of the requesting user so that their following requests are authorized from cache.
+    Intended to be called by the frontend once at login.
+
+    :return: The number of experiments the user has access to
+    """
+    user = getattr(request.state, "user", None)
+    if user is None:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Warming requires a user token")
+    experiments = await warm_user(user)
+    return {"experiment_count": len(experiments)}
@@ -0,0 +1,447 @@
+"""
+h5grove compatible endpoints that read through the shared cache of open HDF5 handles
+"""
+
+import contextlib
+import json
+import os
+import secrets
+import typing
+from collections.abc import Iterator
+from urllib.parse import quote
+
+import h5py  # type: ignore
+import numpy as np
+from fastapi import APIRouter, Depends, Query, Response
+from h5grove.content import (  # type: ignore
+    DatasetContent,
+    GroupContent,
+    ResolvedEntityContent,
+    create_content,
+)
+from h5grove.encoders import encode  # type: ignore
+from h5grove.fastapi_utils import H5GroveRoute, add_base_path, create_error  # type: ignore
+from h5grove.utils import (  # type: ignore
+    LinkResolution,
+    NotFoundError,
+    QueryArgumentError,
+    hdf_path_join,
+    parse_link_resolution_arg,
+)
+from pydantic import BaseModel, Field
+
+from plotting_service.compression import compression
+from plotting_service.executor import IOCategory, run_blocking
+from plotting_service.services.hdf5_service import h5_file_cache
+from plotting_service.services.lod_service import Reduction, decimate_line, reduce_image, select_axes
+from plotting_service.services.pyramid_service import Pyramid, pyramid_cache
+from plotting_service.services.stats_service import HISTOGRAM_RESOLUTION, STATS_HISTOGRAM_BINS, stats_cache
+
+LOD_MAX_PIXELS = 16384
+HDF5_BATCH_MAX_ITEMS = int(os.environ.get("HDF5_BATCH_MAX_ITEMS", "100"))
+
+HDF5Router = APIRouter(route_class=H5GroveRoute)
+
+
+@contextlib.contextmanager
+def open_h5_file(filepath: str) -> Iterator[h5py.File]:
+    """
+    Borrow a cached handle of a HDF5 file, mapping failures to the errors h5grove would return
+    :param filepath: The HDF5 file
+    :return: Context manager yielding the open file
+    """
+    try:
+        with h5_file_cache.open(filepath) as h5file:
+            yield h5file
+    except OSError as e:
+        if isinstance(e, FileNotFoundError) or "No such file or directory" in str(e):
+            raise create_error(404, "File not found!") from None
+        if isinstance(e, PermissionError) or "Permission denied" in str(e):
+            raise create_error(403, "Cannot read file: Permission denied!") from None
+        raise
+
+
+@contextlib.contextmanager
+def get_content(
+    filepath: str, path: str | None, resolve_links_arg: str | None = LinkResolution.ONLY_VALID
+) -> Iterator[typing.Any]:
+    """
+    Resolve the h5grove content of an entity in a HDF5 file
+    :param filepath: The HDF5 file
+    :param path: Path of the entity in the file
+    :param resolve_links_arg: How links are resolved
+    :return: Context manager yielding the content
+    """
+    try:
+        resolve_links = parse_link_resolution_arg(resolve_links_arg, fallback=LinkResolution.ONLY_VALID)
+        with open_h5_file(filepath) as h5file:
+            yield create_content(h5file, path, resolve_links)
+    except NotFoundError as e:
+        raise create_error(404, str(e)) from None
+    except QueryArgumentError as e:
+        raise create_error(422, str(e)) from None
+
+
+def _encode(data: typing.Any, format_: str = "json") -> Response:
+    h5grove_response = encode(data, format_)
+    headers = h5grove_response.headers
+    if format_ == "bin" and np.asarray(data).dtype.kind in "biufc":
+        # Lets the compression middleware byte shuffle numeric arrays
+        headers = {**headers, "X-Item-Size": str(np.asarray(data).dtype.itemsize)}
+    return Response(content=h5grove_response.content, headers=headers)
+
+
+def _read_attr(file: str, path: str, attr_keys: list[str] | None) -> Response:
+    with get_content(file, path) as content:
+        if not isinstance(content, ResolvedEntityContent):
+            raise TypeError(f"{content.path} is not a resolved entity")
+        return _encode(content.attributes(attr_keys))
+
+
+def _read_data(file: str, path: str, dtype: str, format_: str, flatten: bool, selection: str | None) -> Response:
+    with get_content(file, path) as content:
+        if not isinstance(content, DatasetContent):
+            raise TypeError(f"{content.path} is not a dataset")
+        return _encode(content.data(selection, flatten, dtype), format_)
+
+
+def _read_meta(file: str, path: str, resolve_links: str) -> Response:
+    with get_content(file, path, resolve_links) as content:
+        return _encode(content.metadata())
+
+
+def _dataset_stats(file: str, path: str, content: DatasetContent, selection: str | None) -> dict[str, typing.Any]:
+    """
+    Return the `/stats` fields of a selection, read through the statistics cache
+    :param file: The HDF5 file
+    :param path: Path of the dataset in the file
+    :param content: The dataset
+    :param selection: h5grove style selection
+    :return: The statistics
+    """
+    try:
+        stats = stats_cache.get(file, path, selection)
+    except TypeError:
+        # Statistics of non numeric data are left to h5grove
+        return typing.cast("dict[str, typing.Any]", content.data_stats(selection))
+    return stats.h5grove_stats()
+
+
+def _read_stats(file: str, path: str, selection: str | None) -> Response:
+    with get_content(file, path) as content:
+        if not isinstance(content, DatasetContent):
+            raise TypeError(f"{content.path} is not a dataset")
+        return _encode(_dataset_stats(file, path, content, selection))
+
+
+def _read_histogram(file: str, path: str, selection: str | None, bins: int, lower: float, upper: float) -> Response:
+    with get_content(file, path) as content:
+        if not isinstance(content, DatasetContent):
+            raise create_error(422, f"{content.path} is not a dataset")
+        try:
+            stats = stats_cache.get(file, path, selection)
+        except TypeError as e:
+            raise create_error(422, str(e)) from None
+        return _encode(
+            {
+                **stats.h5grove_stats(),
+                "count": stats.count,
+                "histogram": stats.histogram(bins),
+                "limits": [stats.percentile(lower), stats.percentile(upper)],
+            }
+        )
+
+
+def _read_paths(file: str, path: str, resolve_links_arg: str) -> Response:
+    with get_content(file, path, resolve_links_arg) as base_content:
+        if not isinstance(base_content, GroupContent):
+            raise TypeError(f"{base_content.path} is not a group")
+        resolve_links = parse_link_resolution_arg(resolve_links_arg, fallback=LinkResolution.ONLY_VALID)
+        h5file = base_content._h5py_entity.file
+        names = [base_content.path]
+
+        def get_path(name: bytes) -> None:
+            names.append(create_content(h5file, hdf_path_join(path, name.decode()), resolve_links).path)
+
+        base_content._h5py_entity.id.links.visit(get_path)
+        return _encode(names)
+
+
+def _read_lod(
+    file: str, path: str, width: int, height: int | None, reduction: Reduction, selection: str | None
+) -> Response:
+    with get_content(file, path) as content:
+        if not isinstance(content, DatasetContent):
+            raise create_error(422, f"{content.path} is not a dataset")
+        dataset = content._h5py_entity
+        if dataset.dtype.kind not in "biuf":
+            # Strings, compounds and enums have no minimum, maximum or mean to reduce to
+            raise QueryArgumentError(f"{content.path} is not numeric")
+        try:
+            index, axes = select_axes(dataset.shape, selection)
+        except ValueError as e:
+            raise create_error(422, str(e)) from None
+        if len(axes) == 1:
+            line = decimate_line(dataset, index, axes[0], width)
+            return _encode({"x": line.x, "y": line.y, "length": line.length, "decimated": line.decimated})
+        if len(axes) == 2:  # noqa: PLR2004
+            image = reduce_image(dataset, index, axes, width, height or width, reduction)
+            return _encode(
+                {"data": image.data, "shape": image.shape, "block": image.block, "reduction": reduction.value}
+            )
+        raise create_error(422, f"Selection must leave 1 or 2 dimensions, it leaves {len(axes)}")
+
+
+def _get_pyramid(file: str, path: str, selection: str | None) -> Pyramid:
+    try:
+        return pyramid_cache.get(file, path, selection)
+    except FileNotFoundError:
+        raise create_error(404, "File not found!") from None
+    except PermissionError:
+        raise create_error(403, "Cannot read file: Permission denied!") from None
+    except KeyError:
+        raise create_error(404, f"{path} not found") from None
+    except ValueError as e:
+        raise create_error(422, str(e)) from None
+
+
+def _read_pyramid(file: str, path: str, selection: str | None) -> Response:
+    return _encode(_get_pyramid(file, path, selection).metadata())
+
+
+def _read_tile(file: str, path: str, selection: str | None, level: int, x: int, y: int, format_: str) -> Response:
+    pyramid = _get_pyramid(file, path, selection)
+    try:
+        tile = pyramid.tile(level, x, y)
+    except IndexError as e:
+        raise create_error(404, str(e)) from None
+    return _encode(tile, format_)
+
+
+class BatchItem(BaseModel):
+    """One h5grove request of a batch, taking the query parameters of the endpoint it names"""
+
+    endpoint: typing.Literal["attr", "data", "meta", "stats"] = "data"
+    path: str = "/"
+    selection: str | None = None
+    dtype: str = "origin"
+    format: str = "json"
+    flatten: bool = False
+    resolve_links: str = "only_valid"
+    attr_keys: list[str] | None = None
+
+
+class Batch(BaseModel):
+    """h5grove requests to answer from one file"""
+
+    items: list[BatchItem] = Field(min_length=1, max_length=HDF5_BATCH_MAX_ITEMS)
+
+
+def _read_item(file: str, h5file: h5py.File, item: BatchItem) -> tuple[int, dict[str, str], bytes]:
+    """
+    Answer one item of a batch as its endpoint would, reporting errors as the status of the item
+    :param file: The HDF5 file
+    :param h5file: The open file
+    :param item: The item
+    :return: The status, headers and body of the item
+    """
+    try:
+        resolve_links = parse_link_resolution_arg(item.resolve_links, fallback=LinkResolution.ONLY_VALID)
+        content = create_content(h5file, item.path, resolve_links)
+        format_ = "json"
+        if item.endpoint == "meta":
+            data = content.metadata()
+        elif item.endpoint == "attr":
+            if not isinstance(content, ResolvedEntityContent):
+                raise QueryArgumentError(f"{content.path} is not a resolved entity")
+            data = content.attributes(item.attr_keys)
+        elif not isinstance(content, DatasetContent):
+            raise QueryArgumentError(f"{content.path} is not a dataset")
+        elif item.endpoint == "stats":
+            data = _dataset_stats(file, item.path, content, item.selection)
+        else:
+            data = content.data(item.selection, item.flatten, item.dtype)
+            format_ = item.format
+        encoded = encode(data, format_)
+    except NotFoundError as e:
+        return 404, {"Content-Type": "application/json"}, json.dumps({"detail": str(e)}).encode()
+    except QueryArgumentError as e:
+        return 422, {"Content-Type": "application/json"}, json.dumps({"detail": str(e)}).encode()
+    return 200, encoded.headers, encoded.content
+
+
+def _read_batch(file: str, batch: Batch) -> Response:
+    boundary = secrets.token_hex(16)
+    parts = []
+    with open_h5_file(file) as h5file:
+        for number, item in enumerate(batch.items):
+            status, headers, body = _read_item(file, h5file, item)
+            part_headers = {
+                **headers,
+                "Content-Length": str(len(body)),
+                "Content-ID": f"<{number}>",
+                "X-Status": str(status),
+                # Percent encoded so a path cannot add headers or end the part
+                "X-Path": quote(item.path, safe="/"),
+            }
+            head = "".join(f"{name}: {value}\r\n" for name, value in part_headers.items())
+            parts.append(f"--{boundary}\r\n{head}\r\n".encode() + body + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return Response(content=b"".join(parts), media_type=f"multipart/mixed; boundary={boundary}")
+
+
+@HDF5Router.api_route("/", methods=["GET", "HEAD"])
+async def get_root() -> Response:
+    """`/` endpoint handler to check server status"""
+    return Response("ok")
+
+
+@HDF5Router.get("/attr")
+async def get_attr(
+    file: typing.Annotated[str, Depends(add_base_path)],
+    path: str = "/",
+    attr_keys: typing.Annotated[list[str] | None, Query()] = None,
+) -> Response:
+    """`/attr` endpoint handler"""
+    return await run_blocking(IOCategory.METADATA, _read_attr, file, path, attr_keys)
+
+
+# Datasets are numeric arrays or JSON, both of which compress well, so they skip the sampled ratio check
+@HDF5Router.get("/data", dependencies=[Depends(compression(True))])
+async def get_data(
+    file: typing.Annotated[str, Depends(add_base_path)],
+    path: str = "/",
+    dtype: str = "origin",
+    format: str = "json",  # noqa: A002
+    flatten: bool = False,
+    selection: str | None = None,
+) -> Response:
+    """`/data` endpoint handler"""
+    return await run_blocking(IOCategory.BULK_READ, _read_data, file, path, dtype, format, flatten, selection)
+
+
+@HDF5Router.get("/meta")
+async def get_meta(
+    file: typing.Annotated[str, Depends(add_base_path)],
+    path: str = "/",
+    resolve_links: str = "only_valid",
+) -> Response:
+    """`/meta` endpoint handler"""
+    return await run_blocking(IOCategory.METADATA, _read_meta, file, path, resolve_links)
+
+
+@HDF5Router.get("/stats")
+async def get_stats(
+    file: typing.Annotated[str, Depends(add_base_path)], path: str = "/", selection: str | None = None
+) -> Response:
+    """`/stats` endpoint handler, served from the statistics cache so repeat requests read no data"""
+    return await run_blocking(IOCategory.BULK_READ, _read_stats, file, path, selection)
+
+
+@HDF5Router.get("/histogram")
+async def get_histogram(
+    file: typing.Annotated[str, Depends(add_base_path)],
+    path: str = "/",
+    selection: str | None = None,
+    bins: typing.Annotated[int, Query(ge=1, le=HISTOGRAM_RESOLUTION)] = STATS_HISTOGRAM_BINS,
+    lower: typing.Annotated[float, Query(ge=0, le=100)] = 1,
+    upper: typing.Annotated[float, Query(ge=0, le=100)] = 99,
+) -> Response:
+    """Return the statistics of a selection along with a histogram and percentile based colour limits, computed in one
+    chunked pass on first request and cached until the file changes.
+
+    :param file: The HDF5 file
+    :param path: Path of the dataset in the file
+    :param selection: h5grove style selection
+    :param bins: The most histogram bins returned, adjacent bins are merged to fit
+    :param lower: Percentile of the lower colour limit
+    :param upper: Percentile of the upper colour limit
+    :return: JSON of the `/stats` fields, count, histogram edges and counts, and limits
+    """
+    return await run_blocking(IOCategory.BULK_READ, _read_histogram, file, path, selection, bins, lower, upper)
+
+
+@HDF5Router.get("/paths")
+async def get_paths(
+    file: typing.Annotated[str, Depends(add_base_path)],
+    path: str = "/",
+    resolve_links: str = "only_valid",
+) -> Response:
+    """`/paths` endpoint handler"""
+    return await run_blocking(IOCategory.METADATA, _read_paths, file, path, resolve_links)
+
+
+@HDF5Router.get("/lod")
+async def get_lod(
+    file: typing.Annotated[str, Depends(add_base_path)],
+    width: typing.Annotated[int, Query(ge=1, le=LOD_MAX_PIXELS)],
+    path: str = "/",
+    height: typing.Annotated[int | None, Query(ge=1, le=LOD_MAX_PIXELS)] = None,
+    reduction: Reduction = Reduction.MEAN,
+    selection: str | None = None,
+) -> Response:
+    """Return a dataset selection reduced to the pixel size it is drawn at, reading it in bounded chunks. 1D
+    selections are decimated with M4, keeping the first, minimum, maximum and last point of each of width buckets.
+    2D selections are block reduced to at most height by width pixels.
+
+    :param file: The HDF5 file
+    :param width: The pixel width the data is drawn at
+    :param path: Path of the dataset in the file
+    :param height: The pixel height a 2D selection is drawn at, defaults to width
+    :param reduction: How each block of a 2D selection is reduced
+    :param selection: h5grove style selection without steps, leaving 1 or 2 dimensions
+    :return: JSON of x, y, length and decimated for 1D selections, or data, shape, block and reduction for 2D
+    """
+    return await run_blocking(IOCategory.BULK_READ, _read_lod, file, path, width, height, reduction, selection)
+
+
+@HDF5Router.get("/pyramid")
+async def get_pyramid(
+    file: typing.Annotated[str, Depends(add_base_path)], path: str = "/", selection: str | None = None
+) -> Response:
+    """Describe the levels of the pyramid of a 2D selection, building the pyramid on first access. Each level halves
+    the one before until the last fits in one tile.
+
+    :param file: The HDF5 file
+    :param path: Path of the dataset in the file
+    :param selection: h5grove style selection without steps leaving 2 dimensions, such as "5" for one frame of a stack
+    :return: JSON of the tile size and the shape and number of tiles of each level
+    """
+    return await run_blocking(IOCategory.BULK_READ, _read_pyramid, file, path, selection)
+
+
+@HDF5Router.get("/pyramid/tile")
+async def get_pyramid_tile(
+    file: typing.Annotated[str, Depends(add_base_path)],
+    level: typing.Annotated[int, Query(ge=0)],
+    x: typing.Annotated[int, Query(ge=0)],
+    y: typing.Annotated[int, Query(ge=0)],
+    path: str = "/",
+    selection: str | None = None,
+    format: str = "json",  # noqa: A002
+) -> Response:
+    """Return one tile of a pyramid level, so panning and zooming read only the tiles in view.
+
+    :param file: The HDF5 file
+    :param level: The level, 0 being full resolution
+    :param x: The column of the tile
+    :param y: The row of the tile
+    :param path: Path of the dataset in the file
+    :param selection: h5grove style selection without steps leaving 2 dimensions
+    :param format: Any h5grove data format, such as json, bin or npy
+    :return: The tile
+    """
+    return await run_blocking(IOCategory.BULK_READ, _read_tile, file, path, selection, level, x, y, format)
+
+
+@HDF5Router.post("/batch")
+async def post_batch(file: typing.Annotated[str, Depends(add_base_path)], batch: Batch) -> Response:
+    """Answer many `/attr`, `/data`, `/meta` and `/stats` requests on one file together, opening the file and checking
+    access once. Each item is a part of a multipart/mixed response in the order requested, with the status of the
+    item in its X-Status header, so a missing path does not fail the rest of the batch.
+
+    :param file: The HDF5 file
+    :param batch: The items to answer
+    :return: The multipart response
+    """
+    return await run_blocking(IOCategory.BULK_READ, _read_batch, file, batch)
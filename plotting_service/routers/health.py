@@ -5,19 +5,25 @@ from pathlib import Path
 
 from fastapi import APIRouter, HTTPException
 
+from plotting_service.executor import IOCategory, run_blocking
+
 CEPH_DIR = os.environ.get("CEPH_DIR", "/ceph")
 
 HealthRouter = APIRouter()
 
 
+def _read_healthy_file() -> list[str]:
+    with Path(f"{CEPH_DIR}/GENERIC/autoreduce/healthy_file.txt").open("r") as fle:
+        return fle.readlines()
+
+
 @HealthRouter.get("/healthz")
 async def get() -> typing.Literal["ok"]:
     """Health check endpoint :return: "ok"."""
     try:
-        with Path(f"{CEPH_DIR}/GENERIC/autoreduce/healthy_file.txt").open("r") as fle:
-            lines = fle.readlines()
-            if lines[0] != "This is a healthy file! You have read it correctly!\n":
-                raise HTTPException(status_code=HTTPStatus.SERVICE_UNAVAILABLE)
+        lines = await run_blocking(IOCategory.METADATA, _read_healthy_file)
+        if lines[0] != "This is a healthy file! You have read it correctly!\n":
+            raise HTTPException(status_code=HTTPStatus.SERVICE_UNAVAILABLE)
         return "ok"
     except:  # noqa: E722
         raise HTTPException(status_code=HTTPStatus.SERVICE_UNAVAILABLE) from None
@@ -1,23 +1,43 @@
 import logging
 import os
-import re
 import sys
 import typing
+from collections.abc import AsyncGenerator, AsyncIterator
 from http import HTTPStatus
 from pathlib import Path
 
-from fastapi import APIRouter, HTTPException, Query
-from PIL import Image
-from starlette.responses import JSONResponse, Response
-
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette.responses import JSONResponse, Response, StreamingResponse
+
+from plotting_service.compression import compression
+from plotting_service.exceptions import BlockingIOTimeoutError
+from plotting_service.executor import IOCategory, run_blocking
+from plotting_service.services.display_service import (
+    DISPLAY_HISTOGRAM_BINS,
+    DisplayScale,
+    DisplayWindow,
+    WindowMethod,
+)
+from plotting_service.services.image_cache_service import derived_image_cache
 from plotting_service.services.image_service import (
     IMAGE_SUFFIXES,
-    convert_image_to_rgb_array,
-    find_latest_image_in_directory,
+    IMAT_TILE_SIZE,
+    DownsampleMethod,
+    convert_image_to_display_bytes,
+    convert_image_to_rgb_bytes,
+    image_size,
+    read_image_region,
+    tile_levels,
 )
+from plotting_service.services.latest_image_service import IMAT_INDEX_MAX_IMAGES, RB_FOLDER, LatestImageIndex
+from plotting_service.services.stack_service import IMAT_STACK_MAX_FRAMES, Frame, frame_decoder
 from plotting_service.utils import safe_check_filepath
 
 ImatRouter = APIRouter()
+# Native pixels are numeric and compress well once byte shuffled, so they skip the sampled ratio check
+COMPRESS_PIXELS = [Depends(compression(True))]
+# A stream cannot be sampled before it is sent, and compressing every frame would hold back the ones behind it
+STREAM_PIXELS = [Depends(compression(False))]
 
 IMAT_DIR: Path = Path(os.getenv("IMAT_DIR", "/imat")).resolve()
 CEPH_DIR = os.environ.get("CEPH_DIR", "/ceph")
@@ -32,6 +52,127 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+_latest_image_index: LatestImageIndex | None = None
+
+
+def latest_image_index() -> LatestImageIndex:
+    """Return the latest image index of the IMAT directory, replacing it if the directory was changed.
+
+    :return: The latest image index
+    """
+    global _latest_image_index  # noqa: PLW0603
+    if _latest_image_index is None or _latest_image_index.root != IMAT_DIR:
+        if _latest_image_index is not None:
+            _latest_image_index.stop()
+        _latest_image_index = LatestImageIndex(IMAT_DIR)
+    return _latest_image_index
+
+
+def _find_latest_rb_image(rb: str | None = None) -> Path:
+    """Return the most recent image across every RB folder in the IMAT directory, or in one of them.
+
+    :param rb: Only consider this RB folder, such as "RB1234"
+    :return: Path to the latest image
+    """
+    index = latest_image_index()
+    rb_folders = index.rb_folders
+    if not rb_folders:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "No RB folders under IMAT_DIR")
+    if rb is not None and rb not in rb_folders:
+        raise HTTPException(HTTPStatus.NOT_FOUND, f"No {rb} folder under IMAT_DIR")
+
+    latest_path = index.latest(rb)
+    if latest_path is None:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "No images found in IMAT_DIR")
+    return latest_path
+
+
+def _list_images(dir_path: Path) -> list[str]:
+    """Return a sorted list of the TIFF images in a directory.
+
+    :param dir_path: The directory to list
+    :return: Sorted image filenames
+    """
+    # Security: Ensure path is within CEPH_DIR
+    try:
+        safe_check_filepath(dir_path, CEPH_DIR)
+    except FileNotFoundError as err:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Directory not found") from err
+
+    if not dir_path.exists() or not dir_path.is_dir():
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Directory not found")
+
+    images = [entry.name for entry in dir_path.iterdir() if entry.is_file() and entry.suffix.lower() in IMAGE_SUFFIXES]
+
+    return sorted(images)
+
+
+def _check_image_path(image_path: Path) -> None:
+    """Ensure an image path is inside CEPH_DIR and is an existing file.
+
+    :param image_path: The image path to check
+    :return: None
+    """
+    # Security: Ensure path is within CEPH_DIR
+    try:
+        safe_check_filepath(image_path, CEPH_DIR)
+    except FileNotFoundError as err:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Directory not found") from err
+
+    if not image_path.exists() or not image_path.is_file():
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Image not found")
+
+
+def _native_image_deriver(
+    method: DownsampleMethod, box: tuple[int, int, int, int] | None = None
+) -> typing.Callable[[Path, int], tuple[bytes, int, int, int, int]]:
+    """Return the function decoding an image, or a box of it, to its native pixel bytes, downsampling it with the given
+    method.
+
+    :param method: How the image is downsampled
+    :param box: The (left, upper, right, lower) pixel box to read, None for the whole image
+    :return: The function reading an image
+    """
+
+    def derive(image_path: Path, downsample_factor: int) -> tuple[bytes, int, int, int, int]:
+        image, original_width, original_height = read_image_region(image_path, box, downsample_factor, method)
+        sampled_width, sampled_height = image.size
+        # For 16-bit TIFFs, tobytes() returns raw 16-bit bytes
+        return image.tobytes(), original_width, original_height, sampled_width, sampled_height
+
+    return derive
+
+
+def _rgb_image_deriver(
+    image_format: typing.Literal["png", "webp"] | None, method: DownsampleMethod
+) -> typing.Callable[[Path, int], tuple[bytes, int, int, int, int]]:
+    """Return the function deriving an RGB image from an image path and downsample factor.
+
+    :param image_format: Encode the image as png or webp, None derives the raw RGB bytes
+    :param method: How the image is downsampled
+    :return: The function converting an image
+    """
+
+    def derive(image_path: Path, downsample_factor: int) -> tuple[bytes, int, int, int, int]:
+        return convert_image_to_rgb_bytes(image_path, downsample_factor, image_format, method)
+
+    return derive
+
+
+# JSON is built from the raw RGB bytes so both share a cache entry
+IMAGE_ENCODINGS: dict[str, typing.Literal["png", "webp"] | None] = {
+    "json": None,
+    "raw": None,
+    "png": "png",
+    "webp": "webp",
+}
+DOWNSAMPLE_METHOD_DESCRIPTION = (
+    "How the image is downsampled, from the highest quality to the fastest: lanczos resamples the whole image, box "
+    "takes the mean and max the maximum of each block of pixels, and nearest takes one pixel of each block."
+)
+IMAGE_MEDIA_TYPES = {"raw": "application/octet-stream", "png": "image/png", "webp": "image/webp"}
+
+
 @ImatRouter.get("/imat/latest-image", summary="Fetch the latest IMAT image")
 async def get_latest_imat_image(
     downsample_factor: typing.Annotated[
@@ -42,38 +183,41 @@ async def get_latest_imat_image(
             description="Integer factor to reduce each dimension by (1 keeps original resolution).",
         ),
     ] = 8,
-) -> JSONResponse:
+    format: typing.Annotated[  # noqa: A002
+        typing.Literal["json", "raw", "png", "webp"],
+        Query(
+            description=(
+                "json returns the RGB bytes as a list of integers and is kept for older clients. raw returns the RGB "
+                "bytes as binary, png and webp a losslessly encoded image, with the shape in the X-Image-* headers."
+            ),
+        ),
+    ] = "json",
+    rb: typing.Annotated[
+        str | None,
+        Query(pattern=RB_FOLDER.pattern, description="Only consider this RB folder, such as RB1234."),
+    ] = None,
+    method: typing.Annotated[DownsampleMethod, Query(description=DOWNSAMPLE_METHOD_DESCRIPTION)] = (
+        DownsampleMethod.LANCZOS
+    ),
+) -> Response:
     """Return the latest image from any RB folder within the IMAT directory."""
-    # Find RB* folders under the IMAT root
-    rb_dirs = [d for d in IMAT_DIR.iterdir() if d.is_dir() and re.fullmatch(r"RB\d+", d.name)]
-
-    if not rb_dirs:
-        raise HTTPException(HTTPStatus.NOT_FOUND, "No RB folders under IMAT_DIR")
+    latest_path = await run_blocking(IOCategory.METADATA, _find_latest_rb_image, rb)
 
-    latest_path: Path | None = None
-    latest_mtime: float = 0.0
-
-    # Find latest image across all RB folders
-    for rb_dir in rb_dirs:
-        rb_latest = find_latest_image_in_directory(rb_dir)
-        if rb_latest is None:
-            continue
-
-        rb_mtime = rb_latest.stat().st_mtime
-
-        # Track the single most recent image across all RB folders
-        if rb_mtime > latest_mtime:
-            latest_path = rb_latest
-            latest_mtime = rb_mtime
-
-    if latest_path is None:
-        raise HTTPException(HTTPStatus.NOT_FOUND, "No images found in IMAT_DIR")
+    encoding = IMAGE_ENCODINGS[format]
 
     # Convert the image to RGB array
     try:
-        data, original_width, original_height, sampled_width, sampled_height = convert_image_to_rgb_array(
-            latest_path, downsample_factor
+        image_bytes, original_width, original_height, sampled_width, sampled_height = await run_blocking(
+            IOCategory.IMAGE_DECODE,
+            derived_image_cache.get,
+            latest_path,
+            downsample_factor,
+            # Images of more than 8 bits are scaled from their minimum to their maximum rather than clipped
+            f"{encoding or 'rgb'}-{method.value}-minmax",
+            _rgb_image_deriver(encoding, method),
         )
+    except BlockingIOTimeoutError:
+        raise
     except Exception as exc:
         logger.error("Failed to convert IMAT image at %s", latest_path, exc_info=exc)
         raise HTTPException(HTTPStatus.INTERNAL_SERVER_ERROR, "Unable to convert IMAT image") from exc
@@ -81,8 +225,23 @@ async def get_latest_imat_image(
     # Calculate effective downsample factor
     effective_downsample = original_width / sampled_width if sampled_width else 1
 
+    if format != "json":
+        headers = {
+            "X-Image-Width": str(sampled_width),
+            "X-Image-Height": str(sampled_height),
+            "X-Image-Channels": "3",
+            "X-Original-Width": str(original_width),
+            "X-Original-Height": str(original_height),
+            "X-Downsample-Factor": str(effective_downsample),
+            "Access-Control-Expose-Headers": (
+                "X-Image-Width, X-Image-Height, X-Image-Channels, X-Original-Width, X-Original-Height, "
+                "X-Downsample-Factor"
+            ),
+        }
+        return Response(content=image_bytes, media_type=IMAGE_MEDIA_TYPES[format], headers=headers)
+
     payload = {
-        "data": data,
+        "data": list(image_bytes),
         "shape": [sampled_height, sampled_width, 3],
         "originalWidth": original_width,
         "originalHeight": original_height,
@@ -93,6 +252,19 @@ async def get_latest_imat_image(
     return JSONResponse(payload)
 
 
+@ImatRouter.get("/imat/recent-images", summary="List the newest IMAT images")
+async def get_recent_imat_images(
+    count: typing.Annotated[int, Query(ge=1, le=IMAT_INDEX_MAX_IMAGES, description="The most images listed.")] = 10,
+    rb: typing.Annotated[
+        str | None,
+        Query(pattern=RB_FOLDER.pattern, description="Only list images of this RB folder, such as RB1234."),
+    ] = None,
+) -> list[dict[str, typing.Any]]:
+    """Return the newest images across every RB folder, or in one of them, newest first."""
+    newest = await run_blocking(IOCategory.METADATA, latest_image_index().newest, count, rb)
+    return [{"path": str(path.relative_to(IMAT_DIR)), "mtime": mtime} for path, mtime in newest]
+
+
 @ImatRouter.get("/imat/list-images", summary="List images in a directory")
 async def list_imat_images(
     path: typing.Annotated[
@@ -102,21 +274,10 @@ async def list_imat_images(
     """Return a sorted list of TIFF images in the given directory."""
 
     dir_path = (Path(CEPH_DIR) / path).resolve()
-    # Security: Ensure path is within CEPH_DIR
-    try:
-        safe_check_filepath(dir_path, CEPH_DIR)
-    except FileNotFoundError as err:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Directory not found") from err
+    return await run_blocking(IOCategory.METADATA, _list_images, dir_path)
 
-    if not dir_path.exists() or not dir_path.is_dir():
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Directory not found")
-
-    images = [entry.name for entry in dir_path.iterdir() if entry.is_file() and entry.suffix.lower() in IMAGE_SUFFIXES]
 
-    return sorted(images)
-
-
-@ImatRouter.get("/imat/image", summary="Fetch a specific TIFF image as raw data")
+@ImatRouter.get("/imat/image", summary="Fetch a specific TIFF image as raw data", dependencies=COMPRESS_PIXELS)
 async def get_imat_image(
     path: typing.Annotated[str, Query(..., description="Path to the TIFF image file, relative to CEPH_DIR")],
     downsample_factor: typing.Annotated[
@@ -127,47 +288,381 @@ async def get_imat_image(
             description="Integer factor to reduce each dimension by (1 keeps original resolution).",
         ),
     ] = 1,
+    method: typing.Annotated[DownsampleMethod, Query(description=DOWNSAMPLE_METHOD_DESCRIPTION)] = (
+        DownsampleMethod.NEAREST
+    ),
 ) -> Response:
     """Return the raw data of a specific TIFF image as binary."""
 
     image_path = (Path(CEPH_DIR) / path).resolve()
-    # Security: Ensure path is within CEPH_DIR
+    await run_blocking(IOCategory.METADATA, _check_image_path, image_path)
+    return await _native_image_response(
+        image_path, downsample_factor, _native_image_deriver(method), f"native-{method.value}"
+    )
+
+
+async def _native_image_response(
+    image_path: Path,
+    downsample_factor: int,
+    derive: typing.Callable[[Path, int], tuple[bytes, int, int, int, int]],
+    cache_mode: str | None,
+    headers: dict[str, str] | None = None,
+) -> Response:
+    """Derive the native pixel bytes of an image and return them with their shape in headers.
+
+    :param image_path: Path to the image file
+    :param downsample_factor: Factor to reduce resolution (1 keeps original)
+    :param derive: The function reading the image
+    :param cache_mode: Names the derived image in the derived image cache, None to not cache it
+    :param headers: Headers to add to the response
+    :return: The response
+    """
     try:
-        safe_check_filepath(image_path, CEPH_DIR)
-    except FileNotFoundError as err:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Directory not found") from err
+        if cache_mode is None:
+            derived = await run_blocking(IOCategory.IMAGE_DECODE, derive, image_path, downsample_factor)
+        else:
+            derived = await run_blocking(
+                IOCategory.IMAGE_DECODE, derived_image_cache.get, image_path, downsample_factor, cache_mode, derive
+            )
+    except BlockingIOTimeoutError:
+        raise
+    except ValueError as exc:
+        raise HTTPException(HTTPStatus.BAD_REQUEST, str(exc)) from exc
+    except Exception as exc:
+        logger.error(f"Failed to process image {image_path}: {exc}")
+        raise HTTPException(HTTPStatus.INTERNAL_SERVER_ERROR, "Unable to process image") from exc
 
-    if not image_path.exists() or not image_path.is_file():
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Image not found")
+    data_bytes, original_width, original_height, sampled_width, sampled_height = derived
+    headers = {
+        "X-Image-Width": str(sampled_width),
+        "X-Image-Height": str(sampled_height),
+        "X-Original-Width": str(original_width),
+        "X-Original-Height": str(original_height),
+        "X-Downsample-Factor": str(downsample_factor),
+        "X-Item-Size": str(len(data_bytes) // max(sampled_width * sampled_height, 1)),
+        **(headers or {}),
+    }
+    headers["Access-Control-Expose-Headers"] = ", ".join(name for name in headers if name.startswith("X-"))
+
+    return Response(content=data_bytes, media_type="application/octet-stream", headers=headers)
+
+
+@ImatRouter.get(
+    "/imat/image/region", summary="Fetch a region of a TIFF image as raw data", dependencies=COMPRESS_PIXELS
+)
+async def get_imat_image_region(
+    path: typing.Annotated[str, Query(..., description="Path to the TIFF image file, relative to CEPH_DIR")],
+    x: typing.Annotated[int, Query(ge=0, description="Column of the left edge of the region.")],
+    y: typing.Annotated[int, Query(ge=0, description="Row of the top edge of the region.")],
+    width: typing.Annotated[int, Query(ge=1, description="Columns in the region, at full resolution.")],
+    height: typing.Annotated[int, Query(ge=1, description="Rows in the region, at full resolution.")],
+    downsample_factor: typing.Annotated[
+        int,
+        Query(
+            ge=1,
+            le=64,
+            description="Integer factor to reduce each dimension of the region by (1 keeps original resolution).",
+        ),
+    ] = 1,
+    method: typing.Annotated[DownsampleMethod, Query(description=DOWNSAMPLE_METHOD_DESCRIPTION)] = (
+        DownsampleMethod.BOX
+    ),
+) -> Response:
+    """Return the raw data of a region of a TIFF image, reading only the parts of the file holding it. The region is
+    clamped to the image."""
 
+    image_path = (Path(CEPH_DIR) / path).resolve()
+    await run_blocking(IOCategory.METADATA, _check_image_path, image_path)
+    return await _native_image_response(
+        image_path,
+        downsample_factor,
+        _native_image_deriver(method, (x, y, x + width, y + height)),
+        None,
+        {"X-Region-X": str(x), "X-Region-Y": str(y)},
+    )
+
+
+@ImatRouter.get("/imat/image/tiles", summary="Describe the tile pyramid of a TIFF image")
+async def get_imat_image_tiles(
+    path: typing.Annotated[str, Query(..., description="Path to the TIFF image file, relative to CEPH_DIR")],
+) -> dict[str, typing.Any]:
+    """Return the tile size and the shape and number of tiles of each level of the tile pyramid of an image, level 0
+    being full resolution and each level after half the size of the one before."""
+
+    image_path = (Path(CEPH_DIR) / path).resolve()
+    await run_blocking(IOCategory.METADATA, _check_image_path, image_path)
     try:
-        with Image.open(image_path) as img:
-            original_width, original_height = img.size
+        width, height = await run_blocking(IOCategory.METADATA, image_size, image_path)
+    except BlockingIOTimeoutError:
+        raise
+    except Exception as exc:
+        logger.error(f"Failed to read image {image_path}: {exc}")
+        raise HTTPException(HTTPStatus.INTERNAL_SERVER_ERROR, "Unable to process image") from exc
+    return tile_levels(width, height, IMAT_TILE_SIZE)
 
-            if downsample_factor > 1:
-                target_width = max(1, round(original_width / downsample_factor))
-                target_height = max(1, round(original_height / downsample_factor))
-                display_img = img.resize((target_width, target_height), Image.Resampling.NEAREST)
-            else:
-                display_img = img
 
-            sampled_width, sampled_height = display_img.size
-            # For 16-bit TIFFs, tobytes() returns raw 16-bit bytes
-            data_bytes = display_img.tobytes()
+@ImatRouter.get("/imat/image/tile", summary="Fetch a tile of a TIFF image as raw data", dependencies=COMPRESS_PIXELS)
+async def get_imat_image_tile(
+    path: typing.Annotated[str, Query(..., description="Path to the TIFF image file, relative to CEPH_DIR")],
+    level: typing.Annotated[int, Query(ge=0, le=16, description="The level, 0 being full resolution.")],
+    x: typing.Annotated[int, Query(ge=0, description="The column of the tile.")],
+    y: typing.Annotated[int, Query(ge=0, description="The row of the tile.")],
+    method: typing.Annotated[DownsampleMethod, Query(description=DOWNSAMPLE_METHOD_DESCRIPTION)] = (
+        DownsampleMethod.BOX
+    ),
+) -> Response:
+    """Return the raw data of one tile of the tile pyramid of an image, tiles on the bottom and right edges may be
+    smaller than the tile size. Tiles are cached, so frames that are viewed often are served without reading them."""
 
-        headers = {
-            "X-Image-Width": str(sampled_width),
-            "X-Image-Height": str(sampled_height),
-            "X-Original-Width": str(original_width),
-            "X-Original-Height": str(original_height),
-            "X-Downsample-Factor": str(downsample_factor),
-            "Access-Control-Expose-Headers": (
-                "X-Image-Width, X-Image-Height, X-Original-Width, X-Original-Height, X-Downsample-Factor"
+    image_path = (Path(CEPH_DIR) / path).resolve()
+    await run_blocking(IOCategory.METADATA, _check_image_path, image_path)
+    downsample_factor = 2**level
+    span = IMAT_TILE_SIZE * downsample_factor
+    box = (x * span, y * span, (x + 1) * span, (y + 1) * span)
+    return await _native_image_response(
+        image_path,
+        downsample_factor,
+        _native_image_deriver(method, box),
+        f"tile-{IMAT_TILE_SIZE}-{x}-{y}-{method.value}",
+        {"X-Region-X": str(box[0]), "X-Region-Y": str(box[1]), "X-Tile-Size": str(IMAT_TILE_SIZE)},
+    )
+
+
+def display_window(
+    window: typing.Annotated[
+        WindowMethod,
+        Query(
+            description=(
+                "How the limits of the window are chosen: minmax from the minimum and maximum of the image, percentile "
+                "from the lower and upper percentiles and manual from low and high."
             ),
-        }
-
-        return Response(content=data_bytes, media_type="application/octet-stream", headers=headers)
+        ),
+    ] = WindowMethod.PERCENTILE,
+    lower: typing.Annotated[float, Query(ge=0, le=100, description="Percentile of the lower limit.")] = 1,
+    upper: typing.Annotated[float, Query(ge=0, le=100, description="Percentile of the upper limit.")] = 99,
+    low: typing.Annotated[float | None, Query(description="The lower limit of a manual window.")] = None,
+    high: typing.Annotated[float | None, Query(description="The upper limit of a manual window.")] = None,
+    gamma: typing.Annotated[
+        float, Query(gt=0, le=10, description="Power applied to the windowed values, below 1 brightens dark areas.")
+    ] = 1.0,
+    scale: typing.Annotated[
+        DisplayScale,
+        Query(description="linear, or log to bring out faint detail next to bright areas."),
+    ] = DisplayScale.LINEAR,
+) -> DisplayWindow:
+    """Dependency returning how an image is windowed to 8-bit for display.
+
+    :param window: How the limits of the window are chosen
+    :param lower: Percentile of the lower limit
+    :param upper: Percentile of the upper limit
+    :param low: The lower limit of a manual window
+    :param high: The upper limit of a manual window
+    :param gamma: Power applied to the windowed values
+    :param scale: How values between the limits are mapped to brightness
+    :return: The display window
+    """
+    if window is WindowMethod.MANUAL and (low is None or high is None):
+        raise HTTPException(HTTPStatus.BAD_REQUEST, "A manual window needs both low and high")
+    if lower > upper:
+        raise HTTPException(HTTPStatus.BAD_REQUEST, "lower must not be above upper")
+    return DisplayWindow(method=window, lower=lower, upper=upper, low=low, high=high, gamma=gamma, scale=scale)
+
+
+@ImatRouter.get("/imat/image/display", summary="Fetch a TIFF image windowed to 8-bit grayscale for display")
+async def get_imat_image_display(
+    path: typing.Annotated[str, Query(..., description="Path to the TIFF image file, relative to CEPH_DIR")],
+    window: typing.Annotated[DisplayWindow, Depends(display_window)],
+    downsample_factor: typing.Annotated[
+        int,
+        Query(
+            ge=1,
+            le=64,
+            description="Integer factor to reduce each dimension by (1 keeps original resolution).",
+        ),
+    ] = 1,
+    method: typing.Annotated[DownsampleMethod, Query(description=DOWNSAMPLE_METHOD_DESCRIPTION)] = (
+        DownsampleMethod.BOX
+    ),
+    format: typing.Annotated[  # noqa: A002
+        typing.Literal["raw", "png", "webp"],
+        Query(description="raw returns one byte per pixel, png and webp a losslessly encoded image."),
+    ] = "raw",
+    bins: typing.Annotated[
+        int, Query(ge=0, le=DISPLAY_HISTOGRAM_BINS, description="The most histogram bins returned, 0 for none.")
+    ] = DISPLAY_HISTOGRAM_BINS,
+) -> Response:
+    """Return an image downsampled and then windowed to 8-bit grayscale, with the limits of the window in the
+    X-Window-* headers and the histogram of the downsampled image, in bins of equal width, in the X-Histogram-*
+    headers."""
 
+    image_path = (Path(CEPH_DIR) / path).resolve()
+    await run_blocking(IOCategory.METADATA, _check_image_path, image_path)
+    try:
+        data_bytes, original_width, original_height, sampled_width, sampled_height, levels = await run_blocking(
+            IOCategory.IMAGE_DECODE,
+            convert_image_to_display_bytes,
+            image_path,
+            downsample_factor,
+            window,
+            IMAGE_ENCODINGS[format],
+            method,
+            bins,
+        )
+    except BlockingIOTimeoutError:
+        raise
+    except ValueError as exc:
+        raise HTTPException(HTTPStatus.BAD_REQUEST, str(exc)) from exc
     except Exception as exc:
         logger.error(f"Failed to process image {image_path}: {exc}")
         raise HTTPException(HTTPStatus.INTERNAL_SERVER_ERROR, "Unable to process image") from exc
+
+    headers = {
+        "X-Image-Width": str(sampled_width),
+        "X-Image-Height": str(sampled_height),
+        "X-Original-Width": str(original_width),
+        "X-Original-Height": str(original_height),
+        "X-Downsample-Factor": str(downsample_factor),
+        "X-Item-Size": "1",
+        "X-Window-Low": str(levels.low),
+        "X-Window-High": str(levels.high),
+        "X-Histogram-Start": str(levels.histogram_start),
+        "X-Histogram-Width": str(levels.histogram_width),
+        "X-Histogram-Counts": ",".join(map(str, levels.histogram_counts)),
+    }
+    headers["Access-Control-Expose-Headers"] = ", ".join(headers)
+    return Response(content=data_bytes, media_type=IMAGE_MEDIA_TYPES[format], headers=headers)
+
+
+def stack_box(
+    x: typing.Annotated[int, Query(ge=0, description="Column of the left edge of the region of each frame.")] = 0,
+    y: typing.Annotated[int, Query(ge=0, description="Row of the top edge of the region of each frame.")] = 0,
+    width: typing.Annotated[
+        int | None, Query(ge=1, description="Columns in the region, at full resolution, None to the right edge.")
+    ] = None,
+    height: typing.Annotated[
+        int | None, Query(ge=1, description="Rows in the region, at full resolution, None to the bottom edge.")
+    ] = None,
+    sinogram_row: typing.Annotated[
+        int | None,
+        Query(
+            ge=0,
+            description=(
+                "Return a sinogram, only this row of each frame within the columns of the region, replacing y and "
+                "height. Only the columns are downsampled."
+            ),
+        ),
+    ] = None,
+) -> tuple[int, int, int, int] | None:
+    """Dependency returning the (left, upper, right, lower) pixel box read of each frame of a stack.
+
+    :param x: Column of the left edge of the region
+    :param y: Row of the top edge of the region
+    :param width: Columns in the region, None to the right edge of the frame
+    :param height: Rows in the region, None to the bottom edge of the frame
+    :param sinogram_row: Only read this row of the region's columns
+    :return: The box, clamped to each frame when it is read, or None for whole frames
+    """
+    if sinogram_row is not None:
+        y, height = sinogram_row, 1
+    if (x, y, width, height) == (0, 0, None, None):
+        return None
+    return x, y, sys.maxsize if width is None else x + width, sys.maxsize if height is None else y + height
+
+
+@ImatRouter.get(
+    "/imat/stack",
+    summary="Stream a stack of TIFF images, or a sinogram of them, as raw data",
+    dependencies=STREAM_PIXELS,
+)
+async def get_imat_stack(
+    path: typing.Annotated[
+        str, Query(..., description="Path to the directory containing images, relative to CEPH_DIR")
+    ],
+    box: typing.Annotated[tuple[int, int, int, int] | None, Depends(stack_box)],
+    start: typing.Annotated[int, Query(ge=0, description="Index of the first frame in the sorted image list.")] = 0,
+    stop: typing.Annotated[
+        int | None, Query(ge=0, description="Index after the last frame, None for the end of the list.")
+    ] = None,
+    step: typing.Annotated[int, Query(ge=1, description="Take every step-th frame.")] = 1,
+    downsample_factor: typing.Annotated[
+        int,
+        Query(
+            ge=1,
+            le=64,
+            description="Integer factor to reduce each dimension of each frame by (1 keeps original resolution).",
+        ),
+    ] = 1,
+    method: typing.Annotated[DownsampleMethod, Query(description=DOWNSAMPLE_METHOD_DESCRIPTION)] = (
+        DownsampleMethod.NEAREST
+    ),
+) -> StreamingResponse:
+    """Return many frames of a directory in one response, decoded in parallel by a pool of processes and streamed in
+    order as they are decoded. The body is the raw data of each frame one after another, all of the shape in the
+    X-Image-* headers, so with a sinogram_row it is the sinogram with one row per frame."""
+
+    dir_path = (Path(CEPH_DIR) / path).resolve()
+    images = (await run_blocking(IOCategory.METADATA, _list_images, dir_path))[start:stop:step]
+    if not images:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "No images in the requested range")
+    if len(images) > IMAT_STACK_MAX_FRAMES:
+        raise HTTPException(
+            HTTPStatus.BAD_REQUEST, f"{len(images)} frames requested, at most {IMAT_STACK_MAX_FRAMES} are allowed"
+        )
+
+    frames = frame_decoder.decode([dir_path / image for image in images], box, downsample_factor, method)
+    # The first frame is decoded before responding, so its shape can be sent in the headers and a request that cannot
+    # be read fails with a status code rather than a broken stream
+    try:
+        first = await anext(frames)
+    except BlockingIOTimeoutError:
+        # Stops the decodes of the frames after the first, which will never be sent
+        await frames.aclose()
+        raise
+    except ValueError as exc:
+        await frames.aclose()
+        raise HTTPException(HTTPStatus.BAD_REQUEST, str(exc)) from exc
+    except Exception as exc:
+        await frames.aclose()
+        logger.error(f"Failed to process image stack {dir_path}: {exc}")
+        raise HTTPException(HTTPStatus.INTERNAL_SERVER_ERROR, "Unable to process image stack") from exc
+
+    data_bytes, original_width, original_height, sampled_width, sampled_height = first
+    headers = {
+        "X-Frame-Count": str(len(images)),
+        "X-Frame-Start": str(start),
+        "X-Frame-Step": str(step),
+        "X-Image-Width": str(sampled_width),
+        "X-Image-Height": str(sampled_height),
+        "X-Original-Width": str(original_width),
+        "X-Original-Height": str(original_height),
+        "X-Downsample-Factor": str(downsample_factor),
+        "X-Item-Size": str(len(data_bytes) // max(sampled_width * sampled_height, 1)),
+    }
+    if box is not None:
+        headers.update({"X-Region-X": str(box[0]), "X-Region-Y": str(box[1])})
+    headers["Access-Control-Expose-Headers"] = ", ".join(headers)
+    return StreamingResponse(
+        _stream_stack(dir_path, first, frames), media_type="application/octet-stream", headers=headers
+    )
+
+
+async def _stream_stack(dir_path: Path, first: Frame, frames: AsyncGenerator[Frame]) -> AsyncIterator[bytes]:
+    """Yield the pixel bytes of each frame of a stack, checking every frame has the shape of the first.
+
+    :param dir_path: The directory of the stack
+    :param first: The first frame, already decoded
+    :param frames: The frames after the first
+    :return: Async iterator of the pixel bytes of each frame
+    """
+    yield first[0]
+    try:
+        async for frame in frames:
+            if frame[3:] != first[3:] or len(frame[0]) != len(first[0]):
+                raise ValueError(f"Frame of {frame[3]}x{frame[4]} does not match the first frame of the stack")
+            yield frame[0]
+    except Exception as exc:
+        # The status has been sent, the client sees the stream end early
+        logger.error(f"Failed to stream image stack {dir_path}: {exc}")
+        raise
+    finally:
+        await frames.aclose()
@@ -2,10 +2,12 @@ import logging
 import os
 import sys
 from http import HTTPStatus
+from pathlib import Path
 
 from fastapi import APIRouter, HTTPException
 from starlette.responses import StreamingResponse
 
+from plotting_service.executor import IOCategory, run_blocking
 from plotting_service.services.live_data_service import (
     generate_file_change_events,
     get_live_data_directory,
@@ -28,12 +30,11 @@ logger = logging.getLogger(__name__)
 MINIMUM_KEEP_ALIVE_INTERVAL = 5
 
 
-@LiveDataRouter.get("/live-data/{instrument}/files", summary="List files in instrument's live data directory")
-async def get_live_data_files(instrument: str) -> list[str]:
-    """Return list of files in the instrument's live data directory.
+def _get_checked_live_data_directory(instrument: str) -> Path:
+    """Return the instrument's live data directory, ensuring it exists and is inside the livereduce directory.
 
     :param instrument: The instrument name
-    :return: List of filenames in the live data directory
+    :return: Path to the live data directory
     """
     live_data_path = get_live_data_directory(instrument, CEPH_DIR)
 
@@ -43,7 +44,26 @@ async def get_live_data_files(instrument: str) -> list[str]:
         )
 
     safe_check_filepath(live_data_path, CEPH_DIR + "/GENERIC/livereduce")
+    return live_data_path
+
+
+@LiveDataRouter.get("/live-data/{instrument}/files", summary="List files in instrument's live data directory")
+async def get_live_data_files(instrument: str) -> list[str]:
+    """Return list of files in the instrument's live data directory.
+
+    :param instrument: The instrument name
+    :return: List of filenames in the live data directory
+    """
+    return await run_blocking(IOCategory.METADATA, _list_live_data_files, instrument)
 
+
+def _list_live_data_files(instrument: str) -> list[str]:
+    """Return the sorted filenames in the instrument's live data directory.
+
+    :param instrument: The instrument name
+    :return: Sorted filenames
+    """
+    live_data_path = _get_checked_live_data_directory(instrument)
     files = [f.name for f in live_data_path.iterdir() if f.is_file()]
     return sorted(files)
 
@@ -64,14 +84,7 @@ async def live_data(instrument: str, poll_interval: int = 2, keepalive_interval:
     if keepalive_interval < MINIMUM_KEEP_ALIVE_INTERVAL:
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Keepalive interval must be at least 5 seconds")
 
-    live_data_path = get_live_data_directory(instrument, CEPH_DIR)
-
-    if live_data_path is None:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND, detail=f"Live data directory for '{instrument}' not found"
-        )
-
-    safe_check_filepath(live_data_path, CEPH_DIR + "/GENERIC/livereduce")
+    live_data_path = await run_blocking(IOCategory.METADATA, _get_checked_live_data_directory, instrument)
 
     return StreamingResponse(
         generate_file_change_events(live_data_path, CEPH_DIR, instrument, keepalive_interval, poll_interval),
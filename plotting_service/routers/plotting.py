@@ -1,19 +1,37 @@
+import json
 import logging
 import os
 import sys
+import typing
+from collections.abc import AsyncGenerator
+from email.utils import parsedate_to_datetime
 from http import HTTPStatus
+from pathlib import Path
 
-from fastapi import APIRouter, HTTPException
-from starlette.responses import PlainTextResponse
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel, Field
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 
+from plotting_service.authorization import authorize_experiments
+from plotting_service.executor import IOCategory, run_blocking
+from plotting_service.services.text_follow_service import generate_follow_events, read_tail
 from plotting_service.utils import (
     find_file_experiment_number,
     find_file_instrument,
     find_file_user_number,
+    find_files_instrument,
     request_path_check,
+    validate_instrument_name,
 )
 
 CEPH_DIR = os.environ.get("CEPH_DIR", "/ceph")
+TEXT_TAIL_DEFAULT_LINES = 100
+TEXT_TAIL_MAX_BYTES = int(os.environ.get("TEXT_TAIL_MAX_BYTES", str(16 * 1024 * 1024)))
+MINIMUM_KEEP_ALIVE_INTERVAL = 5
+FIND_FILE_BATCH_MAX_FILES = int(os.environ.get("FIND_FILE_BATCH_MAX_FILES", "1000"))
+FIND_FILE_BATCH_MAX_EXPERIMENTS = int(os.environ.get("FIND_FILE_BATCH_MAX_EXPERIMENTS", "50"))
 
 stdout_handler = logging.StreamHandler(stream=sys.stdout)
 logging.basicConfig(
@@ -27,10 +45,35 @@ logger = logging.getLogger(__name__)
 PlottingRouter = APIRouter()
 
 
-@PlottingRouter.get(
-    "/text/instrument/{instrument}/experiment_number/{experiment_number}", response_class=PlainTextResponse
-)
-async def get_text_file(instrument: str, experiment_number: int, filename: str) -> str:
+def _is_not_modified(request_headers: Headers, response_headers: MutableHeaders) -> bool:
+    """
+    Whether a conditional GET can be answered with 304, If-None-Match takes precedence over If-Modified-Since
+    :param request_headers: The request headers
+    :param response_headers: The headers the full response would be sent with
+    :return: True if the client's copy is current
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = response_headers["etag"]
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        return parsedate_to_datetime(response_headers["last-modified"]) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+
+async def _find_text_file(instrument: str, experiment_number: int, filename: str) -> Path:
+    """
+    Find a text file in the reduced data of an experiment, rejecting names that could escape the reduced data folders
+    :param instrument: Instrument the file belongs to
+    :param experiment_number: Experiment number the file belongs to
+    :param filename: Filename of the text file
+    :return: Path to the file
+    """
     # We don't check experiment number as it is an int and pydantic won't process any non int type and return a 422
     # automatically
     if (
@@ -45,13 +88,98 @@ async def get_text_file(instrument: str, experiment_number: int, filename: str)
     ):
         raise HTTPException(status_code=HTTPStatus.FORBIDDEN)
 
-    path = find_file_instrument(CEPH_DIR, instrument, experiment_number, filename)
+    path = await run_blocking(
+        IOCategory.METADATA, find_file_instrument, CEPH_DIR, instrument, experiment_number, filename
+    )
     if path is None:
         logger.error("Could not find the file requested.")
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST)
+    return path
+
+
+@PlottingRouter.get(
+    "/text/instrument/{instrument}/experiment_number/{experiment_number}",
+    response_class=PlainTextResponse,
+    response_model=None,
+)
+async def get_text_file(request: Request, instrument: str, experiment_number: int, filename: str) -> Response:
+    """Stream a text file from the reduced data of an experiment. Range requests are supported, and ETag and
+    Last-Modified headers allow unchanged files to be revalidated with a 304 without reading them.
+
+    :param request: The request, carrying any Range and conditional headers
+    :param instrument: Instrument the file belongs to.
+    :param experiment_number: Experiment number the file belongs to.
+    :param filename: Filename of the text file.
+    :return: The file contents
+    """
+    path = await _find_text_file(instrument, experiment_number, filename)
+    stat_result = await run_blocking(IOCategory.METADATA, path.stat)
+    response = FileResponse(path, stat_result=stat_result, media_type="text/plain; charset=utf-8")
+    if _is_not_modified(request.headers, response.headers):
+        return Response(
+            status_code=HTTPStatus.NOT_MODIFIED,
+            headers={"etag": response.headers["etag"], "last-modified": response.headers["last-modified"]},
+        )
+    return response
+
 
-    with path.open("r") as file:
-        return file.read()
+@PlottingRouter.get(
+    "/text/instrument/{instrument}/experiment_number/{experiment_number}/tail", response_class=PlainTextResponse
+)
+async def get_text_file_tail(
+    instrument: str,
+    experiment_number: int,
+    filename: str,
+    lines: typing.Annotated[int | None, Query(ge=0)] = None,
+    bytes: typing.Annotated[int | None, Query(ge=0)] = None,  # noqa: A002
+) -> PlainTextResponse:
+    """Return the end of a text file, read by seeking from its end. The X-File-Offset header holds the size of the
+    file the returned text ends at, which can be passed to the follow endpoint to continue from there.
+
+    :param instrument: Instrument the file belongs to.
+    :param experiment_number: Experiment number the file belongs to.
+    :param filename: Filename of the text file.
+    :param lines: Return at most this many of the last lines, defaults to 100 if neither lines nor bytes is given.
+    :param bytes: Return at most this many of the last bytes.
+    :return: The end of the file
+    """
+    if lines is None and bytes is None:
+        lines = TEXT_TAIL_DEFAULT_LINES
+    max_bytes = TEXT_TAIL_MAX_BYTES if bytes is None else min(bytes, TEXT_TAIL_MAX_BYTES)
+    path = await _find_text_file(instrument, experiment_number, filename)
+    data, offset = await run_blocking(IOCategory.BULK_READ, read_tail, path, lines, max_bytes)
+    return PlainTextResponse(data.decode("utf-8", errors="replace"), headers={"X-File-Offset": str(offset)})
+
+
+@PlottingRouter.get("/text/instrument/{instrument}/experiment_number/{experiment_number}/follow")
+async def follow_text_file(
+    instrument: str,
+    experiment_number: int,
+    filename: str,
+    offset: typing.Annotated[int | None, Query(ge=0)] = None,
+    keepalive_interval: typing.Annotated[int, Query(ge=MINIMUM_KEEP_ALIVE_INTERVAL)] = 30,
+) -> StreamingResponse:
+    """SSE endpoint streaming the data appended to a text file. One reader per file is shared by every follower, and
+    truncation or rotation of the file is reported as an event before reading restarts from its beginning.
+
+    :param instrument: Instrument the file belongs to.
+    :param experiment_number: Experiment number the file belongs to.
+    :param filename: Filename of the text file.
+    :param offset: Byte offset already received, such as the X-File-Offset of a tail request. Defaults to the end of
+    the file.
+    :param keepalive_interval: The interval in seconds between keepalive messages (default: 30 seconds)
+    :return: StreamingResponse with SSE events
+    """
+    path = await _find_text_file(instrument, experiment_number, filename)
+    return StreamingResponse(
+        generate_follow_events(path, offset, keepalive_interval),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
 
 
 @PlottingRouter.get("/find_file/instrument/{instrument}/experiment_number/{experiment_number}")
@@ -64,14 +192,81 @@ async def find_file_get_instrument(instrument: str, experiment_number: int, file
     :param filename: Filename to find.
     :return: The relative path to the file in the CEPH_DIR env var.
     """
-    path = find_file_instrument(
-        ceph_dir=CEPH_DIR, instrument=instrument, experiment_number=experiment_number, filename=filename
+    path = await run_blocking(
+        IOCategory.METADATA,
+        find_file_instrument,
+        ceph_dir=CEPH_DIR,
+        instrument=instrument,
+        experiment_number=experiment_number,
+        filename=filename,
     )
     if path is None:
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST)
     return str(request_path_check(path=path, base_dir=CEPH_DIR))
 
 
+class FindFileBatch(BaseModel):
+    """Files to find in the reduced data of one or more experiments on an instrument"""
+
+    instrument: str
+    experiment_numbers: list[int] = Field(min_length=1, max_length=FIND_FILE_BATCH_MAX_EXPERIMENTS)
+    filenames: list[str] = Field(min_length=1, max_length=FIND_FILE_BATCH_MAX_FILES)
+
+
+async def _find_batch(batch: FindFileBatch) -> AsyncGenerator[dict[str, str | None]]:
+    """
+    Search each experiment in turn for the filenames not found in an earlier one, yielding results as they are found
+    :param batch: The files and experiments to search
+    :return: Generator of {filename: relative path} mappings, with None for files found in no experiment
+    """
+    remaining = list(dict.fromkeys(batch.filenames))
+    for experiment_number in batch.experiment_numbers:
+        found = await run_blocking(
+            IOCategory.METADATA, find_files_instrument, CEPH_DIR, batch.instrument, experiment_number, remaining
+        )
+        yield {
+            filename: str(request_path_check(path=path, base_dir=CEPH_DIR))
+            for filename, path in found.items()
+            if path is not None
+        }
+        remaining = [filename for filename, path in found.items() if path is None]
+        if not remaining:
+            return
+    yield dict.fromkeys(remaining)
+
+
+@PlottingRouter.post("/find_file/batch", response_model=None)
+async def find_file_batch(
+    request: Request, batch: FindFileBatch, stream: bool = False
+) -> dict[str, str | None] | StreamingResponse:
+    """Return the relative paths to the env var CEPH_DIR of many files in one request. Each experiment folder is
+    traversed once and access to each experiment is checked once.
+
+    :param request: The request, carrying the authorization decision
+    :param batch: The instrument, experiment numbers and filenames to find.
+    :param stream: Stream the results as newline delimited JSON objects of filename and path as they are found.
+    :return: Mapping of each filename to its relative path, or null if it was not found.
+    """
+    validate_instrument_name(batch.instrument)
+    for filename in batch.filenames:
+        if ".." in filename or "/" in filename or "\\" in filename or "~" in filename:
+            raise HTTPException(status_code=HTTPStatus.FORBIDDEN, detail=f"Invalid filename: {filename}")
+    await authorize_experiments(getattr(request.state, "authorization", None), batch.experiment_numbers)
+
+    if not stream:
+        results: dict[str, str | None] = {}
+        async for found in _find_batch(batch):
+            results.update(found)
+        return {filename: results.get(filename) for filename in batch.filenames}
+
+    async def ndjson() -> AsyncGenerator[str]:
+        async for found in _find_batch(batch):
+            for filename, path in found.items():
+                yield json.dumps({"filename": filename, "path": path}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
 @PlottingRouter.get("/find_file/generic/experiment_number/{experiment_number}")
 async def find_file_generic_experiment_number(experiment_number: int, filename: str) -> str:
     """Return the relative path to the env var CEPH_DIR that leads to the
@@ -81,7 +276,13 @@ async def find_file_generic_experiment_number(experiment_number: int, filename:
     :param filename: Filename to find
     :return: The relative path to the file in the CEPH_DIR env var.
     """
-    path = find_file_experiment_number(ceph_dir=CEPH_DIR, experiment_number=experiment_number, filename=filename)
+    path = await run_blocking(
+        IOCategory.METADATA,
+        find_file_experiment_number,
+        ceph_dir=CEPH_DIR,
+        experiment_number=experiment_number,
+        filename=filename,
+    )
     if path is None:
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST)
     return str(request_path_check(path=path, base_dir=CEPH_DIR))
@@ -96,7 +297,9 @@ async def find_file_generic_user_number(user_number: int, filename: str) -> str:
     :param filename: Filename to find
     :return: The relative path to the file in the CEPH_DIR env var.
     """
-    path = find_file_user_number(ceph_dir=CEPH_DIR, user_number=user_number, filename=filename)
+    path = await run_blocking(
+        IOCategory.METADATA, find_file_user_number, ceph_dir=CEPH_DIR, user_number=user_number, filename=filename
+    )
     if path is None:
         raise HTTPException(status_code=HTTPStatus.BAD_REQUEST)
     return str(request_path_check(path, base_dir=CEPH_DIR))
@@ -0,0 +1,142 @@
+"""Intensity windowing of images to 8-bit for display, with the histogram the window was chosen from."""
+
+import enum
+import math
+from dataclasses import dataclass, field
+
+import numpy as np
+
+DISPLAY_HISTOGRAM_BINS = 256
+
+# Integer dtypes small enough to count every value, which gives the limits, percentiles and histogram in one pass and
+# lets the window be applied with a lookup table
+_COUNTABLE_DTYPES = {np.dtype(np.uint8), np.dtype(np.uint16)}
+
+
+class WindowMethod(enum.Enum):
+    """How the lower and upper limits of the window are chosen"""
+
+    # The minimum and maximum of the image
+    MINMAX = "minmax"
+    # Percentiles of the image, ignoring outliers such as hot pixels
+    PERCENTILE = "percentile"
+    # Limits given by the client
+    MANUAL = "manual"
+
+
+class DisplayScale(enum.Enum):
+    """How values between the limits of the window are mapped to brightness"""
+
+    LINEAR = "linear"
+    # The log of one plus the value above the lower limit, bringing out faint detail next to bright areas
+    LOG = "log"
+
+
+@dataclass(frozen=True)
+class DisplayWindow:
+    """The settings used to map an image to 8-bit"""
+
+    method: WindowMethod = WindowMethod.PERCENTILE
+    lower: float = 1
+    upper: float = 99
+    low: float | None = None
+    high: float | None = None
+    gamma: float = 1.0
+    scale: DisplayScale = DisplayScale.LINEAR
+
+
+@dataclass
+class DisplayLevels:
+    """The limits an image was windowed to, and the histogram of the image in bins of equal width"""
+
+    low: float
+    high: float
+    histogram_start: float = 0.0
+    histogram_width: float = 1.0
+    histogram_counts: list[int] = field(default_factory=list)
+
+
+def window_to_uint8(
+    pixels: np.ndarray, window: DisplayWindow, bins: int = DISPLAY_HISTOGRAM_BINS
+) -> tuple[np.ndarray, DisplayLevels]:
+    """
+    Map a single channel image to 8-bit, values at or below the lower limit becoming 0 and values at or above the
+    upper limit 255. NaN becomes 0.
+    :param pixels: The image
+    :param window: How the limits are chosen and values between them mapped
+    :param bins: The most histogram bins returned, 0 to skip the histogram
+    :return: Tuple of the 8-bit image and the limits and histogram
+    """
+    pixels = pixels.astype(pixels.dtype.newbyteorder("="), copy=False)
+    if pixels.dtype in _COUNTABLE_DTYPES:
+        counts = np.bincount(pixels.ravel(), minlength=np.iinfo(pixels.dtype).max + 1)
+        levels = _counted_levels(counts, window, bins)
+        # Map every possible value once, then look each pixel up
+        table = _transfer(np.arange(len(counts)), levels.low, levels.high, window)
+        return table[pixels], levels
+    levels = _levels(pixels, window, bins)
+    return _transfer(pixels, levels.low, levels.high, window), levels
+
+
+def _counted_levels(counts: np.ndarray, window: DisplayWindow, bins: int) -> DisplayLevels:
+    """The limits and histogram of an integer image from the number of pixels with each value"""
+    occupied = np.flatnonzero(counts)
+    if occupied.size == 0:
+        return DisplayLevels(low=0, high=0)
+    minimum, maximum = int(occupied[0]), int(occupied[-1])
+    if window.method is WindowMethod.MANUAL:
+        low, high = _manual_limits(window)
+    elif window.method is WindowMethod.PERCENTILE:
+        cumulative = np.cumsum(counts)
+        # Matches np.percentile with method="lower"
+        ranks = [math.floor(q / 100 * (int(cumulative[-1]) - 1)) for q in (window.lower, window.upper)]
+        low, high = (float(np.searchsorted(cumulative, rank, side="right")) for rank in ranks)
+    else:
+        low, high = float(minimum), float(maximum)
+    levels = DisplayLevels(low=low, high=high, histogram_start=float(minimum))
+    if bins:
+        # Merge adjacent values into bins of equal integer width
+        merge = math.ceil((maximum + 1 - minimum) / bins)
+        occupied_counts = counts[minimum : maximum + 1]
+        merged = np.pad(occupied_counts, (0, -len(occupied_counts) % merge)).reshape(-1, merge).sum(axis=1)
+        levels.histogram_width = float(merge)
+        levels.histogram_counts = merged.tolist()
+    return levels
+
+
+def _levels(pixels: np.ndarray, window: DisplayWindow, bins: int) -> DisplayLevels:
+    """The limits and histogram of the finite values of an image"""
+    finite = pixels[np.isfinite(pixels)] if np.issubdtype(pixels.dtype, np.floating) else pixels.ravel()
+    if finite.size == 0:
+        return DisplayLevels(low=0, high=0)
+    minimum, maximum = float(finite.min()), float(finite.max())
+    if window.method is WindowMethod.MANUAL:
+        low, high = _manual_limits(window)
+    elif window.method is WindowMethod.PERCENTILE:
+        low, high = (float(value) for value in np.percentile(finite, [window.lower, window.upper], method="lower"))
+    else:
+        low, high = minimum, maximum
+    levels = DisplayLevels(low=low, high=high, histogram_start=minimum)
+    if bins:
+        counts, edges = np.histogram(finite, bins=bins, range=(minimum, maximum))
+        levels.histogram_start = float(edges[0])
+        levels.histogram_width = float(edges[1] - edges[0])
+        levels.histogram_counts = counts.tolist()
+    return levels
+
+
+def _manual_limits(window: DisplayWindow) -> tuple[float, float]:
+    if window.low is None or window.high is None:
+        raise ValueError("A manual window needs both a low and a high limit")
+    return window.low, window.high
+
+
+def _transfer(values: np.ndarray, low: float, high: float, window: DisplayWindow) -> np.ndarray:
+    """Map values to 8-bit through the window, raising the fraction of the window to the power of the gamma after
+    the scale, so a gamma below 1 brightens dark values"""
+    span = high - low if high > low else 1.0
+    above = np.clip(values.astype(np.float64) - low, 0, span)
+    fraction = np.log1p(above) / math.log1p(span) if window.scale is DisplayScale.LOG else above / span
+    if window.gamma != 1:
+        fraction = fraction**window.gamma
+    return np.nan_to_num(fraction * 255 + 0.5, nan=0).astype(np.uint8)
@@ -0,0 +1,180 @@
+"""Process wide cache of open read-only HDF5 file handles."""
+
+import contextlib
+import logging
+import os
+import threading
+import time
+import typing
+from collections import OrderedDict
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+import h5py  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+H5_HANDLE_CACHE_SIZE = int(os.environ.get("H5_HANDLE_CACHE_SIZE", "64"))
+H5_HANDLE_IDLE_TIMEOUT = float(os.environ.get("H5_HANDLE_IDLE_TIMEOUT", "300"))
+
+
+@dataclass
+class _Handle:
+    file: h5py.File
+    identity: tuple[int, int, int]
+    users: int = 0
+    last_used: float = 0.0
+    retired: bool = False
+
+    def close(self) -> None:
+        with contextlib.suppress(Exception):
+            self.file.close()
+
+
+class H5FileCache:
+    """
+    Keeps recently used HDF5 files open so that repeated requests skip reading the superblock and B-trees again.
+    Handles are identified by path, mtime, inode and size, a file that changed on disk is reopened. A handle evicted
+    or replaced while a request is still using it is closed once that request releases it.
+    """
+
+    def __init__(
+        self,
+        max_open: int = H5_HANDLE_CACHE_SIZE,
+        idle_timeout: float = H5_HANDLE_IDLE_TIMEOUT,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        :param max_open: The most handles kept open, in use handles may temporarily exceed it
+        :param idle_timeout: Seconds an unused handle is kept open for
+        :param clock: Monotonic clock used for idle expiry, replaceable for testing
+        """
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._handles: OrderedDict[str, _Handle] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._handles)
+
+    @contextlib.contextmanager
+    def open(self, path: str | Path) -> Iterator[h5py.File]:
+        """
+        Borrow an open read-only handle of a file, opening it if it is not cached or has changed on disk
+        :param path: The HDF5 file
+        :return: Context manager yielding the open file
+        """
+        key = str(path)
+        stat_result = Path(key).stat()
+        identity = (stat_result.st_mtime_ns, stat_result.st_ino, stat_result.st_size)
+        handle = self._acquire(key, identity)
+        if handle is None:
+            handle = self._acquire_opened(key, _Handle(h5py.File(key, "r"), identity))
+        try:
+            yield handle.file
+        finally:
+            self._release(handle)
+
+    def _acquire(self, key: str, identity: tuple[int, int, int]) -> _Handle | None:
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None and handle.identity != identity:
+                logger.info("Reopening %s as it changed on disk", key)
+                self._retire(key, handle)
+                handle = None
+            if handle is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            handle.users += 1
+            self._handles.move_to_end(key)
+            return handle
+
+    def _acquire_opened(self, key: str, opened: _Handle) -> _Handle:
+        with self._lock:
+            cached = self._handles.get(key)
+            if cached is not None and cached.identity == opened.identity:
+                # Another request opened the same file first, use its handle
+                cached.users += 1
+                self._handles.move_to_end(key)
+                duplicate: _Handle | None = opened
+                handle = cached
+            else:
+                if cached is not None:
+                    self._retire(key, cached)
+                opened.users = 1
+                self._handles[key] = opened
+                duplicate = None
+                handle = opened
+            self._evict()
+        if duplicate is not None:
+            duplicate.close()
+        return handle
+
+    def _release(self, handle: _Handle) -> None:
+        with self._lock:
+            handle.users -= 1
+            handle.last_used = self._clock()
+            close = handle.retired and handle.users == 0
+            self._evict()
+        if close:
+            handle.close()
+
+    def _retire(self, key: str, handle: _Handle) -> None:
+        """Remove a handle from the cache, closing it now if unused or when its last user releases it"""
+        del self._handles[key]
+        handle.retired = True
+        if handle.users == 0:
+            handle.close()
+
+    def _evict(self) -> None:
+        """Close idle handles and the least recently used unused handles beyond the size limit, lock must be held"""
+        now = self._clock()
+        for key, handle in list(self._handles.items()):
+            over_limit = len(self._handles) > self.max_open
+            idle = handle.users == 0 and now - handle.last_used > self.idle_timeout
+            if (over_limit and handle.users == 0) or idle:
+                self._retire(key, handle)
+                self.evictions += 1
+
+    def evict_idle(self) -> None:
+        """
+        Close handles that have not been used within the idle timeout
+        :return: None
+        """
+        with self._lock:
+            self._evict()
+
+    def clear(self) -> None:
+        """
+        Close every handle, handles in use are closed when released
+        :return: None
+        """
+        with self._lock:
+            for key, handle in list(self._handles.items()):
+                self._retire(key, handle)
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Return the counters and occupancy of the cache
+        :return: Dictionary of cache statistics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "open": len(self._handles),
+                "in_use": sum(handle.users > 0 for handle in self._handles.values()),
+                "max_open": self.max_open,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+h5_file_cache = H5FileCache()
@@ -0,0 +1,236 @@
+"""Two tier cache of images derived from IMAT TIFFs, such as downsampled RGB previews, in memory and on local disk."""
+
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import threading
+import typing
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", str(Path(tempfile.gettempdir()) / "plotting-service-images"))
+IMAGE_CACHE_MEMORY_BYTES = int(os.environ.get("IMAGE_CACHE_MEMORY_BYTES", str(256 * 1024**2)))
+IMAGE_CACHE_DISK_BYTES = int(os.environ.get("IMAGE_CACHE_DISK_BYTES", str(4 * 1024**3)))
+
+# Derived image bytes followed by original width, original height, sampled width and sampled height
+DerivedImage = tuple[bytes, int, int, int, int]
+
+_HEADER = struct.Struct("<4I")
+_SUFFIX = ".img"
+
+
+class DerivedImageCache:
+    """
+    Caches images derived from a source image by (path, mtime, size, downsample factor, mode). Entries are kept in
+    memory and on local disk, each tier evicting its least recently used entries beyond its own byte budget. Concurrent
+    requests for an entry that is not cached generate it once, the others wait for it. Entries written by an earlier
+    process are reused.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path = IMAGE_CACHE_DIR,
+        memory_bytes: int = IMAGE_CACHE_MEMORY_BYTES,
+        disk_bytes: int = IMAGE_CACHE_DISK_BYTES,
+    ) -> None:
+        """
+        :param directory: Local directory the disk tier is stored in
+        :param memory_bytes: The most bytes of images kept in memory
+        :param disk_bytes: The most bytes of images kept on disk
+        """
+        self.directory = Path(directory)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory: OrderedDict[str, DerivedImage] = OrderedDict()
+        self._memory_used = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._generating: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+    @staticmethod
+    def _key(source: Path, downsample_factor: int, mode: str) -> str:
+        stat_result = source.stat()
+        identity = f"{source}\0{stat_result.st_mtime_ns}\0{stat_result.st_size}\0{downsample_factor}\0{mode}"
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    def _load_existing(self) -> None:
+        """Register entries left by an earlier process in least recently used order, lock must be held"""
+        if self._loaded:
+            return
+        self._loaded = True
+        self.directory.mkdir(parents=True, exist_ok=True)
+        existing = []
+        for entry in self.directory.iterdir():
+            if entry.suffix != _SUFFIX:
+                # Left over from a write that did not finish
+                entry.unlink(missing_ok=True)
+                continue
+            stat_result = entry.stat()
+            existing.append((stat_result.st_mtime, entry.stem, stat_result.st_size))
+        for _, key, size in sorted(existing):
+            self._disk[key] = size
+        self._evict_disk()
+
+    def get(
+        self, source: Path, downsample_factor: int, mode: str, generate: Callable[[Path, int], DerivedImage]
+    ) -> DerivedImage:
+        """
+        Return a derived image, generating it if neither tier holds it
+        :param source: The source image
+        :param downsample_factor: The downsample factor the image is derived with
+        :param mode: Names how the image is derived, such as "rgb" or "png"
+        :param generate: Derives the image from the source path and downsample factor
+        :return: The derived image
+        """
+        key = self._key(source, downsample_factor, mode)
+        with self._lock:
+            self._load_existing()
+            cached = self._lookup(key)
+            if cached is not None:
+                return cached
+            # Only the request that starts generating removes the entry, one that waited and finishes later could
+            # otherwise remove the entry of a newer generation and let a duplicate start
+            created = key not in self._generating
+            if created:
+                self._generating[key] = threading.Lock()
+            generating = self._generating[key]
+
+        try:
+            with generating:
+                with self._lock:
+                    # Another request may have generated it while this one waited
+                    cached = self._lookup(key, record=False)
+                if cached is not None:
+                    return cached
+                cached = self._read(key)
+                with self._lock:
+                    if cached is None:
+                        self.misses += 1
+                    else:
+                        self.disk_hits += 1
+                if cached is None:
+                    cached = generate(source, downsample_factor)
+                    self._write(key, cached)
+                with self._lock:
+                    self._store_memory(key, cached)
+                return cached
+        finally:
+            if created:
+                with self._lock:
+                    del self._generating[key]
+
+    def _lookup(self, key: str, record: bool = True) -> DerivedImage | None:
+        """Return the image if it is held in memory, lock must be held"""
+        image = self._memory.get(key)
+        if image is not None:
+            self._memory.move_to_end(key)
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            if record:
+                self.memory_hits += 1
+        return image
+
+    def _store_memory(self, key: str, image: DerivedImage) -> None:
+        """Keep an image in memory, evicting the least recently used beyond the budget, lock must be held"""
+        size = len(image[0])
+        if key in self._memory or size > self.memory_bytes:
+            return
+        self._memory[key] = image
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted[0])
+            self.memory_evictions += 1
+
+    def _read(self, key: str) -> DerivedImage | None:
+        """Read an image from disk if the disk tier holds it"""
+        with self._lock:
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+        path = self.directory / f"{key}{_SUFFIX}"
+        try:
+            content = path.read_bytes()
+            # Touch the file so the least recently used order survives a restart
+            path.touch()
+        except OSError:
+            # Evicted since it was looked up
+            return None
+        original_width, original_height, sampled_width, sampled_height = _HEADER.unpack_from(content)
+        return content[_HEADER.size :], original_width, original_height, sampled_width, sampled_height
+
+    def _write(self, key: str, image: DerivedImage) -> None:
+        """Write an image to disk, evicting the least recently used beyond the budget"""
+        data, *dimensions = image
+        size = _HEADER.size + len(data)
+        if size > self.disk_bytes:
+            return
+        try:
+            with tempfile.NamedTemporaryFile(dir=self.directory, prefix=f".{key}-", delete=False) as file:
+                file.write(_HEADER.pack(*dimensions))
+                file.write(data)
+            Path(file.name).replace(self.directory / f"{key}{_SUFFIX}")
+        except OSError as exc:
+            logger.warning("Unable to write derived image to %s", self.directory, exc_info=exc)
+            return
+        with self._lock:
+            self._disk[key] = size
+            self._disk.move_to_end(key)
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """Delete the least recently used images beyond the disk budget, lock must be held"""
+        total = sum(self._disk.values())
+        while total > self.disk_bytes:
+            key, size = self._disk.popitem(last=False)
+            total -= size
+            (self.directory / f"{key}{_SUFFIX}").unlink(missing_ok=True)
+            self.disk_evictions += 1
+
+    def clear(self) -> None:
+        """
+        Drop every cached image from memory and disk
+        :return: None
+        """
+        with self._lock:
+            for key in list(self._disk):
+                (self.directory / f"{key}{_SUFFIX}").unlink(missing_ok=True)
+            self._disk.clear()
+            self._memory.clear()
+            self._memory_used = 0
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Return the counters and occupancy of both tiers
+        :return: Dictionary of cache statistics
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "memory_max_bytes": self.memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": sum(self._disk.values()),
+                "disk_max_bytes": self.disk_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_evictions": self.memory_evictions,
+                "disk_evictions": self.disk_evictions,
+            }
+
+
+derived_image_cache = DerivedImageCache()
@@ -1,29 +1,260 @@
 """Image processing service for IMAT and related image operations."""
 
+import enum
+import io
+import math
+import os
+import typing
 from pathlib import Path
 
+import numpy as np
 from PIL import Image
 
+from plotting_service.services.display_service import (
+    DISPLAY_HISTOGRAM_BINS,
+    DisplayLevels,
+    DisplayWindow,
+    WindowMethod,
+    window_to_uint8,
+)
+from plotting_service.services.lod_service import LOD_CHUNK_ELEMENTS
+from plotting_service.services.tiff_service import TiffRegionReader, UnsupportedTiffError
+
 IMAGE_SUFFIXES = {".tif", ".tiff"}
+IMAT_TILE_SIZE = int(os.environ.get("IMAT_TILE_SIZE", "256"))
+
+
+class DownsampleMethod(enum.Enum):
+    """How an image is reduced by the downsample factor, from the highest quality to the fastest"""
+
+    # Smooth resampling of the whole decoded image
+    LANCZOS = "lanczos"
+    # Mean of each block of factor by factor pixels
+    BOX = "box"
+    # Maximum of each block, keeping isolated bright pixels visible
+    MAX = "max"
+    # One pixel of each block, decoding only the strips or tiles holding those pixels
+    NEAREST = "nearest"
+
+
+# Modes Image.reduce supports, other modes are reduced with NumPy
+_REDUCIBLE_MODES = {"L", "LA", "RGB", "RGBA", "I", "F"}
+# Modes with more than 8 bits per pixel, which convert("RGB") and convert("L") clip rather than scale
+_WIDE_MODES = {"I;16", "I;16L", "I;16B", "I;16N", "I", "F"}
+# (dtype, samples per pixel) of TIFFs that Image.fromarray can turn back into an image
+_ARRAY_LAYOUTS = {
+    (np.dtype(np.uint8), 1),
+    (np.dtype(np.uint8), 3),
+    (np.dtype(np.uint8), 4),
+    (np.dtype(np.uint16), 1),
+    (np.dtype(np.int32), 1),
+    (np.dtype(np.float32), 1),
+}
+
+
+def _target_size(width: int, height: int, downsample_factor: int) -> tuple[int, int]:
+    """Size of an image reduced by a factor, counting a partial block at the edges as a pixel like block_reduce,
+    Image.reduce and the levels of tile_levels so every method gives the same size"""
+    return math.ceil(width / downsample_factor), math.ceil(height / downsample_factor)
+
+
+def _nearest_indices(length: int, target: int) -> np.ndarray:
+    """The source pixel Image.resize samples for each target pixel with nearest neighbour resampling"""
+    return ((np.arange(target) + 0.5) * length / target).astype(np.intp)
+
+
+def block_reduce(pixels: typing.Any, downsample_factor: int, method: DownsampleMethod) -> np.ndarray:
+    """Reduce each block of factor by factor pixels to its mean or maximum, blocks at the edges cover only the pixels
+    that are there. Rows are read in chunks so the whole image is never held at full resolution.
+
+    :param pixels: The image, an array or anything sliced by (rows, columns) like a TiffRegionReader
+    :param downsample_factor: The rows and columns of each block
+    :param method: BOX for the mean of each block or MAX for the maximum
+    :return: The reduced image, with the dtype of the source
+    """
+    height, width = pixels.shape[:2]
+    rows_per_chunk = max(1, LOD_CHUNK_ELEMENTS // max(width, 1) // downsample_factor) * downsample_factor
+    padded_width = -(-width // downsample_factor) * downsample_factor
+    chunks = []
+    for row_start in range(0, height, rows_per_chunk):
+        chunk = np.asarray(pixels[slice(row_start, min(row_start + rows_per_chunk, height)), slice(0, width)])
+        rows = chunk.shape[0]
+        padded_rows = -(-rows // downsample_factor) * downsample_factor
+        if (padded_rows, padded_width) != (rows, width):
+            # Pad with a value that does not change the maximum, the mean divides by the pixels that are there
+            fill = 0 if method is DownsampleMethod.BOX else _lowest(chunk.dtype)
+            padding = ((0, padded_rows - rows), (0, padded_width - width)) + ((0, 0),) * (chunk.ndim - 2)
+            chunk = np.pad(chunk, padding, constant_values=fill)
+        # Reduce each group of rows, then each group of columns within them
+        grouped = chunk.reshape(padded_rows // downsample_factor, downsample_factor, *chunk.shape[1:])
+        if method is DownsampleMethod.MAX:
+            rows_reduced = grouped.max(axis=1)
+        else:
+            accumulator = np.int64 if np.issubdtype(chunk.dtype, np.integer) else np.float64
+            rows_reduced = grouped.sum(axis=1, dtype=accumulator)
+        grouped = rows_reduced.reshape(
+            rows_reduced.shape[0], padded_width // downsample_factor, downsample_factor, *rows_reduced.shape[2:]
+        )
+        if method is DownsampleMethod.MAX:
+            reduced = grouped.max(axis=2)
+        else:
+            row_counts = np.minimum(downsample_factor, rows - np.arange(0, rows, downsample_factor))
+            column_counts = np.minimum(downsample_factor, width - np.arange(0, width, downsample_factor))
+            counts = np.outer(row_counts, column_counts).reshape(
+                len(row_counts), len(column_counts), *(1,) * (chunk.ndim - 2)
+            )
+            sums = grouped.sum(axis=2)
+            # Integer images round half up
+            reduced = (sums + counts // 2) // counts if sums.dtype == np.int64 else sums / counts
+        chunks.append(reduced.astype(chunk.dtype, copy=False))
+    return np.concatenate(chunks)
+
+
+def _lowest(dtype: np.dtype[typing.Any]) -> int | float:
+    """The lowest value of a dtype"""
+    return int(np.iinfo(dtype).min) if np.issubdtype(dtype, np.integer) else -np.inf
+
+
+def downsample_image(
+    image_path: Path, downsample_factor: int, method: DownsampleMethod = DownsampleMethod.NEAREST
+) -> tuple[Image.Image, int, int]:
+    """Reduce an image by an integer factor. Image.reduce is used for 8-bit images and NumPy for 16-bit images. TIFFs
+    are read through a memory map when uncompressed and strip by strip or tile by tile otherwise, rather than decoded
+    whole.
+
+    :param image_path: Path to the image file
+    :param downsample_factor: Factor to reduce resolution (1 keeps original)
+    :param method: How each block of pixels is reduced
+    :return: Tuple of (downsampled image in the mode of the source, original width, original height)
+    """
+    return read_image_region(image_path, None, downsample_factor, method)
+
+
+class _RegionView:
+    """A rectangle of a TiffRegionReader, sliced by (rows, columns) relative to the rectangle"""
+
+    def __init__(self, reader: TiffRegionReader, box: tuple[int, int, int, int]) -> None:
+        self.reader = reader
+        self.left, self.upper, right, lower = box
+        self.shape = (lower - self.upper, right - self.left)
+
+    def __getitem__(self, key: tuple[slice, slice]) -> np.ndarray:
+        rows = range(self.shape[0])[key[0]]
+        columns = range(self.shape[1])[key[1]]
+        return self.reader.read(
+            slice(self.upper + rows.start, self.upper + rows.stop),
+            slice(self.left + columns.start, self.left + columns.stop),
+        )
+
+
+def _clamp_box(box: tuple[int, int, int, int] | None, width: int, height: int) -> tuple[int, int, int, int]:
+    """Clamp a (left, upper, right, lower) box to an image, raising a ValueError if nothing of it is left"""
+    if box is None:
+        return 0, 0, width, height
+    left, upper, right, lower = box
+    clamped = max(left, 0), max(upper, 0), min(right, width), min(lower, height)
+    if clamped[0] >= clamped[2] or clamped[1] >= clamped[3]:
+        raise ValueError(f"Region {box} is outside the {width}x{height} image")
+    return clamped
 
 
-def find_latest_image_in_directory(directory: Path) -> Path | None:
-    """Return the newest image file under directory, searching recursively.
+def read_image_region(
+    image_path: Path,
+    box: tuple[int, int, int, int] | None,
+    downsample_factor: int,
+    method: DownsampleMethod = DownsampleMethod.BOX,
+) -> tuple[Image.Image, int, int]:
+    """Read a rectangle of an image and reduce it by an integer factor. TIFFs are read through a memory map when
+    uncompressed and otherwise only the strips or tiles overlapping the rectangle are decoded.
 
-    :param directory: The directory to search for images
-    :return: Path to the newest image file, or None if no images found
+    :param image_path: Path to the image file
+    :param box: The (left, upper, right, lower) pixel box to read like Image.crop, clamped to the image, or None for
+    the whole image
+    :param downsample_factor: Factor to reduce resolution (1 keeps original)
+    :param method: How each block of pixels is reduced
+    :return: Tuple of (region in the mode of the source, original width, original height)
+    """
+    if box is not None or (downsample_factor > 1 and method is not DownsampleMethod.LANCZOS):
+        try:
+            with TiffRegionReader(image_path) as reader:
+                # Image.reduce is faster for whole 8-bit images, a region is still read without decoding the rest
+                if (reader.dtype, reader.samples) in _ARRAY_LAYOUTS and not (
+                    box is None and method is DownsampleMethod.BOX and reader.dtype == np.uint8
+                ):
+                    left, upper, right, lower = _clamp_box(box, reader.width, reader.height)
+                    if downsample_factor == 1 or method is DownsampleMethod.LANCZOS:
+                        region = Image.fromarray(reader.read(slice(upper, lower), slice(left, right)))
+                        if downsample_factor > 1:
+                            size = _target_size(right - left, lower - upper, downsample_factor)
+                            region = region.resize(size, Image.Resampling.LANCZOS)
+                        return region, reader.width, reader.height
+                    if method is DownsampleMethod.NEAREST:
+                        target_width, target_height = _target_size(right - left, lower - upper, downsample_factor)
+                        pixels = reader.take(
+                            upper + _nearest_indices(lower - upper, target_height),
+                            left + _nearest_indices(right - left, target_width),
+                        )
+                    else:
+                        pixels = block_reduce(
+                            _RegionView(reader, (left, upper, right, lower)), downsample_factor, method
+                        )
+                    return Image.fromarray(pixels), reader.width, reader.height
+        except UnsupportedTiffError:
+            pass
+
+    with Image.open(image_path) as source:
+        original_width, original_height = source.size
+        image = source if box is None else source.crop(_clamp_box(box, original_width, original_height))
+        if downsample_factor == 1:
+            return image.copy(), original_width, original_height
+        if method is DownsampleMethod.LANCZOS or method is DownsampleMethod.NEAREST:
+            resample = Image.Resampling.LANCZOS if method is DownsampleMethod.LANCZOS else Image.Resampling.NEAREST
+            return (
+                image.resize(_target_size(image.width, image.height, downsample_factor), resample),
+                original_width,
+                original_height,
+            )
+        if method is DownsampleMethod.BOX and image.mode in _REDUCIBLE_MODES:
+            return image.reduce(downsample_factor), original_width, original_height
+        reduced = Image.fromarray(block_reduce(np.asarray(image), downsample_factor, method))
+        return reduced, original_width, original_height
+
+
+def image_size(image_path: Path) -> tuple[int, int]:
+    """Return the size of an image, reading only its header.
+
+    :param image_path: Path to the image file
+    :return: Tuple of (width, height)
     """
-    latest_path: Path | None = None
-    latest_mtime: float = 0.0
+    with Image.open(image_path) as image:
+        return image.size
 
-    for entry in directory.rglob("*"):
-        if entry.is_file() and entry.suffix.lower() in IMAGE_SUFFIXES:
-            mtime = entry.stat().st_mtime
-            if mtime > latest_mtime:
-                latest_path = entry
-                latest_mtime = mtime
 
-    return latest_path
+def tile_levels(width: int, height: int, tile_size: int = IMAT_TILE_SIZE) -> dict[str, typing.Any]:
+    """Describe the levels of the tile pyramid of an image, each half the size of the one before until the last fits
+    in one tile.
+
+    :param width: Width of the image
+    :param height: Height of the image
+    :param tile_size: Rows and columns of each tile
+    :return: The tile size and the shape and number of tiles of each level
+    """
+    levels = []
+    level = 0
+    while True:
+        factor = 2**level
+        rows, columns = math.ceil(height / factor), math.ceil(width / factor)
+        levels.append(
+            {
+                "level": level,
+                "downsample_factor": factor,
+                "shape": [rows, columns],
+                "tiles": [math.ceil(rows / tile_size), math.ceil(columns / tile_size)],
+            }
+        )
+        if max(rows, columns) <= tile_size:
+            return {"tile_size": tile_size, "levels": levels}
+        level += 1
 
 
 def convert_image_to_rgb_array(image_path: Path, downsample_factor: int) -> tuple[list[int], int, int, int, int]:
@@ -33,19 +264,84 @@ def convert_image_to_rgb_array(image_path: Path, downsample_factor: int) -> tupl
     :param downsample_factor: Factor to reduce resolution (1 keeps original)
     :return: Tuple of (data bytes, original width, original height, sampled width, sampled height)
     """
-    with Image.open(image_path) as image:
-        original_width, original_height = image.size
-        converted = image.convert("RGB")
+    data, original_width, original_height, sampled_width, sampled_height = convert_image_to_rgb_bytes(
+        image_path, downsample_factor
+    )
+    return list(data), original_width, original_height, sampled_width, sampled_height
+
+
+def convert_image_to_rgb_bytes(
+    image_path: Path,
+    downsample_factor: int,
+    image_format: typing.Literal["png", "webp"] | None = None,
+    method: DownsampleMethod = DownsampleMethod.LANCZOS,
+) -> tuple[bytes, int, int, int, int]:
+    """Convert image into RGB bytes, either raw with one byte per channel in row major order or as a lossless PNG or
+    WebP.
+
+    :param image_path: Path to the image file
+    :param downsample_factor: Factor to reduce resolution (1 keeps original)
+    :param image_format: Encode the image as png or webp, None returns the raw RGB bytes
+    :param method: How the image is downsampled
+    :return: Tuple of (data bytes, original width, original height, sampled width, sampled height)
+    """
+    if method is DownsampleMethod.LANCZOS:
+        with Image.open(image_path) as image:
+            original_width, original_height = image.size
+            converted = _to_rgb(image)
+
+            if downsample_factor > 1:
+                # Reduce resolution while keeping at least 1x1 output
+                converted = converted.resize(
+                    _target_size(original_width, original_height, downsample_factor), Image.Resampling.LANCZOS
+                )  # Lanczos gives higher-quality downsampling
+    else:
+        downsampled, original_width, original_height = downsample_image(image_path, downsample_factor, method)
+        converted = _to_rgb(downsampled)
+
+    sampled_width, sampled_height = converted.size
+    return _encode(converted, image_format), original_width, original_height, sampled_width, sampled_height
 
-        if downsample_factor > 1:
-            # Reduce resolution while keeping at least 1x1 output
-            target_width = max(1, round(original_width / downsample_factor))
-            target_height = max(1, round(original_height / downsample_factor))
-            converted = converted.resize(
-                (target_width, target_height), Image.Resampling.LANCZOS
-            )  # Lanczos gives higher-quality downsampling
 
-        sampled_width, sampled_height = converted.size
-        data = list(converted.tobytes())
+def _to_rgb(image: Image.Image) -> Image.Image:
+    """Convert an image to RGB, scaling images with more than 8 bits per pixel from their minimum to their maximum"""
+    if image.mode in _WIDE_MODES:
+        pixels, _ = window_to_uint8(np.asarray(image), DisplayWindow(method=WindowMethod.MINMAX), bins=0)
+        return Image.fromarray(pixels).convert("RGB")
+    return image.convert("RGB")
 
-    return data, original_width, original_height, sampled_width, sampled_height
+
+def _encode(image: Image.Image, image_format: typing.Literal["png", "webp"] | None) -> bytes:
+    """The raw bytes of an image, or the image losslessly encoded as PNG or WebP"""
+    if image_format is None:
+        return image.tobytes()
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format.upper(), lossless=True)
+    return buffer.getvalue()
+
+
+def convert_image_to_display_bytes(
+    image_path: Path,
+    downsample_factor: int,
+    window: DisplayWindow,
+    image_format: typing.Literal["png", "webp"] | None = None,
+    method: DownsampleMethod = DownsampleMethod.BOX,
+    bins: int = DISPLAY_HISTOGRAM_BINS,
+) -> tuple[bytes, int, int, int, int, DisplayLevels]:
+    """Convert an image into 8-bit grayscale for display, windowing its intensities after downsampling it. Images with
+    several channels are converted to grayscale first.
+
+    :param image_path: Path to the image file
+    :param downsample_factor: Factor to reduce resolution (1 keeps original)
+    :param window: How the intensities are mapped to 8-bit
+    :param image_format: Encode the image as png or webp, None returns one raw byte per pixel
+    :param method: How the image is downsampled
+    :param bins: The most histogram bins returned, 0 to skip the histogram
+    :return: Tuple of (data bytes, original width, original height, sampled width, sampled height, levels)
+    """
+    image, original_width, original_height = read_image_region(image_path, None, downsample_factor, method)
+    if image.mode not in _WIDE_MODES and image.mode != "L":
+        image = image.convert("L")
+    pixels, levels = window_to_uint8(np.asarray(image), window, bins)
+    display = Image.fromarray(pixels)
+    return _encode(display, image_format), original_width, original_height, display.width, display.height, levels
@@ -0,0 +1,253 @@
+"""Index of the newest images in each RB folder of the IMAT directory, replacing a recursive scan per request."""
+
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+import typing
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from plotting_service.services.image_service import IMAGE_SUFFIXES
+
+logger = logging.getLogger(__name__)
+
+IMAT_INDEX_REFRESH_INTERVAL = float(os.environ.get("IMAT_INDEX_REFRESH_INTERVAL", "2"))
+IMAT_INDEX_MAX_IMAGES = int(os.environ.get("IMAT_INDEX_MAX_IMAGES", "100"))
+
+RB_FOLDER = re.compile(r"RB\d+")
+
+# Directory mtimes are only trusted once they are older than this, a directory listed within the same timestamp tick
+# as a write to it could otherwise hide that write until it is modified again
+_MTIME_GRACE_NS = 2_000_000_000
+
+# (mtime_ns, path relative to the root), ordered so the largest is the newest
+Image = tuple[int, str]
+
+
+@dataclass
+class _Directory:
+    mtime_ns: int | None
+    images: list[Image]
+    subdirs: tuple[str, ...]
+
+
+@dataclass
+class _Snapshot:
+    """What lookups read, replaced as a whole after each refresh so it never has to be locked"""
+
+    rb_folders: frozenset[str] = frozenset()
+    newest_by_rb: dict[str, list[Image]] = field(default_factory=dict)
+    newest: list[Image] = field(default_factory=list)
+
+
+class LatestImageIndex:
+    """
+    The newest images of every RB folder below a root directory and across all of them. The first refresh scans every
+    RB folder, later refreshes stat every directory but only list those whose mtime changed, and only recompute the
+    newest images of the RB folders those belong to. Lookups read the result of the last refresh.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        refresh_interval: float = IMAT_INDEX_REFRESH_INTERVAL,
+        max_images: int = IMAT_INDEX_MAX_IMAGES,
+    ) -> None:
+        """
+        :param root: The IMAT directory holding the RB folders
+        :param refresh_interval: Seconds between refreshes
+        :param max_images: The most images kept per RB folder and across all of them
+        """
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self.max_images = max_images
+        self.ready = False
+        self.refreshes = 0
+        self.listed_directories = 0
+        self._directories: dict[str, _Directory] = {}
+        self._snapshot = _Snapshot()
+        self._refreshed_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def refresh(self) -> None:
+        """
+        Bring the index up to date with the directory tree, listing only directories that changed
+        :return: None
+        """
+        with self._refresh_lock:
+            started = time.monotonic()
+            directories, changed_rbs = self._walk()
+            changed_rbs.update(
+                _rb_of(relative_dir) for relative_dir in self._directories.keys() - directories.keys() if relative_dir
+            )
+            self._directories = directories
+            self._publish(changed_rbs)
+            self.ready = True
+            self._refreshed_at = time.monotonic()
+            self.refreshes += 1
+            logger.debug("Refreshed image index of %s in %.3fs", self.root, self._refreshed_at - started)
+
+    def _walk(self) -> tuple[dict[str, _Directory], set[str]]:
+        """
+        Stat every directory of the RB folders, listing those that are new or changed
+        :return: Tuple of every directory and the RB folders with a directory that changed
+        """
+        now_ns = time.time_ns()
+        directories: dict[str, _Directory] = {}
+        changed_rbs: set[str] = set()
+        pending = [""]
+        while pending:
+            relative_dir = pending.pop()
+            path = os.path.join(self.root, relative_dir)  # noqa: PTH118
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns  # noqa: PTH116
+            except OSError:
+                continue
+            directory = self._directories.get(relative_dir)
+            if directory is None or directory.mtime_ns != mtime_ns:
+                trusted_mtime_ns = mtime_ns if now_ns - mtime_ns > _MTIME_GRACE_NS else None
+                directory = self._list(path, relative_dir, trusted_mtime_ns)
+                self.listed_directories += 1
+                if relative_dir:
+                    changed_rbs.add(_rb_of(relative_dir))
+            directories[relative_dir] = directory
+            pending.extend(directory.subdirs)
+        return directories, changed_rbs
+
+    def _list(self, path: str, relative_dir: str, mtime_ns: int | None) -> _Directory:
+        """
+        List a directory, keeping its newest images. The root only contributes its RB folders.
+        :param path: The directory
+        :param relative_dir: The directory relative to the root
+        :param mtime_ns: The mtime to record, None to list the directory again on the next refresh
+        :return: The listing
+        """
+        images = []
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if not relative_dir:
+                        # RB folders may be links, links inside them are not followed so the walk cannot loop
+                        if RB_FOLDER.fullmatch(entry.name) and entry.is_dir():
+                            subdirs.append(entry.name)
+                    elif entry.is_dir(follow_symlinks=False):
+                        subdirs.append(os.path.join(relative_dir, entry.name))  # noqa: PTH118
+                    elif os.path.splitext(entry.name)[1].lower() in IMAGE_SUFFIXES:  # noqa: PTH122
+                        try:
+                            if entry.is_file():
+                                images.append((entry.stat().st_mtime_ns, os.path.join(relative_dir, entry.name)))  # noqa: PTH118
+                        except OSError:
+                            # Removed while listing
+                            continue
+        except OSError:
+            return _Directory(mtime_ns=None, images=[], subdirs=())
+        return _Directory(mtime_ns=mtime_ns, images=heapq.nlargest(self.max_images, images), subdirs=tuple(subdirs))
+
+    def _publish(self, changed_rbs: set[str]) -> None:
+        """Recompute the newest images of the changed RB folders and across all of them"""
+        root = self._directories.get("")
+        rb_folders = frozenset(root.subdirs) if root is not None else frozenset()
+        newest_by_rb = {rb: images for rb, images in self._snapshot.newest_by_rb.items() if rb in rb_folders}
+        if changed_rbs:
+            grouped: dict[str, list[list[Image]]] = {rb: [] for rb in changed_rbs & rb_folders}
+            for relative_dir, directory in self._directories.items():
+                images = grouped.get(_rb_of(relative_dir)) if relative_dir else None
+                if images is not None:
+                    images.append(directory.images)
+            for rb, images in grouped.items():
+                newest_by_rb[rb] = heapq.nlargest(self.max_images, (image for listing in images for image in listing))
+        elif rb_folders == self._snapshot.rb_folders:
+            return
+        newest = heapq.nlargest(self.max_images, (image for images in newest_by_rb.values() for image in images))
+        self._snapshot = _Snapshot(rb_folders=rb_folders, newest_by_rb=newest_by_rb, newest=newest)
+
+    def _current(self) -> _Snapshot:
+        """Refresh on lookup when no background refresher keeps the index up to date"""
+        if not self.ready or (self._thread is None and time.monotonic() - self._refreshed_at > self.refresh_interval):
+            self.refresh()
+        return self._snapshot
+
+    @property
+    def rb_folders(self) -> frozenset[str]:
+        """The names of the RB folders below the root"""
+        return self._current().rb_folders
+
+    def newest(self, count: int, rb: str | None = None) -> list[tuple[Path, float]]:
+        """
+        Return the newest images, newest first
+        :param count: The most images returned, at most the number the index keeps
+        :param rb: Only return images of this RB folder, such as "RB1234"
+        :return: List of (path, mtime) tuples
+        """
+        snapshot = self._current()
+        images = snapshot.newest if rb is None else snapshot.newest_by_rb.get(rb, [])
+        return [(self.root / relative_path, mtime_ns / 1e9) for mtime_ns, relative_path in images[:count]]
+
+    def latest(self, rb: str | None = None) -> Path | None:
+        """
+        Return the newest image, checking it still exists
+        :param rb: Only consider images of this RB folder, such as "RB1234"
+        :return: Path to the newest image or None
+        """
+        newest = self.newest(1, rb)
+        if newest and not newest[0][0].exists():
+            # Removed since the last refresh
+            self.refresh()
+            newest = self.newest(1, rb)
+        return newest[0][0] if newest else None
+
+    def start(self) -> None:
+        """
+        Scan the root and keep refreshing the index in a background thread
+        :return: None
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="imat-image-index", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.refresh()
+            except Exception as exc:
+                logger.error("Failed to refresh image index of %s", self.root, exc_info=exc)
+            if self._stop.wait(self.refresh_interval):
+                return
+
+    def stop(self) -> None:
+        """
+        Stop refreshing in the background
+        :return: None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Return the size and refresh counters of the index
+        :return: Dictionary of index statistics
+        """
+        snapshot = self._snapshot
+        return {
+            "root": str(self.root),
+            "ready": self.ready,
+            "background": self._thread is not None,
+            "rb_folders": len(snapshot.rb_folders),
+            "directories": len(self._directories),
+            "refreshes": self.refreshes,
+            "listed_directories": self.listed_directories,
+        }
+
+
+def _rb_of(relative_dir: str) -> str:
+    return relative_dir.split(os.sep, 1)[0]
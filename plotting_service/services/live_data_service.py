@@ -6,6 +6,8 @@ import logging
 import typing
 from pathlib import Path
 
+from plotting_service.executor import IOCategory, run_blocking
+
 logger = logging.getLogger(__name__)
 
 
@@ -48,7 +50,7 @@ async def generate_file_change_events(
     yield f'event: connected\ndata: {{"directory": "{relative_dir}"}}\n\n'
 
     # Build initial snapshot of files and their modification times
-    file_snapshot = get_file_snapshot(live_data_path)
+    file_snapshot = await run_blocking(IOCategory.METADATA, get_file_snapshot, live_data_path)
     logger.info(f"Initial snapshot for {instrument}: {len(file_snapshot)} files")
 
     # Track time since last keepalive
@@ -66,7 +68,7 @@ async def generate_file_change_events(
                 polls_since_keepalive = 0
 
             # Get current state
-            current_snapshot = get_file_snapshot(live_data_path)
+            current_snapshot = await run_blocking(IOCategory.METADATA, get_file_snapshot, live_data_path)
 
             # Check for changes
             previous_files = set(file_snapshot.keys())
@@ -0,0 +1,228 @@
+"""Level of detail reduction of large dataset selections, read in bounded chunks."""
+
+import enum
+import math
+import os
+import typing
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+from h5grove.utils import parse_slice  # type: ignore
+
+LOD_CHUNK_ELEMENTS = int(os.environ.get("LOD_CHUNK_ELEMENTS", "4000000"))
+
+Index = list[int | slice]
+
+
+class Reduction(enum.Enum):
+    """How each block of a 2D selection is reduced to one pixel"""
+
+    MEAN = "mean"
+    MAX = "max"
+    MIN = "min"
+    SUM = "sum"
+
+
+_REDUCERS: dict[Reduction, typing.Callable[..., np.ndarray]] = {
+    Reduction.MEAN: np.nanmean,
+    Reduction.MAX: np.nanmax,
+    Reduction.MIN: np.nanmin,
+    Reduction.SUM: np.nansum,
+}
+
+
+@dataclass
+class LineLOD:
+    """Points of a decimated 1D selection, x holds the index of each point within the selection"""
+
+    x: np.ndarray
+    y: np.ndarray
+    length: int
+    decimated: bool
+
+
+@dataclass
+class ImageLOD:
+    """A block reduced 2D selection, each pixel reduces a block of the given shape"""
+
+    data: np.ndarray
+    shape: tuple[int, int]
+    block: tuple[int, int]
+
+
+def select_axes(shape: tuple[int, ...], selection: str | None) -> tuple[Index, list[int]]:
+    """
+    Resolve a h5grove style selection into an index and the axes it leaves to decimate. Slices may not have a step,
+    missing trailing members select the whole axis.
+    :param shape: The shape of the dataset
+    :param selection: The selection, such as "3,:,100:200"
+    :return: The index with every slice bounded, and the axes selected by slices
+    """
+    members = list(parse_slice(selection)) if selection else []
+    if len(members) > len(shape):
+        raise ValueError(f"Selection {selection} has more members than the dataset has dimensions")
+    members += [slice(None)] * (len(shape) - len(members))
+    index: Index = []
+    axes = []
+    for axis, (member, dimension) in enumerate(zip(members, shape, strict=True)):
+        if isinstance(member, slice):
+            start, stop, step = member.indices(dimension)
+            if step != 1:
+                raise ValueError("Selections with a step are not supported, the step is chosen by the level of detail")
+            index.append(slice(start, stop))
+            axes.append(axis)
+        else:
+            index.append(member)
+    return index, axes
+
+
+def narrow_axis(index: Index, axis: int, start: int, stop: int) -> tuple[int | slice, ...]:
+    """
+    Narrow the slice a resolved selection takes along an axis
+    :param index: The resolved selection
+    :param axis: An axis selected by a slice
+    :param start: Start of the range relative to the start of the slice
+    :param stop: Stop of the range relative to the start of the slice
+    :return: The narrowed selection, ready to index the dataset with
+    """
+    bounded = list(index)
+    member = bounded[axis]
+    assert isinstance(member, slice)
+    bounded[axis] = slice(member.start + start, member.start + stop)
+    return tuple(bounded)
+
+
+def axis_length(index: Index, axis: int) -> int:
+    """
+    Return the length of the slice a resolved selection takes along an axis
+    :param index: The resolved selection
+    :param axis: An axis selected by a slice
+    :return: The number of elements selected along the axis
+    """
+    member = index[axis]
+    assert isinstance(member, slice)
+    return int(member.stop - member.start)
+
+
+def decimate_line(
+    dataset: typing.Any, index: Index, axis: int, width: int, chunk_elements: int = LOD_CHUNK_ELEMENTS
+) -> LineLOD:
+    """
+    Decimate a 1D selection with M4: each of width buckets keeps its first, minimum, maximum and last point, which
+    draws the same line at that width as the full data would
+    :param dataset: The dataset, anything indexable like a NumPy array
+    :param index: The resolved selection
+    :param axis: The axis selected by a slice
+    :param width: The number of buckets, the pixel width the data is drawn at
+    :param chunk_elements: The most elements read at once
+    :return: The decimated points
+    """
+    length = axis_length(index, axis)
+    if length <= 4 * width:
+        y = np.asarray(dataset[tuple(index)])
+        return LineLOD(x=np.arange(length), y=y, length=length, decimated=False)
+
+    bucket_size = math.ceil(length / width)
+    buckets_per_chunk = max(1, chunk_elements // bucket_size)
+    xs = []
+    ys = []
+    for chunk_start in range(0, length, buckets_per_chunk * bucket_size):
+        chunk_stop = min(length, chunk_start + buckets_per_chunk * bucket_size)
+        block = np.asarray(dataset[narrow_axis(index, axis, chunk_start, chunk_stop)], dtype=np.float64)
+        local = _m4_indices(block, bucket_size)
+        xs.append(local + chunk_start)
+        ys.append(block[local])
+    return LineLOD(x=np.concatenate(xs), y=np.concatenate(ys), length=length, decimated=True)
+
+
+def _m4_indices(block: np.ndarray, bucket_size: int) -> np.ndarray:
+    """
+    Find the first, minimum, maximum and last points of every bucket of a block
+    :param block: The 1D block, every bucket but the last is full
+    :param bucket_size: The number of points in a full bucket
+    :return: Sorted indices into the block without duplicates
+    """
+    count = len(block)
+    rows = math.ceil(count / bucket_size)
+    padded = np.full(rows * bucket_size, np.nan)
+    padded[:count] = block
+    grid = padded.reshape(rows, bucket_size)
+    nan = np.isnan(grid)
+    minimum = np.where(nan, np.inf, grid).argmin(axis=1)
+    maximum = np.where(nan, -np.inf, grid).argmax(axis=1)
+    last = np.full(rows, bucket_size - 1)
+    last[-1] = count - 1 - (rows - 1) * bucket_size
+    points = np.sort(np.stack([np.zeros(rows, dtype=np.intp), minimum, maximum, last], axis=1), axis=1)
+    keep = np.ones(points.shape, dtype=bool)
+    keep[:, 1:] = points[:, 1:] != points[:, :-1]
+    return typing.cast("np.ndarray", (points + (np.arange(rows) * bucket_size)[:, None])[keep])
+
+
+def reduce_image(
+    dataset: typing.Any,
+    index: Index,
+    axes: list[int],
+    width: int,
+    height: int,
+    reduction: Reduction = Reduction.MEAN,
+    chunk_elements: int = LOD_CHUNK_ELEMENTS,
+) -> ImageLOD:
+    """
+    Reduce a 2D selection to at most height by width pixels, each pixel reducing a block of the selection
+    :param dataset: The dataset, anything indexable like a NumPy array
+    :param index: The resolved selection
+    :param axes: The two axes selected by slices, rows then columns
+    :param width: The most pixels wide the result may be
+    :param height: The most pixels high the result may be
+    :param reduction: How the values of a block are combined
+    :param chunk_elements: The most elements read at once
+    :return: The reduced image
+    """
+    rows, columns = axis_length(index, axes[0]), axis_length(index, axes[1])
+    block = (max(1, math.ceil(rows / height)), max(1, math.ceil(columns / width)))
+    out = reduce_blocks(dataset, index, axes, block, reduction, chunk_elements)
+    return ImageLOD(data=out, shape=(rows, columns), block=block)
+
+
+def reduce_blocks(
+    dataset: typing.Any,
+    index: Index,
+    axes: list[int],
+    block: tuple[int, int],
+    reduction: Reduction = Reduction.MEAN,
+    chunk_elements: int = LOD_CHUNK_ELEMENTS,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Reduce each block of a 2D selection to one value, blocks at the edges cover only the data that is there
+    :param dataset: The dataset, anything indexable like a NumPy array
+    :param index: The resolved selection
+    :param axes: The two axes selected by slices, rows then columns
+    :param block: The rows and columns of each block
+    :param reduction: How the values of a block are combined
+    :param chunk_elements: The most elements read at once
+    :param out: Array to write the result to, such as a memory map, allocated if not given
+    :return: The reduced selection
+    """
+    rows, columns = axis_length(index, axes[0]), axis_length(index, axes[1])
+    block_rows, block_columns = block
+    if out is None:
+        out = np.empty((math.ceil(rows / block_rows), math.ceil(columns / block_columns)))
+    rows_per_chunk = max(block_rows, chunk_elements // max(columns, 1) // block_rows * block_rows)
+    reducer = _REDUCERS[reduction]
+    for row_start in range(0, rows, rows_per_chunk):
+        row_stop = min(rows, row_start + rows_per_chunk)
+        values = np.asarray(dataset[narrow_axis(index, axes[0], row_start, row_stop)], dtype=np.float64)
+        padded_rows = math.ceil(values.shape[0] / block_rows) * block_rows
+        padded_columns = math.ceil(columns / block_columns) * block_columns
+        if (padded_rows, padded_columns) != values.shape:
+            padded = np.full((padded_rows, padded_columns), np.nan)
+            padded[: values.shape[0], :columns] = values
+            values = padded
+        grid = values.reshape(padded_rows // block_rows, block_rows, padded_columns // block_columns, block_columns)
+        with warnings.catch_warnings():
+            # Blocks that are entirely NaN reduce to NaN, which is the expected result
+            warnings.simplefilter("ignore", RuntimeWarning)
+            out[row_start // block_rows : row_start // block_rows + grid.shape[0]] = reducer(grid, axis=(1, 3))
+    return out
@@ -0,0 +1,187 @@
+"""PV subscription service keeping a single multiplexed websocket to the PVWS server."""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+import typing
+from dataclasses import dataclass
+
+import websockets
+
+if typing.TYPE_CHECKING:
+    from websockets.asyncio.client import ClientConnection
+
+logger = logging.getLogger(__name__)
+
+PVWS_URL = os.environ.get("PVWS_URL", "wss://ndaextweb4.nd.rl.ac.uk/pvws/pv")
+PV_STALE_AFTER_DISCONNECT = float(os.environ.get("PV_STALE_AFTER_DISCONNECT", "60"))
+
+
+@dataclass
+class PVValue:
+    """The latest value of a PV and when it was received"""
+
+    value: str
+    timestamp: float
+
+
+class PVManager:
+    """
+    Long lived PV subscriber. PVs are subscribed to lazily over one websocket, the latest value of each is cached and
+    the connection is re-established with exponential backoff whenever it drops.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        stale_after_disconnect: float = PV_STALE_AFTER_DISCONNECT,
+        initial_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ) -> None:
+        """
+        :param url: The PVWS websocket url
+        :param stale_after_disconnect: Seconds cached values are still served for after the connection drops
+        :param initial_backoff: Seconds waited before the first reconnection attempt
+        :param max_backoff: Upper limit of the seconds waited between reconnection attempts
+        """
+        self.url = url
+        self.stale_after_disconnect = stale_after_disconnect
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._values: dict[str, PVValue] = {}
+        self._subscriptions: set[str] = set()
+        self._updated: dict[str, asyncio.Event] = {}
+        self._ws: ClientConnection | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._disconnected_at: float | None = time.monotonic()
+        self.connections = 0
+
+    @property
+    def connected(self) -> bool:
+        """Whether the websocket is currently open"""
+        return self._ws is not None
+
+    def cached(self, pv: str) -> PVValue | None:
+        """
+        Return the cached value of a PV if it can still be trusted
+        :param pv: The PV name
+        :return: The cached value or None
+        """
+        value = self._values.get(pv)
+        if value is None:
+            return None
+        if self._disconnected_at is not None and time.monotonic() - self._disconnected_at > self.stale_after_disconnect:
+            return None
+        return value
+
+    def _ensure_running(self) -> None:
+        """
+        Start the connection task on the running event loop, restarting it if it was started on another loop
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._loop is loop and not self._task.done():
+            return
+        self._loop = loop
+        self._ws = None
+        self._updated = {}
+        self._task = loop.create_task(self._run())
+
+    async def get(self, pv: str, timeout: float = 5.0) -> str:
+        """
+        Return the latest value of a PV, subscribing to it and waiting for the first update if it is not cached
+        :param pv: The PV name
+        :param timeout: Seconds to wait for the first update
+        :return: The PV value as text
+        """
+        self._ensure_running()
+        cached = self.cached(pv)
+        if cached is not None:
+            return cached.value
+
+        updated = self._updated.setdefault(pv, asyncio.Event())
+        updated.clear()
+        if pv not in self._subscriptions:
+            self._subscriptions.add(pv)
+            await self._subscribe([pv])
+        try:
+            await asyncio.wait_for(updated.wait(), timeout=timeout)
+        except TimeoutError:
+            raise TimeoutError(f"Failed to get PV {pv} within {timeout} seconds") from None
+        return self._values[pv].value
+
+    async def _subscribe(self, pvs: list[str]) -> None:
+        """
+        Subscribe to PVs on the open connection, PVs are resubscribed on reconnection so failures are only logged
+        :param pvs: The PV names
+        :return: None
+        """
+        if self._ws is None or not pvs:
+            return
+        try:
+            await self._ws.send(json.dumps({"type": "subscribe", "pvs": pvs}))
+        except websockets.ConnectionClosed:
+            logger.warning("Connection closed while subscribing to %s", pvs)
+
+    def _handle_message(self, message: str | bytes) -> None:
+        """
+        Cache the value from a PVWS update message
+        :param message: The raw message
+        :return: None
+        """
+        data = json.loads(message)
+        pv = data.get("pv")
+        if data.get("type") != "update" or pv not in self._subscriptions:
+            return
+        value = data.get("text") or data.get("value")
+        if value is None:
+            # Updates that only carry metadata, such as severity changes, keep the last value
+            return
+        self._values[pv] = PVValue(value=str(value), timestamp=time.monotonic())
+        self._updated.setdefault(pv, asyncio.Event()).set()
+
+    async def _run(self) -> None:
+        """
+        Keep the websocket open, resubscribing to every PV after each reconnection
+        :return: None
+        """
+        backoff = self.initial_backoff
+        while True:
+            try:
+                async with websockets.connect(self.url) as ws:
+                    self._ws = ws
+                    self._disconnected_at = None
+                    self.connections += 1
+                    backoff = self.initial_backoff
+                    logger.info("Connected to PVWS at %s", self.url)
+                    await self._subscribe(sorted(self._subscriptions))
+                    async for message in ws:
+                        self._handle_message(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("PVWS connection to %s failed: %s", self.url, exc)
+            finally:
+                if self._ws is not None:
+                    self._disconnected_at = time.monotonic()
+                self._ws = None
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def stop(self) -> None:
+        """
+        Close the websocket and stop reconnecting
+        :return: None
+        """
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError, RuntimeError):
+                await self._task
+            self._task = None
+
+
+pv_manager = PVManager(PVWS_URL)
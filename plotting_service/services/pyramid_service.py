@@ -0,0 +1,321 @@
+"""Disk cache of downsampled pyramids of 2D dataset selections, served tile by tile."""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+import typing
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import h5py  # type: ignore
+import numpy as np
+
+from plotting_service.services.hdf5_service import h5_file_cache
+from plotting_service.services.lod_service import axis_length, narrow_axis, reduce_blocks, select_axes
+
+logger = logging.getLogger(__name__)
+
+PYRAMID_CACHE_DIR = os.environ.get("PYRAMID_CACHE_DIR", str(Path(tempfile.gettempdir()) / "plotting-service-pyramids"))
+PYRAMID_CACHE_MAX_BYTES = int(os.environ.get("PYRAMID_CACHE_MAX_BYTES", str(2 * 1024**3)))
+PYRAMID_TILE_SIZE = int(os.environ.get("PYRAMID_TILE_SIZE", "256"))
+MANIFEST = "manifest.json"
+# Incomplete pyramids are only deleted once nothing has been written to them for this long, as another process sharing
+# the cache directory may still be building them
+STAGING_GRACE_SECONDS = 3600
+
+
+def _abandoned(directory: Path) -> bool:
+    """Whether nothing has been written to a directory or the files in it for the grace period"""
+    try:
+        newest = max([directory.stat().st_mtime, *(file.stat().st_mtime for file in directory.iterdir())])
+    except OSError:
+        # Moved into place or deleted by another process
+        return False
+    return time.time() - newest > STAGING_GRACE_SECONDS
+
+
+def _identity(source: str) -> tuple[int, int]:
+    stat_result = Path(source).stat()
+    return stat_result.st_mtime_ns, stat_result.st_size
+
+
+@dataclass
+class Pyramid:
+    """
+    Levels of a 2D selection, each half the size of the one before until the last fits in one tile. Level 0 is the
+    selection itself and is read from the source file, the other levels are memory mapped from the cache.
+    """
+
+    source: str
+    path: str
+    selection: str | None
+    identity: tuple[int, int]
+    tile_size: int
+    shapes: list[tuple[int, int]]
+    directory: Path
+    _levels: list[np.ndarray] = field(default_factory=list, repr=False)
+
+    def __post_init__(self) -> None:
+        self._levels = [
+            np.load(self.directory / f"level_{level}.npy", mmap_mode="r") for level in range(1, len(self.shapes))
+        ]
+
+    def metadata(self) -> dict[str, typing.Any]:
+        """
+        Describe the levels of the pyramid
+        :return: The tile size and the shape and number of tiles of each level
+        """
+        return {
+            "tile_size": self.tile_size,
+            "levels": [
+                {
+                    "level": level,
+                    "shape": shape,
+                    "tiles": [math.ceil(shape[0] / self.tile_size), math.ceil(shape[1] / self.tile_size)],
+                }
+                for level, shape in enumerate(self.shapes)
+            ],
+        }
+
+    def tile(self, level: int, x: int, y: int) -> np.ndarray:
+        """
+        Read one tile, tiles on the bottom and right edges may be smaller than the tile size
+        :param level: The level, 0 being full resolution
+        :param x: The column of the tile
+        :param y: The row of the tile
+        :return: The values of the tile
+        """
+        if not 0 <= level < len(self.shapes):
+            raise IndexError(f"Level {level} does not exist, the pyramid has {len(self.shapes)} levels")
+        rows, columns = self.shapes[level]
+        if not (0 <= y < math.ceil(rows / self.tile_size) and 0 <= x < math.ceil(columns / self.tile_size)):
+            raise IndexError(f"Tile ({x}, {y}) is outside level {level}")
+        row_start, column_start = y * self.tile_size, x * self.tile_size
+        row_stop, column_stop = min(row_start + self.tile_size, rows), min(column_start + self.tile_size, columns)
+        if level > 0:
+            return np.array(self._levels[level - 1][row_start:row_stop, column_start:column_stop])
+
+        with h5_file_cache.open(self.source) as h5file:
+            dataset = h5file[self.path]
+            index, axes = select_axes(dataset.shape, self.selection)
+            rows_index = list(narrow_axis(index, axes[0], row_start, row_stop))
+            return np.asarray(dataset[narrow_axis(rows_index, axes[1], column_start, column_stop)])
+
+
+class PyramidCache:
+    """
+    Builds pyramids on first access and keeps them on local disk, evicting the least recently used once the cache grows
+    beyond its size limit. A pyramid is rebuilt when the mtime or size of its source file changes. Pyramids built by
+    an earlier process are reused.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path = PYRAMID_CACHE_DIR,
+        max_bytes: int = PYRAMID_CACHE_MAX_BYTES,
+        tile_size: int = PYRAMID_TILE_SIZE,
+    ) -> None:
+        """
+        :param directory: Local directory the pyramids are stored in
+        :param max_bytes: The most bytes of pyramids kept, the pyramid in use is kept even if it is larger
+        :param tile_size: Rows and columns of each tile
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.tile_size = tile_size
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._pyramids: dict[str, Pyramid] = {}
+        # The lock serialising builds of each pyramid and the number of requests holding or waiting for it
+        self._build_locks: dict[str, tuple[threading.Lock, int]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.hits = 0
+        self.builds = 0
+        self.evictions = 0
+
+    def _key(self, source: str, path: str, selection: str | None) -> str:
+        return hashlib.sha256(f"{source}\0{path}\0{selection or ''}\0{self.tile_size}".encode()).hexdigest()
+
+    def _load_existing(self) -> None:
+        """Register pyramids left by an earlier process in least recently used order, lock must be held"""
+        if self._loaded:
+            return
+        self._loaded = True
+        self.directory.mkdir(parents=True, exist_ok=True)
+        existing = []
+        for entry in self.directory.iterdir():
+            manifest = entry / MANIFEST
+            if entry.name.startswith(".") or not manifest.exists():
+                if _abandoned(entry):
+                    # Left over from a build that did not finish
+                    shutil.rmtree(entry, ignore_errors=True)
+                continue
+            size = sum(file.stat().st_size for file in entry.iterdir())
+            existing.append((manifest.stat().st_mtime, entry.name, size))
+        for _, key, size in sorted(existing):
+            self._entries[key] = size
+        self._evict(keep=None)
+
+    def get(self, source: str, path: str, selection: str | None = None) -> Pyramid:
+        """
+        Return the pyramid of a 2D selection of a dataset, building it if it is not cached or its source changed
+        :param source: The HDF5 file
+        :param path: Path of the dataset in the file
+        :param selection: h5grove style selection without steps leaving 2 dimensions, such as "5" for one frame of a
+        stack
+        :return: The pyramid
+        """
+        identity = _identity(source)
+        key = self._key(source, path, selection)
+        with self._lock:
+            self._load_existing()
+            pyramid = self._fresh(key, identity)
+            if pyramid is not None:
+                return pyramid
+            build_lock, waiters = self._build_locks.get(key, (threading.Lock(), 0))
+            self._build_locks[key] = (build_lock, waiters + 1)
+
+        try:
+            with build_lock:
+                with self._lock:
+                    # Another request may have built it while this one waited
+                    pyramid = self._fresh(key, identity)
+                    if pyramid is not None:
+                        return pyramid
+                pyramid = self._read_manifest(key, identity) or self._build(key, source, path, selection, identity)
+                size = sum(file.stat().st_size for file in pyramid.directory.iterdir())
+                with self._lock:
+                    self._entries[key] = size
+                    self._entries.move_to_end(key)
+                    self._pyramids[key] = pyramid
+                    self._evict(keep=key)
+                return pyramid
+        finally:
+            with self._lock:
+                # Drop the lock once no request is building or waiting for this pyramid
+                build_lock, waiters = self._build_locks[key]
+                if waiters == 1:
+                    del self._build_locks[key]
+                else:
+                    self._build_locks[key] = (build_lock, waiters - 1)
+
+    def _fresh(self, key: str, identity: tuple[int, int]) -> Pyramid | None:
+        """Return the pyramid if it is loaded and its source is unchanged, lock must be held"""
+        pyramid = self._pyramids.get(key)
+        if pyramid is None or key not in self._entries or pyramid.identity != identity:
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return pyramid
+
+    def _read_manifest(self, key: str, identity: tuple[int, int]) -> Pyramid | None:
+        """Load a pyramid already on disk if it was built from the current version of its source"""
+        try:
+            manifest = json.loads((self.directory / key / MANIFEST).read_text())
+        except (OSError, ValueError):
+            return None
+        if tuple(manifest["identity"]) != identity:
+            return None
+        # Touch the manifest so the least recently used order survives a restart
+        (self.directory / key / MANIFEST).touch()
+        return Pyramid(
+            source=manifest["source"],
+            path=manifest["path"],
+            selection=manifest["selection"],
+            identity=identity,
+            tile_size=manifest["tile_size"],
+            shapes=[(rows, columns) for rows, columns in manifest["shapes"]],
+            directory=self.directory / key,
+        )
+
+    def _build(self, key: str, source: str, path: str, selection: str | None, identity: tuple[int, int]) -> Pyramid:
+        """Build every level in a staging directory and move it into place once complete"""
+        logger.info("Building pyramid of %s in %s", path, source)
+        staging = Path(tempfile.mkdtemp(dir=self.directory, prefix=f".{key}-"))
+        try:
+            with h5_file_cache.open(source) as h5file:
+                dataset = h5file[path]
+                if not isinstance(dataset, h5py.Dataset):
+                    raise ValueError(f"{path} is not a dataset")
+                index, axes = select_axes(dataset.shape, selection)
+                if len(axes) != 2:  # noqa: PLR2004
+                    raise ValueError(f"Selection must leave 2 dimensions, it leaves {len(axes)}")
+                shapes = [(axis_length(index, axes[0]), axis_length(index, axes[1]))]
+                previous: typing.Any = dataset
+                while max(shapes[-1]) > self.tile_size:
+                    shape = (math.ceil(shapes[-1][0] / 2), math.ceil(shapes[-1][1] / 2))
+                    level = np.lib.format.open_memmap(
+                        staging / f"level_{len(shapes)}.npy", mode="w+", dtype=np.float32, shape=shape
+                    )
+                    reduce_blocks(previous, index, axes, (2, 2), out=level)
+                    level.flush()
+                    previous, index, axes = level, [slice(0, shape[0]), slice(0, shape[1])], [0, 1]
+                    shapes.append(shape)
+            manifest = {
+                "source": source,
+                "path": path,
+                "selection": selection,
+                "identity": identity,
+                "tile_size": self.tile_size,
+                "shapes": shapes,
+            }
+            (staging / MANIFEST).write_text(json.dumps(manifest))
+            target = self.directory / key
+            shutil.rmtree(target, ignore_errors=True)
+            staging.replace(target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        with self._lock:
+            self.builds += 1
+        return Pyramid(source, path, selection, identity, self.tile_size, shapes, target)
+
+    def _evict(self, keep: str | None) -> None:
+        """Delete the least recently used pyramids beyond the size limit, lock must be held"""
+        total = sum(self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                return
+            if key == keep:
+                continue
+            total -= self._entries.pop(key)
+            self._pyramids.pop(key, None)
+            # Requests still reading an evicted pyramid keep their memory maps of the deleted files
+            shutil.rmtree(self.directory / key, ignore_errors=True)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Delete every cached pyramid
+        :return: None
+        """
+        with self._lock:
+            for key in list(self._entries):
+                shutil.rmtree(self.directory / key, ignore_errors=True)
+            self._entries.clear()
+            self._pyramids.clear()
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Return the counters and occupancy of the cache
+        :return: Dictionary of cache statistics
+        """
+        with self._lock:
+            return {
+                "pyramids": len(self._entries),
+                "bytes": sum(self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "builds": self.builds,
+                "evictions": self.evictions,
+            }
+
+
+pyramid_cache = PyramidCache()
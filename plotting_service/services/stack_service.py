@@ -0,0 +1,157 @@
+"""Decodes stacks of IMAT frames in a pool of processes, yielding them in order as soon as each one is decoded."""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import typing
+from collections import deque
+from collections.abc import AsyncGenerator, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from plotting_service.exceptions import BlockingIOTimeoutError
+from plotting_service.executor import FS_TIMEOUT
+from plotting_service.services.image_service import DownsampleMethod, read_image_region
+
+logger = logging.getLogger(__name__)
+
+IMAT_STACK_WORKERS = int(os.environ.get("IMAT_STACK_WORKERS", str(os.cpu_count() or 4)))
+IMAT_STACK_MAX_FRAMES = int(os.environ.get("IMAT_STACK_MAX_FRAMES", "1000"))
+
+# Native pixel bytes of a frame followed by original width, original height, sampled width and sampled height
+Frame = tuple[bytes, int, int, int, int]
+
+
+def decode_frame(
+    image_path: Path, box: tuple[int, int, int, int] | None, downsample_factor: int, method: DownsampleMethod
+) -> Frame:
+    """
+    Decode one frame of a stack to its native pixel bytes, run in a worker process
+    :param image_path: Path to the image file
+    :param box: The (left, upper, right, lower) pixel box to read, None for the whole image
+    :param downsample_factor: Factor to reduce resolution (1 keeps original)
+    :param method: How the frame is downsampled
+    :return: The frame
+    """
+    image, original_width, original_height = read_image_region(image_path, box, downsample_factor, method)
+    return image.tobytes(), original_width, original_height, image.width, image.height
+
+
+class FrameDecoder:
+    """
+    Decodes the frames of a stack in a pool of processes, so decoding uses every core rather than the one the event
+    loop and the thread pool share. A window of frames ahead of the one being sent is decoded at once, and frames are
+    yielded in order, so a response streams them while later ones are still decoding. The pool is started on first
+    use and started again if a worker dies.
+    """
+
+    def __init__(self, workers: int = IMAT_STACK_WORKERS, timeout: float = FS_TIMEOUT) -> None:
+        """
+        :param workers: Number of worker processes, and twice it the number of frames decoded ahead
+        :param timeout: Seconds each frame may take to decode
+        """
+        self.workers = max(workers, 1)
+        self.timeout = timeout
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+        self.stacks = 0
+        self.frames = 0
+        self.failed = 0
+        self.timeouts = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # Forking a process that runs threads can copy a held lock into the child, the fork server does not
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver")
+                )
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor) -> None:
+        """Drop a pool whose worker died so the next stack starts a new one"""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def decode(
+        self,
+        image_paths: Sequence[Path],
+        box: tuple[int, int, int, int] | None,
+        downsample_factor: int,
+        method: DownsampleMethod,
+    ) -> AsyncGenerator[Frame]:
+        """
+        Decode the frames of a stack, yielding them in order
+        :param image_paths: The frames
+        :param box: The (left, upper, right, lower) pixel box to read of each frame, None for the whole frame
+        :param downsample_factor: Factor to reduce resolution (1 keeps original)
+        :param method: How each frame is downsampled
+        :return: Async generator of frames
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        remaining = iter(image_paths)
+        pending: deque[asyncio.Future[Frame]] = deque()
+
+        def submit() -> None:
+            image_path = next(remaining, None)
+            if image_path is not None:
+                pending.append(loop.run_in_executor(pool, decode_frame, image_path, box, downsample_factor, method))
+
+        self.stacks += 1
+        try:
+            for _ in range(self.workers * 2):
+                submit()
+            while pending:
+                try:
+                    frame = await asyncio.wait_for(pending.popleft(), self.timeout)
+                except TimeoutError:
+                    self.timeouts += 1
+                    raise BlockingIOTimeoutError(f"Frame decode timed out after {self.timeout} seconds") from None
+                except BrokenProcessPool:
+                    self.failed += 1
+                    logger.error("A frame decoding worker died, restarting the pool")
+                    self._discard_pool(pool)
+                    raise
+                except Exception:
+                    self.failed += 1
+                    raise
+                self.frames += 1
+                submit()
+                yield frame
+        finally:
+            # The client went away or a frame failed, frames that have not started decoding are dropped
+            for future in pending:
+                future.cancel()
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Return the pool size and frame counters
+        :return: Dictionary of decoder statistics
+        """
+        return {
+            "workers": self.workers,
+            "running": self._pool is not None,
+            "stacks": self.stacks,
+            "frames": self.frames,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+        }
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes without waiting for running decodes
+        :return: None
+        """
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+frame_decoder = FrameDecoder()
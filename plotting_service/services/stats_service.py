@@ -0,0 +1,361 @@
+"""Dataset statistics and histograms computed in one chunked pass and cached on local disk."""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import typing
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from h5grove.utils import parse_slice  # type: ignore
+
+from plotting_service.cache import TTLCache
+from plotting_service.services.hdf5_service import h5_file_cache
+from plotting_service.services.lod_service import LOD_CHUNK_ELEMENTS, axis_length, narrow_axis, select_axes
+
+logger = logging.getLogger(__name__)
+
+STATS_CACHE_DIR = os.environ.get("STATS_CACHE_DIR", str(Path(tempfile.gettempdir()) / "plotting-service-stats"))
+STATS_CACHE_MAX_ENTRIES = int(os.environ.get("STATS_CACHE_MAX_ENTRIES", "10000"))
+STATS_HISTOGRAM_BINS = int(os.environ.get("STATS_HISTOGRAM_BINS", "256"))
+# Resolution of the histogram kept for percentiles, a power of two so that doubling its range merges bins exactly
+HISTOGRAM_RESOLUTION = 4096
+
+
+@dataclass
+class DatasetStats:
+    """
+    Statistics of the finite values of a selection, with a histogram of HISTOGRAM_RESOLUTION bins of equal width
+    starting at histogram_start that every value falls in
+    """
+
+    count: int
+    integer: bool
+    minimum: float | None
+    maximum: float | None
+    strict_positive_min: float | None
+    positive_min: float | None
+    mean: float | None
+    std: float | None
+    histogram_start: float
+    histogram_width: float
+    histogram_counts: np.ndarray
+
+    def h5grove_stats(self) -> dict[str, typing.Any]:
+        """
+        Return the statistics in the form of the h5grove `/stats` endpoint
+        :return: strict_positive_min, positive_min, min, max, mean and std
+        """
+        cast: typing.Callable[[float], float | int] = int if self.integer else float
+        values = {
+            "strict_positive_min": self.strict_positive_min,
+            "positive_min": self.positive_min,
+            "min": self.minimum,
+            "max": self.maximum,
+            "mean": self.mean,
+            "std": self.std,
+        }
+        return {key: None if value is None else cast(value) for key, value in values.items()}
+
+    def histogram(self, bins: int = STATS_HISTOGRAM_BINS) -> dict[str, list[float] | list[int]]:
+        """
+        Return the histogram over the occupied range, merging adjacent bins down to at most the given number
+        :param bins: The most bins returned
+        :return: The bin edges and counts
+        """
+        occupied = np.flatnonzero(self.histogram_counts)
+        if occupied.size == 0:
+            return {"edges": [], "counts": []}
+        first, last = int(occupied[0]), int(occupied[-1]) + 1
+        merge = math.ceil((last - first) / bins)
+        counts = self.histogram_counts[first:last]
+        counts = np.pad(counts, (0, -len(counts) % merge)).reshape(-1, merge).sum(axis=1)
+        edges = self.histogram_start + (first + np.arange(len(counts) + 1) * merge) * self.histogram_width
+        return {"edges": edges.tolist(), "counts": counts.tolist()}
+
+    def percentile(self, q: float) -> float | None:
+        """
+        Estimate a percentile from the histogram, accurate to the width of one of its bins
+        :param q: The percentile, between 0 and 100
+        :return: The estimate, or None if the selection has no finite values
+        """
+        if self.count == 0 or self.minimum is None or self.maximum is None:
+            return None
+        cumulative = np.cumsum(self.histogram_counts)
+        target = q / 100 * self.count
+        index = min(int(np.searchsorted(cumulative, target)), HISTOGRAM_RESOLUTION - 1)
+        before = cumulative[index - 1] if index > 0 else 0
+        fraction = (target - before) / self.histogram_counts[index] if self.histogram_counts[index] else 0.0
+        estimate = self.histogram_start + (index + fraction) * self.histogram_width
+        return float(min(max(estimate, self.minimum), self.maximum))
+
+    def to_json(self) -> dict[str, typing.Any]:
+        """
+        Serialise the statistics for the disk cache
+        :return: JSON compatible dictionary
+        """
+        return {
+            "count": self.count,
+            "integer": self.integer,
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+            "strict_positive_min": self.strict_positive_min,
+            "positive_min": self.positive_min,
+            "mean": self.mean,
+            "std": self.std,
+            "histogram_start": self.histogram_start,
+            "histogram_width": self.histogram_width,
+            "histogram_counts": self.histogram_counts.tolist(),
+        }
+
+    @classmethod
+    def from_json(cls, data: dict[str, typing.Any]) -> "DatasetStats":
+        """
+        Load statistics serialised by to_json
+        :param data: The serialised statistics
+        :return: The statistics
+        """
+        return cls(**{**data, "histogram_counts": np.asarray(data["histogram_counts"], dtype=np.int64)})
+
+
+class _Accumulator:
+    """Combines the statistics of chunks, merging mean and variance with Chan's parallel algorithm"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.strict_positive_min = math.inf
+        self.positive_min = math.inf
+        self.start = 0.0
+        self.width = 0.0
+        self.counts = np.zeros(HISTOGRAM_RESOLUTION, dtype=np.int64)
+        # Set while every value seen so far is the same, as the histogram range is then only a guess
+        self._constant: float | None = None
+
+    def add(self, values: np.ndarray) -> None:
+        values = values.ravel()
+        if values.dtype == np.bool_:
+            values = values.view(np.uint8)
+        if np.issubdtype(values.dtype, np.floating):
+            finite = np.isfinite(values)
+            if not finite.all():
+                values = values[finite]
+        if values.size == 0:
+            return
+        chunk_min, chunk_max = float(values.min()), float(values.max())
+        chunk_mean = float(values.mean(dtype=np.float64))
+        chunk_m2 = float(values.var(dtype=np.float64)) * values.size
+        previous_count = self.count
+        total = self.count + values.size
+        delta = chunk_mean - self.mean
+        self.m2 += chunk_m2 + delta * delta * self.count * values.size / total
+        self.mean += delta * values.size / total
+        self.count = total
+        self.minimum, self.maximum = min(self.minimum, chunk_min), max(self.maximum, chunk_max)
+        # Reductions with where avoid copying the positive values out
+        initial = np.inf if np.issubdtype(values.dtype, np.floating) else np.iinfo(values.dtype).max
+        if chunk_max >= 0:
+            self.positive_min = min(self.positive_min, float(np.min(values, where=values >= 0, initial=initial)))
+        if chunk_max > 0:
+            self.strict_positive_min = min(
+                self.strict_positive_min, float(np.min(values, where=values > 0, initial=initial))
+            )
+        self._add_to_histogram(values, chunk_min, chunk_max, previous_count)
+
+    def _add_to_histogram(self, values: np.ndarray, chunk_min: float, chunk_max: float, previous_count: int) -> None:
+        if self.width == 0.0 or self._constant is not None:
+            low = chunk_min if self._constant is None else min(chunk_min, self._constant)
+            high = chunk_max if self._constant is None else max(chunk_max, self._constant)
+            if high > low:
+                # Fit the range to the data now that it has a spread, earlier values all share one bin
+                constant = self._constant
+                self.start, self.width, self._constant = low, (high - low) / HISTOGRAM_RESOLUTION * (1 + 1e-9), None
+                self.counts[:] = 0
+                if constant is not None:
+                    self.counts[self._bins(np.array([constant]))] += previous_count
+            elif self.width == 0.0:
+                self.start, self.width, self._constant = low, max(abs(low), 1.0), low
+        while chunk_min < self.start or chunk_max >= self.start + self.width * HISTOGRAM_RESOLUTION:
+            # Double the range, pairs of bins merge into one so the counts stay exact
+            merged = self.counts.reshape(-1, 2).sum(axis=1)
+            self.counts = np.zeros(HISTOGRAM_RESOLUTION, dtype=np.int64)
+            if chunk_min < self.start:
+                self.start -= self.width * HISTOGRAM_RESOLUTION
+                self.counts[HISTOGRAM_RESOLUTION // 2 :] = merged
+            else:
+                self.counts[: HISTOGRAM_RESOLUTION // 2] = merged
+            self.width *= 2
+        self.counts += np.bincount(self._bins(values), minlength=HISTOGRAM_RESOLUTION)
+
+    def _bins(self, values: np.ndarray) -> np.ndarray:
+        bins = ((values - self.start) * (1 / self.width)).astype(np.intp)
+        return np.clip(bins, 0, HISTOGRAM_RESOLUTION - 1, out=bins)
+
+    def result(self, integer: bool) -> DatasetStats:
+        def finite(value: float) -> float | None:
+            return value if math.isfinite(value) else None
+
+        return DatasetStats(
+            count=self.count,
+            integer=integer,
+            minimum=finite(self.minimum),
+            maximum=finite(self.maximum),
+            strict_positive_min=finite(self.strict_positive_min),
+            positive_min=finite(self.positive_min),
+            mean=self.mean if self.count else None,
+            std=math.sqrt(self.m2 / self.count) if self.count else None,
+            histogram_start=self.start,
+            histogram_width=self.width,
+            histogram_counts=self.counts,
+        )
+
+
+def compute_stats(
+    dataset: typing.Any, selection: str | None = None, chunk_elements: int = LOD_CHUNK_ELEMENTS
+) -> DatasetStats:
+    """
+    Compute the statistics and histogram of the finite values of a selection, reading it in bounded chunks
+    :param dataset: The dataset, anything indexable like a NumPy array with a dtype
+    :param selection: h5grove style selection, selections with a step are read in one go
+    :param chunk_elements: The most elements read at once
+    :return: The statistics
+    """
+    dtype = np.dtype(dataset.dtype)
+    if dtype.kind not in "biuf":
+        raise TypeError(f"Cannot compute statistics of {dtype} data")
+    accumulator = _Accumulator()
+    try:
+        index, axes = select_axes(dataset.shape, selection)
+    except ValueError:
+        accumulator.add(np.asarray(dataset[parse_slice(selection)]))
+        return accumulator.result(integer=dtype.kind != "f")
+
+    if not axes:
+        accumulator.add(np.asarray(dataset[tuple(index)]))
+        return accumulator.result(integer=dtype.kind != "f")
+    row_elements = math.prod(axis_length(index, axis) for axis in axes[1:])
+    rows = axis_length(index, axes[0])
+    rows_per_chunk = max(1, chunk_elements // max(row_elements, 1))
+    for row_start in range(0, rows, rows_per_chunk):
+        accumulator.add(
+            np.asarray(dataset[narrow_axis(index, axes[0], row_start, min(rows, row_start + rows_per_chunk))])
+        )
+    return accumulator.result(integer=dtype.kind != "f")
+
+
+class StatsCache:
+    """
+    Keeps the statistics of dataset selections in memory and as JSON files on local disk, keyed by file, dataset path,
+    selection and the mtime and size of the file, so repeat requests read no data even after a restart. The oldest
+    files are deleted once there are more than max_entries.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path = STATS_CACHE_DIR,
+        max_entries: int = STATS_CACHE_MAX_ENTRIES,
+        memory_size: int = 1024,
+    ) -> None:
+        """
+        :param directory: Local directory the statistics are stored in
+        :param max_entries: The most statistics kept on disk
+        :param memory_size: The most statistics kept in memory
+        """
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self._memory: TTLCache[str, DatasetStats] = TTLCache(max_size=memory_size, ttl=3600)
+        self._lock = threading.Lock()
+        self._written = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, source: str, path: str, selection: str | None = None) -> DatasetStats:
+        """
+        Return the statistics of a selection of a dataset, computing them if they are not cached or the file changed
+        :param source: The HDF5 file
+        :param path: Path of the dataset in the file
+        :param selection: h5grove style selection
+        :return: The statistics
+        """
+        stat_result = Path(source).stat()
+        key = hashlib.sha256(
+            f"{source}\0{path}\0{selection or ''}\0{stat_result.st_mtime_ns}\0{stat_result.st_size}".encode()
+        ).hexdigest()
+        stats = self._memory.get(key) or self._read(key)
+        if stats is not None:
+            with self._lock:
+                self.hits += 1
+            self._memory.set(key, stats)
+            return stats
+
+        with self._lock:
+            self.misses += 1
+        with h5_file_cache.open(source) as h5file:
+            stats = compute_stats(h5file[path], selection)
+        self._memory.set(key, stats)
+        self._write(key, stats)
+        return stats
+
+    def _read(self, key: str) -> DatasetStats | None:
+        try:
+            return DatasetStats.from_json(json.loads((self.directory / f"{key}.json").read_text()))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _write(self, key: str, stats: DatasetStats) -> None:
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            staging = self.directory / f".{key}.{threading.get_ident()}"
+            staging.write_text(json.dumps(stats.to_json()))
+            staging.replace(self.directory / f"{key}.json")
+        except OSError as exc:
+            logger.warning("Could not cache statistics in %s: %s", self.directory, exc)
+            return
+        with self._lock:
+            self._written += 1
+            check = self._written % max(self.max_entries // 10, 1) == 0
+        if check:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete the oldest tenth of the files once there are more than max_entries"""
+        entries = sorted(self.directory.glob("*.json"), key=lambda entry: entry.stat().st_mtime)
+        if len(entries) <= self.max_entries:
+            return
+        for entry in entries[: len(entries) - self.max_entries + self.max_entries // 10]:
+            entry.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        """
+        Delete every cached statistic
+        :return: None
+        """
+        self._memory.clear()
+        for entry in self.directory.glob("*.json"):
+            entry.unlink(missing_ok=True)
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Return the counters of the cache
+        :return: Dictionary of cache statistics
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "in_memory": len(self._memory),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+stats_cache = StatsCache()
@@ -0,0 +1,266 @@
+"""Tail and follow support for text files, sharing one reader per followed file across subscribers."""
+
+import asyncio
+import codecs
+import json
+import logging
+import os
+import typing
+from dataclasses import dataclass
+from pathlib import Path
+
+from plotting_service.executor import IOCategory, run_blocking
+
+logger = logging.getLogger(__name__)
+
+TEXT_FOLLOW_POLL_INTERVAL = float(os.environ.get("TEXT_FOLLOW_POLL_INTERVAL", "1"))
+TEXT_FOLLOW_MAX_READ = int(os.environ.get("TEXT_FOLLOW_MAX_READ", str(1024 * 1024)))
+TEXT_FOLLOW_QUEUE_SIZE = int(os.environ.get("TEXT_FOLLOW_QUEUE_SIZE", "256"))
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def read_range(path: Path, start: int, end: int) -> bytes:
+    """Read the bytes of a file between two offsets.
+
+    :param path: The file to read
+    :param start: Offset of the first byte
+    :param end: Offset after the last byte
+    :return: The bytes read, fewer than requested if the file is shorter
+    """
+    with path.open("rb") as file:
+        file.seek(start)
+        return file.read(max(end - start, 0))
+
+
+def read_tail(path: Path, lines: int | None = None, max_bytes: int | None = None) -> tuple[bytes, int]:
+    """Read the end of a file by seeking from its end, so the cost depends on the amount read not the file size.
+
+    :param path: The file to read
+    :param lines: Return at most this many of the last lines
+    :param max_bytes: Return at most this many of the last bytes
+    :return: The bytes read and the size of the file they end at
+    """
+    with path.open("rb") as file:
+        size = file.seek(0, os.SEEK_END)
+        minimum_start = 0 if max_bytes is None else max(size - max_bytes, 0)
+        start = minimum_start if lines is None else _find_line_start(file, size, lines, minimum_start)
+        file.seek(start)
+        return file.read(size - start), size
+
+
+def _find_line_start(file: typing.BinaryIO, size: int, lines: int, minimum_start: int) -> int:
+    """Walk back from the end of a file block by block to find where its last lines start.
+
+    :param file: The open file
+    :param size: The size of the file
+    :param lines: The number of lines wanted
+    :param minimum_start: Offset the search stops at
+    :return: Offset of the first of the last lines
+    """
+    if size == 0 or lines == 0:
+        return size
+    file.seek(size - 1)
+    # A trailing newline ends the last line rather than starting a new one
+    wanted = lines + 1 if file.read(1) == b"\n" else lines
+    position = size
+    newlines = 0
+    while position > minimum_start:
+        block_start = max(position - TAIL_BLOCK_SIZE, minimum_start)
+        file.seek(block_start)
+        block = file.read(position - block_start)
+        index = len(block)
+        while newlines < wanted:
+            index = block.rfind(b"\n", 0, index)
+            if index == -1:
+                break
+            newlines += 1
+        if newlines == wanted:
+            return block_start + index + 1
+        position = block_start
+    return minimum_start
+
+
+@dataclass(frozen=True)
+class FollowEvent:
+    """A change to a followed file"""
+
+    event: str
+    offset: int
+    data: str = ""
+
+    def to_sse(self) -> str:
+        """Format the event as a server sent event"""
+        payload: dict[str, typing.Any] = {"offset": self.offset}
+        if self.data:
+            payload["data"] = self.data
+        return f"event: {self.event}\ndata: {json.dumps(payload)}\n\n"
+
+
+class FileFollower:
+    """
+    Polls one file for appended bytes and fans them out to every subscriber, so each change is read from disk once no
+    matter how many clients follow the file. Truncation and rotation (the path pointing at a new inode) restart
+    reading from the beginning of the file.
+    """
+
+    def __init__(self, path: Path, poll_interval: float = TEXT_FOLLOW_POLL_INTERVAL) -> None:
+        """
+        :param path: The file to follow
+        :param poll_interval: Seconds between checks for appended data
+        """
+        self.path = path
+        self.poll_interval = poll_interval
+        self.offset = 0
+        self.reads = 0
+        self._inode: int | None = None
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._subscribers: set[asyncio.Queue[FollowEvent | None]] = set()
+        self._ready = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def subscribers(self) -> int:
+        """The number of subscribers"""
+        return len(self._subscribers)
+
+    def subscribe(self) -> "asyncio.Queue[FollowEvent | None]":
+        """
+        Start receiving changes to the file, starting the reader if this is the first subscriber. Registering does not
+        wait, so a subscriber cancelled before the reader is ready can always unsubscribe.
+        :return: The queue events are delivered to, None signals the subscriber fell behind
+        """
+        queue: asyncio.Queue[FollowEvent | None] = asyncio.Queue(maxsize=TEXT_FOLLOW_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return queue
+
+    async def ready(self) -> int:
+        """
+        Wait for the reader to find the end of the file
+        :return: The offset subscribers follow on from
+        """
+        await self._ready.wait()
+        return self.offset
+
+    def unsubscribe(self, queue: "asyncio.Queue[FollowEvent | None]") -> None:
+        """
+        Stop receiving changes, stopping the reader once there are no subscribers left
+        :param queue: The queue returned by subscribe
+        :return: None
+        """
+        self._subscribers.discard(queue)
+        if not self._subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._ready.clear()
+
+    def _publish(self, event: FollowEvent) -> None:
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A subscriber that cannot keep up is disconnected rather than buffering without bound
+                self._subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def _poll(self) -> None:
+        try:
+            stat_result = await run_blocking(IOCategory.METADATA, self.path.stat)
+        except FileNotFoundError:
+            # Mid rotation, the new file will be picked up on a later poll
+            return
+        if self._inode is not None and stat_result.st_ino != self._inode:
+            logger.info("Followed file %s was rotated", self.path)
+            self._restart(stat_result.st_ino, "rotated")
+        elif stat_result.st_size < self.offset:
+            logger.info("Followed file %s was truncated", self.path)
+            self._restart(stat_result.st_ino, "truncated")
+        self._inode = stat_result.st_ino
+
+        while self.offset < stat_result.st_size:
+            end = min(stat_result.st_size, self.offset + TEXT_FOLLOW_MAX_READ)
+            data = await run_blocking(IOCategory.BULK_READ, read_range, self.path, self.offset, end)
+            if not data:
+                return
+            self.reads += 1
+            self._publish(FollowEvent("append", self.offset, self._decoder.decode(data)))
+            self.offset += len(data)
+
+    def _restart(self, inode: int, reason: str) -> None:
+        self.offset = 0
+        self._inode = inode
+        self._decoder.reset()
+        self._publish(FollowEvent(reason, 0))
+
+    async def _run(self) -> None:
+        try:
+            stat_result = await run_blocking(IOCategory.METADATA, self.path.stat)
+            self.offset = stat_result.st_size
+            self._inode = stat_result.st_ino
+        except OSError as exc:
+            logger.warning("Could not stat followed file %s: %s", self.path, exc)
+        self._ready.set()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error following %s", self.path)
+
+
+_followers: dict[Path, FileFollower] = {}
+
+
+def get_follower(path: Path) -> FileFollower:
+    """
+    Return the shared follower of a file, creating it if the file is not followed yet
+    :param path: The file to follow
+    :return: The follower
+    """
+    follower = _followers.get(path)
+    if follower is None:
+        follower = _followers[path] = FileFollower(path, TEXT_FOLLOW_POLL_INTERVAL)
+    return follower
+
+
+async def generate_follow_events(
+    path: Path, offset: int | None = None, keepalive_interval: float = 30
+) -> typing.AsyncGenerator[str, None]:
+    """Generate SSE events carrying the data appended to a file.
+
+    :param path: The file to follow
+    :param offset: Byte offset the client already has the file up to, the gap to the current end is sent first
+    :param keepalive_interval: Seconds without changes before a keepalive comment is sent
+    :yield: SSE formatted event strings
+    """
+    follower = get_follower(path)
+    queue = follower.subscribe()
+    try:
+        current_offset = await follower.ready()
+        start = current_offset if offset is None else max(min(offset, current_offset), 0)
+        start = max(start, current_offset - TEXT_FOLLOW_MAX_READ)
+        yield FollowEvent("connected", start).to_sse()
+        if start < current_offset:
+            data = await run_blocking(IOCategory.BULK_READ, read_range, path, start, current_offset)
+            yield FollowEvent("append", start, data.decode("utf-8", errors="replace")).to_sse()
+
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=keepalive_interval)
+            except TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                yield FollowEvent("lagged", follower.offset).to_sse()
+                return
+            yield event.to_sse()
+    except asyncio.CancelledError:
+        logger.info("Follow connection closed for %s", path)
+    finally:
+        follower.unsubscribe(queue)
+        if follower.subscribers == 0 and _followers.get(path) is follower:
+            del _followers[path]
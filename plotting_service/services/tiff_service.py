@@ -0,0 +1,164 @@
+"""Reads regions of TIFF images, decoding only the strips or tiles that overlap them."""
+
+import math
+import typing
+from collections.abc import Iterator
+from pathlib import Path
+from types import TracebackType
+
+import numpy as np
+import tifffile
+
+
+class UnsupportedTiffError(Exception):
+    """Raised when a TIFF is laid out in a way regions cannot be read from, such as with separate colour planes"""
+
+
+def _has_codecs(page: tifffile.TiffPage) -> bool:
+    """Whether tifffile can decompress and undo the predictor of a page, some codecs need imagecodecs"""
+    try:
+        tifffile.TIFF.DECOMPRESSORS[page.compression]
+        if page.predictor > 1:
+            tifffile.TIFF.UNPREDICTORS[page.predictor]
+    except (KeyError, ImportError):
+        return False
+    return True
+
+
+class TiffRegionReader:
+    """
+    The first page of a TIFF image, read region by region. Each read decodes only the strips or tiles the region
+    overlaps, or for uncompressed images loads only the pages of the file holding it, so sampling rows or cropping
+    never decodes the whole image.
+    """
+
+    def __init__(self, path: Path) -> None:
+        """
+        :param path: The TIFF image
+        """
+        try:
+            self._tiff = tifffile.TiffFile(path)
+        except tifffile.TiffFileError as exc:
+            raise UnsupportedTiffError(f"{path} is not a TIFF") from exc
+        page = self._tiff.pages.first
+        if (
+            not isinstance(page, tifffile.TiffPage)
+            or page.imagedepth != 1
+            or (page.samplesperpixel > 1 and page.planarconfig == tifffile.PLANARCONFIG.SEPARATE)
+            or page.photometric == tifffile.PHOTOMETRIC.PALETTE
+            or page.bitspersample not in (8, 16, 32, 64)
+        ):
+            self._tiff.close()
+            raise UnsupportedTiffError(f"Regions of {path} cannot be read")
+        if not page.is_memmappable and not _has_codecs(page):
+            # Compressions such as LZW need imagecodecs, without it the image is left to Pillow
+            self._tiff.close()
+            raise UnsupportedTiffError(
+                f"No codec for the {tifffile.COMPRESSION(page.compression).name} compression of {path}"
+            )
+        self._page = page
+        self.height: int = page.imagelength
+        self.width: int = page.imagewidth
+        self.samples: int = page.samplesperpixel
+        self.dtype: np.dtype[typing.Any] = np.dtype(page.dtype).newbyteorder("=")
+        if page.is_tiled:
+            self.segment_shape = (page.tilelength, page.tilewidth)
+        else:
+            self.segment_shape = (min(page.rowsperstrip, self.height), self.width)
+        self.segments_across = math.ceil(self.width / self.segment_shape[1])
+        self.segments_decoded = 0
+        # Uncompressed images stored in one contiguous block are read through a memory map instead, so only the pages
+        # holding the pixels read are loaded
+        self._memmap: np.ndarray | None = tifffile.memmap(path, page=0, mode="r") if page.is_memmappable else None
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        """Rows and columns of the image, followed by the samples per pixel if there are more than one"""
+        return (self.height, self.width) if self.samples == 1 else (self.height, self.width, self.samples)
+
+    def _segments(
+        self, bands: typing.Iterable[int], columns: typing.Iterable[int]
+    ) -> Iterator[tuple[int, int, np.ndarray]]:
+        """
+        Decode the segments at the given bands of rows and segment columns
+        :param bands: Indices of the bands of rows, each one segment high
+        :param columns: Indices of the segment columns
+        :return: Iterator of (first row, first column, segment) tuples, segments at the edges may be padded
+        """
+        page = self._page
+        indices = [band * self.segments_across + column for band in bands for column in columns]
+        offsets = [page.dataoffsets[index] for index in indices]
+        bytecounts = [page.databytecounts[index] for index in indices]
+        for data, index in self._tiff.filehandle.read_segments(offsets, bytecounts, indices, sort=True):
+            segment, (_, _, row, column, _), _ = page.decode(data, index, jpegtables=page.jpegtables)
+            if segment is None:
+                # Sparse images leave segments that were never written empty
+                continue
+            self.segments_decoded += 1
+            yield row, column, segment[0] if self.samples > 1 else segment[0, ..., 0]
+
+    def read(self, rows: slice, columns: slice) -> np.ndarray:
+        """
+        Read a rectangular region
+        :param rows: The rows to read, without a step
+        :param columns: The columns to read, without a step
+        :return: The region
+        """
+        if self._memmap is not None:
+            return np.asarray(self._memmap[rows, columns], dtype=self.dtype)
+        row_start, row_stop, _ = rows.indices(self.height)
+        column_start, column_stop, _ = columns.indices(self.width)
+        out = np.zeros((max(row_stop - row_start, 0), max(column_stop - column_start, 0), *self.shape[2:]), self.dtype)
+        if out.size == 0:
+            return out
+        segment_rows, segment_columns = self.segment_shape
+        bands = range(row_start // segment_rows, (row_stop - 1) // segment_rows + 1)
+        across = range(column_start // segment_columns, (column_stop - 1) // segment_columns + 1)
+        for row, column, segment in self._segments(bands, across):
+            top, bottom = max(row, row_start), min(row + segment.shape[0], row_stop)
+            left, right = max(column, column_start), min(column + segment.shape[1], column_stop)
+            out[top - row_start : bottom - row_start, left - column_start : right - column_start] = segment[
+                top - row : bottom - row, left - column : right - column
+            ]
+        return out
+
+    def take(self, rows: np.ndarray, columns: np.ndarray) -> np.ndarray:
+        """
+        Read the pixels at every combination of the given rows and columns, decoding only the segments holding them
+        :param rows: Sorted indices of the rows
+        :param columns: Sorted indices of the columns
+        :return: The pixels, one row per row index and one column per column index
+        """
+        if self._memmap is not None:
+            return np.asarray(self._memmap[rows][:, columns], dtype=self.dtype)
+        out = np.zeros((len(rows), len(columns), *self.shape[2:]), self.dtype)
+        segment_rows, segment_columns = self.segment_shape
+        row_bands = rows // segment_rows
+        column_bands = columns // segment_columns
+        for row, column, segment in self._segments(np.unique(row_bands).tolist(), np.unique(column_bands).tolist()):
+            selected_rows = np.flatnonzero(row_bands == row // segment_rows)
+            selected_columns = np.flatnonzero(column_bands == column // segment_columns)
+            out[np.ix_(selected_rows, selected_columns)] = segment[
+                np.ix_(rows[selected_rows] - row, columns[selected_columns] - column)
+            ]
+        return out
+
+    def __getitem__(self, key: tuple[slice, ...]) -> np.ndarray:
+        """Read a region with a (rows, columns) tuple of slices, so the image can be reduced like a dataset"""
+        return self.read(key[0], key[1])
+
+    def close(self) -> None:
+        """
+        Close the file
+        :return: None
+        """
+        self._memmap = None
+        self._tiff.close()
+
+    def __enter__(self) -> "TiffRegionReader":
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        self.close()
@@ -1,14 +1,15 @@
 import asyncio
-import json
 import logging
 import re
+from collections.abc import Iterable
 from contextlib import suppress
 from http import HTTPStatus
 from pathlib import Path
 
-import websockets
 from fastapi import HTTPException
-from starlette.requests import Request
+
+from plotting_service.file_index import file_index_registry, negative_lookup_cache
+from plotting_service.services.pv_service import pv_manager
 
 logger = logging.getLogger(__name__)
 
@@ -55,13 +56,32 @@ def _safe_find_file_in_dir(dir_path: Path, base_path: str, filename: str) -> Pat
         raise HTTPException(status_code=HTTPStatus.FORBIDDEN, detail="Invalid path being accessed.") from None
 
     if dir_path.exists():
-        found_paths = list(dir_path.rglob(filename))
-        if len(found_paths) > 0 and found_paths[0].exists():
-            return found_paths[0]
+        return file_index_registry.find(dir_path, filename)
 
     return None
 
 
+def _instrument_autoreduced_folder(ceph_dir: str, instrument: str, experiment_number: int) -> Path:
+    # Does the autoreduced/RBNumber folder exist? If so use it, else use unknown
+    autoreduced_folder = Path(ceph_dir) / f"{instrument.upper()}/RBNumber/RB{experiment_number}/autoreduced"
+    with suppress(OSError):
+        safe_check_filepath(filepath=autoreduced_folder, base_path=ceph_dir)
+    if autoreduced_folder.exists():
+        return autoreduced_folder
+    return Path(ceph_dir) / f"{instrument.upper()}/RBNumber/unknown/autoreduced"
+
+
+def _search_instrument(ceph_dir: str, autoreduced_folder: Path, filename: str) -> Path | None:
+    # Run normal check
+    basic_path = autoreduced_folder / filename
+    # Do a check as we are handling user entered data here
+    with suppress(OSError):
+        safe_check_filepath(filepath=basic_path, base_path=ceph_dir)
+    if basic_path.exists():
+        return basic_path
+    return _safe_find_file_in_dir(dir_path=autoreduced_folder, base_path=ceph_dir, filename=filename)
+
+
 def find_file_instrument(ceph_dir: str, instrument: str, experiment_number: int, filename: str) -> Path | None:
     """
     Find a file likely made by automated reduction of an experiment number
@@ -71,23 +91,32 @@ def find_file_instrument(ceph_dir: str, instrument: str, experiment_number: int,
     :param filename: name of the file to find
     :return: path to the filename or None
     """
-    # Run normal check
-    basic_path = Path(ceph_dir) / f"{instrument.upper()}/RBNumber/RB{experiment_number}/autoreduced/{filename}"
-    # Do a check as we are handling user entered data here
-    with suppress(OSError):
-        safe_check_filepath(filepath=basic_path, base_path=ceph_dir)
-    if basic_path.exists():
-        return basic_path
+    autoreduced_folder = _instrument_autoreduced_folder(ceph_dir, instrument, experiment_number)
+    return negative_lookup_cache.find(
+        # The folder is part of the key, so a miss in unknown is not trusted once the experiment has its own folder
+        key=("instrument", autoreduced_folder, filename),
+        directory=autoreduced_folder,
+        search=lambda: _search_instrument(ceph_dir, autoreduced_folder, filename),
+    )
 
-    # Does the autoreduced/RBNumber folder exist? If so use it, else use unknown
-    autoreduced_folder = Path(ceph_dir) / f"{instrument.upper()}/RBNumber/RB{experiment_number}/autoreduced"
-    with suppress(OSError):
-        safe_check_filepath(filepath=autoreduced_folder, base_path=ceph_dir)
-    if autoreduced_folder.exists():
-        return _safe_find_file_in_dir(dir_path=autoreduced_folder, base_path=ceph_dir, filename=filename)
 
-    autoreduced_folder = Path(ceph_dir) / f"{instrument.upper()}/RBNumber/unknown/autoreduced"
-    return _safe_find_file_in_dir(dir_path=autoreduced_folder, base_path=ceph_dir, filename=filename)
+def find_files_instrument(
+    ceph_dir: str, instrument: str, experiment_number: int, filenames: Iterable[str]
+) -> dict[str, Path | None]:
+    """
+    Find several files likely made by automated reduction of an experiment number with one traversal of its folder
+    :param ceph_dir: base path of the filename path
+    :param instrument: name of the instrument to find the files in
+    :param experiment_number: experiment number of the files
+    :param filenames: names of the files to find
+    :return: mapping of each filename to its path or None
+    """
+    autoreduced_folder = _instrument_autoreduced_folder(ceph_dir, instrument, experiment_number)
+    try:
+        safe_check_filepath(filepath=autoreduced_folder, base_path=ceph_dir)
+    except OSError:
+        return dict.fromkeys(filenames)
+    return file_index_registry.find_many(autoreduced_folder, filenames)
 
 
 def find_file_experiment_number(ceph_dir: str, experiment_number: int, filename: str) -> Path | None:
@@ -99,7 +128,11 @@ def find_file_experiment_number(ceph_dir: str, experiment_number: int, filename:
     :return: Full path to the filename or None
     """
     dir_path = Path(ceph_dir) / f"GENERIC/autoreduce/ExperimentNumbers/{experiment_number}/"
-    return _safe_find_file_in_dir(dir_path=dir_path, base_path=ceph_dir, filename=filename)
+    return negative_lookup_cache.find(
+        key=("experiment_number", ceph_dir, experiment_number, filename),
+        directory=dir_path,
+        search=lambda: _safe_find_file_in_dir(dir_path=dir_path, base_path=ceph_dir, filename=filename),
+    )
 
 
 def find_file_user_number(ceph_dir: str, user_number: int, filename: str) -> Path | None:
@@ -111,37 +144,11 @@ def find_file_user_number(ceph_dir: str, user_number: int, filename: str) -> Pat
     :return: Full path to the filename or None
     """
     dir_path = Path(ceph_dir) / f"GENERIC/autoreduce/UserNumbers/{user_number}/"
-    return _safe_find_file_in_dir(dir_path=dir_path, base_path=ceph_dir, filename=filename)
-
-
-def find_experiment_number(request: Request) -> int:
-    """
-    Find the experiment number from a request
-    :param request: Request to be used to get the experiment number
-    :return: Experiment number in the request
-    """
-    if request.url.path.startswith("/text"):
-        return int(request.url.path.split("/")[-1])
-    if request.url.path.startswith("/find_file"):
-        url_parts = request.url.path.split("/")
-        try:
-            experiment_number_index = url_parts.index("experiment_number")
-            return int(url_parts[experiment_number_index + 1])
-        except (ValueError, IndexError):
-            logger.warning(
-                f"The requested path {request.url.path} does not include an experiment number. "
-                f"Permissions cannot be checked"
-            )
-            raise HTTPException(HTTPStatus.BAD_REQUEST, "Request missing experiment number") from None
-    match = re.search(r"%2FRB(\d+)%2F", request.url.query)
-    if match is not None:
-        return int(match.group(1))
-
-    logger.warning(
-        f"The requested nexus metadata path {request.url.path} does not include an experiment number. "
-        f"Permissions cannot be checked"
+    return negative_lookup_cache.find(
+        key=("user_number", ceph_dir, user_number, filename),
+        directory=dir_path,
+        search=lambda: _safe_find_file_in_dir(dir_path=dir_path, base_path=ceph_dir, filename=filename),
     )
-    raise HTTPException(HTTPStatus.BAD_REQUEST, "Request missing experiment number")
 
 
 def request_path_check(path: Path | None, base_dir: str) -> Path:
@@ -161,24 +168,13 @@ def request_path_check(path: Path | None, base_dir: str) -> Path:
 
 
 async def get_current_rb_async(instrument: str, timeout: float = 5.0) -> str:
-    pv = f"IN:{instrument.upper()}:DAE:_RBNUMBER"
-    ws_url = "wss://ndaextweb4.nd.rl.ac.uk/pvws/pv"
-
-    async with websockets.connect(ws_url) as ws:
-        await ws.send(json.dumps({"type": "subscribe", "pvs": [pv]}))
-
-        async def wait_for_update() -> str:
-            while True:
-                msg = await ws.recv()
-                data = json.loads(msg)
-
-                if data.get("type") == "update" and data.get("pv") == pv:
-                    return data.get("text") or str(data.get("value"))
-
-        try:
-            return await asyncio.wait_for(wait_for_update(), timeout=timeout)
-        except TimeoutError:
-            raise TimeoutError(f"Failed to get PV {pv} within {timeout} seconds") from None
+    """
+    Given an instrument name, return the rb number of the current experiment from the shared PV subscription
+    :param instrument: Instrument name to get rb number for
+    :param timeout: Seconds to wait for the PV if its value is not cached yet
+    :return: RB number of the current ISIS run
+    """
+    return await pv_manager.get(f"IN:{instrument.upper()}:DAE:_RBNUMBER", timeout=timeout)
 
 
 def get_current_rb_for_instrument(instrument: str) -> str:
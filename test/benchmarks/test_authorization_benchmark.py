@@ -0,0 +1,77 @@
+import logging
+import time
+import typing
+
+import h5py
+import httpx
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from h5grove.fastapi_utils import router, settings  # type: ignore
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+
+from plotting_service.authorization import AuthorizationMiddleware, authorize
+
+STAFF_TOKEN = (
+    "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."  # noqa: S105
+    "eyJ1c2VybnVtYmVyIjoxMjM0LCJyb2xlIjoic3RhZmYiLCJ1c2VybmFtZSI6ImZvbyIsImV4cCI6NDg3MjQ2ODk4M30."
+    "-ktYEwdUfg5_PmUocmrAonZ6lwPJdcMoklWnVME1wLE"
+)
+REQUESTS = 500
+
+logger = logging.getLogger(__name__)
+
+
+async def authorize_in_base_http_middleware(
+    request: Request, call_next: typing.Callable[..., typing.Any]
+) -> typing.Any:
+    await authorize(request.scope)
+    return await call_next(request)
+
+
+def make_two_layer_app() -> FastAPI:
+    """The previous layout, two BaseHTTPMiddleware layers that both authorize the request"""
+    app = FastAPI()
+    app.add_middleware(BaseHTTPMiddleware, dispatch=authorize_in_base_http_middleware)
+    app.add_middleware(BaseHTTPMiddleware, dispatch=authorize_in_base_http_middleware)
+    app.include_router(router)
+    return app
+
+
+def make_single_layer_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(AuthorizationMiddleware)
+    app.include_router(router)
+    return app
+
+
+async def time_meta_requests(app: FastAPI) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        params = {"file": "LOQ/RBNumber/RB1245/autoreduced/small.h5", "path": "/data"}
+        headers = {"Authorization": f"Bearer {STAFF_TOKEN}"}
+        # Warm up caches and lazy imports
+        await client.get("/meta", params=params, headers=headers)
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            response = await client.get("/meta", params=params, headers=headers)
+            response.raise_for_status()
+        return (time.perf_counter() - start) / REQUESTS
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_benchmark_meta_request_overhead(tmp_path, monkeypatch):
+    file_path = tmp_path / "LOQ" / "RBNumber" / "RB1245" / "autoreduced" / "small.h5"
+    file_path.parent.mkdir(parents=True)
+    with h5py.File(file_path, "w") as h5file:
+        h5file["data"] = np.arange(10)
+    monkeypatch.setattr(settings, "base_dir", str(tmp_path))
+
+    two_layer = await time_meta_requests(make_two_layer_app())
+    single_layer = await time_meta_requests(make_single_layer_app())
+
+    logger.info("Two BaseHTTPMiddleware layers: %.1f us per /meta request", two_layer * 1e6)
+    logger.info("Single ASGI authorization layer: %.1f us per /meta request", single_layer * 1e6)
+    assert single_layer < two_layer
@@ -0,0 +1,49 @@
+import logging
+import time
+
+import numpy as np
+import pytest
+
+from plotting_service.compression import ENCODERS, byte_shuffle
+
+logger = logging.getLogger(__name__)
+
+
+def payloads() -> dict[str, tuple[bytes, int]]:
+    rng = np.random.default_rng(0)
+    # A detector image, smooth with counting noise, like the 16 bit TIFFs from IMAT
+    y, x = np.mgrid[0:2048, 0:2048]
+    image = (20000 * np.exp(-((x - 1024) ** 2 + (y - 1024) ** 2) / 8e5) + rng.poisson(50, (2048, 2048))).astype(
+        np.uint16
+    )
+    spectrum = np.cumsum(rng.normal(0, 1, 1_000_000)).astype(np.float64)
+    return {"uint16 image": (image.tobytes(), 2), "float64 spectrum": (spectrum.tobytes(), 8)}
+
+
+@pytest.mark.benchmark
+def test_benchmark_encodings():
+    for name, (data, item_size) in payloads().items():
+        start = time.perf_counter()
+        baseline = ENCODERS["gzip"](9)
+        baseline_size = len(baseline.compress(data) + baseline.finish())
+        logger.info(
+            "%s: %d bytes, gzip level 9 as before %.3f in %.0f ms",
+            name,
+            len(data),
+            baseline_size / len(data),
+            (time.perf_counter() - start) * 1e3,
+        )
+        for encoding in ENCODERS:
+            for shuffle in (False, True):
+                start = time.perf_counter()
+                payload = byte_shuffle(data, item_size) if shuffle else data
+                encoder = ENCODERS[encoding]({"gzip": 6, "zstd": 3, "br": 4}[encoding])
+                size = len(encoder.compress(payload) + encoder.finish())
+                logger.info(
+                    "%s: %s%s %.3f in %.0f ms",
+                    name,
+                    encoding,
+                    " shuffled" if shuffle else "",
+                    size / len(data),
+                    (time.perf_counter() - start) * 1e3,
+                )
@@ -0,0 +1,71 @@
+import logging
+import time
+
+import numpy as np
+import pytest
+import tifffile
+from fastapi.testclient import TestClient
+
+from plotting_service import plotting_api
+from plotting_service.routers import imat
+from plotting_service.services.display_service import DisplayWindow, window_to_uint8
+from plotting_service.services.image_cache_service import DerivedImageCache
+
+SIZE = 2048
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(scope="module")
+def radiograph(tmp_path_factory):
+    """A 2k 16 bit radiograph of a bright disc on a noisy background"""
+    rng = np.random.default_rng(0)
+    y, x = np.ogrid[0:SIZE, 0:SIZE]
+    pixels = (20000 * np.exp(-((x - SIZE / 2) ** 2 + (y - SIZE / 2) ** 2) / (SIZE**2 / 5))).astype(np.uint16)
+    pixels += rng.poisson(50, (SIZE, SIZE)).astype(np.uint16)
+    root = tmp_path_factory.mktemp("radiographs")
+    tifffile.imwrite(root / "radiograph.tif", pixels)
+    return root, pixels
+
+
+def timed_get(client, url, params):
+    start = time.perf_counter()
+    response = client.get(url, params=params, headers={"Authorization": "Bearer foo", "Accept-Encoding": "identity"})
+    assert response.status_code == 200  # noqa: PLR2004
+    return len(response.content), (time.perf_counter() - start) * 1e3
+
+
+@pytest.mark.benchmark
+def test_benchmark_display_payloads(radiograph, tmp_path, monkeypatch):
+    root, pixels = radiograph
+    monkeypatch.setenv("API_KEY", "foo")
+    monkeypatch.setattr(imat, "CEPH_DIR", str(root))
+    monkeypatch.setattr(imat, "derived_image_cache", DerivedImageCache(tmp_path / "cache"))
+    client = TestClient(plotting_api.app)
+
+    native_bytes, native_ms = timed_get(client, "/imat/image", {"path": "radiograph.tif"})
+    raw_bytes, raw_ms = timed_get(client, "/imat/image/display", {"path": "radiograph.tif"})
+    png_bytes, png_ms = timed_get(client, "/imat/image/display", {"path": "radiograph.tif", "format": "png"})
+
+    start = time.perf_counter()
+    window_to_uint8(pixels, DisplayWindow())
+    table_ms = (time.perf_counter() - start) * 1e3
+    start = time.perf_counter()
+    window_to_uint8(pixels.astype(np.float32), DisplayWindow())
+    float_ms = (time.perf_counter() - start) * 1e3
+
+    logger.info(
+        "16 bit %d KiB in %.0f ms, 8 bit %d KiB in %.0f ms, 8 bit png %d KiB in %.0f ms; windowing %.0f ms with a "
+        "lookup table, %.0f ms for float32",
+        native_bytes // 1024,
+        native_ms,
+        raw_bytes // 1024,
+        raw_ms,
+        png_bytes // 1024,
+        png_ms,
+        table_ms,
+        float_ms,
+    )
+    assert raw_bytes * 2 == native_bytes
+    assert png_bytes < raw_bytes
+    assert table_ms < float_ms
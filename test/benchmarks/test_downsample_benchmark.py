@@ -0,0 +1,65 @@
+import logging
+import time
+
+import numpy as np
+import pytest
+import tifffile
+from PIL import Image
+
+from plotting_service.services.image_service import DownsampleMethod, convert_image_to_rgb_bytes, downsample_image
+
+FACTORS = (1, 2, 8, 64)
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(scope="module", params=[2048, 4096], ids=["2k", "4k"])
+def detector_image(request, tmp_path_factory):
+    """A 16 bit detector image, written in strips as IMAT cameras do"""
+    size = request.param
+    rng = np.random.default_rng(0)
+    y, x = np.ogrid[0:size, 0:size]
+    pixels = 20000 * np.exp(-((x - size / 2) ** 2 + (y - size / 2) ** 2) / (size**2 / 5)) + rng.poisson(
+        50, (size, size)
+    )
+    path = tmp_path_factory.mktemp("images") / f"image_{size}.tif"
+    tifffile.imwrite(path, pixels.astype(np.uint16), rowsperstrip=16)
+    return path
+
+
+def pil_nearest(image_path, factor):
+    """The previous /imat/image downsampling, resizing the fully decoded image"""
+    with Image.open(image_path) as image:
+        if factor == 1:
+            return image.tobytes()
+        size = (max(1, round(image.width / factor)), max(1, round(image.height / factor)))
+        return image.resize(size, Image.Resampling.NEAREST).tobytes()
+
+
+def timed(function, repeats=3):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1e3
+
+
+@pytest.mark.benchmark
+def test_benchmark_downsample_methods(detector_image):
+    for factor in FACTORS:
+        timings = {
+            "previous nearest": timed(lambda factor=factor: pil_nearest(detector_image, factor)),
+            "previous lanczos rgb": timed(lambda factor=factor: convert_image_to_rgb_bytes(detector_image, factor)),
+        }
+        for method in DownsampleMethod:
+            timings[method.value] = timed(
+                lambda factor=factor, method=method: downsample_image(detector_image, factor, method)[0].tobytes()
+            )
+        logger.info(
+            "%s factor %d: %s",
+            detector_image.name,
+            factor,
+            ", ".join(f"{name} {milliseconds:.1f} ms" for name, milliseconds in timings.items()),
+        )
+        if factor >= 8:  # noqa: PLR2004
+            assert timings["nearest"] < timings["previous nearest"]
+            assert timings["box"] < timings["previous lanczos rgb"]
@@ -0,0 +1,67 @@
+import logging
+import os
+import time
+
+import pytest
+
+from plotting_service.file_index import FileIndex
+
+FILES = 100_000
+FILES_PER_DIRECTORY = 100
+LOOKUPS = 200
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(scope="module")
+def synthetic_tree(tmp_path_factory):
+    root = tmp_path_factory.mktemp("autoreduced")
+    for directory_number in range(FILES // FILES_PER_DIRECTORY):
+        directory = root / f"run{directory_number:05d}"
+        directory.mkdir()
+        for file_number in range(FILES_PER_DIRECTORY):
+            (directory / f"MAR{directory_number:05d}_{file_number:03d}.nxspe").touch()
+        # Reduced data directories are rarely written to, age them past the index mtime grace period
+        os.utime(directory, (time.time() - 60, time.time() - 60))
+    return root
+
+
+def rglob_first(root, filename):
+    """The previous lookup, which built the full match list before taking the first element"""
+    found_paths = list(root.rglob(filename))
+    return found_paths[0] if found_paths else None
+
+
+@pytest.mark.benchmark
+def test_benchmark_find_file_in_100k_file_tree(synthetic_tree):
+    filename = f"MAR{FILES // FILES_PER_DIRECTORY - 1:05d}_050.nxspe"
+
+    start = time.perf_counter()
+    expected = rglob_first(synthetic_tree, filename)
+    rglob_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    short_circuit = next(synthetic_tree.rglob(filename), None)
+    short_circuit_seconds = time.perf_counter() - start
+
+    index = FileIndex(synthetic_tree)
+    start = time.perf_counter()
+    index.refresh()
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.refresh()
+    refresh_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(LOOKUPS):
+        found = index.find(filename)
+    lookup_seconds = (time.perf_counter() - start) / LOOKUPS
+
+    logger.info("rglob full list: %.1f ms", rglob_seconds * 1e3)
+    logger.info("rglob first match: %.1f ms", short_circuit_seconds * 1e3)
+    logger.info("Index build: %.1f ms, incremental refresh: %.1f ms", build_seconds * 1e3, refresh_seconds * 1e3)
+    logger.info("Indexed lookup: %.1f us", lookup_seconds * 1e6)
+    assert found == short_circuit == expected
+    assert lookup_seconds < rglob_seconds
+    assert refresh_seconds < build_seconds
@@ -0,0 +1,53 @@
+import logging
+import time
+
+import h5py
+import httpx
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from h5grove.fastapi_utils import settings
+
+from plotting_service.routers.hdf5 import HDF5Router
+from plotting_service.services.hdf5_service import h5_file_cache
+
+PLOTS = 100
+PATHS = ["/entry/data/signal", "/entry/data/errors", "/entry/data/x", "/entry/data/y"]
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_benchmark_batch_against_separate_requests(tmp_path, monkeypatch):
+    with h5py.File(tmp_path / "run.nxs", "w") as h5file:
+        rng = np.random.default_rng(0)
+        h5file["entry/data/signal"] = rng.random((100, 100))
+        h5file["entry/data/errors"] = rng.random((100, 100))
+        h5file["entry/data/x"] = np.arange(100.0)
+        h5file["entry/data/y"] = np.arange(100.0)
+    monkeypatch.setattr(settings, "base_dir", str(tmp_path))
+    app = FastAPI()
+    app.include_router(HDF5Router)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        start = time.perf_counter()
+        for _ in range(PLOTS):
+            (await client.get("/meta", params={"file": "run.nxs", "path": "/entry/data"})).raise_for_status()
+            for path in PATHS:
+                params = {"file": "run.nxs", "path": path, "format": "bin"}
+                (await client.get("/data", params=params)).raise_for_status()
+        separate = (time.perf_counter() - start) / PLOTS
+
+        items = [{"endpoint": "meta", "path": "/entry/data"}] + [{"path": path, "format": "bin"} for path in PATHS]
+        start = time.perf_counter()
+        for _ in range(PLOTS):
+            response = await client.post("/batch", params={"file": "run.nxs"}, json={"items": items})
+            response.raise_for_status()
+        batched = (time.perf_counter() - start) / PLOTS
+    h5_file_cache.clear()
+
+    logger.info("Separate requests: %.0f us per plot", separate * 1e6)
+    logger.info("Batch request: %.0f us per plot", batched * 1e6)
+    assert batched < separate
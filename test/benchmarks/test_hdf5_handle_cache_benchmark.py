@@ -0,0 +1,53 @@
+import logging
+import time
+
+import h5py
+import httpx
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from h5grove.fastapi_utils import settings
+
+from plotting_service.routers.hdf5 import HDF5Router
+from plotting_service.services.hdf5_service import h5_file_cache
+
+REQUESTS = 200
+
+logger = logging.getLogger(__name__)
+
+
+async def time_data_requests(client: httpx.AsyncClient, cold: bool) -> float:
+    params = {"file": "run.nxs", "path": "/entry/data/signal", "selection": "0:10", "format": "bin"}
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        if cold:
+            h5_file_cache.clear()
+        response = await client.get("/data", params=params)
+        response.raise_for_status()
+    return (time.perf_counter() - start) / REQUESTS
+
+
+@pytest.mark.benchmark
+@pytest.mark.asyncio
+async def test_benchmark_cold_and_warm_data_latency(tmp_path, monkeypatch):
+    with h5py.File(tmp_path / "run.nxs", "w") as h5file:
+        # A NeXus like layout, many small groups make opening the file relatively expensive
+        for index in range(500):
+            group = h5file.create_group(f"entry/instrument/component_{index}")
+            group.attrs["NX_class"] = "NXcollection"
+            group["value"] = np.arange(10)
+        h5file["entry/data/signal"] = np.random.default_rng(0).random((1000, 1000))
+    monkeypatch.setattr(settings, "base_dir", str(tmp_path))
+    app = FastAPI()
+    app.include_router(HDF5Router)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        cold = await time_data_requests(client, cold=True)
+        await time_data_requests(client, cold=False)
+        warm = await time_data_requests(client, cold=False)
+    h5_file_cache.clear()
+
+    logger.info("Cold /data: %.1f us per request", cold * 1e6)
+    logger.info("Warm /data: %.1f us per request", warm * 1e6)
+    assert warm < cold
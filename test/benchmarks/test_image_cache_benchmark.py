@@ -0,0 +1,62 @@
+import logging
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from plotting_service.services.image_cache_service import DerivedImageCache
+from plotting_service.services.image_service import convert_image_to_rgb_bytes
+
+STACK_SIZE = 20
+PASSES = 5
+DOWNSAMPLE_FACTOR = 4
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(scope="module")
+def stack(tmp_path_factory):
+    root = tmp_path_factory.mktemp("stack")
+    rng = np.random.default_rng(0)
+    paths = []
+    for number in range(STACK_SIZE):
+        path = root / f"IMAT_{number:05d}.tif"
+        Image.fromarray(rng.integers(0, 60000, (2048, 2048), dtype=np.uint16)).save(path, format="TIFF")
+        paths.append(path)
+    return paths
+
+
+@pytest.mark.benchmark
+def test_benchmark_scrolling_through_a_stack(stack, tmp_path):
+    """A user scrolling back and forth through a stack at one downsample factor"""
+    start = time.perf_counter()
+    for _ in range(PASSES):
+        for path in stack:
+            convert_image_to_rgb_bytes(path, DOWNSAMPLE_FACTOR)
+    uncached_seconds = (time.perf_counter() - start) / (PASSES * STACK_SIZE)
+
+    cache = DerivedImageCache(tmp_path / "cache")
+    start = time.perf_counter()
+    for _ in range(PASSES):
+        for path in stack:
+            cache.get(path, DOWNSAMPLE_FACTOR, "rgb", convert_image_to_rgb_bytes)
+    cached_seconds = (time.perf_counter() - start) / (PASSES * STACK_SIZE)
+
+    restarted = DerivedImageCache(tmp_path / "cache")
+    start = time.perf_counter()
+    for path in stack:
+        restarted.get(path, DOWNSAMPLE_FACTOR, "rgb", convert_image_to_rgb_bytes)
+    disk_seconds = (time.perf_counter() - start) / STACK_SIZE
+
+    logger.info(
+        "Per image: decode %.1f ms, cached %.2f ms over %d passes, disk tier %.2f ms, %s",
+        uncached_seconds * 1e3,
+        cached_seconds * 1e3,
+        PASSES,
+        disk_seconds * 1e3,
+        cache.stats(),
+    )
+    assert cache.stats()["misses"] == STACK_SIZE
+    assert restarted.stats()["disk_hits"] == STACK_SIZE
+    assert cached_seconds < uncached_seconds / 2
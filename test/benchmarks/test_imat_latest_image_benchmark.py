@@ -0,0 +1,47 @@
+import json
+import logging
+import time
+import tracemalloc
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from plotting_service.services.image_service import convert_image_to_rgb_array, convert_image_to_rgb_bytes
+
+logger = logging.getLogger(__name__)
+
+DOWNSAMPLE_FACTOR = 2
+
+
+@pytest.mark.benchmark
+def test_benchmark_latest_image_formats(tmp_path):
+    # A 2048 by 2048 16 bit detector image like those IMAT writes, smooth with counting noise
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:2048, 0:2048]
+    pixels = (20000 * np.exp(-((x - 1024) ** 2 + (y - 1024) ** 2) / 8e5) + rng.poisson(50, (2048, 2048))).astype(
+        np.uint16
+    )
+    image_path = tmp_path / "imat.tiff"
+    Image.fromarray(pixels).save(image_path, format="TIFF")
+
+    # Timed separately from the memory measurement, which slows allocation heavy code such as building the list
+    sizes = {}
+    for name, encode in (
+        ("json", lambda: json.dumps(convert_image_to_rgb_array(image_path, DOWNSAMPLE_FACTOR)[0]).encode()),
+        ("raw", lambda: convert_image_to_rgb_bytes(image_path, DOWNSAMPLE_FACTOR)[0]),
+        ("png", lambda: convert_image_to_rgb_bytes(image_path, DOWNSAMPLE_FACTOR, "png")[0]),
+        ("webp", lambda: convert_image_to_rgb_bytes(image_path, DOWNSAMPLE_FACTOR, "webp")[0]),
+    ):
+        start = time.perf_counter()
+        body = encode()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        encode()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        sizes[name] = len(body)
+        logger.info("%s: %d bytes in %.0f ms, peak %.1f MiB", name, len(body), elapsed * 1e3, peak / 1024**2)
+
+    assert sizes["raw"] == (2048 // DOWNSAMPLE_FACTOR) ** 2 * 3
+    assert sizes["raw"] < sizes["json"] / 2
@@ -0,0 +1,71 @@
+import logging
+import time
+
+import numpy as np
+import pytest
+import tifffile
+from fastapi.testclient import TestClient
+
+from plotting_service import plotting_api
+from plotting_service.routers import imat
+from plotting_service.services.image_cache_service import DerivedImageCache
+
+SIZE = 4096
+REGION = 256
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(scope="module", params=["strips", "compressed tiles"])
+def radiograph(request, tmp_path_factory):
+    """A 4k 16 bit radiograph, either uncompressed in strips or zlib compressed in 256 pixel tiles"""
+    rng = np.random.default_rng(0)
+    y, x = np.ogrid[0:SIZE, 0:SIZE]
+    pixels = (20000 * np.exp(-((x - SIZE / 2) ** 2 + (y - SIZE / 2) ** 2) / (SIZE**2 / 5))).astype(np.uint16)
+    pixels += rng.poisson(50, (SIZE, SIZE)).astype(np.uint16)
+    root = tmp_path_factory.mktemp("radiographs")
+    options = {"rowsperstrip": 16} if request.param == "strips" else {"tile": (256, 256), "compression": "zlib"}
+    tifffile.imwrite(root / "radiograph.tif", pixels, **options)
+    return root, request.param
+
+
+def timed_get(client, url, params):
+    start = time.perf_counter()
+    response = client.get(url, params=params, headers={"Authorization": "Bearer foo"})
+    assert response.status_code == 200  # noqa: PLR2004
+    return len(response.content), (time.perf_counter() - start) * 1e3
+
+
+@pytest.mark.benchmark
+def test_benchmark_deep_zoom(radiograph, tmp_path, monkeypatch):
+    root, layout = radiograph
+    monkeypatch.setenv("API_KEY", "foo")
+    monkeypatch.setattr(imat, "CEPH_DIR", str(root))
+    monkeypatch.setattr(imat, "derived_image_cache", DerivedImageCache(tmp_path / "cache"))
+    client = TestClient(plotting_api.app)
+
+    full_bytes, full_ms = timed_get(client, "/imat/image", {"path": "radiograph.tif"})
+    region_params = {"path": "radiograph.tif", "x": 1900, "y": 1700, "width": REGION, "height": REGION}
+    region_bytes, region_ms = timed_get(client, "/imat/image/region", region_params)
+    tile_params = {"path": "radiograph.tif", "level": 0, "x": 7, "y": 7}
+    tile_bytes, tile_ms = timed_get(client, "/imat/image/tile", tile_params)
+    _, cached_tile_ms = timed_get(client, "/imat/image/tile", tile_params)
+    overview_bytes, overview_ms = timed_get(client, "/imat/image/tile", {**tile_params, "level": 4, "x": 0, "y": 0})
+
+    logger.info(
+        "%s: full frame %d KiB in %.0f ms, region %d KiB in %.1f ms, tile %d KiB in %.1f ms (cached %.1f ms), "
+        "overview tile %d KiB in %.0f ms",
+        layout,
+        full_bytes // 1024,
+        full_ms,
+        region_bytes // 1024,
+        region_ms,
+        tile_bytes // 1024,
+        tile_ms,
+        cached_tile_ms,
+        overview_bytes // 1024,
+        overview_ms,
+    )
+    assert region_bytes == REGION * REGION * 2
+    assert region_bytes < full_bytes / 200
+    assert region_ms < full_ms
@@ -0,0 +1,71 @@
+import logging
+import time
+
+import numpy as np
+import pytest
+import tifffile
+from fastapi.testclient import TestClient
+
+from plotting_service import plotting_api
+from plotting_service.routers import imat
+from plotting_service.services.image_cache_service import DerivedImageCache
+from plotting_service.services.stack_service import FrameDecoder
+
+FRAMES = 200
+SIZE = 512
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(scope="module")
+def projections(tmp_path_factory):
+    """A tomography scan of zlib compressed 16 bit projections"""
+    rng = np.random.default_rng(0)
+    root = tmp_path_factory.mktemp("projections")
+    for index in range(FRAMES):
+        pixels = rng.poisson(1000, (SIZE, SIZE)).astype(np.uint16)
+        tifffile.imwrite(root / f"projection_{index:04d}.tif", pixels, compression="zlib", rowsperstrip=64)
+    return root
+
+
+@pytest.mark.benchmark
+def test_benchmark_stack_against_frame_requests(projections, tmp_path, monkeypatch):
+    monkeypatch.setenv("API_KEY", "foo")
+    monkeypatch.setattr(imat, "CEPH_DIR", str(projections))
+    monkeypatch.setattr(imat, "derived_image_cache", DerivedImageCache(tmp_path / "cache"))
+    monkeypatch.setattr(imat, "frame_decoder", FrameDecoder())
+    client = TestClient(plotting_api.app)
+    # Compressing noise would dominate the timings
+    headers = {"Authorization": "Bearer foo", "Accept-Encoding": "identity"}
+    # Start the worker processes before timing
+    client.get("/imat/stack", params={"path": ".", "stop": 1}, headers=headers)
+
+    start = time.perf_counter()
+    names = client.get("/imat/list-images", params={"path": "."}, headers=headers).json()
+    frame_bytes = sum(len(client.get("/imat/image", params={"path": name}, headers=headers).content) for name in names)
+    frames_ms = (time.perf_counter() - start) * 1e3
+
+    start = time.perf_counter()
+    response = client.get("/imat/stack", params={"path": "."}, headers=headers)
+    stack_ms = (time.perf_counter() - start) * 1e3
+
+    start = time.perf_counter()
+    sinogram = client.get("/imat/stack", params={"path": ".", "sinogram_row": SIZE // 2}, headers=headers)
+    sinogram_ms = (time.perf_counter() - start) * 1e3
+    imat.frame_decoder.shutdown()
+
+    logger.info(
+        "%d frames with %d workers: %d requests %.0f ms, one stack %.0f ms (%d MiB), sinogram %.0f ms (%d KiB)",
+        FRAMES,
+        imat.frame_decoder.workers,
+        FRAMES + 1,
+        frames_ms,
+        stack_ms,
+        len(response.content) // 1024**2,
+        sinogram_ms,
+        len(sinogram.content) // 1024,
+    )
+    assert len(response.content) == frame_bytes == FRAMES * SIZE * SIZE * 2
+    assert len(sinogram.content) == FRAMES * SIZE * 2
+    assert stack_ms < frames_ms
+    assert sinogram_ms < stack_ms
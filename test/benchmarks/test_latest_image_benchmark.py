@@ -0,0 +1,82 @@
+import logging
+import os
+import re
+import time
+
+import pytest
+
+from plotting_service.services.image_service import IMAGE_SUFFIXES
+from plotting_service.services.latest_image_service import LatestImageIndex
+
+RB_FOLDERS = 50
+RUNS_PER_RB = 10
+IMAGES_PER_RUN = 200
+LOOKUPS = 1000
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(scope="module")
+def imat_archive(tmp_path_factory):
+    root = tmp_path_factory.mktemp("imat")
+    past = time.time() - 3600
+    for rb_number in range(RB_FOLDERS):
+        for run_number in range(RUNS_PER_RB):
+            run = root / f"RB{rb_number:04d}" / f"run{run_number:02d}"
+            run.mkdir(parents=True)
+            for image_number in range(IMAGES_PER_RUN):
+                (run / f"IMAT_{image_number:05d}.tif").touch()
+            os.utime(run, (past, past))
+        os.utime(root / f"RB{rb_number:04d}", (past, past))
+    os.utime(root, (past, past))
+    return root
+
+
+def rglob_latest(root):
+    """The previous lookup, which searched and stat'ed every file of every RB folder"""
+    latest_path = None
+    latest_mtime = 0.0
+    for rb_dir in (d for d in root.iterdir() if d.is_dir() and re.fullmatch(r"RB\d+", d.name)):
+        for entry in rb_dir.rglob("*"):
+            if entry.is_file() and entry.suffix.lower() in IMAGE_SUFFIXES:
+                mtime = entry.stat().st_mtime
+                if mtime > latest_mtime:
+                    latest_path, latest_mtime = entry, mtime
+    return latest_path
+
+
+@pytest.mark.benchmark
+def test_benchmark_latest_image_in_100k_image_archive(imat_archive):
+    start = time.perf_counter()
+    expected = rglob_latest(imat_archive)
+    rglob_seconds = time.perf_counter() - start
+
+    index = LatestImageIndex(imat_archive)
+    start = time.perf_counter()
+    index.refresh()
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.refresh()
+    refresh_seconds = time.perf_counter() - start
+
+    # Lookups while a background thread keeps the index fresh read the last refresh
+    index.start()
+    try:
+        start = time.perf_counter()
+        for _ in range(LOOKUPS):
+            found = index.latest()
+        lookup_seconds = (time.perf_counter() - start) / LOOKUPS
+    finally:
+        index.stop()
+
+    logger.info(
+        "%d images: rglob %.1f ms, index build %.1f ms, unchanged refresh %.1f ms, lookup %.1f us",
+        RB_FOLDERS * RUNS_PER_RB * IMAGES_PER_RUN,
+        rglob_seconds * 1e3,
+        build_seconds * 1e3,
+        refresh_seconds * 1e3,
+        lookup_seconds * 1e6,
+    )
+    assert found.stat().st_mtime == expected.stat().st_mtime
+    assert lookup_seconds < rglob_seconds / 100
@@ -0,0 +1,48 @@
+import logging
+import time
+
+import h5py
+import numpy as np
+import pytest
+
+from plotting_service.services.lod_service import decimate_line, reduce_image, select_axes
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.benchmark
+def test_benchmark_lod_throughput(tmp_path):
+    rng = np.random.default_rng(0)
+    with h5py.File(tmp_path / "run.nxs", "w") as h5file:
+        h5file.create_dataset("line", data=rng.random(20_000_000), chunks=(1_000_000,))
+        h5file.create_dataset("image", data=rng.random((4000, 4000)), chunks=(500, 4000))
+
+    with h5py.File(tmp_path / "run.nxs", "r") as h5file:
+        line = h5file["line"]
+        index, axes = select_axes(line.shape, None)
+        start = time.perf_counter()
+        result = decimate_line(line, index, axes[0], width=2000)
+        line_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        full = line[()]
+        line_read_seconds = time.perf_counter() - start
+
+        image = h5file["image"]
+        index, axes = select_axes(image.shape, None)
+        start = time.perf_counter()
+        reduced = reduce_image(image, index, axes, width=1000, height=1000)
+        image_seconds = time.perf_counter() - start
+
+    logger.info(
+        "M4 of %d points to %d: %.1f M points/s (plain read %.1f M points/s), %d bytes instead of %d",
+        line.size,
+        len(result.x),
+        line.size / line_seconds / 1e6,
+        line.size / line_read_seconds / 1e6,
+        result.x.nbytes + result.y.nbytes,
+        full.nbytes,
+    )
+    logger.info(
+        "Block mean of %s to %s: %.1f M pixels/s", reduced.shape, reduced.data.shape, image.size / image_seconds / 1e6
+    )
+    assert len(result.x) <= 4 * 2000
@@ -0,0 +1,53 @@
+import logging
+import time
+
+import h5py
+import numpy as np
+import pytest
+
+from plotting_service.services.hdf5_service import h5_file_cache
+from plotting_service.services.pyramid_service import PyramidCache
+
+VIEW_TILES = 4
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.benchmark
+def test_benchmark_pyramid_navigation(tmp_path):
+    source = str(tmp_path / "run.nxs")
+    with h5py.File(source, "w") as h5file:
+        h5file.create_dataset("image", data=np.random.default_rng(0).random((4096, 4096)), chunks=(256, 256))
+    cache = PyramidCache(tmp_path / "pyramids")
+
+    start = time.perf_counter()
+    pyramid = cache.get(source, "/image")
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    read_bytes = 0
+    views = 0
+    for level, shape in enumerate(pyramid.shapes):
+        # Pan across each level with a view of 2 by 2 tiles
+        for y in range(0, max(1, shape[0] // pyramid.tile_size - 1), 2):
+            x = y % max(1, shape[1] // pyramid.tile_size - 1)
+            for tile_y, tile_x in ((y, x), (y, x + 1), (y + 1, x), (y + 1, x + 1)):
+                try:
+                    read_bytes += cache.get(source, "/image").tile(level, tile_x, tile_y).nbytes
+                except IndexError:
+                    continue
+            views += 1
+    view_seconds = (time.perf_counter() - start) / views
+    h5_file_cache.clear()
+
+    logger.info(
+        "Built %d levels in %.2f s, %d bytes on disk", len(pyramid.shapes), build_seconds, cache.stats()["bytes"]
+    )
+    logger.info(
+        "%.0f KB and %.2f ms per view of %d tiles, a full /data read is %d KB",
+        read_bytes / views / 1024,
+        view_seconds * 1e3,
+        VIEW_TILES,
+        4096 * 4096 * 8 / 1024,
+    )
+    assert read_bytes / views < 4096 * 4096 * 8 / 50
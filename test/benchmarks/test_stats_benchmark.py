@@ -0,0 +1,40 @@
+import logging
+import time
+
+import h5py
+import numpy as np
+import pytest
+from h5grove.content import DatasetContent
+
+from plotting_service.services.hdf5_service import h5_file_cache
+from plotting_service.services.stats_service import StatsCache
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.benchmark
+def test_benchmark_stats_cold_and_cached(tmp_path):
+    source = str(tmp_path / "run.nxs")
+    with h5py.File(source, "w") as h5file:
+        data = np.random.default_rng(0).random((10, 2000, 2000), dtype=np.float32)
+        h5file.create_dataset("data", data=data, chunks=(1, 500, 2000))
+    cache = StatsCache(tmp_path / "stats")
+
+    with h5py.File(source, "r") as h5file:
+        start = time.perf_counter()
+        DatasetContent("/data", h5file["data"]).data_stats()
+        h5grove_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cache.get(source, "/data")
+    cold_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(100):
+        cache.get(source, "/data")
+    warm_seconds = (time.perf_counter() - start) / 100
+    h5_file_cache.clear()
+
+    logger.info("h5grove /stats: %.0f ms", h5grove_seconds * 1e3)
+    logger.info("Chunked statistics and histogram, first request: %.0f ms", cold_seconds * 1e3)
+    logger.info("Cached statistics: %.0f us", warm_seconds * 1e6)
+    assert warm_seconds < cold_seconds / 100
@@ -1,10 +1,21 @@
-from http import HTTPStatus
+import asyncio
 from unittest.mock import patch
 
 import pytest
 
-from plotting_service.auth import User, get_experiments_for_user, get_user_from_token
-from plotting_service.exceptions import AuthError
+from plotting_service import auth
+from plotting_service.auth import (
+    User,
+    decision_cache,
+    experiment_cache,
+    get_experiments_for_user,
+    get_user_from_token,
+    invalidate_user,
+    token_cache,
+    user_can_access_experiment,
+    warm_user,
+)
+from plotting_service.exceptions import AuthError, AuthServiceUnavailableError
 
 TOKEN = (
     "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9"  # noqa: S105
@@ -13,21 +24,168 @@ TOKEN = (
 )
 
 
-@patch("plotting_service.auth.requests.get")
-def test_get_experiment_for_user(mock_get):
-    mock_get.return_value.status_code = HTTPStatus.OK
-    mock_get.return_value.json.return_value = [1234]
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    experiment_cache.clear()
+    decision_cache.clear()
+    token_cache.clear()
+    yield
+    experiment_cache.clear()
+    decision_cache.clear()
+    token_cache.clear()
+
 
-    exp_numbs = get_experiments_for_user(user=User(user_number=123, role="user"))
-    assert exp_numbs == [1234]
+@pytest.mark.asyncio
+@patch("plotting_service.auth.auth_client.get_experiments")
+async def test_get_experiment_for_user(mock_get_experiments):
+    mock_get_experiments.return_value = [1234]
 
+    exp_numbs = await get_experiments_for_user(user=User(user_number=123, role="user"))
+    assert exp_numbs == frozenset({1234})
+    mock_get_experiments.assert_awaited_once_with(123)
 
-@patch("plotting_service.auth.requests.get")
-def test_get_experiments_for_user_non_200_status(mock_get):
-    mock_get.return_value.status_code = HTTPStatus.FORBIDDEN
+
+@pytest.mark.asyncio
+@patch("plotting_service.auth.auth_client.get_experiments")
+async def test_get_experiments_for_user_auth_api_failure(mock_get_experiments):
+    mock_get_experiments.side_effect = AuthServiceUnavailableError()
 
     with pytest.raises(RuntimeError):
-        get_experiments_for_user(user=User(user_number=123, role="user"))
+        await get_experiments_for_user(user=User(user_number=123, role="user"))
+
+
+@pytest.mark.asyncio
+@patch("plotting_service.auth.auth_client.get_experiments")
+async def test_get_experiments_for_user_is_cached(mock_get_experiments):
+    mock_get_experiments.return_value = [1234]
+    user = User(user_number=123, role="user")
+    hits = experiment_cache.hits
+
+    assert await get_experiments_for_user(user) == frozenset({1234})
+    assert await get_experiments_for_user(user) == frozenset({1234})
+
+    mock_get_experiments.assert_awaited_once()
+    assert experiment_cache.hits == hits + 1
+
+
+@pytest.mark.asyncio
+@patch("plotting_service.auth.auth_client.get_experiments")
+async def test_get_experiments_for_user_refetches_after_invalidation(mock_get_experiments):
+    mock_get_experiments.return_value = [1234]
+    user = User(user_number=123, role="user")
+
+    await get_experiments_for_user(user)
+    experiment_cache.invalidate(user.user_number)
+    await get_experiments_for_user(user)
+
+    assert mock_get_experiments.await_count == 2  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+@patch("plotting_service.auth.auth_client.get_experiments")
+async def test_get_experiments_for_user_serves_stale_and_refreshes(mock_get_experiments):
+    mock_get_experiments.return_value = [1, 2]
+    user = User(user_number=123, role="user")
+    experiment_cache.set(user.user_number, frozenset({1}), ttl=-1)
+
+    assert await get_experiments_for_user(user) == frozenset({1})
+    await asyncio.gather(*auth._refresh_tasks)
+
+    mock_get_experiments.assert_awaited_once_with(123)
+    assert experiment_cache.get(user.user_number) == frozenset({1, 2})
+
+
+@pytest.mark.asyncio
+@patch("plotting_service.auth.auth_client.get_experiments")
+async def test_refresh_experiments_for_user_keeps_stale_on_failure(mock_get_experiments):
+    mock_get_experiments.side_effect = AuthServiceUnavailableError()
+    user = User(user_number=123, role="user")
+    experiment_cache.set(user.user_number, frozenset({1}), ttl=-1)
+
+    await auth._refresh_experiments_for_user(user)
+
+    assert experiment_cache.lookup(user.user_number) == (frozenset({1}), True)
+
+
+@pytest.mark.asyncio
+@patch("plotting_service.auth.auth_client.get_experiments")
+async def test_user_can_access_experiment_caches_decisions(mock_get_experiments):
+    mock_get_experiments.return_value = [1234]
+    user = User(user_number=123, role="user")
+
+    assert await user_can_access_experiment(user, 1234)
+    experiment_cache.clear()
+    assert await user_can_access_experiment(user, 1234)
+
+    mock_get_experiments.assert_awaited_once()
+    assert decision_cache.get((123, 1234))
+
+
+@pytest.mark.asyncio
+@patch("plotting_service.auth.DECISION_CACHE_NEGATIVE_TTL", -1)
+@patch("plotting_service.auth.auth_client.get_experiments")
+async def test_user_can_access_experiment_negative_decisions_use_own_ttl(mock_get_experiments):
+    mock_get_experiments.return_value = [1234]
+    user = User(user_number=123, role="user")
+
+    assert not await user_can_access_experiment(user, 1)
+
+    assert decision_cache.get((123, 1)) is None
+    assert decision_cache.get((123, 1234)) is None
+
+
+@pytest.mark.asyncio
+@patch("plotting_service.auth.auth_client.get_experiments")
+async def test_changed_experiments_drop_cached_decisions(mock_get_experiments):
+    mock_get_experiments.return_value = [1]
+    user = User(user_number=123, role="user")
+    assert not await user_can_access_experiment(user, 2)
+
+    mock_get_experiments.return_value = [1, 2]
+    experiment_cache.set(user.user_number, frozenset({1}), ttl=-1)
+    await auth._refresh_experiments_for_user(user)
+
+    assert await user_can_access_experiment(user, 2)
+
+
+@pytest.mark.asyncio
+@patch("plotting_service.auth.EXPERIMENT_CACHE_TTL", -1)
+@patch("plotting_service.auth.auth_client.get_experiments")
+async def test_removed_user_loses_access_once_experiments_refresh(mock_get_experiments):
+    mock_get_experiments.return_value = [1234]
+    user = User(user_number=123, role="user")
+    assert await user_can_access_experiment(user, 1234)
+
+    mock_get_experiments.return_value = []
+    experiment_cache.set(user.user_number, frozenset({1234}), ttl=-1)
+    # The stale list is served while it is refreshed in the background
+    assert await user_can_access_experiment(user, 1234)
+    await asyncio.gather(*auth._refresh_tasks)
+
+    assert not await user_can_access_experiment(user, 1234)
+
+
+@pytest.mark.asyncio
+@patch("plotting_service.auth.auth_client.get_experiments")
+async def test_warm_user_prefetches_decisions(mock_get_experiments):
+    mock_get_experiments.return_value = [1, 2, 3]
+    user = User(user_number=123, role="user")
+
+    assert await warm_user(user) == frozenset({1, 2, 3})
+
+    assert all(decision_cache.get((123, experiment_number)) for experiment_number in (1, 2, 3))
+
+
+def test_invalidate_user():
+    experiment_cache.set(123, frozenset({1}))
+    decision_cache.set((123, 1), True)
+    decision_cache.set((456, 1), True)
+
+    invalidate_user(123)
+
+    assert 123 not in experiment_cache  # noqa: PLR2004
+    assert (123, 1) not in decision_cache
+    assert (456, 1) in decision_cache
 
 
 def test_get_user_from_token():
@@ -40,3 +198,29 @@ def test_get_user_from_token():
 def test_get_user_from_token_invalid_token():
     with pytest.raises(AuthError):
         get_user_from_token("foo")
+
+
+def test_get_user_from_token_is_cached():
+    with patch("plotting_service.auth.jwt.decode", wraps=auth.jwt.decode) as mock_decode:
+        first_user = get_user_from_token(TOKEN)
+        second_user = get_user_from_token(TOKEN)
+
+    mock_decode.assert_called_once()
+    assert first_user is second_user
+    assert len(token_cache) == 1
+
+
+def test_get_user_from_token_cache_expires_with_token():
+    with patch("plotting_service.auth.time.time", return_value=2151305304 - 10):
+        get_user_from_token(TOKEN)
+
+    assert len(token_cache) == 1
+    with patch.object(token_cache, "_clock", return_value=token_cache._clock() + 11):
+        assert token_cache.get(next(iter(token_cache._entries))) is None
+
+
+def test_get_user_from_token_invalid_token_not_cached():
+    with pytest.raises(AuthError):
+        get_user_from_token("foo")
+
+    assert len(token_cache) == 0
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import threading
+import time
+from collections.abc import Iterator
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from plotting_service.auth import AuthClient
+from plotting_service.exceptions import AuthServiceUnavailableError
+
+STUB_LATENCY = 0.1
+
+
+class StubAuthServer(ThreadingHTTPServer):
+    """Local stand in for the FIA auth api that answers /experiment after a fixed latency"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), StubAuthHandler)
+        self.latency = STUB_LATENCY
+        self.status = HTTPStatus.OK
+        self.request_count = 0
+        self.connections: set[int] = set()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubAuthHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StubAuthServer
+
+    def do_GET(self) -> None:
+        with self.server.lock:
+            self.server.request_count += 1
+            self.server.connections.add(self.client_address[1])
+        time.sleep(self.server.latency)
+        user_number = int(parse_qs(urlparse(self.path).query)["user_number"][0])
+        body = json.dumps([user_number * 10]).encode()
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+        pass
+
+
+@pytest.fixture
+def stub_auth_server() -> Iterator[StubAuthServer]:
+    server = StubAuthServer()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.asyncio
+async def test_auth_client_gets_experiments(stub_auth_server):
+    client = AuthClient(base_url=stub_auth_server.url, api_key="key")
+
+    assert await client.get_experiments(12) == [120]
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_auth_client_coalesces_concurrent_lookups_for_same_user(stub_auth_server):
+    client = AuthClient(base_url=stub_auth_server.url, api_key="key")
+
+    results = await asyncio.gather(*(client.get_experiments(12) for _ in range(50)))
+
+    assert all(result == [120] for result in results)
+    assert stub_auth_server.request_count == 1
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_auth_client_cancelled_caller_does_not_cancel_coalesced_lookup(stub_auth_server):
+    client = AuthClient(base_url=stub_auth_server.url, api_key="key")
+    cancelled = asyncio.create_task(client.get_experiments(12))
+    waiting = asyncio.create_task(client.get_experiments(12))
+    await asyncio.sleep(STUB_LATENCY / 2)
+
+    cancelled.cancel()
+
+    assert await waiting == [120]
+    assert cancelled.cancelled()
+    assert stub_auth_server.request_count == 1
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_auth_client_latency_under_concurrency(stub_auth_server):
+    users = 20
+    client = AuthClient(base_url=stub_auth_server.url, api_key="key", max_connections=users)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(client.get_experiments(user) for user in range(users)))
+    elapsed = time.perf_counter() - start
+
+    assert results == [[user * 10] for user in range(users)]
+    # Sequential blocking calls would take users * latency
+    assert elapsed < users * STUB_LATENCY / 4
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_auth_client_reuses_pooled_connections(stub_auth_server):
+    stub_auth_server.latency = 0
+    client = AuthClient(base_url=stub_auth_server.url, api_key="key")
+
+    for user in range(10):
+        await client.get_experiments(user)
+
+    assert len(stub_auth_server.connections) == 1
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_auth_client_does_not_block_event_loop(stub_auth_server):
+    client = AuthClient(base_url=stub_auth_server.url, api_key="key")
+    ticks = 0
+
+    async def ticker() -> None:
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(ticker())
+    await client.get_experiments(12)
+    ticker_task.cancel()
+
+    assert ticks >= STUB_LATENCY / 0.01 / 2
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_auth_client_non_200_status(stub_auth_server):
+    stub_auth_server.status = HTTPStatus.FORBIDDEN
+    client = AuthClient(base_url=stub_auth_server.url, api_key="key")
+
+    with pytest.raises(RuntimeError):
+        await client.get_experiments(12)
+    assert not client.circuit_open
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_auth_client_circuit_opens_on_timeouts(stub_auth_server):
+    stub_auth_server.latency = 0.5
+    client = AuthClient(base_url=stub_auth_server.url, api_key="key", timeout=0.05, failure_threshold=2)
+
+    for user in range(2):
+        with pytest.raises(AuthServiceUnavailableError):
+            await client.get_experiments(user)
+    assert client.circuit_open
+
+    start = time.perf_counter()
+    with pytest.raises(AuthServiceUnavailableError) as exc:
+        await client.get_experiments(3)
+
+    assert time.perf_counter() - start < 0.05  # noqa: PLR2004
+    assert 0 < exc.value.retry_after <= client.reset_timeout
+    assert stub_auth_server.request_count == 2  # noqa: PLR2004
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_auth_client_circuit_closes_after_successful_trial(stub_auth_server):
+    stub_auth_server.status = HTTPStatus.SERVICE_UNAVAILABLE
+    client = AuthClient(base_url=stub_auth_server.url, api_key="key", failure_threshold=1, reset_timeout=0)
+    with pytest.raises(AuthServiceUnavailableError):
+        await client.get_experiments(1)
+    assert client.circuit_open
+
+    stub_auth_server.status = HTTPStatus.OK
+
+    assert await client.get_experiments(1) == [10]
+    assert not client.circuit_open
+    await client.aclose()
@@ -0,0 +1,267 @@
+import os
+from http import HTTPStatus
+from unittest import mock
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from plotting_service.auth import decision_cache
+from plotting_service.authorization import AuthorizationMiddleware, Policy, authorize, resolve_route
+
+USER_TOKEN = (
+    "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9"  # noqa: S105
+    ".eyJ1c2VybnVtYmVyIjoxMjM0LCJyb2xlIjoidXNlciIsInVzZXJuYW1lIjoiZm9vIiwiZXhwIjoyMTUxMzA1MzA0fQ"
+    ".z7qVg2foW61rjYiKXp0Jw_cb5YkbWY-JoNG8GUVo2SY"
+)
+STAFF_TOKEN = (
+    "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."  # noqa: S105
+    "eyJ1c2VybnVtYmVyIjoxMjM0LCJyb2xlIjoic3RhZmYiLCJ1c2VybmFtZSI6ImZvbyIsImV4cCI6NDg3MjQ2ODk4M30."
+    "-ktYEwdUfg5_PmUocmrAonZ6lwPJdcMoklWnVME1wLE"
+)
+USER_NUMBER = 1234
+META_QUERY = "file=LOQ%2FRBNumber%2FRB1245%2Fautoreduced%2Frun-110754%2F110754.h5&path=%2F"
+
+
+@pytest.fixture(autouse=True)
+def _clear_decision_cache():
+    decision_cache.clear()
+    yield
+    decision_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def api_key_setter():
+    os.environ["API_KEY"] = "foo"
+    yield "api_key_setter"
+    os.environ.pop("API_KEY")
+
+
+def make_scope(path: str, query: str = "", token: str | None = None, method: str = "GET") -> dict:
+    headers = [] if token is None else [(b"authorization", f"Bearer {token}".encode())]
+    return {"type": "http", "method": method, "path": path, "query_string": query.encode(), "headers": headers}
+
+
+@pytest.mark.parametrize(
+    ("path", "policy"),
+    [
+        ("/healthz", Policy.PUBLIC),
+        ("/openapi.json", Policy.PUBLIC),
+        ("/", Policy.AUTHENTICATED),
+        ("/admin/cache/experiments", Policy.AUTHENTICATED),
+        ("/live/live-data/MARI", Policy.LIVE_INSTRUMENT),
+        ("/live/live-data/MARI/files", Policy.LIVE_INSTRUMENT),
+        ("/find_file/generic/user_number/1234", Policy.USER_NUMBER),
+        ("/find_file/generic/experiment_number/1245", Policy.EXPERIMENT),
+        ("/find_file/instrument/LOQ/experiment_number/1245", Policy.EXPERIMENT),
+        ("/text/instrument/LOQ/experiment_number/1245", Policy.EXPERIMENT),
+        ("/meta/", Policy.EXPERIMENT),
+        ("/data/", Policy.EXPERIMENT),
+    ],
+)
+def test_resolve_route(path: str, policy: Policy):
+    route, _ = resolve_route(path)
+
+    assert route.policy is policy
+
+
+@pytest.mark.asyncio
+async def test_authorize_public_route_without_token():
+    decision = await authorize(make_scope("/healthz"))
+
+    assert decision.policy is Policy.PUBLIC
+
+
+@pytest.mark.asyncio
+async def test_authorize_options_without_token():
+    decision = await authorize(make_scope("/meta/", method="OPTIONS"))
+
+    assert decision.policy is Policy.PUBLIC
+
+
+@pytest.mark.asyncio
+async def test_authorize_missing_token():
+    with pytest.raises(HTTPException) as exc:
+        await authorize(make_scope("/meta/", META_QUERY))
+
+    assert exc.value.status_code == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_authorize_api_key():
+    decision = await authorize(make_scope("/meta/", token="foo"))  # noqa: S106
+
+    assert decision.api_key
+    assert decision.privileged
+
+
+@pytest.mark.asyncio
+async def test_authorize_api_key_failed():
+    os.environ["API_KEY"] = "ActuallyADecentAPIKey"
+
+    with pytest.raises(HTTPException) as exc:
+        await authorize(make_scope("/meta/", token="foo"))  # noqa: S106
+
+    assert exc.value.status_code == HTTPStatus.FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_authorize_bad_token():
+    with pytest.raises(HTTPException) as exc:
+        await authorize(make_scope("/meta/", META_QUERY, token="bad_token"))  # noqa: S106
+
+    assert exc.value.status_code == HTTPStatus.FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_authorize_staff_bypasses_experiment_check():
+    with mock.patch("plotting_service.auth.get_experiments_for_user") as get_experiments_mock:
+        decision = await authorize(make_scope("/meta/", token=STAFF_TOKEN))
+
+    get_experiments_mock.assert_not_called()
+    assert decision.privileged
+    assert decision.user.user_number == USER_NUMBER
+
+
+@pytest.mark.parametrize(
+    ("path", "query"),
+    [
+        ("/meta/", META_QUERY),
+        ("/text/instrument/LOQ/experiment_number/1245", "filename=foo.txt"),
+        ("/find_file/instrument/LOQ/experiment_number/1245", "filename=foo.nxs"),
+        ("/find_file/generic/experiment_number/1245", "filename=foo.nxs"),
+    ],
+)
+@pytest.mark.asyncio
+async def test_authorize_user_experiment(path: str, query: str):
+    with mock.patch("plotting_service.auth.get_experiments_for_user", return_value=frozenset({1245})):
+        decision = await authorize(make_scope(path, query, token=USER_TOKEN))
+
+    assert decision.policy is Policy.EXPERIMENT
+    assert decision.experiment_number == 1245  # noqa: PLR2004
+    assert not decision.privileged
+
+
+@pytest.mark.asyncio
+async def test_authorize_user_experiment_no_permission():
+    with (
+        mock.patch("plotting_service.auth.get_experiments_for_user", return_value=frozenset({1})),
+        pytest.raises(HTTPException) as exc,
+    ):
+        await authorize(make_scope("/meta/", META_QUERY, token=USER_TOKEN))
+
+    assert exc.value.status_code == HTTPStatus.FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_authorize_user_missing_experiment_number():
+    with pytest.raises(HTTPException) as exc:
+        await authorize(make_scope("/data", token=USER_TOKEN))
+
+    assert exc.value.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_authorize_user_number():
+    decision = await authorize(make_scope(f"/find_file/generic/user_number/{USER_NUMBER}", token=USER_TOKEN))
+
+    assert decision.user_number == USER_NUMBER
+
+
+@pytest.mark.asyncio
+async def test_authorize_other_user_number():
+    with pytest.raises(HTTPException) as exc:
+        await authorize(make_scope("/find_file/generic/user_number/1", token=USER_TOKEN))
+
+    assert exc.value.status_code == HTTPStatus.FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_authorize_live_instrument_with_query_token():
+    with (
+        mock.patch("plotting_service.authorization.get_current_rb_async", return_value="RB1245") as current_rb_mock,
+        mock.patch("plotting_service.auth.get_experiments_for_user", return_value=frozenset({1245})),
+    ):
+        decision = await authorize(make_scope("/live/live-data/MARI", f"token={USER_TOKEN}"))
+
+    current_rb_mock.assert_awaited_once_with("MARI")
+    assert decision.instrument == "MARI"
+
+
+@pytest.mark.asyncio
+async def test_authorize_text_follow_with_query_token():
+    path = "/text/instrument/LOQ/experiment_number/1245/follow"
+    with mock.patch("plotting_service.auth.get_experiments_for_user", return_value=frozenset({1245})):
+        decision = await authorize(make_scope(path, f"filename=foo.log&token={USER_TOKEN}"))
+
+    assert decision.policy is Policy.EXPERIMENT
+    assert decision.experiment_number == 1245  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_authorize_live_instrument_not_current_experiment():
+    with (
+        mock.patch("plotting_service.authorization.get_current_rb_async", return_value="1"),
+        mock.patch("plotting_service.auth.get_experiments_for_user", return_value=frozenset({1245})),
+        pytest.raises(HTTPException) as exc,
+    ):
+        await authorize(make_scope("/live/live-data/MARI", token=USER_TOKEN))
+
+    assert exc.value.status_code == HTTPStatus.FORBIDDEN
+
+
+@pytest.mark.asyncio
+async def test_authorize_live_instrument_pv_failure():
+    with (
+        mock.patch("plotting_service.authorization.get_current_rb_async", side_effect=TimeoutError()),
+        pytest.raises(HTTPException) as exc,
+    ):
+        await authorize(make_scope("/live/live-data/MARI", token=USER_TOKEN))
+
+    assert exc.value.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
+
+
+@pytest.mark.asyncio
+async def test_authorize_query_token_only_accepted_for_live_routes():
+    with pytest.raises(HTTPException) as exc:
+        await authorize(make_scope("/meta/", f"{META_QUERY}&token={USER_TOKEN}"))
+
+    assert exc.value.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def make_app(dev_mode: bool = False) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(AuthorizationMiddleware, dev_mode=dev_mode)
+
+    @app.get("/meta/")
+    async def meta(request: Request) -> dict[str, str | None]:
+        decision = getattr(request.state, "authorization", None)
+        return {"policy": None if decision is None else decision.policy.value}
+
+    return app
+
+
+def test_authorization_middleware_attaches_decision():
+    client = TestClient(make_app())
+    with mock.patch("plotting_service.auth.get_experiments_for_user", return_value=frozenset({1245})):
+        response = client.get(f"/meta/?{META_QUERY}", headers={"Authorization": f"Bearer {USER_TOKEN}"})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {"policy": "experiment"}
+
+
+def test_authorization_middleware_rejects_with_json_response():
+    client = TestClient(make_app())
+    response = client.get(f"/meta/?{META_QUERY}")
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert response.json() == {"detail": "Unauthenticated"}
+
+
+def test_authorization_middleware_dev_mode():
+    client = TestClient(make_app(dev_mode=True))
+    response = client.get(f"/meta/?{META_QUERY}")
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {"policy": None}
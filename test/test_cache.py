@@ -0,0 +1,80 @@
+from plotting_service.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_cache_get_and_set():
+    cache: TTLCache[int, str] = TTLCache(max_size=2, ttl=10, clock=FakeClock())
+    cache.set(1, "one")
+
+    assert cache.get(1) == "one"
+    assert cache.get(2) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_cache_entry_expires():
+    clock = FakeClock()
+    cache: TTLCache[int, str] = TTLCache(max_size=2, ttl=10, clock=clock)
+    cache.set(1, "one")
+
+    clock.now = 10
+
+    assert cache.get(1) is None
+    assert cache.lookup(1) is None
+
+
+def test_ttl_cache_custom_entry_ttl():
+    clock = FakeClock()
+    cache: TTLCache[int, str] = TTLCache(max_size=2, ttl=10, clock=clock)
+    cache.set(1, "one", ttl=1)
+
+    clock.now = 2
+
+    assert cache.get(1) is None
+
+
+def test_ttl_cache_serves_stale_within_window():
+    clock = FakeClock()
+    cache: TTLCache[int, str] = TTLCache(max_size=2, ttl=10, stale_ttl=5, clock=clock)
+    cache.set(1, "one")
+
+    clock.now = 12
+    assert cache.lookup(1) == ("one", True)
+    assert cache.get(1) is None
+
+    clock.now = 15
+    assert cache.lookup(1) is None
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache: TTLCache[int, str] = TTLCache(max_size=2, ttl=10, clock=FakeClock())
+    cache.set(1, "one")
+    cache.set(2, "two")
+    cache.get(1)
+    cache.set(3, "three")
+
+    assert 1 in cache
+    assert 2 not in cache  # noqa: PLR2004
+    assert 3 in cache  # noqa: PLR2004
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_invalidate_and_clear():
+    cache: TTLCache[int, str] = TTLCache(max_size=3, ttl=10, clock=FakeClock())
+    cache.set(1, "one")
+    cache.set(2, "two")
+
+    assert cache.invalidate(1)
+    assert not cache.invalidate(1)
+    assert len(cache) == 1
+
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,145 @@
+import gzip
+
+import numpy as np
+import pytest
+from fastapi import Depends, FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from plotting_service.compression import (
+    CompressionMiddleware,
+    byte_shuffle,
+    choose_encoding,
+    compression,
+    compression_metrics,
+)
+
+TEXT = b"line of a reduction log\n" * 500
+NOISE = np.random.default_rng(0).bytes(200_000)
+ARRAY = np.linspace(0, 1000, 50_000).astype(np.float32)
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, encodings="zstd,br,gzip")
+
+
+@app.get("/text")
+async def text() -> Response:
+    return Response(TEXT, media_type="text/plain")
+
+
+@app.get("/small")
+async def small() -> Response:
+    return Response(b"ok" * 10, media_type="text/plain")
+
+
+@app.get("/png")
+async def png() -> Response:
+    return Response(TEXT, media_type="image/png")
+
+
+@app.get("/png-forced", dependencies=[Depends(compression(True))])
+async def png_forced() -> Response:
+    return Response(TEXT, media_type="image/png")
+
+
+@app.get("/text-opted-out", dependencies=[Depends(compression(False))])
+async def text_opted_out() -> Response:
+    return Response(TEXT, media_type="text/plain")
+
+
+@app.get("/noise")
+async def noise() -> Response:
+    return Response(NOISE, media_type="application/octet-stream")
+
+
+@app.get("/array")
+async def array() -> Response:
+    return Response(ARRAY.tobytes(), media_type="application/octet-stream", headers={"X-Item-Size": "4"})
+
+
+@app.get("/stream")
+async def stream() -> StreamingResponse:
+    async def chunks():
+        for _ in range(5):
+            yield TEXT
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+@pytest.fixture
+def client():
+    compression_metrics.clear()
+    return TestClient(app)
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "expected"),
+    [
+        ("gzip, br", "br"),
+        ("gzip;q=1, br;q=0.5", "gzip"),
+        ("*", "zstd"),
+        ("br;q=0, *;q=0.1", "zstd"),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_choose_encoding(accept_encoding, expected):
+    assert choose_encoding(accept_encoding, ["zstd", "br", "gzip"]) == expected
+
+
+def test_gzip_negotiated(client):
+    response = client.get("/text", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == TEXT
+    stats = compression_metrics.stats()["encodings"]["gzip"]
+    assert stats["responses"] == 1
+    assert stats["ratio"] < 0.1  # noqa: PLR2004
+
+
+@pytest.mark.parametrize(("module", "encoding"), [("zstandard", "zstd"), ("brotli", "br")])
+def test_optional_encodings(client, module, encoding):
+    pytest.importorskip(module)
+    response = client.get("/text", headers={"Accept-Encoding": encoding})
+
+    assert response.headers["content-encoding"] == encoding
+    assert response.content == TEXT
+
+
+@pytest.mark.parametrize("path", ["/small", "/png", "/text-opted-out", "/noise"])
+def test_not_compressed(client, path):
+    response = client.get(path, headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert compression_metrics.stats()["skipped"]
+
+
+def test_route_can_opt_in(client):
+    response = client.get("/png-forced", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def test_numeric_arrays_byte_shuffled_when_accepted(client):
+    plain = client.get("/array", headers={"Accept-Encoding": "gzip"})
+    shuffled = client.get("/array", headers={"Accept-Encoding": "gzip", "X-Accept-Byte-Shuffle": "1"})
+
+    assert "x-byte-shuffle" not in plain.headers
+    assert shuffled.headers["x-byte-shuffle"] == "4"
+    assert int(shuffled.headers["content-length"]) < int(plain.headers["content-length"])
+    unshuffled = np.frombuffer(shuffled.content, dtype=np.uint8).reshape(4, -1).T.tobytes()
+    assert np.array_equal(np.frombuffer(unshuffled, dtype=np.float32), ARRAY)
+
+
+def test_byte_shuffle_keeps_trailing_bytes():
+    assert byte_shuffle(b"abcdefg", 2) == b"acebdfg"
+
+
+def test_streamed_response_compressed(client):
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert gzip.decompress(raw) == TEXT * 5
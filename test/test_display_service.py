@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from plotting_service.services.display_service import DisplayScale, DisplayWindow, WindowMethod, window_to_uint8
+
+PIXELS = np.random.default_rng(0).integers(100, 60000, (37, 53), dtype=np.uint16)
+
+
+def test_minmax_window_spans_the_image():
+    pixels = np.array([[100, 200], [300, 500]], dtype=np.uint16)
+
+    display, levels = window_to_uint8(pixels, DisplayWindow(method=WindowMethod.MINMAX), bins=4)
+
+    assert display.tolist() == [[0, 64], [128, 255]]
+    assert (levels.low, levels.high) == (100, 500)
+    assert (levels.histogram_start, levels.histogram_width, levels.histogram_counts) == (100, 101, [2, 1, 0, 1])
+
+
+@pytest.mark.parametrize("dtype", [np.uint16, np.float32])
+def test_percentile_window_matches_numpy(dtype):
+    pixels = PIXELS.astype(dtype)
+
+    display, levels = window_to_uint8(pixels, DisplayWindow(lower=2, upper=98))
+
+    low, high = np.percentile(pixels, [2, 98], method="lower")
+    expected = (np.clip((pixels.astype(np.float64) - low) / (high - low), 0, 1) * 255 + 0.5).astype(np.uint8)
+    assert (levels.low, levels.high) == (low, high)
+    assert np.array_equal(display, expected)
+    assert sum(levels.histogram_counts) == pixels.size
+
+
+def test_manual_window_with_gamma_and_log_scale():
+    pixels = np.array([0, 10, 50, 100, 200], dtype=np.uint16)
+
+    gamma, _ = window_to_uint8(pixels, DisplayWindow(method=WindowMethod.MANUAL, low=0, high=100, gamma=0.5))
+    log, _ = window_to_uint8(pixels, DisplayWindow(method=WindowMethod.MANUAL, low=0, high=100, scale=DisplayScale.LOG))
+
+    assert gamma.tolist() == [0, 81, 180, 255, 255]
+    assert log.tolist() == [0, 132, 217, 255, 255]
+
+
+def test_manual_window_needs_both_limits():
+    with pytest.raises(ValueError, match="low and a high"):
+        window_to_uint8(PIXELS, DisplayWindow(method=WindowMethod.MANUAL, low=0))
+
+
+def test_float_window_ignores_nan():
+    pixels = np.array([np.nan, 0.0, 0.5, 1.0], dtype=np.float32)
+
+    display, levels = window_to_uint8(pixels, DisplayWindow(method=WindowMethod.MINMAX), bins=2)
+
+    assert display.tolist() == [0, 0, 128, 255]
+    assert levels.histogram_counts == [1, 2]
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from plotting_service.exceptions import BlockingIOTimeoutError
+from plotting_service.executor import BlockingExecutor, IOCategory
+
+
+@pytest.fixture
+def executor():
+    blocking_executor = BlockingExecutor(
+        max_workers=8,
+        limits={IOCategory.METADATA: 2, IOCategory.BULK_READ: 1, IOCategory.IMAGE_DECODE: 1},
+        timeout=5,
+    )
+    yield blocking_executor
+    blocking_executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_slow_filesystem_call_does_not_block_event_loop(executor):
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    await executor.run(IOCategory.METADATA, time.sleep, 0.3)
+    task.cancel()
+
+    assert ticks >= 10  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_category_limit_bounds_concurrency(executor):
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def slow_call():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+
+    await asyncio.gather(*(executor.run(IOCategory.METADATA, slow_call) for _ in range(6)))
+
+    stats = executor.stats()["categories"]["metadata"]
+    assert peak == 2  # noqa: PLR2004
+    assert stats["completed"] == 6  # noqa: PLR2004
+    assert stats["max_queued"] >= 4  # noqa: PLR2004
+    assert stats["queued"] == 0
+    assert stats["running"] == 0
+
+
+@pytest.mark.asyncio
+async def test_categories_do_not_starve_each_other(executor):
+    release = threading.Event()
+    blocked = asyncio.ensure_future(executor.run(IOCategory.BULK_READ, release.wait))
+    await asyncio.sleep(0.01)
+
+    assert await executor.run(IOCategory.METADATA, lambda: "listed") == "listed"
+
+    release.set()
+    await blocked
+
+
+@pytest.mark.asyncio
+async def test_timeout_raises_and_keeps_slot_until_thread_finishes(executor):
+    release = threading.Event()
+
+    with pytest.raises(BlockingIOTimeoutError):
+        await executor.run(IOCategory.BULK_READ, release.wait, timeout=0.05)
+
+    stats = executor.stats()["categories"]["bulk_read"]
+    assert stats["timeouts"] == 1
+    assert stats["running"] == 1
+
+    release.set()
+    assert await executor.run(IOCategory.BULK_READ, lambda: 1) == 1
+
+
+@pytest.mark.asyncio
+async def test_failures_are_counted(executor):
+    def broken():
+        raise FileNotFoundError("missing")
+
+    with pytest.raises(FileNotFoundError):
+        await executor.run(IOCategory.METADATA, broken)
+
+    assert executor.stats()["categories"]["metadata"]["failed"] == 1
@@ -0,0 +1,194 @@
+import os
+import time
+
+import pytest
+
+from plotting_service.file_index import FileIndex, FileIndexRegistry, NegativeLookupCache
+
+
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / "run1" / "nested").mkdir(parents=True)
+    (tmp_path / "run2").mkdir()
+    (tmp_path / "run1" / "nested" / "output.nxs").touch()
+    (tmp_path / "run2" / "output.nxs").touch()
+    (tmp_path / "run2" / "other.txt").touch()
+    return tmp_path
+
+
+def age(path, seconds=10):
+    """Move the mtime of a directory into the past so the index trusts it"""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_file_index_finds_shallowest_match(tree):
+    index = FileIndex(tree)
+
+    assert index.find("output.nxs") == tree / "run2" / "output.nxs"
+    assert index.file_count == 3  # noqa: PLR2004
+
+
+def test_file_index_returns_none_for_missing_file(tree):
+    assert FileIndex(tree).find("missing.nxs") is None
+
+
+def test_file_index_picks_up_new_files_on_miss(tree):
+    index = FileIndex(tree, miss_refresh_interval=0)
+    index.find("output.nxs")
+
+    (tree / "run1" / "new.nxs").touch()
+
+    assert index.find("new.nxs") == tree / "run1" / "new.nxs"
+
+
+def test_file_index_forgets_removed_files(tree):
+    index = FileIndex(tree, miss_refresh_interval=0)
+    index.find("output.nxs")
+
+    (tree / "run2" / "output.nxs").unlink()
+
+    assert index.find("output.nxs") == tree / "run1" / "nested" / "output.nxs"
+    assert index.file_count == 2  # noqa: PLR2004
+
+
+def test_file_index_only_lists_changed_directories(tree, monkeypatch):
+    for directory in (tree, tree / "run1", tree / "run1" / "nested", tree / "run2"):
+        age(directory)
+    index = FileIndex(tree)
+    index.refresh()
+
+    listed = []
+    original_list = FileIndex._list
+
+    def record_list(path, relative_dir, mtime_ns):
+        listed.append(relative_dir)
+        return original_list(path, relative_dir, mtime_ns)
+
+    monkeypatch.setattr(FileIndex, "_list", staticmethod(record_list))
+    (tree / "run2" / "late.nxs").touch()
+    age(tree / "run2", seconds=5)
+    index.refresh()
+
+    assert listed == ["run2"]
+    assert index.find("late.nxs") == tree / "run2" / "late.nxs"
+
+
+def test_file_index_gives_up_on_large_trees(tree):
+    index = FileIndex(tree, max_files=2)
+    index.refresh()
+
+    assert index.too_large
+    assert not index.ready
+
+
+def test_registry_scans_while_index_is_cold(tree):
+    registry = FileIndexRegistry()
+
+    assert registry.find(tree, "other.txt") == tree / "run2" / "other.txt"
+    assert registry.scans == 1
+
+    for _ in range(100):
+        if registry.get(tree).ready:
+            break
+        time.sleep(0.01)
+
+    assert registry.find(tree, "other.txt") == tree / "run2" / "other.txt"
+    assert registry.scans == 1
+
+
+def test_registry_scans_glob_patterns(tree):
+    registry = FileIndexRegistry()
+
+    assert registry.find(tree, "oth*.txt") == tree / "run2" / "other.txt"
+
+
+def test_registry_bounds_number_of_indexes(tmp_path):
+    registry = FileIndexRegistry(max_roots=2)
+    roots = [tmp_path / str(number) for number in range(3)]
+    for root in roots:
+        root.mkdir()
+        registry.get(root)
+
+    assert len(registry._indexes) == 2  # noqa: PLR2004
+
+
+def test_registry_bounds_files_across_indexes(tree):
+    registry = FileIndexRegistry(max_total_files=2)
+    registry.find_many(tree / "run1", ["output.nxs"])
+    registry.find_many(tree / "run2", ["output.nxs"])
+
+    # The next use of run2 finds three files indexed and drops the least recently used run1
+    run2 = registry.get(tree / "run2")
+    assert registry._indexes.items() == [(tree / "run2", run2)]
+    assert registry.stats()["indexed_files"] == 2  # noqa: PLR2004
+
+    registry.find_many(tree, ["output.nxs"])
+    registry.get(tree)
+
+    # The index in use is kept even though it alone is over the budget
+    assert [root for root, _ in registry._indexes.items()] == [tree]
+    assert registry.evictions == 2  # noqa: PLR2004
+
+
+def negative_lookup(tree):
+    """A negative lookup cache over a registry whose index of the tree is built and refreshes on every miss"""
+    registry = FileIndexRegistry(miss_refresh_interval=0)
+    registry.get(tree).refresh()
+    return registry, NegativeLookupCache(registry)
+
+
+def test_negative_lookup_cache_skips_search_until_directory_changes(tree):
+    registry, cache = negative_lookup(tree)
+    searches = []
+
+    def search():
+        searches.append(1)
+        return registry.find(tree, "pending.nxs")
+
+    assert cache.find("key", tree, search) is None
+    assert cache.find("key", tree, search) is None
+    assert len(searches) == 1
+
+    (tree / "run2" / "pending.nxs").touch()
+
+    assert cache.find("key", tree, search) == tree / "run2" / "pending.nxs"
+    assert len(searches) == 2  # noqa: PLR2004
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["negative_hits"], stats["negative_entries"]) == (1, 1, 1, 0)
+
+
+def test_negative_lookup_cache_sees_files_written_to_subdirectories(tree):
+    age(tree / "run1" / "nested")
+    registry, cache = negative_lookup(tree)
+
+    def search():
+        return registry.find(tree, "pending.nxs")
+
+    assert cache.find("key", tree, search) is None
+    assert cache.find("key", tree, search) is None
+
+    (tree / "run1" / "nested" / "pending.nxs").touch()
+
+    assert cache.find("key", tree, search) == tree / "run1" / "nested" / "pending.nxs"
+
+
+def test_negative_lookup_cache_forgets_misses_without_an_index(tree):
+    cache = NegativeLookupCache(FileIndexRegistry())
+
+    cache.find("key", tree, lambda: None)
+    cache.find("key", tree, lambda: None)
+
+    assert cache.misses == 2  # noqa: PLR2004
+    assert cache.stats()["negative_entries"] == 0
+
+
+def test_negative_lookup_cache_expires(tree):
+    registry, _ = negative_lookup(tree)
+    cache = NegativeLookupCache(registry, ttl=0)
+    cache.find("key", tree, lambda: None)
+
+    cache.find("key", tree, lambda: None)
+
+    assert cache.misses == 2  # noqa: PLR2004
+    assert cache.negative_hits == 0
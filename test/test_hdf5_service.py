@@ -0,0 +1,107 @@
+import h5py
+import numpy as np
+import pytest
+
+from plotting_service.services.hdf5_service import H5FileCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_file(path, values=(1, 2, 3)):
+    with h5py.File(path, "w") as h5file:
+        h5file["data"] = np.array(values)
+    return path
+
+
+@pytest.fixture
+def h5_path(tmp_path):
+    return make_file(tmp_path / "run.nxs")
+
+
+def test_handle_reused_between_requests(h5_path):
+    cache = H5FileCache()
+
+    with cache.open(h5_path) as first:
+        first_id = first.id.id
+    with cache.open(h5_path) as second:
+        assert second.id.id == first_id
+        assert list(second["data"][()]) == [1, 2, 3]
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.clear()
+
+
+def test_handle_reopened_when_file_changes(h5_path):
+    cache = H5FileCache()
+    with cache.open(h5_path) as h5file:
+        old_file = h5file
+
+    # Reduction writes a new file over the old one, HDF5 cannot truncate a file this process has open
+    make_file(h5_path.with_suffix(".tmp"), values=(4, 5)).replace(h5_path)
+
+    with cache.open(h5_path) as h5file:
+        assert list(h5file["data"][()]) == [4, 5]
+    assert not old_file.id.valid
+    cache.clear()
+
+
+def test_least_recently_used_handle_closed_when_full(tmp_path):
+    cache = H5FileCache(max_open=1)
+    first = make_file(tmp_path / "first.nxs")
+    second = make_file(tmp_path / "second.nxs")
+
+    with cache.open(first) as first_file:
+        pass
+    with cache.open(second) as second_file:
+        pass
+
+    assert not first_file.id.valid
+    assert second_file.id.valid
+    assert len(cache) == 1
+    cache.clear()
+
+
+def test_handles_in_use_are_not_evicted(tmp_path):
+    cache = H5FileCache(max_open=1)
+    first = make_file(tmp_path / "first.nxs")
+    second = make_file(tmp_path / "second.nxs")
+
+    with cache.open(first) as first_file:
+        with cache.open(second) as second_file:
+            assert len(cache) == 2  # noqa: PLR2004
+        assert first_file.id.valid
+        assert not second_file.id.valid
+    assert len(cache) == 1
+    cache.clear()
+
+
+def test_idle_handles_closed(h5_path):
+    clock = FakeClock()
+    cache = H5FileCache(idle_timeout=10, clock=clock)
+    with cache.open(h5_path) as h5file:
+        pass
+
+    clock.now = 11
+    cache.evict_idle()
+
+    assert not h5file.id.valid
+    assert len(cache) == 0
+
+
+def test_clear_waits_for_handles_in_use(h5_path):
+    cache = H5FileCache()
+    with cache.open(h5_path) as h5file:
+        cache.clear()
+        assert h5file.id.valid
+    assert not h5file.id.valid
+
+
+def test_missing_file_raises(tmp_path):
+    with pytest.raises(FileNotFoundError), H5FileCache().open(tmp_path / "missing.nxs"):
+        pass
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+
+import pytest
+
+from plotting_service.services.image_cache_service import DerivedImageCache
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "image.tif"
+    path.write_bytes(b"tiff")
+    return path
+
+
+class Generator:
+    """Derives a fake image of a given size, counting the calls"""
+
+    def __init__(self, size=100, delay=0.0):
+        self.size = size
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, path, downsample_factor):
+        self.calls += 1
+        time.sleep(self.delay)
+        return bytes([downsample_factor]) * self.size, 8, 4, 8 // downsample_factor, 4 // downsample_factor
+
+
+def test_image_cache_serves_memory_then_disk(tmp_path, source):
+    generate = Generator()
+    cache = DerivedImageCache(tmp_path / "cache")
+
+    first = cache.get(source, 2, "rgb", generate)
+    assert cache.get(source, 2, "rgb", generate) == first
+    assert generate.calls == 1
+
+    restarted = DerivedImageCache(tmp_path / "cache")
+    assert restarted.get(source, 2, "rgb", generate) == first
+    assert generate.calls == 1
+    assert restarted.get(source, 2, "rgb", generate) == first
+
+    assert cache.stats()["memory_hits"] == 1
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_image_cache_keys_on_factor_mode_and_source_version(tmp_path, source):
+    generate = Generator()
+    cache = DerivedImageCache(tmp_path / "cache")
+
+    cache.get(source, 2, "rgb", generate)
+    cache.get(source, 4, "rgb", generate)
+    cache.get(source, 2, "png", generate)
+    assert generate.calls == 3  # noqa: PLR2004
+
+    source.write_bytes(b"changed tiff")
+    os.utime(source, (time.time() + 10, time.time() + 10))
+    cache.get(source, 2, "rgb", generate)
+    assert generate.calls == 4  # noqa: PLR2004
+
+
+def test_image_cache_evicts_each_tier_to_its_budget(tmp_path, source):
+    generate = Generator(size=100)
+    cache = DerivedImageCache(tmp_path / "cache", memory_bytes=250, disk_bytes=2 * 116)
+
+    for factor in (1, 2, 3):
+        cache.get(source, factor, "rgb", generate)
+
+    stats = cache.stats()
+    assert (stats["memory_entries"], stats["memory_evictions"]) == (2, 1)
+    assert (stats["disk_entries"], stats["disk_evictions"]) == (2, 1)
+    assert len(list((tmp_path / "cache").iterdir())) == 2  # noqa: PLR2004
+
+    # The first image was evicted from both tiers
+    cache.get(source, 1, "rgb", generate)
+    assert generate.calls == 4  # noqa: PLR2004
+
+
+def test_image_cache_generates_concurrent_requests_once(tmp_path, source):
+    generate = Generator(delay=0.2)
+    cache = DerivedImageCache(tmp_path / "cache")
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(cache.get(source, 2, "rgb", generate))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert generate.calls == 1
+    assert len(set(results)) == 1
+    assert len(results) == 8  # noqa: PLR2004
+
+
+def test_image_cache_waiters_leave_the_generating_entry_to_its_creator(tmp_path, source):
+    cache = DerivedImageCache(tmp_path / "cache")
+    key = cache._key(source, 2, "rgb")
+    in_flight = cache._generating[key] = threading.Lock()
+
+    cache.get(source, 2, "rgb", Generator())
+
+    assert cache._generating[key] is in_flight
+
+
+def test_image_cache_does_not_cache_failures(tmp_path, source):
+    cache = DerivedImageCache(tmp_path / "cache")
+
+    def fail(path, downsample_factor):
+        raise ValueError("corrupt image")
+
+    with pytest.raises(ValueError, match="corrupt image"):
+        cache.get(source, 2, "rgb", fail)
+
+    generate = Generator()
+    cache.get(source, 2, "rgb", generate)
+    assert generate.calls == 1
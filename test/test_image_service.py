@@ -0,0 +1,150 @@
+import math
+from unittest import mock
+
+import numpy as np
+import pytest
+import tifffile
+from PIL import Image
+
+from plotting_service.services.image_service import (
+    DownsampleMethod,
+    block_reduce,
+    convert_image_to_rgb_bytes,
+    downsample_image,
+    read_image_region,
+    tile_levels,
+)
+
+PIXELS = np.random.default_rng(0).integers(0, 60000, (37, 53), dtype=np.uint16)
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / "image.tif"
+    tifffile.imwrite(path, PIXELS, rowsperstrip=4)
+    return path
+
+
+def test_block_reduce_mean_and_max_cover_partial_edge_blocks():
+    pixels = np.arange(25, dtype=np.uint16).reshape(5, 5)
+
+    np.testing.assert_array_equal(
+        block_reduce(pixels, 2, DownsampleMethod.BOX), np.array([[3, 5, 7], [13, 15, 17], [21, 23, 24]])
+    )
+    np.testing.assert_array_equal(
+        block_reduce(pixels, 2, DownsampleMethod.MAX), np.array([[6, 8, 9], [16, 18, 19], [21, 23, 24]])
+    )
+    assert block_reduce(pixels, 2, DownsampleMethod.BOX).dtype == np.uint16
+
+
+@pytest.mark.parametrize("factor", [2, 3, 8, 64])
+def test_downsample_nearest_matches_pil_resize(image_path, factor):
+    image, original_width, original_height = downsample_image(image_path, factor, DownsampleMethod.NEAREST)
+
+    with Image.open(image_path) as original:
+        expected = original.resize((math.ceil(53 / factor), math.ceil(37 / factor)), Image.Resampling.NEAREST)
+    assert (original_width, original_height) == (53, 37)
+    assert image.mode == "I;16"
+    np.testing.assert_array_equal(np.asarray(image), np.asarray(expected))
+
+
+@pytest.mark.parametrize("method", [DownsampleMethod.BOX, DownsampleMethod.MAX])
+def test_downsample_16_bit_blocks(image_path, method):
+    image, _, _ = downsample_image(image_path, 4, method)
+
+    np.testing.assert_array_equal(np.asarray(image), block_reduce(PIXELS, 4, method))
+    assert image.size == (14, 10)
+
+
+@pytest.mark.parametrize("factor", [2, 3, 8, 64])
+def test_downsample_methods_give_the_same_size(image_path, factor):
+    sizes = {downsample_image(image_path, factor, method)[0].size for method in DownsampleMethod}
+
+    assert sizes == {(math.ceil(53 / factor), math.ceil(37 / factor))}
+
+
+def test_downsample_8_bit_box_uses_image_reduce(tmp_path):
+    pixels = np.random.default_rng(1).integers(0, 255, (37, 53, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(tmp_path / "rgb.tif")
+
+    image, _, _ = downsample_image(tmp_path / "rgb.tif", 4, DownsampleMethod.BOX)
+
+    assert image.mode == "RGB"
+    np.testing.assert_array_equal(np.asarray(image), np.asarray(Image.fromarray(pixels).reduce(4)))
+
+
+def test_downsample_falls_back_to_pil_for_other_formats(tmp_path):
+    Image.fromarray(PIXELS.astype(np.uint8)).save(tmp_path / "image.png")
+
+    image, _, _ = downsample_image(tmp_path / "image.png", 2, DownsampleMethod.MAX)
+
+    np.testing.assert_array_equal(np.asarray(image), block_reduce(PIXELS.astype(np.uint8), 2, DownsampleMethod.MAX))
+
+
+def test_block_reduce_rgb_and_float_images():
+    rgb = np.random.default_rng(2).integers(0, 255, (9, 7, 3), dtype=np.uint8)
+    values = np.random.default_rng(3).random((9, 7)).astype(np.float32)
+
+    np.testing.assert_array_equal(block_reduce(rgb, 3, DownsampleMethod.MAX)[0, 0], rgb[:3, :3].max(axis=(0, 1)))
+    np.testing.assert_allclose(block_reduce(values, 3, DownsampleMethod.BOX)[2, 2], values[6:9, 6:7].mean())
+
+
+@pytest.mark.parametrize("method", list(DownsampleMethod))
+def test_read_image_region_matches_cropping_the_image(tmp_path, method):
+    path = tmp_path / "tiled.tif"
+    tifffile.imwrite(path, PIXELS, tile=(16, 16), compression="zlib")
+    box = (5, 3, 45, 30)
+
+    region, original_width, original_height = read_image_region(path, box, 2, method)
+
+    cropped = tmp_path / "cropped.tif"
+    tifffile.imwrite(cropped, PIXELS[3:30, 5:45])
+    expected, _, _ = read_image_region(cropped, None, 2, method)
+    assert (original_width, original_height) == (53, 37)
+    np.testing.assert_array_equal(np.asarray(region), np.asarray(expected))
+
+
+def test_read_8_bit_region_with_box_only_reads_the_region(tmp_path, monkeypatch):
+    pixels = np.random.default_rng(4).integers(0, 255, (37, 53, 3), dtype=np.uint8)
+    path = tmp_path / "rgb.tif"
+    tifffile.imwrite(path, pixels, tile=(16, 16), compression="zlib")
+    monkeypatch.setattr("plotting_service.services.image_service.Image.open", mock.Mock(side_effect=AssertionError))
+
+    region, _, _ = read_image_region(path, (5, 3, 45, 30), 4, DownsampleMethod.BOX)
+
+    assert region.mode == "RGB"
+    np.testing.assert_array_equal(np.asarray(region), block_reduce(pixels[3:30, 5:45], 4, DownsampleMethod.BOX))
+
+
+def test_read_image_region_is_clamped_to_the_image(image_path):
+    region, _, _ = read_image_region(image_path, (50, 30, 100, 100), 1)
+
+    np.testing.assert_array_equal(np.asarray(region), PIXELS[30:, 50:])
+    with pytest.raises(ValueError, match="outside"):
+        read_image_region(image_path, (60, 0, 70, 10), 1)
+
+
+def test_tile_levels_halve_until_one_tile():
+    levels = tile_levels(1000, 600, tile_size=256)["levels"]
+
+    assert [level["shape"] for level in levels] == [[600, 1000], [300, 500], [150, 250]]
+    assert [level["tiles"] for level in levels] == [[3, 4], [2, 2], [1, 1]]
+
+
+def test_rgb_conversion_scales_16_bit_images(image_path):
+    data, *_ = convert_image_to_rgb_bytes(image_path, 1, method=DownsampleMethod.NEAREST)
+
+    grey = np.frombuffer(data, dtype=np.uint8)[::3]
+    assert (grey.min(), grey.max()) == (0, 255)
+
+
+@pytest.mark.parametrize("method", list(DownsampleMethod))
+def test_downsample_lzw_images(tmp_path, method):
+    Image.fromarray(PIXELS).save(tmp_path / "lzw.tif", format="TIFF", compression="tiff_lzw")
+    tifffile.imwrite(tmp_path / "plain.tif", PIXELS)
+
+    downsampled, *size = downsample_image(tmp_path / "lzw.tif", 4, method)
+    expected, *expected_size = downsample_image(tmp_path / "plain.tif", 4, method)
+
+    assert size == expected_size
+    assert np.array_equal(np.asarray(downsampled), np.asarray(expected))
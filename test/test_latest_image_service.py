@@ -0,0 +1,99 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from plotting_service.services.latest_image_service import LatestImageIndex
+
+
+def write_image(path, mtime):
+    """Create an empty image file with the given mtime in seconds"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    os.utime(path, (mtime, mtime))
+
+
+def age(path, seconds=10):
+    """Move the mtime of a directory into the past so the index trusts it"""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+@pytest.fixture
+def archive(tmp_path):
+    now = time.time() - 100
+    write_image(tmp_path / "RB1" / "run1" / "a.tif", now)
+    write_image(tmp_path / "RB1" / "run2" / "b.tiff", now + 2)
+    write_image(tmp_path / "RB2" / "c.TIF", now + 1)
+    write_image(tmp_path / "RB2" / "notes.txt", now + 5)
+    write_image(tmp_path / "other" / "d.tif", now + 10)
+    write_image(tmp_path / "loose.tif", now + 10)
+    for directory in (
+        tmp_path,
+        tmp_path / "RB1",
+        tmp_path / "RB1" / "run1",
+        tmp_path / "RB1" / "run2",
+        tmp_path / "RB2",
+        tmp_path / "other",
+    ):
+        age(directory)
+    return tmp_path
+
+
+def test_latest_image_index_finds_newest_image_of_rb_folders(archive):
+    index = LatestImageIndex(archive)
+
+    assert index.rb_folders == {"RB1", "RB2"}
+    assert index.latest() == archive / "RB1" / "run2" / "b.tiff"
+    assert index.latest("RB2") == archive / "RB2" / "c.TIF"
+    assert index.latest("RB3") is None
+    assert [path.name for path, _ in index.newest(10)] == ["b.tiff", "c.TIF", "a.tif"]
+
+
+def test_latest_image_index_keeps_at_most_max_images(archive):
+    index = LatestImageIndex(archive, max_images=2)
+
+    assert [path.name for path, _ in index.newest(10)] == ["b.tiff", "c.TIF"]
+    assert [path.name for path, _ in index.newest(10, "RB1")] == ["b.tiff", "a.tif"]
+
+
+def test_latest_image_index_only_lists_changed_directories(archive):
+    index = LatestImageIndex(archive)
+    index.refresh()
+    listed = index.listed_directories
+
+    write_image(archive / "RB2" / "new.tif", time.time())
+    age(archive / "RB2", seconds=5)
+    index.refresh()
+
+    assert index.listed_directories == listed + 1
+    assert index.latest() == archive / "RB2" / "new.tif"
+    assert index.latest("RB1") == archive / "RB1" / "run2" / "b.tiff"
+
+
+def test_latest_image_index_forgets_removed_images_and_folders(archive):
+    index = LatestImageIndex(archive, refresh_interval=0)
+    index.refresh()
+
+    (archive / "RB1" / "run2" / "b.tiff").unlink()
+    assert index.latest() == archive / "RB2" / "c.TIF"
+
+    shutil.rmtree(archive / "RB2")
+    assert index.rb_folders == {"RB1"}
+    assert index.latest() == archive / "RB1" / "run1" / "a.tif"
+
+
+def test_latest_image_index_refreshes_in_background(archive):
+    index = LatestImageIndex(archive, refresh_interval=0.01)
+    index.start()
+    try:
+        write_image(archive / "RB3" / "new.tif", time.time())
+        deadline = time.monotonic() + 5
+        while index.latest() != archive / "RB3" / "new.tif" and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        index.stop()
+
+    assert index.latest() == archive / "RB3" / "new.tif"
+    assert index.stats()["rb_folders"] == 3  # noqa: PLR2004
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from plotting_service.services.lod_service import Reduction, decimate_line, reduce_image, select_axes
+
+
+def naive_m4(values, width):
+    bucket_size = -(-len(values) // width)
+    points = set()
+    for start in range(0, len(values), bucket_size):
+        bucket = values[start : start + bucket_size]
+        points.update(start + offset for offset in (0, np.argmin(bucket), np.argmax(bucket), len(bucket) - 1))
+    return np.array(sorted(points))
+
+
+@pytest.mark.parametrize("chunk_elements", [7, 100, 4_000_000])
+def test_decimate_line_matches_naive_m4(chunk_elements):
+    values = np.random.default_rng(1).normal(size=10_001)
+    index, axes = select_axes(values.shape, None)
+
+    line = decimate_line(values, index, axes[0], width=100, chunk_elements=chunk_elements)
+
+    expected = naive_m4(values, 100)
+    assert line.decimated
+    assert line.length == len(values)
+    np.testing.assert_array_equal(line.x, expected)
+    np.testing.assert_array_equal(line.y, values[expected])
+
+
+def test_decimate_line_keeps_extremes():
+    values = np.zeros(100_000)
+    values[12_345] = 10
+    values[54_321] = -10
+    index, axes = select_axes(values.shape, None)
+
+    line = decimate_line(values, index, axes[0], width=50)
+
+    assert len(line.x) <= 4 * 50
+    assert line.y.max() == 10  # noqa: PLR2004
+    assert line.y.min() == -10  # noqa: PLR2004
+    assert {0, 12_345, 54_321, 99_999} <= set(line.x.tolist())
+
+
+def test_decimate_line_short_selection_returned_whole():
+    values = np.arange(20.0)
+    index, axes = select_axes(values.shape, "5:15")
+
+    line = decimate_line(values, index, axes[0], width=100)
+
+    assert not line.decimated
+    np.testing.assert_array_equal(line.x, np.arange(10))
+    np.testing.assert_array_equal(line.y, values[5:15])
+
+
+def test_decimate_line_of_selected_row():
+    values = np.random.default_rng(2).normal(size=(3, 5000))
+    index, axes = select_axes(values.shape, "1")
+
+    line = decimate_line(values, index, axes[0], width=10, chunk_elements=1000)
+
+    np.testing.assert_array_equal(line.x, naive_m4(values[1], 10))
+
+
+@pytest.mark.parametrize("reduction", list(Reduction))
+@pytest.mark.parametrize("chunk_elements", [50, 4_000_000])
+def test_reduce_image_matches_naive_blocks(reduction, chunk_elements):
+    values = np.random.default_rng(3).random((101, 57))
+    index, axes = select_axes(values.shape, None)
+
+    image = reduce_image(values, index, axes, width=10, height=20, reduction=reduction, chunk_elements=chunk_elements)
+
+    reducer = {"mean": np.mean, "max": np.max, "min": np.min, "sum": np.sum}[reduction.value]
+    block_rows, block_columns = image.block
+    assert image.block == (6, 6)
+    assert image.data.shape == (17, 10)
+    for row in range(image.data.shape[0]):
+        for column in range(image.data.shape[1]):
+            block = values[
+                row * block_rows : (row + 1) * block_rows, column * block_columns : (column + 1) * block_columns
+            ]
+            assert image.data[row, column] == pytest.approx(reducer(block))
+
+
+def test_reduce_image_of_selected_plane():
+    values = np.arange(4 * 8 * 8, dtype=float).reshape(4, 8, 8)
+    index, axes = select_axes(values.shape, "2,0:4")
+
+    image = reduce_image(values, index, axes, width=4, height=2, reduction=Reduction.MAX)
+
+    np.testing.assert_array_equal(image.data, values[2, 0:4].reshape(2, 2, 4, 2).max(axis=(1, 3)))
+
+
+def test_select_axes_rejects_steps():
+    with pytest.raises(ValueError, match="step"):
+        select_axes((10,), "::2")
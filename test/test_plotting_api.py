@@ -1,18 +1,27 @@
+import email
+import io
+import json
 import os
-from collections.abc import Iterator
 from http import HTTPStatus
-from typing import Any
 from unittest import mock
 
+import h5py
+import numpy as np
 import pytest
-from fastapi.exceptions import HTTPException
 from fastapi.testclient import TestClient
+from h5grove.fastapi_utils import settings
 from PIL import Image
 
 from plotting_service import plotting_api
-from plotting_service.plotting_api import check_permissions
-from plotting_service.routers import imat
+from plotting_service.auth import decision_cache, experiment_cache, get_user_from_token, invalidate_user
+from plotting_service.exceptions import AuthServiceUnavailableError, BlockingIOTimeoutError
+from plotting_service.routers import hdf5, imat, plotting
+from plotting_service.services.hdf5_service import h5_file_cache
+from plotting_service.services.image_cache_service import DerivedImageCache
 from plotting_service.services.image_service import convert_image_to_rgb_array
+from plotting_service.services.pyramid_service import PyramidCache
+from plotting_service.services.stack_service import FrameDecoder
+from plotting_service.services.stats_service import StatsCache
 
 USER_TOKEN = (
     "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9"  # noqa: S105
@@ -26,11 +35,6 @@ STAFF_TOKEN = (
 )
 
 
-class AwaitableNonAsyncMagicMock(mock.MagicMock):
-    def __await__(self) -> Iterator[Any]:
-        return iter([])
-
-
 @pytest.fixture(autouse=True)
 def api_key_setter():
     os.environ["API_KEY"] = "foo"
@@ -38,88 +42,6 @@ def api_key_setter():
     os.environ.pop("API_KEY")
 
 
-@pytest.mark.asyncio
-async def test_check_permissions_api_key():
-    request = mock.MagicMock()
-    request.headers.get("Authorization").split.return_value = [None, "foo"]
-    call_next = AwaitableNonAsyncMagicMock()
-
-    await check_permissions(request, call_next)
-
-    call_next.assert_called_once_with(request)
-
-
-@pytest.mark.asyncio
-async def test_check_permissions_api_key_failed():
-    os.environ["API_KEY"] = "ActuallyADecentAPIKey"
-    request = mock.MagicMock()
-    request.url.path = "/data"
-    request.headers.get("Authorization").split.return_value = [None, "foo"]
-    call_next = AwaitableNonAsyncMagicMock()
-
-    with pytest.raises(HTTPException):
-        await check_permissions(request, call_next)
-
-    call_next.assert_not_called()
-
-
-@pytest.mark.asyncio
-async def test_check_permissions_token_user():
-    request = mock.MagicMock()
-    request.url.path = "/data?path=/"
-    request.headers.get("Authorization").split.return_value = [None, USER_TOKEN]
-    call_next = AwaitableNonAsyncMagicMock()
-    experiment_number = str(mock.MagicMock())
-
-    with (
-        mock.patch("plotting_service.plotting_api.find_experiment_number") as experiment_number_mock,
-        mock.patch("plotting_service.plotting_api.get_experiments_for_user") as get_experiments_for_user_mock,
-    ):
-        experiment_number_mock.return_value = experiment_number
-        get_experiments_for_user_mock.return_value = [experiment_number]
-        await check_permissions(request, call_next)
-
-    call_next.assert_called_once_with(request)
-
-
-@pytest.mark.asyncio
-async def test_check_permissions_token_user_failed_no_perms():
-    request = mock.MagicMock()
-    request.url.path = "/data"
-    request.url.query = ""
-    request.headers.get("Authorization").split.return_value = [None, USER_TOKEN]
-    call_next = AwaitableNonAsyncMagicMock()
-
-    with pytest.raises(HTTPException):
-        await check_permissions(request, call_next)
-
-    call_next.assert_not_called()
-
-
-@pytest.mark.asyncio
-async def test_check_permissions_token_staff():
-    request = mock.MagicMock()
-    request.headers.get("Authorization").split.return_value = [None, STAFF_TOKEN]
-    call_next = AwaitableNonAsyncMagicMock()
-
-    await check_permissions(request, call_next)
-
-    call_next.assert_called_once_with(request)
-
-
-@pytest.mark.asyncio
-async def test_check_permissions_token_failed_bad_token():
-    request = mock.MagicMock()
-    request.url.path = "/data"
-    request.headers.get("Authorization").split.return_value = [None, "bad_token"]
-    call_next = AwaitableNonAsyncMagicMock()
-
-    with pytest.raises(HTTPException):
-        await check_permissions(request, call_next)
-
-    call_next.assert_not_called()
-
-
 def testconvert_image_to_rgb_array_returns_data_and_metadata(tmp_path):
     """Ensure images convert to RGB data without altering size when no
     downsampling occurs."""
@@ -206,6 +128,42 @@ def test_get_latest_imat_image_with_mock_rb_folder(tmp_path, monkeypatch):
     assert payload["data"] == expected_bytes
 
 
+def test_get_latest_imat_image_binary_formats(tmp_path, monkeypatch):
+    """The raw and png formats of /imat/latest-image return the same pixels as the JSON format, as binary bodies with
+    the shape in headers."""
+    monkeypatch.setattr(imat, "IMAT_DIR", tmp_path)
+    rb_dir = tmp_path / "RB1234"
+    rb_dir.mkdir()
+    image = Image.new("RGB", (8, 4))
+    for x in range(image.width):
+        for y in range(image.height):
+            image.putpixel((x, y), (x * 20 % 256, y * 40 % 256, (x + y) * 15 % 256))
+    image.save(rb_dir / "imat_sample.tiff", format="TIFF")
+    image.close()
+
+    client = TestClient(plotting_api.app)
+    headers = {"Authorization": "Bearer foo"}
+    expected = client.get("/imat/latest-image", params={"downsample_factor": 2}, headers=headers).json()["data"]
+
+    response = client.get("/imat/latest-image", params={"downsample_factor": 2, "format": "raw"}, headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["x-image-width"] == "4"
+    assert response.headers["x-image-height"] == "2"
+    assert response.headers["x-image-channels"] == "3"
+    assert response.headers["x-original-width"] == "8"
+    assert response.headers["x-original-height"] == "4"
+    assert float(response.headers["x-downsample-factor"]) == 2  # noqa: PLR2004
+    assert list(response.content) == expected
+
+    response = client.get("/imat/latest-image", params={"downsample_factor": 2, "format": "png"}, headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"] == "image/png"
+    with Image.open(io.BytesIO(response.content)) as decoded:
+        assert decoded.size == (4, 2)
+        assert list(decoded.convert("RGB").tobytes()) == expected
+
+
 def test_list_imat_images(tmp_path, monkeypatch):
     """Verify that /imat/list-images correctly filters and sorts image files."""
     monkeypatch.setattr(imat, "CEPH_DIR", str(tmp_path))
@@ -343,7 +301,7 @@ def test_get_latest_imat_image_conversion_error(tmp_path, monkeypatch):
 
     client = TestClient(plotting_api.app)
     with mock.patch(
-        "plotting_service.routers.imat.convert_image_to_rgb_array", side_effect=Exception("Conversion failed")
+        "plotting_service.routers.imat.convert_image_to_rgb_bytes", side_effect=Exception("Conversion failed")
     ):
         response = client.get(
             "/imat/latest-image", params={"downsample_factor": 1}, headers={"Authorization": "Bearer foo"}
@@ -351,3 +309,623 @@ def test_get_latest_imat_image_conversion_error(tmp_path, monkeypatch):
 
     assert response.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
     assert "Unable to convert IMAT image" in response.json()["detail"]
+
+
+def test_admin_experiment_cache_stats_requires_api_key():
+    client = TestClient(plotting_api.app)
+    response = client.get("/admin/cache/experiments", headers={"Authorization": f"Bearer {STAFF_TOKEN}"})
+
+    assert response.status_code == HTTPStatus.FORBIDDEN
+
+
+def test_admin_experiment_cache_stats():
+    client = TestClient(plotting_api.app)
+    response = client.get("/admin/cache/experiments", headers={"Authorization": "Bearer foo"})
+
+    assert response.status_code == HTTPStatus.OK
+    assert {"size", "hits", "stale_hits", "misses", "hit_ratio"} <= response.json().keys()
+
+
+def test_admin_invalidate_experiment_cache_for_user():
+    experiment_cache.set(1234, frozenset({1}))
+    client = TestClient(plotting_api.app)
+    response = client.delete("/admin/cache/experiments/1234", headers={"Authorization": "Bearer foo"})
+
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert 1234 not in experiment_cache  # noqa: PLR2004
+
+
+def test_admin_invalidate_experiment_cache():
+    experiment_cache.set(1234, frozenset({1}))
+    client = TestClient(plotting_api.app)
+    response = client.delete("/admin/cache/experiments", headers={"Authorization": "Bearer foo"})
+
+    assert response.status_code == HTTPStatus.NO_CONTENT
+    assert len(experiment_cache) == 0
+
+
+def test_user_resolved_once_per_request(tmp_path, monkeypatch):
+    monkeypatch.setattr(imat, "CEPH_DIR", str(tmp_path))
+    (tmp_path / "test_data").mkdir()
+
+    client = TestClient(plotting_api.app)
+    with mock.patch("plotting_service.authorization.get_user_from_token", wraps=get_user_from_token) as mock_get_user:
+        response = client.get(
+            "/imat/list-images", params={"path": "test_data"}, headers={"Authorization": f"Bearer {STAFF_TOKEN}"}
+        )
+
+    assert response.status_code == HTTPStatus.OK
+    mock_get_user.assert_called_once_with(STAFF_TOKEN)
+
+
+def test_admin_decision_cache_stats():
+    client = TestClient(plotting_api.app)
+    response = client.get("/admin/cache/decisions", headers={"Authorization": "Bearer foo"})
+
+    assert response.status_code == HTTPStatus.OK
+    assert "hit_ratio" in response.json()
+
+
+def test_auth_warm():
+    client = TestClient(plotting_api.app)
+    with mock.patch("plotting_service.auth.auth_client.get_experiments", return_value=[1, 2]):
+        response = client.post("/auth/warm", headers={"Authorization": f"Bearer {USER_TOKEN}"})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {"experiment_count": 2}
+    assert decision_cache.get((1234, 1))
+    invalidate_user(1234)
+
+
+def test_unavailable_auth_api_returns_service_unavailable():
+    client = TestClient(plotting_api.app)
+    headers = {"Authorization": f"Bearer {USER_TOKEN}", "Origin": "https://example.com"}
+    circuit_open = AuthServiceUnavailableError("Auth api circuit is open", retry_after=12.5)
+
+    with mock.patch("plotting_service.auth.auth_client.get_experiments", side_effect=circuit_open):
+        meta = client.get("/meta/?file=LOQ%2FRBNumber%2FRB1%2Frun.nxs&path=%2F", headers=headers)
+        warm = client.post("/auth/warm", headers=headers)
+
+    for response in (meta, warm):
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        assert response.headers["Retry-After"] == "13"
+        assert response.headers["Access-Control-Allow-Origin"] == "https://example.com"
+    invalidate_user(1234)
+
+
+def test_auth_warm_requires_user_token():
+    client = TestClient(plotting_api.app)
+    response = client.post("/auth/warm", headers={"Authorization": "Bearer foo"})
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_get_imat_image_slow_filesystem_returns_gateway_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(imat, "CEPH_DIR", str(tmp_path))
+    client = TestClient(plotting_api.app)
+
+    with mock.patch.object(imat, "run_blocking", side_effect=BlockingIOTimeoutError("metadata call timed out")):
+        response = client.get("/imat/image", params={"path": "slow.tif"}, headers={"Authorization": "Bearer foo"})
+
+    assert response.status_code == HTTPStatus.GATEWAY_TIMEOUT
+
+
+def test_admin_find_file_cache_stats():
+    client = TestClient(plotting_api.app)
+    response = client.get("/admin/cache/find-file", headers={"Authorization": "Bearer foo"})
+
+    assert response.status_code == HTTPStatus.OK
+    assert {"hits", "misses", "negative_hits", "indexes", "scans"} <= response.json().keys()
+
+
+@pytest.fixture
+def batch_tree(tmp_path, monkeypatch):
+    monkeypatch.setattr(plotting, "CEPH_DIR", str(tmp_path))
+    first = tmp_path / "MARI" / "RBNumber" / "RB1" / "autoreduced"
+    second = tmp_path / "MARI" / "RBNumber" / "RB2" / "autoreduced" / "run"
+    first.mkdir(parents=True)
+    second.mkdir(parents=True)
+    (first / "MAR1.nxspe").touch()
+    (second / "MAR2.nxspe").touch()
+    return tmp_path
+
+
+def test_find_file_batch(batch_tree):
+    client = TestClient(plotting_api.app)
+    response = client.post(
+        "/find_file/batch",
+        json={"instrument": "MARI", "experiment_numbers": [1, 2], "filenames": ["MAR1.nxspe", "MAR2.nxspe", "MAR3"]},
+        headers={"Authorization": f"Bearer {STAFF_TOKEN}"},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        "MAR1.nxspe": "MARI/RBNumber/RB1/autoreduced/MAR1.nxspe",
+        "MAR2.nxspe": "MARI/RBNumber/RB2/autoreduced/run/MAR2.nxspe",
+        "MAR3": None,
+    }
+
+
+def test_find_file_batch_streams_ndjson(batch_tree):
+    client = TestClient(plotting_api.app)
+    response = client.post(
+        "/find_file/batch",
+        params={"stream": True},
+        json={"instrument": "MARI", "experiment_numbers": [2], "filenames": ["MAR2.nxspe", "MAR3"]},
+        headers={"Authorization": f"Bearer {STAFF_TOKEN}"},
+    )
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"filename": "MAR2.nxspe", "path": "MARI/RBNumber/RB2/autoreduced/run/MAR2.nxspe"},
+        {"filename": "MAR3", "path": None},
+    ]
+
+
+def test_find_file_batch_checks_every_experiment(batch_tree):
+    client = TestClient(plotting_api.app)
+    with mock.patch("plotting_service.auth.auth_client.get_experiments", return_value=[1]) as get_experiments:
+        response = client.post(
+            "/find_file/batch",
+            json={"instrument": "MARI", "experiment_numbers": [1, 2], "filenames": ["MAR1.nxspe"]},
+            headers={"Authorization": f"Bearer {USER_TOKEN}"},
+        )
+
+    assert response.status_code == HTTPStatus.FORBIDDEN
+    get_experiments.assert_called_once()
+    invalidate_user(1234)
+
+
+def test_find_file_batch_rejects_paths(batch_tree):
+    client = TestClient(plotting_api.app)
+    response = client.post(
+        "/find_file/batch",
+        json={"instrument": "MARI", "experiment_numbers": [1], "filenames": ["../../etc/passwd"]},
+        headers={"Authorization": f"Bearer {STAFF_TOKEN}"},
+    )
+
+    assert response.status_code == HTTPStatus.FORBIDDEN
+
+
+@pytest.fixture
+def text_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(plotting, "CEPH_DIR", str(tmp_path))
+    path = tmp_path / "MARI" / "RBNumber" / "RB1" / "autoreduced" / "reduction.log"
+    path.parent.mkdir(parents=True)
+    path.write_text("".join(f"line {number}\n" for number in range(1000)))
+    return path
+
+
+def get_text(headers=None):
+    client = TestClient(plotting_api.app)
+    return client.get(
+        "/text/instrument/MARI/experiment_number/1",
+        params={"filename": "reduction.log"},
+        headers={"Authorization": f"Bearer {STAFF_TOKEN}", **(headers or {})},
+    )
+
+
+def test_get_text_file(text_file):
+    response = get_text()
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.text == text_file.read_text()
+    assert response.headers["content-type"] == "text/plain; charset=utf-8"
+    assert "etag" in response.headers
+    assert "last-modified" in response.headers
+
+
+def test_get_text_file_range(text_file):
+    response = get_text({"Range": "bytes=0-6"})
+
+    assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert response.text == "line 0\n"
+    assert response.headers["content-range"] == f"bytes 0-6/{text_file.stat().st_size}"
+
+
+def test_get_text_file_not_modified(text_file):
+    etag = get_text().headers["etag"]
+
+    with mock.patch("starlette.responses.FileResponse._handle_simple") as send_file:
+        response = get_text({"If-None-Match": etag})
+
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.content == b""
+    send_file.assert_not_called()
+
+
+def test_get_text_file_not_modified_since(text_file):
+    last_modified = get_text().headers["last-modified"]
+
+    assert get_text({"If-Modified-Since": last_modified}).status_code == HTTPStatus.NOT_MODIFIED
+
+
+def test_get_text_file_modified(text_file):
+    etag = get_text().headers["etag"]
+    text_file.write_text("rewritten\n")
+    os.utime(text_file, (1, 1))
+
+    response = get_text({"If-None-Match": etag})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.text == "rewritten\n"
+
+
+def test_get_text_file_tail(text_file):
+    client = TestClient(plotting_api.app)
+    response = client.get(
+        "/text/instrument/MARI/experiment_number/1/tail",
+        params={"filename": "reduction.log", "lines": 2},
+        headers={"Authorization": f"Bearer {STAFF_TOKEN}"},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.text == "line 998\nline 999\n"
+    assert response.headers["x-file-offset"] == str(text_file.stat().st_size)
+
+
+def test_h5_data_reads_through_handle_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "base_dir", str(tmp_path))
+    with h5py.File(tmp_path / "run.nxs", "w") as h5file:
+        h5file["entry/data"] = np.arange(5)
+    client = TestClient(plotting_api.app)
+    hits = h5_file_cache.hits
+
+    for _ in range(2):
+        response = client.get(
+            "/data",
+            params={"file": "run.nxs", "path": "/entry/data"},
+            headers={"Authorization": f"Bearer {STAFF_TOKEN}"},
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert response.json() == [0, 1, 2, 3, 4]
+
+    assert h5_file_cache.hits == hits + 1
+    meta = client.get(
+        "/meta", params={"file": "run.nxs", "path": "/entry"}, headers={"Authorization": f"Bearer {STAFF_TOKEN}"}
+    )
+    assert meta.json()["children"][0]["name"] == "data"
+    missing = client.get("/meta", params={"file": "nope.nxs"}, headers={"Authorization": f"Bearer {STAFF_TOKEN}"})
+    assert missing.status_code == HTTPStatus.NOT_FOUND
+    h5_file_cache.clear()
+
+
+def test_lod_decimates_dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "base_dir", str(tmp_path))
+    with h5py.File(tmp_path / "run.nxs", "w") as h5file:
+        h5file["entry/line"] = np.sin(np.linspace(0, 100, 100_000))
+        h5file["entry/image"] = np.ones((3, 400, 300))
+    client = TestClient(plotting_api.app)
+    headers = {"Authorization": f"Bearer {STAFF_TOKEN}"}
+
+    line = client.get("/lod", params={"file": "run.nxs", "path": "/entry/line", "width": 200}, headers=headers)
+    assert line.status_code == HTTPStatus.OK
+    assert line.json()["decimated"]
+    assert len(line.json()["x"]) <= 800  # noqa: PLR2004
+
+    image = client.get(
+        "/lod",
+        params={"file": "run.nxs", "path": "/entry/image", "selection": "1", "width": 100, "reduction": "sum"},
+        headers=headers,
+    )
+    assert image.status_code == HTTPStatus.OK
+    assert image.json()["block"] == [4, 3]
+    assert image.json()["data"][0][0] == 12  # noqa: PLR2004
+
+    volume = client.get("/lod", params={"file": "run.nxs", "path": "/entry/image", "width": 100}, headers=headers)
+    assert volume.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    h5_file_cache.clear()
+
+
+def test_lod_rejects_non_numeric_datasets(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "base_dir", str(tmp_path))
+    with h5py.File(tmp_path / "run.nxs", "w") as h5file:
+        h5file["entry/names"] = np.array([b"a", b"b", b"c"])
+        h5file["entry/events"] = np.zeros(3, dtype=[("time", "f8"), ("pixel", "i4")])
+    client = TestClient(plotting_api.app)
+    headers = {"Authorization": f"Bearer {STAFF_TOKEN}"}
+
+    for path in ("/entry/names", "/entry/events"):
+        response = client.get("/lod", params={"file": "run.nxs", "path": path, "width": 200}, headers=headers)
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    h5_file_cache.clear()
+
+
+def test_pyramid_tiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "base_dir", str(tmp_path))
+    monkeypatch.setattr(hdf5, "pyramid_cache", PyramidCache(tmp_path / "pyramids", tile_size=64))
+    with h5py.File(tmp_path / "run.nxs", "w") as h5file:
+        h5file["entry/image"] = np.ones((200, 100))
+    client = TestClient(plotting_api.app)
+    headers = {"Authorization": f"Bearer {STAFF_TOKEN}"}
+    params = {"file": "run.nxs", "path": "/entry/image"}
+
+    pyramid = client.get("/pyramid", params=params, headers=headers)
+    assert pyramid.status_code == HTTPStatus.OK
+    assert [level["shape"] for level in pyramid.json()["levels"]] == [[200, 100], [100, 50], [50, 25]]
+
+    tile = client.get("/pyramid/tile", params={**params, "level": 1, "x": 0, "y": 1}, headers=headers)
+    assert tile.status_code == HTTPStatus.OK
+    assert np.array(tile.json()).shape == (36, 50)
+    outside = client.get("/pyramid/tile", params={**params, "level": 1, "x": 1, "y": 0}, headers=headers)
+    assert outside.status_code == HTTPStatus.NOT_FOUND
+    h5_file_cache.clear()
+
+
+def test_batch_answers_items_from_one_open(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "base_dir", str(tmp_path))
+    with h5py.File(tmp_path / "run.nxs", "w") as h5file:
+        h5file["entry/data/signal"] = np.arange(6).reshape(2, 3)
+        h5file["entry/data/x"] = np.array([0.5, 1.5, 2.5])
+        h5file["entry/data"].attrs["signal"] = "signal"
+    client = TestClient(plotting_api.app)
+    misses = h5_file_cache.misses
+    items = [
+        {"endpoint": "meta", "path": "/entry/data"},
+        {"path": "/entry/data/signal", "selection": "1"},
+        {"path": "/entry/data/x", "format": "bin", "dtype": "safe"},
+        {"endpoint": "attr", "path": "/entry/data", "attr_keys": ["signal"]},
+        {"path": "/entry/missing\r\nX-Status: 200"},
+    ]
+
+    response = client.post(
+        "/batch",
+        params={"file": "run.nxs"},
+        json={"items": items},
+        headers={"Authorization": f"Bearer {STAFF_TOKEN}"},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    message = email.message_from_bytes(
+        f"Content-Type: {response.headers['content-type']}\r\n\r\n".encode() + response.content
+    )
+    parts = message.get_payload()
+    assert [part["X-Status"] for part in parts] == ["200", "200", "200", "200", "404"]
+    assert parts[4]["X-Path"] == "/entry/missing%0D%0AX-Status%3A%20200"
+    assert json.loads(parts[0].get_payload())["children"][0]["name"] == "signal"
+    assert json.loads(parts[1].get_payload()) == [3, 4, 5]
+    assert np.frombuffer(parts[2].get_payload(decode=True), dtype=np.float64).tolist() == [0.5, 1.5, 2.5]
+    assert json.loads(parts[3].get_payload()) == {"signal": "signal"}
+    assert h5_file_cache.misses == misses + 1
+    h5_file_cache.clear()
+
+
+def test_histogram_and_cached_stats(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "base_dir", str(tmp_path))
+    monkeypatch.setattr(hdf5, "stats_cache", StatsCache(tmp_path / "stats"))
+    with h5py.File(tmp_path / "run.nxs", "w") as h5file:
+        h5file["entry/data"] = np.arange(1000.0).reshape(10, 100)
+        h5file["entry/names"] = np.array([b"a", b"b"])
+    client = TestClient(plotting_api.app)
+    headers = {"Authorization": f"Bearer {STAFF_TOKEN}"}
+
+    histogram = client.get(
+        "/histogram", params={"file": "run.nxs", "path": "/entry/data", "bins": 10, "upper": 90}, headers=headers
+    )
+    assert histogram.status_code == HTTPStatus.OK
+    assert histogram.json()["histogram"]["counts"] == [100] * 10
+    assert histogram.json()["limits"] == pytest.approx([10, 900], abs=1)
+
+    stats = client.get("/stats", params={"file": "run.nxs", "path": "/entry/data"}, headers=headers)
+    assert stats.json()["mean"] == pytest.approx(499.5)
+    assert hdf5.stats_cache.stats()["hits"] == 1
+
+    batch = client.post(
+        "/batch",
+        params={"file": "run.nxs"},
+        json={"items": [{"endpoint": "stats", "path": "/entry/data"}]},
+        headers=headers,
+    )
+    parts = email.message_from_bytes(
+        f"Content-Type: {batch.headers['content-type']}\r\n\r\n".encode() + batch.content
+    ).get_payload()
+    assert json.loads(parts[0].get_payload()) == stats.json()
+    assert hdf5.stats_cache.stats()["hits"] == 2  # noqa: PLR2004
+
+    names = client.get("/histogram", params={"file": "run.nxs", "path": "/entry/names"}, headers=headers)
+    assert names.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    h5_file_cache.clear()
+
+
+def test_get_recent_imat_images(tmp_path, monkeypatch):
+    """/imat/recent-images lists the newest images newest first, optionally of one RB folder."""
+    monkeypatch.setattr(imat, "IMAT_DIR", tmp_path)
+    for rb, name, mtime in (("RB1", "a.tif", 100), ("RB2", "b.tif", 200), ("RB1", "c.tif", 300)):
+        (tmp_path / rb).mkdir(exist_ok=True)
+        (tmp_path / rb / name).touch()
+        os.utime(tmp_path / rb / name, (mtime, mtime))
+
+    client = TestClient(plotting_api.app)
+    response = client.get("/imat/recent-images", params={"count": 2}, headers={"Authorization": "Bearer foo"})
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == [{"path": "RB1/c.tif", "mtime": 300}, {"path": "RB2/b.tif", "mtime": 200}]
+
+    response = client.get("/imat/recent-images", params={"rb": "RB2"}, headers={"Authorization": "Bearer foo"})
+    assert [image["path"] for image in response.json()] == ["RB2/b.tif"]
+
+    response = client.get("/imat/latest-image", params={"rb": "RB3"}, headers={"Authorization": "Bearer foo"})
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def test_imat_images_are_served_from_derived_image_cache(tmp_path, monkeypatch):
+    """Repeated requests for an IMAT image at the same downsample factor decode it once."""
+    monkeypatch.setattr(imat, "CEPH_DIR", str(tmp_path))
+    cache = DerivedImageCache(tmp_path / "cache")
+    monkeypatch.setattr(imat, "derived_image_cache", cache)
+    Image.new("I;16", (8, 4), color=1000).save(tmp_path / "stack_0001.tif", format="TIFF")
+
+    client = TestClient(plotting_api.app)
+    responses = [
+        client.get(
+            "/imat/image",
+            params={"path": "stack_0001.tif", "downsample_factor": 2},
+            headers={"Authorization": "Bearer foo"},
+        )
+        for _ in range(3)
+    ]
+
+    assert all(response.status_code == HTTPStatus.OK for response in responses)
+    assert len({response.content for response in responses}) == 1
+    assert responses[0].headers["X-Image-Width"] == "4"
+    stats = cache.stats()
+    assert (stats["misses"], stats["memory_hits"]) == (1, 2)
+
+    response = client.get("/admin/cache/images", headers={"Authorization": "Bearer foo"})
+    assert response.status_code == HTTPStatus.OK
+    assert {"memory_hits", "disk_hits", "misses", "hit_ratio"} <= response.json().keys()
+
+
+def test_get_imat_image_downsample_method(tmp_path, monkeypatch):
+    """/imat/image reduces each block of pixels with the requested method."""
+    monkeypatch.setattr(imat, "CEPH_DIR", str(tmp_path))
+    pixels = np.arange(64, dtype=np.uint16).reshape(8, 8)
+    Image.fromarray(pixels).save(tmp_path / "test.tif", format="TIFF")
+
+    client = TestClient(plotting_api.app)
+    response = client.get(
+        "/imat/image",
+        params={"path": "test.tif", "downsample_factor": 4, "method": "max"},
+        headers={"Authorization": "Bearer foo"},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["X-Image-Width"] == "2"
+    assert np.frombuffer(response.content, dtype=np.uint16).tolist() == [27, 31, 59, 63]
+
+
+def test_get_imat_image_region_and_tiles(tmp_path, monkeypatch):
+    """A region or tile of an IMAT image returns only its pixels, at the requested level of detail."""
+    monkeypatch.setattr(imat, "CEPH_DIR", str(tmp_path))
+    monkeypatch.setattr(imat, "IMAT_TILE_SIZE", 4)
+    monkeypatch.setattr(imat, "derived_image_cache", DerivedImageCache(tmp_path / "cache"))
+    pixels = np.arange(100, dtype=np.uint16).reshape(10, 10)
+    Image.fromarray(pixels).save(tmp_path / "test.tif", format="TIFF")
+    client = TestClient(plotting_api.app)
+    headers = {"Authorization": "Bearer foo"}
+
+    response = client.get(
+        "/imat/image/region", params={"path": "test.tif", "x": 2, "y": 3, "width": 4, "height": 2}, headers=headers
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert (response.headers["X-Image-Width"], response.headers["X-Image-Height"]) == ("4", "2")
+    assert np.frombuffer(response.content, dtype=np.uint16).tolist() == pixels[3:5, 2:6].ravel().tolist()
+
+    response = client.get(
+        "/imat/image/region", params={"path": "test.tif", "x": 20, "y": 0, "width": 4, "height": 2}, headers=headers
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+    response = client.get("/imat/image/tiles", params={"path": "test.tif"}, headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    assert [level["tiles"] for level in response.json()["levels"]] == [[3, 3], [2, 2], [1, 1]]
+
+    response = client.get(
+        "/imat/image/tile", params={"path": "test.tif", "level": 1, "x": 1, "y": 0, "method": "max"}, headers=headers
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["X-Region-X"] == "8"
+    assert (response.headers["X-Image-Width"], response.headers["X-Image-Height"]) == ("1", "4")
+    assert np.frombuffer(response.content, dtype=np.uint16).tolist() == [19, 39, 59, 79]
+
+
+def test_get_imat_stack_and_sinogram(tmp_path, monkeypatch):
+    """A stack streams every selected frame in order, and a sinogram one row of each."""
+    monkeypatch.setattr(imat, "CEPH_DIR", str(tmp_path))
+    monkeypatch.setattr(imat, "frame_decoder", FrameDecoder(workers=2))
+    stack = np.arange(6 * 4 * 5, dtype=np.uint16).reshape(6, 4, 5)
+    for index, pixels in enumerate(stack):
+        Image.fromarray(pixels).save(tmp_path / f"frame_{index}.tif", format="TIFF")
+    client = TestClient(plotting_api.app)
+    headers = {"Authorization": "Bearer foo"}
+
+    try:
+        response = client.get("/imat/stack", params={"path": ".", "start": 1, "step": 2}, headers=headers)
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["X-Frame-Count"] == "3"
+        assert (response.headers["X-Image-Width"], response.headers["X-Image-Height"]) == ("5", "4")
+        assert np.array_equal(np.frombuffer(response.content, dtype=np.uint16).reshape(3, 4, 5), stack[1::2])
+
+        response = client.get(
+            "/imat/stack", params={"path": ".", "sinogram_row": 2, "x": 1, "width": 3}, headers=headers
+        )
+        assert response.status_code == HTTPStatus.OK
+        assert (response.headers["X-Region-Y"], response.headers["X-Image-Height"]) == ("2", "1")
+        assert np.array_equal(np.frombuffer(response.content, dtype=np.uint16).reshape(6, 3), stack[:, 2, 1:4])
+
+        response = client.get("/imat/stack", params={"path": ".", "sinogram_row": 9}, headers=headers)
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+        response = client.get("/imat/stack", params={"path": ".", "start": 6}, headers=headers)
+        assert response.status_code == HTTPStatus.NOT_FOUND
+    finally:
+        imat.frame_decoder.shutdown()
+
+
+def test_imat_pixel_routes_choose_compression(tmp_path, monkeypatch):
+    """Single images are compressed whatever their sampled ratio, streamed stacks are never compressed."""
+    monkeypatch.setattr(imat, "CEPH_DIR", str(tmp_path))
+    monkeypatch.setattr(imat, "frame_decoder", FrameDecoder(workers=1))
+    Image.fromarray(np.zeros((64, 64), dtype=np.uint16)).save(tmp_path / "frame_0.tif", format="TIFF")
+    client = TestClient(plotting_api.app)
+    headers = {"Authorization": "Bearer foo", "Accept-Encoding": "gzip"}
+
+    try:
+        image = client.get("/imat/image", params={"path": "frame_0.tif"}, headers=headers)
+        stack = client.get("/imat/stack", params={"path": "."}, headers=headers)
+    finally:
+        imat.frame_decoder.shutdown()
+
+    assert image.headers["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in stack.headers
+    assert image.content == stack.content == bytes(64 * 64 * 2)
+
+
+@pytest.mark.parametrize(
+    ("error", "status"),
+    [
+        (ValueError("Region is outside the image"), HTTPStatus.BAD_REQUEST),
+        (OSError("Truncated image"), HTTPStatus.INTERNAL_SERVER_ERROR),
+        (BlockingIOTimeoutError("Frame decode timed out"), HTTPStatus.GATEWAY_TIMEOUT),
+    ],
+)
+def test_get_imat_stack_closes_frames_when_first_frame_fails(tmp_path, monkeypatch, error, status):
+    """The frames decoding ahead of a first frame that failed are stopped."""
+    monkeypatch.setattr(imat, "CEPH_DIR", str(tmp_path))
+    Image.fromarray(np.zeros((4, 5), dtype=np.uint16)).save(tmp_path / "frame_0.tif", format="TIFF")
+    frames = mock.MagicMock()
+    frames.__anext__.side_effect = error
+    frames.aclose = mock.AsyncMock()
+    client = TestClient(plotting_api.app)
+
+    with mock.patch.object(imat.frame_decoder, "decode", return_value=frames):
+        response = client.get("/imat/stack", params={"path": "."}, headers={"Authorization": "Bearer foo"})
+
+    assert response.status_code == status
+    frames.aclose.assert_awaited_once()
+
+
+def test_get_imat_image_display(tmp_path, monkeypatch):
+    """A 16-bit image is windowed to one byte per pixel, with the window and histogram in headers."""
+    monkeypatch.setattr(imat, "CEPH_DIR", str(tmp_path))
+    pixels = np.array([[1000, 2000], [3000, 5000]], dtype=np.uint16)
+    Image.fromarray(pixels).save(tmp_path / "test.tif", format="TIFF")
+    client = TestClient(plotting_api.app)
+    headers = {"Authorization": "Bearer foo"}
+
+    response = client.get("/imat/image/display", params={"path": "test.tif", "window": "minmax"}, headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    assert list(response.content) == [0, 64, 128, 255]
+    assert (response.headers["X-Window-Low"], response.headers["X-Window-High"]) == ("1000.0", "5000.0")
+    assert sum(map(int, response.headers["X-Histogram-Counts"].split(","))) == 4  # noqa: PLR2004
+
+    response = client.get(
+        "/imat/image/display",
+        params={"path": "test.tif", "window": "manual", "low": 2000, "high": 3000, "format": "png"},
+        headers=headers,
+    )
+    assert response.status_code == HTTPStatus.OK
+    with Image.open(io.BytesIO(response.content)) as image:
+        assert np.asarray(image).tolist() == [[0, 0], [255, 255]]
+
+    response = client.get("/imat/image/display", params={"path": "test.tif", "window": "manual"}, headers=headers)
+    assert response.status_code == HTTPStatus.BAD_REQUEST
@@ -0,0 +1,131 @@
+import asyncio
+import json
+from collections.abc import AsyncIterator
+
+import pytest
+import pytest_asyncio
+from websockets.asyncio.server import ServerConnection, serve
+
+from plotting_service.services.pv_service import PVManager
+
+MARI_PV = "IN:MARI:DAE:_RBNUMBER"
+LET_PV = "IN:LET:DAE:_RBNUMBER"
+
+
+class FakePVWS:
+    """Local PVWS server that answers subscriptions with the current value of each PV"""
+
+    def __init__(self) -> None:
+        self.values = {MARI_PV: "1234", LET_PV: "5678"}
+        self.connections: list[ServerConnection] = []
+        self.subscriptions: list[list[str]] = []
+        self.url = ""
+
+    async def handler(self, ws: ServerConnection) -> None:
+        self.connections.append(ws)
+        async for message in ws:
+            pvs = json.loads(message)["pvs"]
+            self.subscriptions.append(pvs)
+            for pv in pvs:
+                if pv in self.values:
+                    await ws.send(json.dumps({"type": "update", "pv": pv, "text": self.values[pv]}))
+
+    async def publish(self, pv: str, value: str) -> None:
+        self.values[pv] = value
+        for ws in self.connections:
+            await ws.send(json.dumps({"type": "update", "pv": pv, "value": value}))
+
+
+@pytest_asyncio.fixture
+async def fake_pvws() -> AsyncIterator[FakePVWS]:
+    fake = FakePVWS()
+    async with serve(fake.handler, "127.0.0.1", 0) as server:
+        port = next(iter(server.sockets)).getsockname()[1]
+        fake.url = f"ws://127.0.0.1:{port}"
+        yield fake
+
+
+@pytest_asyncio.fixture
+async def manager(fake_pvws) -> AsyncIterator[PVManager]:
+    pv_manager = PVManager(fake_pvws.url, initial_backoff=0.01, max_backoff=0.05)
+    yield pv_manager
+    await pv_manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_pv_manager_gets_value(manager):
+    assert await manager.get(MARI_PV) == "1234"
+
+
+@pytest.mark.asyncio
+async def test_pv_manager_reuses_connection_and_caches_value(manager, fake_pvws):
+    await manager.get(MARI_PV)
+    await manager.get(MARI_PV)
+
+    assert len(fake_pvws.connections) == 1
+    assert fake_pvws.subscriptions == [[MARI_PV]]
+    assert manager.cached(MARI_PV).value == "1234"
+
+
+@pytest.mark.asyncio
+async def test_pv_manager_multiplexes_instruments_over_one_connection(manager, fake_pvws):
+    assert await manager.get(MARI_PV) == "1234"
+    assert await manager.get(LET_PV) == "5678"
+
+    assert len(fake_pvws.connections) == 1
+    assert fake_pvws.subscriptions == [[MARI_PV], [LET_PV]]
+
+
+@pytest.mark.asyncio
+async def test_pv_manager_caches_pushed_updates(manager, fake_pvws):
+    await manager.get(MARI_PV)
+
+    await fake_pvws.publish(MARI_PV, "4321")
+    await asyncio.sleep(0.05)
+
+    assert await manager.get(MARI_PV) == "4321"
+
+
+@pytest.mark.asyncio
+async def test_pv_manager_reconnects_and_resubscribes(manager, fake_pvws):
+    await manager.get(MARI_PV)
+    await fake_pvws.connections[0].close()
+    fake_pvws.values[MARI_PV] = "9999"
+
+    for _ in range(100):
+        await asyncio.sleep(0.01)
+        if manager.cached(MARI_PV).value == "9999":
+            break
+
+    assert manager.connections == 2  # noqa: PLR2004
+    assert fake_pvws.subscriptions[-1] == [MARI_PV]
+    assert await manager.get(MARI_PV) == "9999"
+
+
+@pytest.mark.asyncio
+async def test_pv_manager_times_out_for_unknown_pv(manager):
+    with pytest.raises(TimeoutError):
+        await manager.get("IN:NOPE:DAE:_RBNUMBER", timeout=0.1)
+
+
+@pytest.mark.asyncio
+async def test_pv_manager_drops_values_stale_after_disconnect(fake_pvws):
+    manager = PVManager(fake_pvws.url, stale_after_disconnect=0, initial_backoff=10)
+    await manager.get(MARI_PV)
+    await fake_pvws.connections[0].close()
+    await asyncio.sleep(0.05)
+
+    assert not manager.connected
+    assert manager.cached(MARI_PV) is None
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_pv_manager_backs_off_when_server_unavailable():
+    manager = PVManager("ws://127.0.0.1:1", initial_backoff=0.01, max_backoff=0.02)
+
+    with pytest.raises(TimeoutError):
+        await manager.get(MARI_PV, timeout=0.1)
+
+    assert not manager.connected
+    await manager.stop()
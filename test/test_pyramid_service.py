@@ -0,0 +1,120 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import h5py
+import numpy as np
+import pytest
+
+from plotting_service.services.hdf5_service import h5_file_cache
+from plotting_service.services.pyramid_service import STAGING_GRACE_SECONDS, PyramidCache
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "run.nxs"
+    with h5py.File(path, "w") as h5file:
+        h5file["entry/image"] = np.arange(100 * 60, dtype=float).reshape(100, 60)
+        h5file["entry/stack"] = np.arange(3 * 40 * 40, dtype=float).reshape(3, 40, 40)
+        h5file["entry/line"] = np.arange(10)
+    yield str(path)
+    h5_file_cache.clear()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PyramidCache(tmp_path / "pyramids", tile_size=16)
+
+
+def test_levels_halve_until_one_tile(cache, source):
+    pyramid = cache.get(source, "/entry/image")
+
+    assert pyramid.shapes == [(100, 60), (50, 30), (25, 15), (13, 8)]
+    levels = pyramid.metadata()["levels"]
+    assert levels[0]["tiles"] == [7, 4]
+    assert levels[-1]["tiles"] == [1, 1]
+
+
+def test_tiles_match_downsampled_source(cache, source):
+    values = np.arange(100 * 60, dtype=float).reshape(100, 60)
+    pyramid = cache.get(source, "/entry/image")
+
+    np.testing.assert_array_equal(pyramid.tile(0, 1, 2), values[32:48, 16:32])
+    np.testing.assert_array_equal(pyramid.tile(0, 3, 6), values[96:100, 48:60])
+    level_1 = values.reshape(50, 2, 30, 2).mean(axis=(1, 3))
+    np.testing.assert_allclose(pyramid.tile(1, 1, 0), level_1[0:16, 16:30])
+    with pytest.raises(IndexError):
+        pyramid.tile(1, 2, 0)
+
+
+def test_pyramid_of_stack_frame(cache, source):
+    pyramid = cache.get(source, "/entry/stack", "1")
+
+    frame = np.arange(3 * 40 * 40, dtype=float).reshape(3, 40, 40)[1]
+    np.testing.assert_array_equal(pyramid.tile(0, 2, 0), frame[0:16, 32:40])
+    np.testing.assert_allclose(pyramid.tile(2, 0, 0), frame.reshape(10, 4, 10, 4).mean(axis=(1, 3)))
+
+
+def test_pyramid_reused_and_rebuilt_when_source_changes(cache, source):
+    cache.get(source, "/entry/image")
+    cache.get(source, "/entry/image")
+    assert (cache.builds, cache.hits) == (1, 1)
+
+    stat_result = Path(source).stat()
+    os.utime(source, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1_000_000_000))
+    cache.get(source, "/entry/image")
+    assert cache.builds == 2  # noqa: PLR2004
+
+
+def test_pyramids_survive_restart(cache, source, tmp_path):
+    cache.get(source, "/entry/image")
+
+    restarted = PyramidCache(tmp_path / "pyramids", tile_size=16)
+    pyramid = restarted.get(source, "/entry/image")
+
+    assert restarted.builds == 0
+    assert len(pyramid.shapes) == 4  # noqa: PLR2004
+
+
+def test_least_recently_used_pyramid_evicted(cache, source):
+    first = cache.get(source, "/entry/image")
+    cache.max_bytes = cache.stats()["bytes"]
+    cache.get(source, "/entry/stack", "0")
+
+    assert cache.evictions == 1
+    assert not first.directory.exists()
+    assert cache.stats()["pyramids"] == 1
+
+
+def test_selection_must_leave_two_dimensions(cache, source):
+    with pytest.raises(ValueError, match="2 dimensions"):
+        cache.get(source, "/entry/line")
+    with pytest.raises(ValueError, match="2 dimensions"):
+        cache.get(source, "/entry/stack")
+
+
+def test_build_locks_dropped_once_built(cache, source):
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        pyramids = list(pool.map(lambda _: cache.get(source, "/entry/image"), range(8)))
+
+    assert all(pyramid is pyramids[0] for pyramid in pyramids)
+    assert cache.builds == 1
+    assert cache._build_locks == {}
+
+
+def test_only_abandoned_staging_directories_removed(cache, source, tmp_path):
+    cache.get(source, "/entry/image")
+    in_progress = tmp_path / "pyramids" / ".building-1"
+    abandoned = tmp_path / "pyramids" / ".building-2"
+    for staging in (in_progress, abandoned):
+        staging.mkdir()
+        (staging / "level_1.npy").write_bytes(b"level")
+    old = time.time() - STAGING_GRACE_SECONDS - 60
+    for path in (abandoned / "level_1.npy", abandoned):
+        os.utime(path, (old, old))
+
+    PyramidCache(tmp_path / "pyramids", tile_size=16).get(source, "/entry/image")
+
+    assert in_progress.exists()
+    assert not abandoned.exists()
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from PIL import Image, UnidentifiedImageError
+
+from plotting_service.services.image_service import DownsampleMethod
+from plotting_service.services.stack_service import FrameDecoder, decode_frame
+
+
+@pytest.fixture
+def frames(tmp_path):
+    """Five 8x6 16 bit frames, each pixel offset by 100 times the frame number"""
+    paths = []
+    for index in range(5):
+        path = tmp_path / f"frame_{index}.tif"
+        Image.fromarray((np.arange(48, dtype=np.uint16) + index * 100).reshape(6, 8)).save(path, format="TIFF")
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def decoder():
+    frame_decoder = FrameDecoder(workers=2, timeout=30)
+    yield frame_decoder
+    frame_decoder.shutdown()
+
+
+def test_decode_frame_reads_region(frames):
+    data, original_width, original_height, width, height = decode_frame(
+        frames[1], (2, 1, 6, 3), 1, DownsampleMethod.NEAREST
+    )
+
+    assert (original_width, original_height, width, height) == (8, 6, 4, 2)
+    assert np.frombuffer(data, dtype=np.uint16).tolist() == [110, 111, 112, 113, 118, 119, 120, 121]
+
+
+@pytest.mark.asyncio
+async def test_decoder_yields_frames_in_order(frames, decoder):
+    decoded = [frame async for frame in decoder.decode(frames, (0, 2, 8, 3), 2, DownsampleMethod.MAX)]
+
+    assert [np.frombuffer(frame[0], dtype=np.uint16).tolist() for frame in decoded] == [
+        [index * 100 + value for value in (17, 19, 21, 23)] for index in range(5)
+    ]
+    assert decoder.stats()["frames"] == 5  # noqa: PLR2004
+
+
+@pytest.mark.asyncio
+async def test_decoder_raises_decode_errors(frames, decoder):
+    frames[2].write_bytes(b"not an image")
+
+    decoded = decoder.decode(frames, None, 1, DownsampleMethod.NEAREST)
+    assert len([await anext(decoded), await anext(decoded)]) == 2  # noqa: PLR2004
+    with pytest.raises(UnidentifiedImageError):
+        await anext(decoded)
+
+    assert decoder.stats()["failed"] == 1
@@ -0,0 +1,94 @@
+import h5py
+import numpy as np
+import pytest
+from h5grove.utils import get_array_stats
+
+from plotting_service.services.hdf5_service import h5_file_cache
+from plotting_service.services.stats_service import HISTOGRAM_RESOLUTION, StatsCache, compute_stats
+
+
+@pytest.fixture
+def values():
+    values = np.random.default_rng(4).normal(10, 3, size=(50, 40))
+    values[3, 4] = np.nan
+    values[7, 8] = np.inf
+    values[9, 9] = 0
+    return values
+
+
+@pytest.mark.parametrize("chunk_elements", [1, 100, 4_000_000])
+def test_stats_match_h5grove(values, chunk_elements):
+    stats = compute_stats(values, chunk_elements=chunk_elements)
+
+    expected = get_array_stats(values[np.isfinite(values)])
+    for key, value in stats.h5grove_stats().items():
+        assert value == pytest.approx(expected[key])
+    assert stats.count == values.size - 2
+    assert stats.histogram_counts.sum() == stats.count
+
+
+def test_stats_of_selection(values):
+    stats = compute_stats(values, "5:10, 2", chunk_elements=2)
+
+    assert stats.h5grove_stats()["mean"] == pytest.approx(values[5:10, 2].mean())
+    assert compute_stats(values, "::2").count == np.isfinite(values[::2]).sum()
+
+
+def test_integer_stats_match_h5grove():
+    values = np.arange(-5, 1000, dtype=np.int32).reshape(-1, 5)
+
+    assert compute_stats(values, chunk_elements=10).h5grove_stats() == get_array_stats(values)
+
+
+def test_percentiles_within_one_bin(values):
+    stats = compute_stats(values, chunk_elements=100)
+
+    finite = values[np.isfinite(values)]
+    for q in (1, 50, 99):
+        assert stats.percentile(q) == pytest.approx(
+            np.percentile(finite, q, method="inverted_cdf"), abs=stats.histogram_width
+        )
+    # Doubling the range to fit later chunks leaves bins at most four times as wide as a perfect fit
+    assert stats.histogram_width <= 4 * (finite.max() - finite.min()) / HISTOGRAM_RESOLUTION
+
+
+def test_histogram_range_grows_with_later_chunks():
+    values = np.concatenate([np.zeros(100), np.linspace(0, 1e-3, 100), np.linspace(-50, 50, 100)])
+
+    stats = compute_stats(values, chunk_elements=100)
+
+    assert stats.histogram_counts.sum() == 300  # noqa: PLR2004
+    assert stats.percentile(50) == pytest.approx(
+        np.percentile(values, 50, method="inverted_cdf"), abs=stats.histogram_width
+    )
+    histogram = stats.histogram(bins=10)
+    assert len(histogram["counts"]) <= 10  # noqa: PLR2004
+    assert sum(histogram["counts"]) == 300  # noqa: PLR2004
+    assert histogram["edges"][0] <= -50  # noqa: PLR2004
+    assert histogram["edges"][-1] >= 50  # noqa: PLR2004
+
+
+def test_non_numeric_data_rejected():
+    with pytest.raises(TypeError):
+        compute_stats(np.array(["a", "b"]))
+
+
+def test_cache_reads_no_data_on_repeat(tmp_path, values):
+    source = tmp_path / "run.nxs"
+    with h5py.File(source, "w") as h5file:
+        h5file["data"] = values
+    cache = StatsCache(tmp_path / "stats")
+
+    first = cache.get(str(source), "/data")
+    restarted = StatsCache(tmp_path / "stats")
+    second = restarted.get(str(source), "/data")
+
+    assert second.h5grove_stats() == first.h5grove_stats()
+    assert (cache.misses, restarted.hits, restarted.misses) == (1, 1, 0)
+
+    # HDF5 cannot write to a file this process has open, so replace it as reduction would
+    with h5py.File(tmp_path / "new.nxs", "w") as h5file:
+        h5file["data"] = np.full((2, 2), 1000.0)
+    (tmp_path / "new.nxs").replace(source)
+    assert restarted.get(str(source), "/data").maximum == 1000  # noqa: PLR2004
+    h5_file_cache.clear()
@@ -0,0 +1,154 @@
+import asyncio
+import json
+
+import pytest
+
+from plotting_service.services import text_follow_service
+from plotting_service.services.text_follow_service import FileFollower, generate_follow_events, read_tail
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "reduction.log"
+    path.write_text("".join(f"line {number}\n" for number in range(10)))
+    return path
+
+
+@pytest.fixture(autouse=True)
+def _fast_polling(monkeypatch):
+    monkeypatch.setattr(text_follow_service, "TEXT_FOLLOW_POLL_INTERVAL", 0.01)
+
+
+def parse(event):
+    name, data = event.strip().split("\n")
+    return name.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+@pytest.mark.parametrize(
+    ("lines", "max_bytes", "expected"),
+    [
+        (3, None, "line 7\nline 8\nline 9\n"),
+        (0, None, ""),
+        (100, None, "".join(f"line {number}\n" for number in range(10))),
+        (None, 7, "line 9\n"),
+        (3, 10, " 8\nline 9\n"),
+    ],
+)
+def test_read_tail(log_file, lines, max_bytes, expected):
+    data, offset = read_tail(log_file, lines=lines, max_bytes=max_bytes)
+
+    assert data.decode() == expected
+    assert offset == log_file.stat().st_size
+
+
+def test_read_tail_without_trailing_newline(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_follow_service, "TAIL_BLOCK_SIZE", 4)
+    path = tmp_path / "partial.log"
+    path.write_text("first\nsecond\nthird")
+
+    assert read_tail(path, lines=2)[0] == b"second\nthird"
+
+
+@pytest.mark.asyncio
+async def test_follow_streams_appended_data(log_file):
+    events = generate_follow_events(log_file)
+    assert parse(await anext(events)) == ("connected", {"offset": log_file.stat().st_size})
+
+    size = log_file.stat().st_size
+    with log_file.open("a") as file:
+        file.write("line 10\n")
+
+    assert parse(await anext(events)) == ("append", {"offset": size, "data": "line 10\n"})
+    await events.aclose()
+
+
+@pytest.mark.asyncio
+async def test_follow_sends_gap_from_offset(log_file):
+    events = generate_follow_events(log_file, offset=log_file.stat().st_size - 7)
+
+    assert parse(await anext(events))[0] == "connected"
+    assert parse(await anext(events))[1]["data"] == "line 9\n"
+    await events.aclose()
+
+
+@pytest.mark.asyncio
+async def test_follow_reports_truncation(log_file):
+    events = generate_follow_events(log_file)
+    await anext(events)
+
+    log_file.write_text("new\n")
+
+    assert parse(await anext(events)) == ("truncated", {"offset": 0})
+    assert parse(await anext(events)) == ("append", {"offset": 0, "data": "new\n"})
+    await events.aclose()
+
+
+@pytest.mark.asyncio
+async def test_follow_reports_rotation(log_file, tmp_path):
+    events = generate_follow_events(log_file)
+    await anext(events)
+
+    log_file.rename(tmp_path / "reduction.log.1")
+    (tmp_path / "reduction.log").write_text("line 0 of a much longer new file\n")
+
+    assert parse(await anext(events)) == ("rotated", {"offset": 0})
+    assert parse(await anext(events))[1]["data"] == "line 0 of a much longer new file\n"
+    await events.aclose()
+
+
+@pytest.mark.asyncio
+async def test_followers_share_one_reader(log_file):
+    first = generate_follow_events(log_file)
+    second = generate_follow_events(log_file)
+    await anext(first)
+    await anext(second)
+    follower = text_follow_service.get_follower(log_file)
+
+    with log_file.open("a") as file:
+        file.write("line 10\n")
+
+    assert parse(await anext(first))[1]["data"] == parse(await anext(second))[1]["data"] == "line 10\n"
+    assert follower.subscribers == 2  # noqa: PLR2004
+    assert follower.reads == 1
+
+    await first.aclose()
+    await second.aclose()
+    assert log_file not in text_follow_service._followers
+
+
+@pytest.mark.asyncio
+async def test_follower_stops_when_cancelled_before_ready(log_file):
+    events = generate_follow_events(log_file)
+    connecting = asyncio.ensure_future(anext(events))
+    await asyncio.sleep(0)
+    follower = text_follow_service.get_follower(log_file)
+    task = follower._task
+    assert follower.subscribers == 1
+
+    connecting.cancel()
+    with pytest.raises((asyncio.CancelledError, StopAsyncIteration)):
+        await connecting
+
+    assert follower.subscribers == 0
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert log_file not in text_follow_service._followers
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_is_disconnected(log_file, monkeypatch):
+    monkeypatch.setattr(text_follow_service, "TEXT_FOLLOW_QUEUE_SIZE", 1)
+    follower = FileFollower(log_file, poll_interval=0.01)
+    queue = follower.subscribe()
+    await follower.ready()
+
+    with log_file.open("a") as file:
+        file.write("line 10\n")
+    await asyncio.sleep(0.05)
+    with log_file.open("a") as file:
+        file.write("line 11\n")
+    await asyncio.sleep(0.05)
+
+    assert queue.get_nowait() is None
+    assert follower.subscribers == 0
+    follower.unsubscribe(queue)
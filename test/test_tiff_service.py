@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+import tifffile
+from PIL import Image
+
+from plotting_service.services.tiff_service import TiffRegionReader, UnsupportedTiffError
+
+PIXELS = np.arange(300 * 200, dtype=np.uint16).reshape(300, 200)
+
+
+@pytest.fixture(
+    params=[
+        {"rowsperstrip": 16},
+        {"tile": (64, 64), "compression": "zlib"},
+        {"rowsperstrip": 300},
+    ],
+    ids=["strips", "compressed tiles", "one strip"],
+)
+def image_path(request, tmp_path):
+    path = tmp_path / "image.tif"
+    tifffile.imwrite(path, PIXELS, **request.param)
+    return path
+
+
+def test_read_returns_region(image_path):
+    with TiffRegionReader(image_path) as reader:
+        assert reader.shape == PIXELS.shape
+        np.testing.assert_array_equal(reader.read(slice(10, 290), slice(5, 199)), PIXELS[10:290, 5:199])
+        np.testing.assert_array_equal(reader[slice(0, 300), slice(0, 200)], PIXELS)
+
+
+def test_take_returns_sampled_pixels(image_path):
+    rows = np.arange(3, 300, 17)
+    columns = np.arange(1, 200, 9)
+
+    with TiffRegionReader(image_path) as reader:
+        np.testing.assert_array_equal(reader.take(rows, columns), PIXELS[np.ix_(rows, columns)])
+
+
+def test_read_decodes_only_overlapping_tiles(tmp_path):
+    path = tmp_path / "tiled.tif"
+    tifffile.imwrite(path, PIXELS, tile=(64, 64))
+
+    with TiffRegionReader(path) as reader:
+        reader.read(slice(70, 120), slice(10, 60))
+        assert reader.segments_decoded == 1
+        reader.take(np.array([0, 299]), np.array([0, 199]))
+        assert reader.segments_decoded == 1 + 4
+
+
+def test_reads_rgb_and_big_endian_images(tmp_path):
+    rgb = np.random.default_rng(0).integers(0, 255, (40, 30, 3), dtype=np.uint8)
+    tifffile.imwrite(tmp_path / "rgb.tif", rgb, tile=(16, 16), photometric="rgb")
+    tifffile.imwrite(tmp_path / "big.tif", PIXELS.astype(">u2"))
+
+    with TiffRegionReader(tmp_path / "rgb.tif") as reader:
+        np.testing.assert_array_equal(reader.read(slice(5, 35), slice(3, 30)), rgb[5:35, 3:30])
+    with TiffRegionReader(tmp_path / "big.tif") as reader:
+        assert reader.dtype == np.dtype(np.uint16)
+        np.testing.assert_array_equal(reader.read(slice(0, 10), slice(0, 10)), PIXELS[:10, :10])
+
+
+def test_rejects_images_that_are_not_tiffs(tmp_path):
+    Image.new("L", (4, 4)).save(tmp_path / "image.png")
+
+    with pytest.raises(UnsupportedTiffError):
+        TiffRegionReader(tmp_path / "image.png")
+
+
+def test_rejects_compressions_without_a_codec(tmp_path, monkeypatch):
+    Image.fromarray(np.arange(64, dtype=np.uint16).reshape(8, 8)).save(
+        tmp_path / "lzw.tif", format="TIFF", compression="tiff_lzw"
+    )
+    monkeypatch.setattr(tifffile.TIFF, "DECOMPRESSORS", {1: tifffile.TIFF.DECOMPRESSORS[1]})
+
+    with pytest.raises(UnsupportedTiffError, match="LZW"):
+        TiffRegionReader(tmp_path / "lzw.tif")
@@ -1,3 +1,4 @@
+import os
 import shutil
 from collections.abc import Callable
 from pathlib import Path
@@ -8,11 +9,12 @@ from unittest import mock
 import pytest
 from fastapi import HTTPException
 
+from plotting_service.file_index import file_index_registry
 from plotting_service.utils import (
-    find_experiment_number,
     find_file_experiment_number,
     find_file_instrument,
     find_file_user_number,
+    get_current_rb_async,
     safe_check_filepath,
 )
 
@@ -119,6 +121,24 @@ def test_find_file_instrument_uses_unknown_when_rb_no_exist():
         assert found_file == path
 
 
+def test_find_file_instrument_miss_does_not_search_unknown_when_rb_exists():
+    with TemporaryDirectory() as tmpdir:
+        rb_folder = Path(tmpdir) / "FUN_INST" / "RBNumber" / "RB1231234" / "autoreduced"
+        unknown_folder = Path(tmpdir) / "FUN_INST" / "RBNumber" / "unknown" / "autoreduced"
+        (rb_folder / "run-1").mkdir(parents=True)
+        (unknown_folder / "run-2").mkdir(parents=True)
+
+        with mock.patch("os.scandir", wraps=os.scandir) as scandir:
+            file_index_registry.get(rb_folder).refresh()
+            for _ in range(3):
+                assert find_file_instrument(tmpdir, "FUN_INST", 1231234, "missing.nxspe") is None
+
+        listed = [Path(call.args[0]) for call in scandir.call_args_list]
+        assert not any(path.is_relative_to(unknown_folder) for path in listed)
+        assert file_index_registry.peek(unknown_folder) is None
+        file_index_registry.clear()
+
+
 @pytest.mark.parametrize(
     ("find_file_method", "method_inputs", "path_to_make"),
     [
@@ -165,27 +185,9 @@ def test_find_file_methods_does_not_allow_path_injection(find_file_method: Calla
         find_file_method(*method_inputs)
 
 
-def test_find_experiment_number_text():
-    request = mock.MagicMock()
-    experiment_number = 1245
-    request.url.path = f"/text/instrument/LOQ/experiment_number/{experiment_number}"
-
-    assert find_experiment_number(request) == experiment_number
-
-
-def test_find_experiment_number_find_file():
-    request = mock.MagicMock()
-    experiment_number = 1245
-    request.url.path = f"/find_file/instrument/LOQ/experiment_number/{experiment_number}"
-
-    assert find_experiment_number(request) == experiment_number
-
-
-def test_find_experiment_number_other():
-    request = mock.MagicMock()
-    experiment_number = 1245
-    path = f"/meta/?file=LOQ%2FRBNumber%2FRB{experiment_number}%2Fautoreduced%2Frun-110754%2F110754.h5&path=%2F"
-    request.url.query = path
-    request.url.path = path
+@pytest.mark.asyncio
+async def test_get_current_rb_async_reads_shared_pv_subscription():
+    with mock.patch("plotting_service.utils.pv_manager.get", return_value="1234") as pv_get_mock:
+        assert await get_current_rb_async("mari") == "1234"
 
-    assert find_experiment_number(request) == experiment_number
+    pv_get_mock.assert_awaited_once_with("IN:MARI:DAE:_RBNUMBER", timeout=5.0)